@@ -24,6 +24,7 @@ if not __CORRFUNC_SETUP__:
     from . import utils
     from . import theory
     from . import mocks
+    from .estimators import estimate_memory, estimate_runtime
 
 
 def read_text_file(filename, encoding="utf-8"):
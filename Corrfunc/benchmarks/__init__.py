@@ -0,0 +1,21 @@
+"""
+Benchmarks for the clustering statistic calculations on synthetic
+catalogs. Run ``python -m Corrfunc.benchmarks --help`` for the
+command-line interface.
+"""
+from __future__ import (division, print_function, absolute_import,
+                        unicode_literals)
+
+__author__ = ('Manodeep Sinha')
+__all__ = ('run_benchmarks', 'parameter_sets', 'save_results',
+           'load_results', 'compare_results', 'uniform_catalog',
+           'clustered_catalog', )
+
+import sys
+
+from .catalogs import uniform_catalog, clustered_catalog
+from .suite import (run_benchmarks, parameter_sets, save_results,
+                    load_results, compare_results)
+
+if sys.version_info[0] < 3:
+    __all__ = [n.encode('ascii') for n in __all__]
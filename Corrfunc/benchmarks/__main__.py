@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Command-line interface to the benchmarks.
+
+Examples
+--------
+Run the quick sweep, and save the timings as the baseline::
+
+    python -m Corrfunc.benchmarks --quick -o baseline.json
+
+Re-run the same sweep later, and compare against the baseline (exits with
+status 1 if any of the benchmarks became slower)::
+
+    python -m Corrfunc.benchmarks --quick -o current.json \\
+        --baseline baseline.json
+
+Only compare two existing result files::
+
+    python -m Corrfunc.benchmarks --compare current.json \\
+        --baseline baseline.json
+"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import sys
+
+
+def _parse_args(argv):
+    import argparse
+    from .suite import BENCHMARKS, DEFAULT_PARAMS
+
+    def _bool(s):
+        if s.lower() in ('1', 'true', 'yes'):
+            return True
+        if s.lower() in ('0', 'false', 'no'):
+            return False
+        raise argparse.ArgumentTypeError("Expected a boolean. "
+                                         "Found '{0}'".format(s))
+
+    parser = argparse.ArgumentParser(
+        prog='python -m Corrfunc.benchmarks',
+        description="Benchmark the Corrfunc pair-counters on synthetic "
+        "catalogs, and compare against a baseline.")
+    parser.add_argument('-b', '--benchmarks', nargs='+',
+                        choices=list(BENCHMARKS.keys()),
+                        help="Benchmarks to run (default: all)")
+    parser.add_argument('--quick', action='store_true',
+                        help="Run the smaller sweep of parameters")
+    parser.add_argument('--sweep', choices=['axes', 'grid'], default='axes',
+                        help="Sweep one parameter at a time ('axes', "
+                        "default), or every combination ('grid')")
+    parser.add_argument('-n', '--nrepeats', type=int, default=3,
+                        help="Number of timed calls per benchmark")
+    parser.add_argument('--seed', type=int, default=42,
+                        help="Seed for the synthetic catalogs")
+    parser.add_argument('-o', '--output', default='corrfunc_benchmarks.json',
+                        help="JSON file to write the timings to")
+    parser.add_argument('--baseline',
+                        help="JSON file with the baseline timings")
+    parser.add_argument('--compare',
+                        help="Compare this JSON file against the baseline, "
+                        "instead of running the benchmarks")
+    parser.add_argument('--factor', type=float, default=1.1,
+                        help="Flag the benchmarks that are slower (or "
+                        "faster) than the baseline by more than this factor")
+    parser.add_argument('--statistic', choices=['min', 'median'],
+                        default='min',
+                        help="Timing to compare against the baseline")
+    parser.add_argument('-q', '--quiet', action='store_true')
+
+    types = dict(distribution=str, npts=int, boxsize=float, rmax=float,
+                 nbins=int, weights=_bool, precision=str, isa=str,
+                 nthreads=int)
+    for key in DEFAULT_PARAMS:
+        parser.add_argument('--' + key, nargs='+', type=types[key],
+                            help="Values of {0} to sweep over".format(key))
+
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    from .suite import (DEFAULT_PARAMS, QUICK_PARAMS, parameter_sets,
+                        run_benchmarks, save_results, load_results,
+                        compare_results)
+
+    args = _parse_args(argv)
+    if args.compare is not None:
+        if args.baseline is None:
+            print("Comparing requires a --baseline", file=sys.stderr)
+            return 2
+        results = load_results(args.compare)
+    else:
+        params = dict(QUICK_PARAMS) if args.quick else dict()
+        for key in DEFAULT_PARAMS:
+            values = getattr(args, key)
+            if values is not None:
+                params[key] = values
+
+        param_sets = parameter_sets(sweep=args.sweep, params=params)
+        results = run_benchmarks(benchmarks=args.benchmarks,
+                                 param_sets=param_sets,
+                                 nrepeats=args.nrepeats, seed=args.seed,
+                                 verbose=not args.quiet)
+        save_results(results, args.output)
+
+    if args.baseline is None:
+        return 0
+
+    baseline = load_results(args.baseline)
+    comparison = compare_results(results, baseline, factor=args.factor,
+                                 statistic=args.statistic,
+                                 verbose=not args.quiet)
+    nregressions = sum(1 for c in comparison if c['status'] == 'regression')
+    print("{0} benchmarks compared, {1} regressions".format(
+        len(comparison), nregressions))
+    return 1 if nregressions > 0 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Synthetic catalogs for the benchmarks. All catalogs are generated locally
+from a seed, so that the same benchmark always runs on the same points.
+"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+__author__ = ('Manodeep Sinha')
+__all__ = ('uniform_catalog', 'clustered_catalog', 'make_catalog',
+           'box_to_sky', )
+
+
+def uniform_catalog(npts, boxsize, seed=42, dtype='f8'):
+    """
+    Returns ``npts`` points distributed uniformly within a periodic
+    cube of side ``boxsize``.
+
+    Parameters
+    -----------
+    npts : integer
+        Number of points
+
+    boxsize : double
+        Side-length of the cube
+
+    seed : integer, default 42
+        Seed for the random number generator
+
+    dtype : numpy dtype, default 'f8'
+        Data-type of the returned positions
+
+    Returns
+    --------
+    positions : array, shape (npts, 3)
+        The positions of the points
+
+    """
+    import numpy as np
+
+    rng = np.random.RandomState(seed)
+    positions = rng.uniform(0.0, boxsize, (npts, 3))
+    return positions.astype(dtype)
+
+
+def clustered_catalog(npts, boxsize, seed=42, dtype='f8',
+                      nclusters=None, cluster_radius=None,
+                      cluster_fraction=0.8):
+    """
+    Returns ``npts`` points within a periodic cube of side ``boxsize``,
+    with a fraction ``cluster_fraction`` of the points in Gaussian clusters
+    (a Neyman-Scott process) and the rest distributed uniformly.
+
+    The clustered points produce the over-dense cells, and the uneven
+    amount of work per cell, that a uniform catalog does not.
+
+    Parameters
+    -----------
+    npts : integer
+        Number of points
+
+    boxsize : double
+        Side-length of the cube
+
+    seed : integer, default 42
+        Seed for the random number generator
+
+    dtype : numpy dtype, default 'f8'
+        Data-type of the returned positions
+
+    nclusters : integer, default None
+        Number of clusters. By default, there are ~100 points per cluster
+        (and at least one cluster)
+
+    cluster_radius : double, default None
+        The standard deviation of the positions around the center of
+        every cluster. Default is ``boxsize/100``
+
+    cluster_fraction : double, default 0.8
+        Fraction of the points within the clusters
+
+    Returns
+    --------
+    positions : array, shape (npts, 3)
+        The positions of the points
+
+    """
+    import numpy as np
+
+    if cluster_fraction < 0.0 or cluster_fraction > 1.0:
+        msg = "The fraction of clustered points must be within [0, 1]. "\
+              "Found cluster_fraction = {0}".format(cluster_fraction)
+        raise ValueError(msg)
+
+    if cluster_radius is None:
+        cluster_radius = boxsize / 100.0
+
+    nclustered = int(npts * cluster_fraction)
+    if nclusters is None:
+        nclusters = max(nclustered // 100, 1)
+
+    rng = np.random.RandomState(seed)
+    positions = np.empty((npts, 3), dtype=np.float64)
+    centers = rng.uniform(0.0, boxsize, (nclusters, 3))
+    members = rng.randint(0, nclusters, nclustered)
+    positions[:nclustered] = centers[members] + \
+        rng.normal(0.0, cluster_radius, (nclustered, 3))
+    positions[nclustered:] = rng.uniform(0.0, boxsize,
+                                         (npts - nclustered, 3))
+
+    # Wrap the clusters straddling the edges back into the box
+    positions = np.remainder(positions, boxsize)
+    positions[positions >= boxsize] = 0.0
+    return positions.astype(dtype)
+
+
+def make_catalog(distribution, npts, boxsize, seed=42, dtype='f8'):
+    """
+    Returns a ``uniform`` or ``clustered`` catalog, by name.
+
+    Parameters
+    -----------
+    distribution : string
+        Either ``'uniform'`` or ``'clustered'``
+
+    npts, boxsize, seed, dtype :
+        See :py:func:`uniform_catalog`
+
+    Returns
+    --------
+    positions : array, shape (npts, 3)
+        The positions of the points
+
+    """
+    generators = {'uniform': uniform_catalog,
+                  'clustered': clustered_catalog}
+    try:
+        generator = generators[distribution]
+    except KeyError:
+        msg = "Valid distributions are {0}. Found distribution = {1}"\
+              .format(sorted(generators.keys()), distribution)
+        raise ValueError(msg)
+
+    return generator(npts, boxsize, seed=seed, dtype=dtype)
+
+
+def box_to_sky(positions, boxsize, distance=None):
+    """
+    Places a cube of points at a distance from an observer (at the origin),
+    and returns the ``(RA, DEC, CZ)`` of the points, in the format expected
+    by the mocks routines. ``CZ`` is the comoving distance to the point,
+    i.e., the mocks routines need to be called with
+    ``is_comoving_dist=True``.
+
+    Parameters
+    -----------
+    positions : array, shape (N, 3)
+        Positions within a cube of side ``boxsize``
+
+    boxsize : double
+        Side-length of the cube
+
+    distance : double, default None
+        Distance of the near corner of the cube from the observer (along
+        every axis). Default is ``boxsize``
+
+    Returns
+    --------
+    sky : array, shape (N, 3)
+        ``RA`` (in [0, 360) degrees), ``DEC`` (in [-90, 90] degrees) and
+        ``CZ`` of the points, with the same data-type as ``positions``
+
+    """
+    import numpy as np
+
+    if distance is None:
+        distance = boxsize
+
+    xyz = np.asarray(positions, dtype=np.float64) + distance
+    x, y, z = xyz[:, 0], xyz[:, 1], xyz[:, 2]
+    dist = np.sqrt(x * x + y * y + z * z)
+    sky = np.empty(xyz.shape, dtype=np.float64)
+    sky[:, 0] = np.remainder(np.degrees(np.arctan2(y, x)), 360.0)
+    sky[:, 1] = np.degrees(np.arcsin(z / dist))
+    sky[:, 2] = dist
+    return sky.astype(np.asarray(positions).dtype)
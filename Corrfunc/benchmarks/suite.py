@@ -0,0 +1,647 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for all of the theory and mocks routines.
+
+Every benchmark is run over a set of parameters (number of points, ``rmax``,
+number of bins, weights, precision, ``isa`` and ``nthreads``) on synthetic
+uniform and clustered catalogs. The timings are saved as JSON, and can be
+compared against a stored baseline to flag the regressions.
+"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+__author__ = ('Manodeep Sinha')
+__all__ = ('BENCHMARKS', 'DEFAULT_PARAMS', 'SWEEP_PARAMS', 'QUICK_PARAMS',
+           'parameter_sets', 'run_benchmarks', 'save_results',
+           'load_results', 'compare_results', 'result_key', )
+
+import sys
+import time
+from collections import OrderedDict
+
+try:
+    _timer = time.perf_counter
+except AttributeError:
+    _timer = time.time
+
+# Version of the JSON format of the results
+RESULTS_FORMAT = 1
+
+# The parameters of a single benchmark. ``rmax`` is also used as ``pimax``
+DEFAULT_PARAMS = OrderedDict([('distribution', 'uniform'),
+                              ('npts', 100000),
+                              ('boxsize', 420.0),
+                              ('rmax', 20.0),
+                              ('nbins', 15),
+                              ('weights', False),
+                              ('precision', 'double'),
+                              ('isa', 'fastest'),
+                              ('nthreads', 1)])
+
+
+def _default_nthreads():
+    import multiprocessing
+    max_threads = multiprocessing.cpu_count()
+    nthreads = [1]
+    while 2 * nthreads[-1] <= max_threads:
+        nthreads.append(2 * nthreads[-1])
+    if nthreads[-1] != max_threads:
+        nthreads.append(max_threads)
+    return nthreads
+
+
+# The values of every parameter that are swept over
+SWEEP_PARAMS = OrderedDict([('distribution', ['uniform', 'clustered']),
+                            ('npts', [10000, 100000, 1000000]),
+                            ('rmax', [5.0, 10.0, 20.0, 40.0, 80.0]),
+                            ('nbins', [5, 15, 30, 60]),
+                            ('weights', [False, True]),
+                            ('precision', ['double', 'float', 'mixed']),
+                            ('isa', ['fastest', 'avx', 'sse42',
+                                     'fallback']),
+                            ('nthreads', _default_nthreads())])
+
+# A smaller sweep, that finishes within a few minutes
+QUICK_PARAMS = OrderedDict([('distribution', ['uniform', 'clustered']),
+                            ('npts', [10000, 50000]),
+                            ('rmax', [10.0, 20.0]),
+                            ('nbins', [15]),
+                            ('weights', [False, True]),
+                            ('precision', ['double', 'float']),
+                            ('isa', ['fastest', 'fallback']),
+                            ('nthreads', [1])])
+
+
+def _rbins(params):
+    import numpy as np
+    return np.logspace(np.log10(0.1), np.log10(params['rmax']),
+                       params['nbins'] + 1)
+
+
+def _weight_kwargs(name, params, data, suffix='1'):
+    if not params['weights']:
+        return dict()
+    key = 'weights' if name in ('wp', 'xi') else 'weights' + suffix
+    return {key: data['weights'], 'weight_type': 'pair_product'}
+
+
+def _precision_kwargs(params):
+    if params['precision'] == 'mixed':
+        return dict(mixed_precision=True)
+    return dict()
+
+
+def _run_DD(params, data):
+    from Corrfunc.theory import DD
+    return DD(1, params['nthreads'], _rbins(params),
+              positions1=data['positions'], periodic=True,
+              boxsize=params['boxsize'], isa=params['isa'],
+              c_api_timer=True, **dict(_weight_kwargs('DD', params, data),
+                                       **_precision_kwargs(params)))
+
+
+def _run_DDrppi(params, data):
+    from Corrfunc.theory import DDrppi
+    return DDrppi(1, params['nthreads'], params['rmax'], _rbins(params),
+                  positions1=data['positions'], periodic=True,
+                  boxsize=params['boxsize'], isa=params['isa'],
+                  c_api_timer=True,
+                  **dict(_weight_kwargs('DDrppi', params, data),
+                         **_precision_kwargs(params)))
+
+
+def _run_DDsmu(params, data):
+    from Corrfunc.theory import DDsmu
+    return DDsmu(1, params['nthreads'], _rbins(params), 1.0, 10,
+                 positions1=data['positions'], periodic=True,
+                 boxsize=params['boxsize'], isa=params['isa'],
+                 c_api_timer=True,
+                 **dict(_weight_kwargs('DDsmu', params, data),
+                        **_precision_kwargs(params)))
+
+
+def _run_wp(params, data):
+    from Corrfunc.theory import wp
+    return wp(params['boxsize'], params['rmax'], params['nthreads'],
+              _rbins(params), positions=data['positions'],
+              isa=params['isa'], c_api_timer=True,
+              **dict(_weight_kwargs('wp', params, data),
+                     **_precision_kwargs(params)))
+
+
+def _run_xi(params, data):
+    from Corrfunc.theory import xi
+    return xi(params['boxsize'], params['nthreads'], _rbins(params),
+              positions=data['positions'], isa=params['isa'],
+              c_api_timer=True,
+              **dict(_weight_kwargs('xi', params, data),
+                     **_precision_kwargs(params)))
+
+
+def _nspheres(params):
+    # At most 10000 spheres, that fill at most half the volume
+    import numpy as np
+    sphere_volume = 4.0 / 3.0 * np.pi * params['rmax'] ** 3
+    return int(max(min(10000, 0.5 * params['boxsize'] ** 3 / sphere_volume),
+                   1))
+
+
+def _run_vpf(params, data):
+    from Corrfunc.theory import vpf
+    return vpf(params['rmax'], params['nbins'], _nspheres(params), 6, 42,
+               positions=data['positions'], periodic=True,
+               boxsize=params['boxsize'], isa=params['isa'],
+               c_api_timer=True)
+
+
+def _run_DDrppi_mocks(params, data):
+    from Corrfunc.mocks import DDrppi_mocks
+    return DDrppi_mocks(1, 1, params['nthreads'], params['rmax'],
+                        _rbins(params), positions1=data['sky'],
+                        is_comoving_dist=True, isa=params['isa'],
+                        c_api_timer=True,
+                        **_weight_kwargs('DDrppi_mocks', params, data))
+
+
+def _run_DDsmu_mocks(params, data):
+    from Corrfunc.mocks import DDsmu_mocks
+    return DDsmu_mocks(1, 1, params['nthreads'], 1.0, 10, _rbins(params),
+                       positions1=data['sky'], is_comoving_dist=True,
+                       isa=params['isa'], c_api_timer=True,
+                       **_weight_kwargs('DDsmu_mocks', params, data))
+
+
+def _run_DDtheta_mocks(params, data):
+    import numpy as np
+    from Corrfunc.mocks import DDtheta_mocks
+
+    # Angular bins that subtend the same separations (as the other
+    # routines) at the mean distance of the points
+    thetabins = np.degrees(_rbins(params) / data['mean_distance'])
+    return DDtheta_mocks(1, params['nthreads'], thetabins,
+                         positions1=data['sky'][:, :2], isa=params['isa'],
+                         c_api_timer=True,
+                         **_weight_kwargs('DDtheta_mocks', params, data))
+
+
+def _run_vpf_mocks(params, data):
+    import numpy as np
+    from Corrfunc.mocks import vpf_mocks
+
+    # Spheres with fewer randoms than a 1-sigma deviation from the mean
+    # are not entirely within the footprint (as in mocks/vpf/vpf_mocks.c)
+    nrand = len(data['rand_sky'])
+    expected = nrand * 4.0 / 3.0 * np.pi * params['rmax'] ** 3 / \
+        params['boxsize'] ** 3
+    threshold_ngb = max(int(expected - np.sqrt(expected)), 1)
+    return vpf_mocks(params['rmax'], params['nbins'], _nspheres(params), 6,
+                     threshold_ngb, data['centers_file'], 1,
+                     positions=data['sky'], rand_positions=data['rand_sky'],
+                     is_comoving_dist=True, isa=params['isa'],
+                     c_api_timer=True)
+
+
+# Every benchmark, with the values of the parameters that it supports.
+# ``None`` means that every value is supported; parameters that are not
+# listed can only take their default value
+BENCHMARKS = OrderedDict([
+    ('DD', (_run_DD, dict(weights=None, precision=None, nthreads=None))),
+    ('DDrppi', (_run_DDrppi, dict(weights=None, precision=None,
+                                  nthreads=None))),
+    ('DDsmu', (_run_DDsmu, dict(weights=None, precision=None,
+                                nthreads=None))),
+    ('wp', (_run_wp, dict(weights=None, precision=None, nthreads=None))),
+    ('xi', (_run_xi, dict(weights=None, precision=None, nthreads=None))),
+    ('vpf', (_run_vpf, dict(precision=['double', 'float']))),
+    ('DDrppi_mocks', (_run_DDrppi_mocks,
+                      dict(weights=None, precision=['double', 'float'],
+                           nthreads=None))),
+    ('DDsmu_mocks', (_run_DDsmu_mocks,
+                     dict(weights=None, precision=['double', 'float'],
+                          nthreads=None))),
+    ('DDtheta_mocks', (_run_DDtheta_mocks,
+                       dict(weights=None, precision=['double', 'float'],
+                            nthreads=None))),
+    ('vpf_mocks', (_run_vpf_mocks, dict(precision=['double', 'float']))),
+])
+
+# Parameters that every benchmark supports
+_COMMON_PARAMS = ('distribution', 'npts', 'boxsize', 'rmax', 'nbins', 'isa')
+
+
+def _supports(name, params):
+    supported = BENCHMARKS[name][1]
+    for key, value in params.items():
+        if key in _COMMON_PARAMS:
+            continue
+        if key not in supported:
+            if value != DEFAULT_PARAMS[key]:
+                return False
+        elif supported[key] is not None and value not in supported[key]:
+            return False
+
+    return True
+
+
+def parameter_sets(sweep='axes', params=None, defaults=None):
+    """
+    Returns the list of parameters to benchmark.
+
+    Parameters
+    -----------
+    sweep : string, default 'axes'
+        With ``'axes'``, every parameter is swept over its values while
+        all the other parameters are held at their default values (for
+        every ``distribution``), or at their first value if the default
+        is not swept over. With ``'grid'``, every combination of the
+        values is returned.
+
+    params : dictionary, default None
+        The values of the parameters to sweep over. Missing parameters take
+        their values from :py:data:`SWEEP_PARAMS`
+
+    defaults : dictionary, default None
+        The default values of the parameters. Missing parameters take
+        their values from :py:data:`DEFAULT_PARAMS`
+
+    Returns
+    --------
+    param_sets : list of dictionaries
+        The unique sets of parameters, in the order that they are run
+
+    """
+    import itertools
+
+    sweep_params = OrderedDict(SWEEP_PARAMS)
+    if params is not None:
+        for key, values in params.items():
+            if key not in DEFAULT_PARAMS:
+                msg = "Valid parameters are {0}. Found parameter = {1}"\
+                      .format(list(DEFAULT_PARAMS.keys()), key)
+                raise ValueError(msg)
+            sweep_params[key] = list(values)
+
+    default_params = OrderedDict(DEFAULT_PARAMS)
+    if defaults is not None:
+        default_params.update(defaults)
+
+    if sweep == 'grid':
+        keys = list(sweep_params.keys())
+        combinations = [OrderedDict(zip(keys, values)) for values in
+                        itertools.product(*sweep_params.values())]
+        param_sets = []
+        for combination in combinations:
+            p = OrderedDict(default_params)
+            p.update(combination)
+            param_sets.append(p)
+    elif sweep == 'axes':
+        # Parameters whose default is not one of the swept values are held
+        # at their first value instead
+        for key, values in sweep_params.items():
+            if default_params[key] not in values:
+                default_params[key] = values[0]
+
+        param_sets = []
+        for distribution in sweep_params['distribution']:
+            base = OrderedDict(default_params)
+            base['distribution'] = distribution
+            param_sets.append(base)
+            for key, values in sweep_params.items():
+                if key == 'distribution':
+                    continue
+                for value in values:
+                    p = OrderedDict(base)
+                    p[key] = value
+                    param_sets.append(p)
+    else:
+        msg = "Valid sweeps are 'axes' and 'grid'. Found sweep = {0}"\
+              .format(sweep)
+        raise ValueError(msg)
+
+    unique = []
+    seen = set()
+    for p in param_sets:
+        key = _params_key(p)
+        if key not in seen:
+            seen.add(key)
+            unique.append(p)
+
+    return unique
+
+
+def _params_key(params):
+    return ', '.join('{0}={1}'.format(k, params[k])
+                     for k in sorted(params.keys()))
+
+
+def result_key(result):
+    """
+    Returns the string that identifies a benchmark result, i.e., the name of
+    the benchmark and the values of all of its parameters.
+    """
+    return '{0}({1})'.format(result['benchmark'],
+                             _params_key(result['params']))
+
+
+def _make_data(params, seed, workdir, cache):
+    import os
+    import numpy as np
+    from .catalogs import make_catalog, box_to_sky
+
+    dtype = np.float32 if params['precision'] == 'float' else np.float64
+    key = (params['distribution'], params['npts'], params['boxsize'],
+           np.dtype(dtype).char, seed)
+    if key in cache:
+        return cache[key]
+
+    positions = make_catalog(params['distribution'], params['npts'],
+                             params['boxsize'], seed=seed, dtype=dtype)
+    rng = np.random.RandomState(seed + 1)
+    weights = rng.uniform(0.5, 1.5, params['npts']).astype(dtype)
+    sky = box_to_sky(positions, params['boxsize'])
+    rand = make_catalog('uniform', params['npts'], params['boxsize'],
+                        seed=seed + 2, dtype=dtype)
+    centers_file = os.path.join(workdir, 'centers_{0}_{1}_{2}.txt'.format(
+        *key[:2] + (key[3], )))
+    data = dict(positions=positions, weights=weights, sky=sky,
+                rand_sky=box_to_sky(rand, params['boxsize']),
+                mean_distance=float(np.mean(sky[:, 2])),
+                centers_file=centers_file)
+
+    # Only keep the catalogs for the current set of points
+    cache.clear()
+    cache[key] = data
+    return data
+
+
+def _environment():
+    import platform
+    import multiprocessing
+    import datetime
+    import numpy as np
+    import Corrfunc
+
+    return OrderedDict([
+        ('corrfunc_version', Corrfunc.__version__),
+        ('python_version', platform.python_version()),
+        ('numpy_version', np.__version__),
+        ('machine', platform.machine()),
+        ('processor', platform.processor()),
+        ('system', platform.system()),
+        ('node', platform.node()),
+        ('cpu_count', multiprocessing.cpu_count()),
+        ('date', datetime.datetime.utcnow().isoformat())])
+
+
+def run_benchmarks(benchmarks=None, param_sets=None, nrepeats=3, seed=42,
+                   verbose=True):
+    """
+    Runs the benchmarks, and returns the timings.
+
+    Every benchmark is called once (to include any one-time setup costs,
+    e.g., writing the ``centers_file`` for ``vpf_mocks``) before the
+    ``nrepeats`` timed calls.
+
+    Parameters
+    -----------
+    benchmarks : list of strings, default None
+        Names of the benchmarks to run (keys of :py:data:`BENCHMARKS`).
+        Default is to run all of them
+
+    param_sets : list of dictionaries, default None
+        The parameters to run every benchmark with. Default is
+        ``parameter_sets()``. A benchmark is skipped for the parameters
+        that it does not support (e.g., weights for ``vpf``)
+
+    nrepeats : integer, default 3
+        Number of timed calls for every benchmark
+
+    seed : integer, default 42
+        Seed for the synthetic catalogs
+
+    verbose : boolean, default True
+        Print the timings as the benchmarks are run
+
+    Returns
+    --------
+    results : dictionary
+        With keys ``format``, ``environment`` and ``results``. Every item of
+        ``results`` is a dictionary with the ``benchmark``, the ``params``,
+        the wall-clock ``times`` and ``api_times`` (time spent within the C
+        library) of every call, their ``min`` and ``median``, and the
+        ``status`` (``'ok'``, or ``'failed'``, with the reason in ``error``)
+
+    """
+    import shutil
+    import tempfile
+    import numpy as np
+
+    if benchmarks is None:
+        benchmarks = list(BENCHMARKS.keys())
+    else:
+        for name in benchmarks:
+            if name not in BENCHMARKS:
+                msg = "Valid benchmarks are: {0}\nFound benchmark = {1}"\
+                      .format(list(BENCHMARKS.keys()), name)
+                raise ValueError(msg)
+
+    if param_sets is None:
+        param_sets = parameter_sets()
+
+    if nrepeats < 1:
+        msg = "Number of repeats must be at least 1. Found nrepeats = {0}"\
+              .format(nrepeats)
+        raise ValueError(msg)
+
+    if verbose:
+        print("{0:14s} {1:>10s} {2:>9s} {3:>7s} {4:>5s} {5:>7s} {6:>9s} "
+              "{7:>8s} {8:>4s} {9:>12s} {10:>12s}".format(
+                  'benchmark', 'distrib', 'npts', 'rmax', 'nbins', 'weights',
+                  'precision', 'isa', 'nthr', 'min [s]', 'median [s]'))
+
+    workdir = tempfile.mkdtemp(prefix='corrfunc_benchmarks_')
+    cache = dict()
+    results = []
+    try:
+        for params in param_sets:
+            for name in benchmarks:
+                if not _supports(name, params):
+                    continue
+
+                run = BENCHMARKS[name][0]
+                result = OrderedDict([('benchmark', name),
+                                      ('params', OrderedDict(params))])
+                data = _make_data(params, seed, workdir, cache)
+                try:
+                    run(params, data)
+                    times = np.empty(nrepeats)
+                    api_times = np.empty(nrepeats)
+                    for i in range(nrepeats):
+                        t0 = _timer()
+                        _, api_times[i] = run(params, data)
+                        times[i] = _timer() - t0
+                except (ImportError, RuntimeError, ValueError,
+                        TypeError) as e:
+                    result['status'] = 'failed'
+                    result['error'] = '{0}: {1}'.format(type(e).__name__, e)
+                    results.append(result)
+                    if verbose:
+                        print("{0:14s} failed with {1}".format(
+                            name, result['error']))
+                    continue
+
+                result['status'] = 'ok'
+                result['times'] = times.tolist()
+                result['api_times'] = api_times.tolist()
+                result['min'] = float(times.min())
+                result['median'] = float(np.median(times))
+                results.append(result)
+                if verbose:
+                    print("{0:14s} {1:>10s} {2:9d} {3:7.2f} {4:5d} {5:>7s} "
+                          "{6:>9s} {7:>8s} {8:4d} {9:12.4f} {10:12.4f}"
+                          .format(name, params['distribution'],
+                                  params['npts'], params['rmax'],
+                                  params['nbins'], str(params['weights']),
+                                  params['precision'], params['isa'],
+                                  params['nthreads'], result['min'],
+                                  result['median']))
+                    sys.stdout.flush()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return OrderedDict([('format', RESULTS_FORMAT),
+                        ('environment', _environment()),
+                        ('nrepeats', nrepeats),
+                        ('seed', seed),
+                        ('results', results)])
+
+
+def save_results(results, filename):
+    """
+    Writes the results of :py:func:`run_benchmarks` to a JSON file.
+    """
+    import json
+    with open(filename, 'w') as f:
+        json.dump(results, f, indent=1)
+        f.write('\n')
+
+
+def load_results(filename):
+    """
+    Reads the results of :py:func:`run_benchmarks` from a JSON file.
+    """
+    import json
+    with open(filename, 'r') as f:
+        results = json.load(f, object_pairs_hook=OrderedDict)
+
+    if results.get('format') != RESULTS_FORMAT:
+        msg = "Benchmark results in file '{0}' have format = {1}. Expected "\
+              "format = {2}".format(filename, results.get('format'),
+                                    RESULTS_FORMAT)
+        raise ValueError(msg)
+
+    return results
+
+
+def compare_results(results, baseline, factor=1.1, statistic='min',
+                    verbose=True):
+    """
+    Compares the timings against a baseline, and flags the benchmarks that
+    became slower (or faster) by more than ``factor``.
+
+    Parameters
+    -----------
+    results : dictionary
+        The results of :py:func:`run_benchmarks` (or
+        :py:func:`load_results`)
+
+    baseline : dictionary
+        The baseline results, in the same format
+
+    factor : double, default 1.1
+        A benchmark is a ``regression`` if it is slower than the baseline
+        by more than this factor, and an ``improvement`` if it is faster by
+        more than this factor
+
+    statistic : string, default 'min'
+        The timing that is compared, ``'min'`` or ``'median'``
+
+    verbose : boolean, default True
+        Print the benchmarks that changed
+
+    Returns
+    --------
+    comparison : list of dictionaries
+        One for every benchmark in either ``results`` or ``baseline``, with
+        the ``key`` of the benchmark, the ``baseline`` and ``current``
+        timings, their ``ratio`` and the ``status``: one of
+        ``'regression'``, ``'improvement'``, ``'unchanged'``, ``'failed'``
+        (did not run in ``results``), ``'new'`` (not in ``baseline``) or
+        ``'missing'`` (not in ``results``)
+
+    """
+    if factor <= 1.0:
+        msg = "Factor must be larger than 1. Found factor = {0}"\
+              .format(factor)
+        raise ValueError(msg)
+
+    if statistic not in ('min', 'median'):
+        msg = "Valid statistics are 'min' and 'median'. Found statistic "\
+              "= {0}".format(statistic)
+        raise ValueError(msg)
+
+    if verbose and results['environment'].get('node') != \
+       baseline['environment'].get('node'):
+        print("Warning: Comparing against a baseline from a different "
+              "machine ('{0}' vs '{1}')".format(
+                  results['environment'].get('node'),
+                  baseline['environment'].get('node')), file=sys.stderr)
+
+    current = OrderedDict((result_key(r), r) for r in results['results'])
+    previous = OrderedDict((result_key(r), r) for r in baseline['results'])
+
+    comparison = []
+    for key, r in current.items():
+        b = previous.get(key)
+        entry = OrderedDict([('key', key), ('baseline', None),
+                             ('current', None), ('ratio', None)])
+        if r['status'] == 'ok':
+            entry['current'] = r[statistic]
+
+        if b is not None and b['status'] == 'ok':
+            entry['baseline'] = b[statistic]
+
+        if entry['current'] is None:
+            entry['status'] = 'failed'
+        elif b is None or entry['baseline'] is None:
+            entry['status'] = 'new'
+        else:
+            entry['ratio'] = entry['current'] / entry['baseline'] \
+                if entry['baseline'] > 0 else float('inf')
+            if entry['ratio'] > factor:
+                entry['status'] = 'regression'
+            elif entry['ratio'] < 1.0 / factor:
+                entry['status'] = 'improvement'
+            else:
+                entry['status'] = 'unchanged'
+        comparison.append(entry)
+
+    for key in previous:
+        if key not in current:
+            comparison.append(OrderedDict([('key', key),
+                                           ('baseline', None),
+                                           ('current', None),
+                                           ('ratio', None),
+                                           ('status', 'missing')]))
+
+    if verbose:
+        for entry in comparison:
+            if entry['status'] in ('regression', 'improvement'):
+                print("{0:11s} {1:8.3f}x  {2}".format(
+                    entry['status'], entry['ratio'], entry['key']))
+            elif entry['status'] == 'failed':
+                print("{0:11s} {1:>9s}  {2}".format(entry['status'], '',
+                                                     entry['key']))
+
+    return comparison
@@ -0,0 +1,463 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+An on-disk cache for the results of the pair-counters.
+
+The cache is opt-in: it is used once ``enable_result_cache`` has been called,
+or when the ``CORRFUNC_RESULT_CACHE`` environment variable is set to a
+directory. Every call to a pair-counter in :py:mod:`Corrfunc.theory` and
+:py:mod:`Corrfunc.mocks` is then looked up by a content hash of the input
+arrays (positions, weights, velocities) and of all the other parameters that
+affect the result (the bins -- including the contents of a ``binfile`` --,
+``pimax``, ``periodic``, ``boxsize``, ``weight_type``, the output flags,
+etc). Only ``nthreads`` and ``verbose`` are left out of the key. A
+``grid_file`` can be very large, so it goes into the key by its path, size,
+modification time and header rather than by its contents. The arguments are
+hashed as passed, i.e., the same positions passed as an
+``(N, 3)`` array and as three columns are cached separately.
+
+The results are stored as one ``.npy`` file per call. The files are written
+to a temporary file and renamed into place, so several processes can share
+the same directory, and the least recently used files are removed when the
+total size goes above ``max_size``.
+
+Calls that time (or otherwise measure) the C library, e.g. with
+``c_api_timer=True``, and calls that reorder the input arrays
+(``permute_in_place=True``) are never cached.
+"""
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+import functools
+import sys
+
+__all__ = ['enable_result_cache', 'disable_result_cache',
+           'clear_result_cache', 'result_cache_dir', ]
+if sys.version_info[0] < 3:
+    __all__ = [n.encode('ascii') for n in __all__]
+
+# Bump whenever the layout of the key or of the stored results changes
+CACHE_FORMAT = 2
+
+# Default limit on the total size of the cached results (in bytes)
+DEFAULT_MAX_SIZE = 1 << 30
+
+# The pair-counters are called directly (no caching) if any of these are set
+_UNCACHEABLE_ARGUMENTS = ('c_api_timer', 'c_api_phase_timer', 'c_cell_timer',
+                          'c_perf_counters', 'c_api_phase_memory',
+                          'permute_in_place')
+
+# Do not change the result
+_IGNORED_ARGUMENTS = ('nthreads', 'verbose')
+
+# Names of files whose contents (rather than the name) go into the key
+_FILE_ARGUMENTS = ('binfile', 'centers_file', 'grid_file')
+
+# Large files that go into the key by their path, size, modification time and
+# first bytes (the header of a gridded catalog), rather than their contents
+_STAT_FILE_ARGUMENTS = ('grid_file', )
+_STAT_FILE_HEADER_BYTES = 256
+
+# Number of bytes of an array that are hashed in one go
+_HASH_CHUNK_BYTES = 1 << 24
+
+_TEMPORARY_PREFIX = '.tmp-'
+_SUFFIX = '.npy'
+
+_settings = dict(enabled=None, directory=None, max_size=None)
+
+
+class _Uncacheable(Exception):
+    pass
+
+
+def enable_result_cache(directory=None, max_size=DEFAULT_MAX_SIZE):
+    """
+    Caches the results of the pair-counters on disk.
+
+    Parameters
+    -----------
+
+    directory: string, optional
+        Directory for the cached results. Default is ``results`` within
+        :py:func:`Corrfunc.utils.default_cache_dir`. Created when the first
+        result is stored.
+
+    max_size: integer, default 1 GB
+        Maximum total size of the cached results (in bytes). The least
+        recently used results are removed beyond that.
+
+    Example
+    --------
+
+    >>> import tempfile
+    >>> import numpy as np
+    >>> from Corrfunc.cache import enable_result_cache, disable_result_cache
+    >>> from Corrfunc.theory.DD import DD
+    >>> enable_result_cache(tempfile.mkdtemp())
+    >>> np.random.seed(42)
+    >>> X, Y, Z = np.random.uniform(0, 100.0, (3, 1000))
+    >>> bins = np.linspace(1.0, 10.0, 5)
+    >>> first = DD(1, 2, bins, X, Y, Z, boxsize=100.0)
+    >>> second = DD(1, 4, bins, X, Y, Z, boxsize=100.0) # from the cache
+    >>> np.array_equal(first, second)
+    True
+    >>> disable_result_cache()
+
+    """
+    if max_size is None or max_size <= 0:
+        msg = "Error: The maximum size of the cache must be positive. "\
+              "Found max_size = {0}".format(max_size)
+        raise ValueError(msg)
+
+    _settings['enabled'] = True
+    _settings['directory'] = directory
+    _settings['max_size'] = int(max_size)
+
+
+def disable_result_cache():
+    """
+    Stops caching the results of the pair-counters (even if the
+    ``CORRFUNC_RESULT_CACHE`` environment variable is set). The cached
+    results are kept on disk.
+    """
+    _settings['enabled'] = False
+    _settings['directory'] = None
+    _settings['max_size'] = None
+
+
+def result_cache_dir():
+    """
+    Returns the directory of the result cache, or ``None`` if the results
+    are not being cached.
+    """
+    import os
+    from Corrfunc.utils import default_cache_dir
+
+    if _settings['enabled'] is None:
+        return os.environ.get('CORRFUNC_RESULT_CACHE') or None
+    if not _settings['enabled']:
+        return None
+
+    directory = _settings['directory']
+    if directory is None:
+        directory = os.path.join(default_cache_dir(), 'results')
+    return directory
+
+
+def _max_size():
+    import os
+
+    if _settings['max_size'] is not None:
+        return _settings['max_size']
+    max_size = os.environ.get('CORRFUNC_RESULT_CACHE_SIZE')
+    if not max_size:
+        return DEFAULT_MAX_SIZE
+    try:
+        return int(float(max_size))
+    except ValueError:
+        msg = "Error: Could not parse CORRFUNC_RESULT_CACHE_SIZE = `{0}` "\
+              "as a number of bytes".format(max_size)
+        raise ValueError(msg)
+
+
+def clear_result_cache(directory=None):
+    """
+    Removes all the cached results from ``directory`` (default, the current
+    directory of the result cache).
+    """
+    if directory is None:
+        directory = result_cache_dir()
+    if directory is None:
+        return
+
+    for path, _, _ in _list_entries(directory, temporary=True):
+        _remove(path)
+
+
+def _hash_array(h, array):
+    """
+    Adds the dtype, the shape and the contents of ``array`` to the hash,
+    without copying more than a chunk of a strided array at a time
+    """
+    import numpy as np
+
+    array = np.asanyarray(array)
+    if array.dtype.hasobject:
+        raise _Uncacheable()
+
+    h.update('{0}{1}'.format(array.dtype.str, array.shape).encode('utf-8'))
+    if array.dtype.names is not None:
+        h.update(repr(array.dtype.descr).encode('utf-8'))
+    if array.size == 0:
+        return
+    if array.ndim == 0:
+        array = array.reshape(1)
+
+    if array.flags.c_contiguous:
+        h.update(array.reshape(-1).view(np.uint8))
+        return
+
+    rows = max(1, _HASH_CHUNK_BYTES // max(1, array[0].nbytes))
+    for start in range(0, len(array), rows):
+        chunk = np.ascontiguousarray(array[start:start + rows])
+        h.update(chunk.reshape(-1).view(np.uint8))
+
+
+def _hash_value(h, name, value):
+    import os
+
+    h.update('\0{0}='.format(name).encode('utf-8'))
+    try:
+        string_types = (basestring, )
+    except NameError:
+        string_types = (str, bytes)
+
+    if name in _FILE_ARGUMENTS and isinstance(value, string_types):
+        if not os.path.isfile(value):
+            # The call will either fail, or write the file
+            raise _Uncacheable()
+        if name in _STAT_FILE_ARGUMENTS:
+            st = os.stat(value)
+            stat = 'stat:{0}:{1}:{2!r}:'.format(os.path.abspath(value),
+                                                st.st_size, st.st_mtime)
+            h.update(stat.encode('utf-8'))
+            with open(value, 'rb') as f:
+                h.update(f.read(_STAT_FILE_HEADER_BYTES))
+            return
+
+        h.update(b'file:')
+        with open(value, 'rb') as f:
+            for block in iter(lambda: f.read(_HASH_CHUNK_BYTES), b''):
+                h.update(block)
+    elif value is None:
+        h.update(b'None')
+    elif isinstance(value, bool):
+        h.update('bool:{0}'.format(value).encode('utf-8'))
+    elif isinstance(value, string_types):
+        if not isinstance(value, bytes):
+            value = value.encode('utf-8')
+        h.update(b'str:' + value)
+    elif isinstance(value, float):
+        h.update('float:{0!r}'.format(value).encode('utf-8'))
+    elif isinstance(value, int) or type(value).__name__ == 'long':
+        h.update('int:{0}'.format(value).encode('utf-8'))
+    else:
+        h.update(b'array:')
+        _hash_array(h, value)
+
+
+def result_cache_key(routine, arguments):
+    """
+    Returns the key of a call to the pair-counter ``routine`` with the
+    (complete) dictionary of ``arguments``, or ``None`` if the call can not
+    be cached
+    """
+    import hashlib
+    from Corrfunc import __version__
+
+    for name in _UNCACHEABLE_ARGUMENTS:
+        if arguments.get(name):
+            return None
+
+    # sha1 is fast (and hardware accelerated on most recent cpus), and
+    # available with python2. The key is not meant to be secure
+    h = hashlib.sha1()
+    h.update('{0}:{1}:{2}'.format(CACHE_FORMAT, __version__, routine)
+             .encode('utf-8'))
+    try:
+        for name in sorted(arguments):
+            if name in _IGNORED_ARGUMENTS:
+                continue
+            _hash_value(h, name, arguments[name])
+    except _Uncacheable:
+        return None
+
+    return '{0}-{1}'.format(routine, h.hexdigest())
+
+
+def _list_entries(directory, temporary=False):
+    """
+    Returns (path, last use, size) for all the cached results in
+    ``directory``, and (with ``temporary``) for the partially written ones
+    """
+    import os
+
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return []
+
+    entries = []
+    for name in names:
+        if not name.endswith(_SUFFIX):
+            continue
+        if name.startswith(_TEMPORARY_PREFIX) and not temporary:
+            continue
+        path = os.path.join(directory, name)
+        try:
+            st = os.stat(path)
+        except OSError:
+            # Removed by another process in the meantime
+            continue
+        entries.append((path, st.st_mtime, st.st_size))
+
+    return entries
+
+
+def _remove(path):
+    import os
+
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _load(directory, key):
+    import os
+    import numpy as np
+
+    path = os.path.join(directory, key + _SUFFIX)
+    try:
+        with open(path, 'rb') as f:
+            results = np.load(f, allow_pickle=False)
+    except (IOError, OSError):
+        return None
+    except ValueError:
+        # Not written by this version of numpy (or damaged) -> recount
+        _remove(path)
+        return None
+
+    # The modification time marks the last use, for the LRU eviction
+    try:
+        os.utime(path, None)
+    except OSError:
+        pass
+
+    return results
+
+
+def _evict(directory, max_size):
+    """
+    Removes the least recently used results until the rest fit within
+    ``max_size``. Temporary files left behind by crashed processes are
+    removed after a day
+    """
+    import os
+    import time
+
+    entries = _list_entries(directory, temporary=True)
+    stale = time.time() - 86400.0
+    total = 0
+    results = []
+    for path, last_use, size in entries:
+        if os.path.basename(path).startswith(_TEMPORARY_PREFIX):
+            if last_use < stale:
+                _remove(path)
+            continue
+        total += size
+        results.append((last_use, path, size))
+
+    results.sort()
+    for _, path, size in results:
+        if total <= max_size:
+            break
+        _remove(path)
+        total -= size
+
+
+def _store(directory, key, results, max_size):
+    """
+    Writes ``results`` atomically: into a temporary file within
+    ``directory`` that is then renamed to the name of the key
+    """
+    import os
+    import tempfile
+    from warnings import warn
+    import numpy as np
+
+    if not isinstance(results, np.ndarray) or results.dtype.hasobject or \
+       results.nbytes > max_size:
+        return
+
+    try:
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+    except OSError:
+        # Created by another process in the meantime
+        if not os.path.isdir(directory):
+            return
+
+    tmpname = None
+    try:
+        fd, tmpname = tempfile.mkstemp(dir=directory, suffix=_SUFFIX,
+                                       prefix=_TEMPORARY_PREFIX)
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, results, allow_pickle=False)
+        replace = getattr(os, 'replace', os.rename)
+        replace(tmpname, os.path.join(directory, key + _SUFFIX))
+        tmpname = None
+    except (IOError, OSError) as e:
+        warn("Could not store the pair counts in the result cache "
+             "{0}: {1}".format(directory, e))
+    finally:
+        if tmpname is not None:
+            _remove(tmpname)
+
+    _evict(directory, max_size)
+
+
+def _call_arguments(func, args, kwargs):
+    """
+    Returns all the arguments of ``func(*args, **kwargs)`` (including the
+    defaults) as a dictionary
+    """
+    import inspect
+
+    try:
+        signature = inspect.signature(func)
+    except AttributeError:
+        return inspect.getcallargs(func, *args, **kwargs)
+
+    bound = signature.bind(*args, **kwargs)
+    arguments = dict((p.name, p.default)
+                     for p in signature.parameters.values()
+                     if p.default is not p.empty)
+    arguments.update(bound.arguments)
+    return arguments
+
+
+def cached_counter(routine):
+    """
+    Decorator for the python wrappers of the pair-counters: the results are
+    looked up in (and stored into) the result cache, if it is enabled
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            directory = result_cache_dir()
+            if directory is None:
+                return func(*args, **kwargs)
+
+            try:
+                arguments = _call_arguments(func, args, kwargs)
+            except TypeError:
+                # Let the pair-counter report the wrong arguments
+                return func(*args, **kwargs)
+
+            key = result_cache_key(routine, arguments)
+            if key is None:
+                return func(*args, **kwargs)
+
+            results = _load(directory, key)
+            if results is not None:
+                return results
+
+            results = func(*args, **kwargs)
+            _store(directory, key, results, _max_size())
+            return results
+
+        return wrapper
+
+    return decorator
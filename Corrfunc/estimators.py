@@ -0,0 +1,986 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Estimates of the resources needed by the pair-counters, before calling them.
+
+The estimates follow the same steps as the C code: the lattice is set up
+with the logic in ``get_binsize`` (and the default bin refine factors, the
+cap on the number of cells for small catalogs and the boost of the refine
+factors for inefficient lattices), the particles are assumed to be uniformly
+(Poisson) distributed over the cells, and the neighbouring cells are
+assigned with the same stencil of ``(2*refine + 1)`` cells per dimension.
+"""
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+from bisect import bisect_left
+import math
+import sys
+
+__all__ = ['estimate_memory', 'estimate_runtime', 'calibrate_runtime', ]
+if sys.version_info[0] < 3:
+    __all__ = [n.encode('ascii') for n in __all__]
+
+# Mirrors the constants in the C code (utils/defs.h, utils/gridlink_impl.c.src,
+# utils/gridlink_mocks_impl.c.src and utils/cellarray_DOUBLE.h)
+NLATMAX = 100
+BOOST_CELL_THRESH = 10
+BOOST_NUMPART_THRESH = 250
+BOOST_BIN_REF = 1
+GRIDLINK_ALIGNMENT = 64
+MOCKS_MEMORY_INCREASE_FAC = 1.1
+
+# sizeof the cells (for MAX_NUM_WEIGHTS = 10, on a 64-bit machine)
+_THEORY_CELL_BYTES = {8: 256, 4: 248}
+_MOCKS_CELL_BYTES = 144
+_POINTER_BYTES = 8
+
+_THEORY_ROUTINES = ('DD', 'DDrppi', 'DDsmu', 'wp', 'xi')
+_MOCKS_ROUTINES = ('DDrppi_mocks', 'DDsmu_mocks')
+
+
+def _malloc_bytes(nbytes):
+    """
+    Size of the (glibc) malloc chunk that holds ``nbytes``
+    """
+    return max(32, ((nbytes + 8 + 15) // 16) * 16)
+
+
+def _get_binsize(diff, rmax, refine_factor, max_cells, periodic):
+    """
+    Number of cells along one dimension, as in ``get_binsize_DOUBLE``
+    """
+    nmesh = max(1, int(refine_factor * diff / rmax))
+    if periodic and nmesh < 2 * refine_factor + 1:
+        msg = "Error: nlattice = {0} is so small that with periodic "\
+              "wrapping the same cells will be counted twice. Please reduce "\
+              "rmax = {1} to be a smaller fraction of the particle "\
+              "distribution region = {2}".format(nmesh, rmax, diff)
+        raise ValueError(msg)
+
+    if nmesh > max_cells:
+        nmesh = 2 * refine_factor + 1 \
+            if periodic and max_cells < 2 * refine_factor + 1 else max_cells
+
+    return nmesh
+
+
+def _get_max_cells_for_particles(max_cells, N):
+    """
+    Cap on the number of cells for small catalogs, as in
+    ``get_max_cells_for_particles``
+    """
+    ncells = max(1, int(N ** (1.0 / 3.0)))
+    # cbrt might be just below an integer for perfect cubes
+    if (ncells + 1) ** 3 <= N:
+        ncells += 1
+    return min(ncells, max_cells)
+
+
+def _allocation_sizes(expected_n, increase_fac, nmax):
+    """
+    Sizes that the arrays of a cell are (re-)allocated to while the particles
+    are assigned to the cells, up to (at least) ``nmax`` particles
+    """
+    sizes = [expected_n]
+    while sizes[-1] < nmax:
+        nallocated = sizes[-1]
+        n = int(nallocated * increase_fac)
+        sizes.append(n if n > nallocated else nallocated + 1)
+    return sizes
+
+
+def _poisson_expectation(lam, func):
+    """
+    Expectation of ``func(n)`` for ``n`` drawn from a Poisson distribution
+    with mean ``lam``
+    """
+    if lam <= 0:
+        return func(0)
+
+    width = 12.0 * math.sqrt(lam) + 20
+    nlo = max(0, int(lam - width))
+    nhi = int(lam + width) + 1
+    log_lam = math.log(lam)
+    total = 0.0
+    for n in range(nlo, nhi + 1):
+        pmf = math.exp(n * log_lam - lam - math.lgamma(n + 1))
+        total += pmf * func(n)
+
+    return total
+
+
+def _lattice_bytes(N, ncells, nweights, element_size, mocks):
+    """
+    Memory used by one lattice of ``N`` particles in ``ncells`` cells. Returns
+    the memory while the particles are being assigned to the cells, the memory
+    of the finished lattice, and the number of non-empty cells
+    """
+    lam = N / ncells
+    nonempty = ncells * (1.0 - math.exp(-lam))
+    if not mocks:
+        # The particles are counted first, and then every cell is carved
+        # (padded to a multiple of the SIMD width, see
+        # GRIDLINK_PADDED_NELEMENTS_DOUBLE, and aligned) out of one block
+        narrays = 3 + nweights
+        nvec = 32 // element_size
+
+        def padded(n):
+            npadded = ((n + 2 * nvec - 2) // nvec) * nvec
+            nbytes = npadded * element_size
+            return narrays * (((nbytes + GRIDLINK_ALIGNMENT - 1) //
+                               GRIDLINK_ALIGNMENT) * GRIDLINK_ALIGNMENT)
+
+        final = ncells * (_THEORY_CELL_BYTES[element_size] +
+                          _poisson_expectation(lam, padded))
+        return final, final, nonempty
+
+    # x, y, z and cz
+    increase_fac = MOCKS_MEMORY_INCREASE_FAC
+    narrays = 4 + nweights
+    expected_n = max(2, int(lam * increase_fac))
+    nmax = int(lam + 12.0 * math.sqrt(lam) + 21)
+    sizes = _allocation_sizes(expected_n, increase_fac, nmax)
+
+    def gridded(n):
+        nallocated = sizes[min(bisect_left(sizes, n), len(sizes) - 1)]
+        return narrays * _malloc_bytes(nallocated * element_size)
+
+    structs = ncells * (_MOCKS_CELL_BYTES + 8)  # + nallocated
+    gridding = structs + ncells * _poisson_expectation(lam, gridded)
+    final = gridding - ncells * 8
+    return gridding, final, nonempty
+
+
+def _element_size(precision):
+    """
+    sizeof(DOUBLE) for the precision of the input arrays
+    """
+    precision = precision.lower() if hasattr(precision, 'lower') \
+        else precision
+    if precision not in ('double', 'float'):
+        msg = "Error: precision must be 'double' or 'float'. Found {0}"\
+              .format(precision)
+        raise ValueError(msg)
+    return 8 if precision == 'double' else 4
+
+
+def _total_nbins(routine, bins, pimax, nmu_bins):
+    """
+    Number of bins in the histograms of the pair-counter
+    """
+    nbins = max(len(bins) - 1, 1) if bins is not None else 1
+    if routine in ('DDrppi', 'DDrppi_mocks'):
+        nbins *= max(int(pimax), 1)
+    elif routine in ('DDsmu', 'DDsmu_mocks'):
+        nbins *= nmu_bins
+    return nbins
+
+
+def _setup_lattice(what, routine, N1, N2, bins, rmax, boxsize, pimax, mu_max,
+                   periodic, refine_factors, max_cells_per_dim):
+    """
+    Sets up the lattice in the same way as the pair-counter ``routine``: the
+    search sizes along every axis, the default bin refine factors, the cap on
+    the number of cells for small catalogs and the boost of the refine
+    factors for inefficient lattices. Returns a dictionary with the lattice
+    (before and after the boost) and the (updated) inputs
+    """
+    if routine not in _THEORY_ROUTINES + _MOCKS_ROUTINES:
+        msg = "Error: {0} can only be estimated for {1}. Found routine = "\
+              "{2}".format(what, ', '.join(_THEORY_ROUTINES + _MOCKS_ROUTINES),
+                           routine)
+        raise ValueError(msg)
+
+    mocks = routine in _MOCKS_ROUTINES
+    if rmax is None:
+        if bins is None:
+            msg = "Error: Either the bins or rmax must be passed"
+            raise ValueError(msg)
+        rmax = max(bins)
+    if boxsize is None or boxsize <= 0 or rmax <= 0:
+        msg = "Error: Both boxsize = {0} and rmax = {1} must be positive"\
+              .format(boxsize, rmax)
+        raise ValueError(msg)
+    if routine in ('DDrppi', 'wp', 'DDrppi_mocks') and \
+       (pimax is None or pimax <= 0):
+        msg = "Error: pimax must be positive for {0}. Found pimax = {1}"\
+              .format(routine, pimax)
+        raise ValueError(msg)
+    if N1 < 1 or (N2 is not None and N2 < 1):
+        msg = "Error: The number of particles must be positive. Found "\
+              "N1 = {0} and N2 = {1}".format(N1, N2)
+        raise ValueError(msg)
+
+    if routine in ('wp', 'xi'):
+        N2 = None
+        periodic = True
+    if mocks:
+        periodic = False
+    autocorr = N2 is None
+
+    # Max. separations along every axis (the `search' sizes in the C code)
+    if routine in ('DDrppi', 'wp'):
+        search = (rmax, rmax, pimax)
+    elif routine == 'DDsmu':
+        search = (rmax, rmax, rmax * mu_max)
+    elif routine == 'DDrppi_mocks':
+        max_sep = math.sqrt(rmax * rmax + pimax * pimax)
+        search = (max_sep, max_sep, max_sep)
+    else:
+        search = (rmax, rmax, rmax)
+
+    refine = list(refine_factors)
+    if any(r < 1 for r in refine):
+        msg = "Error: The bin refine factors must be at least 1. Found {0}"\
+              .format(refine)
+        raise ValueError(msg)
+    if max_cells_per_dim <= 0:
+        max_cells_per_dim = NLATMAX
+
+    if routine == 'wp':
+        if rmax < 0.05 * boxsize:
+            refine[0] = refine[1] = 1
+        if pimax < 0.05 * boxsize:
+            refine[2] = 1
+    elif routine == 'xi':
+        if rmax < 0.05 * boxsize:
+            refine = [1, 1, 1]
+    else:
+        refine = [1 if s < 0.05 * boxsize else r
+                  for s, r in zip(search, refine)]
+
+    max_cells = max_cells_per_dim
+    if not mocks:
+        max_cells = _get_max_cells_for_particles(
+            max_cells_per_dim, N1 if autocorr else N1 + N2)
+
+    def _nmesh(refine):
+        return tuple(_get_binsize(boxsize, s, r, max_cells, periodic)
+                     for s, r in zip(search, refine))
+
+    initial_nmesh = nmesh = _nmesh(refine)
+    ncells = nmesh[0] * nmesh[1] * nmesh[2]
+
+    # Boost the refine factors for inefficient lattices
+    avg_np = N1 / ncells
+    max_nmesh = max(nmesh)
+    boosted = (max_nmesh <= BOOST_CELL_THRESH or
+               avg_np >= BOOST_NUMPART_THRESH) and max_nmesh < max_cells
+    if routine == 'DDsmu':
+        # DDsmu multiplies the refine factors by BOOST_BIN_REF (= 1)
+        boosted = False
+    if boosted:
+        refine[0] += BOOST_BIN_REF
+        refine[1] += BOOST_BIN_REF
+        nmesh = _nmesh(refine)
+        ncells = nmesh[0] * nmesh[1] * nmesh[2]
+
+    return dict(mocks=mocks, autocorr=autocorr, periodic=periodic, N2=N2,
+                rmax=rmax, boxsize=boxsize, search=search,
+                initial_nmesh=initial_nmesh, boosted=boosted, nmesh=nmesh,
+                refine_factors=tuple(refine), ncells=ncells)
+
+
+def estimate_memory(routine, N1, N2=None, bins=None, rmax=None,
+                    boxsize=None, nthreads=1, pimax=None, mu_max=1.0,
+                    nmu_bins=1, periodic=True, weight_type=None,
+                    num_weights=None, precision='double',
+                    xbin_refine_factor=2, ybin_refine_factor=2,
+                    zbin_refine_factor=1, max_cells_per_dim=100,
+                    is_comoving_dist=False):
+    """
+    Estimates the memory that a pair-counter will allocate, per phase, for
+    (uniformly distributed) catalogs of ``N1`` (and ``N2``) particles.
+
+    The lattice is set up exactly as in the C code (including the default
+    bin refine factors, the cap on the number of cells for small catalogs and
+    the boost of the refine factors), and the number of particles per cell is
+    taken to be Poisson distributed. The theory lattices are counted first and
+    carved out of a single block (without any spare room in the cells). For
+    the mocks, clustered catalogs use more memory than the estimate, since the
+    arrays of the dense cells grow in steps of 10% beyond the expected number
+    of particles per cell.
+    The actual peak memory can be measured with ``c_api_phase_memory=True``.
+
+    Parameters
+    -----------
+
+    routine: string
+        One of ``DD``, ``DDrppi``, ``DDsmu``, ``wp`` and ``xi`` (theory), or
+        ``DDrppi_mocks`` and ``DDsmu_mocks``.
+
+    N1: integer
+        Number of particles in the first catalog.
+
+    N2: integer, optional
+        Number of particles in the second catalog, for cross-correlations.
+        Not used by ``wp`` and ``xi``.
+
+    bins: array-like, optional
+        The bin edges (only used to find ``rmax``, and the number of bins of
+        the per-thread histograms).
+
+    rmax: double, optional
+        Maximum separation, i.e., ``rpmax`` for ``DDrppi`` and ``wp``, and
+        ``smax`` for ``DDsmu``. Defaults to the last bin edge.
+
+    boxsize: double
+        The side of the periodic box, or the extent of the particles along
+        every dimension (for the mocks, the extent of the Cartesian positions,
+        e.g., twice the maximum comoving distance for a full-sky survey).
+
+    nthreads: integer, default 1
+        Number of OpenMP threads, every thread keeps its own histograms.
+
+    pimax: double, optional
+        Maximum line-of-sight separation (required for ``DDrppi``, ``wp``
+        and ``DDrppi_mocks``).
+
+    mu_max: double, default 1.0
+        Maximum cosine of the angle to the line-of-sight for ``DDsmu``.
+
+    nmu_bins: integer, default 1
+        Number of ``mu`` bins for ``DDsmu`` and ``DDsmu_mocks``.
+
+    periodic: boolean, default True
+        Periodic boundary conditions (always True for ``wp`` and ``xi``, and
+        False for the mocks).
+
+    weight_type: string, optional
+        The weighting scheme. Every particle carries ``num_weights`` weights.
+
+    num_weights: integer, optional
+        Number of weights per particle. Defaults to 1 if ``weight_type`` is
+        set, and 0 otherwise.
+
+    precision: string, default 'double'
+        ``double`` or ``float``, the precision of the input arrays.
+
+    (xyz)bin_refine_factor: integer, default (2,2,1)
+        The bin refine factors, as passed to the pair-counter (these are
+        updated in the same way as within the C code).
+
+    max_cells_per_dim: integer, default 100
+        Max. number of cells per dimension.
+
+    is_comoving_dist: boolean, default False
+        For the mocks, whether ``cz`` is already the comoving distance.
+
+    Returns
+    --------
+
+    estimate: dict
+        ``nmesh`` (the number of cells per dimension), ``refine_factors``
+        (the bin refine factors after the boost), ``ncells``, ``phases`` (a
+        dictionary of the memory in use at the peak of every phase, above
+        the memory in use before the call, in bytes, as reported by
+        ``c_api_phase_memory=True``), ``peak`` (the largest of these, in
+        bytes) and ``components`` (the sizes of the individual allocations
+        that make up the peak, in bytes).
+
+    .. note:: The estimate does not include the input arrays, or the memory
+       used by the Python interpreter. The quantised (``max_position_error``)
+       and in-place (``permute_in_place``) lattices are not modelled.
+
+    Example
+    --------
+
+    >>> from Corrfunc.estimators import estimate_memory
+    >>> estimate = estimate_memory('DD', 1000000, rmax=10.0, boxsize=420.0)
+    >>> print(estimate['nmesh'], estimate['refine_factors'])
+    (42, 42, 42) (1, 1, 1)
+    >>> print(sorted(estimate['phases']))
+    ['assign_ngb_cells', 'distance', 'gridlink', 'kernel', 'sort']
+    >>> estimate['peak'] == estimate['phases']['kernel']
+    True
+
+    """
+    lattice = _setup_lattice('Memory', routine, N1, N2, bins, rmax, boxsize,
+                             pimax, mu_max, periodic,
+                             (xbin_refine_factor, ybin_refine_factor,
+                              zbin_refine_factor), max_cells_per_dim)
+    mocks = lattice['mocks']
+    autocorr = lattice['autocorr']
+    N2 = lattice['N2']
+    element_size = _element_size(precision)
+    if num_weights is None:
+        num_weights = 0 if weight_type is None else 1
+
+    components = dict()
+    phases = dict(distance=0)
+
+    # The cartesian positions (and the comoving distances) for the mocks
+    if mocks:
+        Ntot = N1 if autocorr else N1 + N2
+        components['positions'] = 3 * Ntot * element_size
+        components['distances'] = 0 if is_comoving_dist \
+            else Ntot * element_size
+        phases['distance'] = components['positions'] + \
+            components['distances']
+
+    inputs = phases['distance']
+    nmesh = lattice['initial_nmesh']
+    ncells = nmesh[0] * nmesh[1] * nmesh[2]
+    grid1 = _lattice_bytes(N1, ncells, num_weights, element_size, mocks)
+    gridlink_peak = inputs + max(grid1[0], grid1[1])
+
+    # The first lattice is freed before the particles are gridded again with
+    # the boosted refine factors
+    nmesh = lattice['nmesh']
+    refine = lattice['refine_factors']
+    ncells = lattice['ncells']
+    if lattice['boosted']:
+        grid1 = _lattice_bytes(N1, ncells, num_weights, element_size, mocks)
+        gridlink_peak = max(gridlink_peak, inputs + max(grid1[0], grid1[1]))
+
+    cells = grid1[1]
+    sort_peak = inputs + grid1[0]
+    if not autocorr:
+        grid2 = _lattice_bytes(N2, ncells, num_weights, element_size, mocks)
+        gridlink_peak = max(gridlink_peak,
+                            inputs + cells + max(grid2[0], grid2[1]))
+        sort_peak = inputs + cells + grid2[0]
+        cells += grid2[1]
+    components['lattice'] = cells
+    phases['gridlink'] = gridlink_peak
+    phases['sort'] = 0 if mocks else sort_peak
+
+    # The neighbouring cells (and the periodic wrap offsets) of every
+    # non-empty cell in the first lattice
+    max_ngb_cells = (2 * refine[0] + 1) * (2 * refine[1] + 1) * \
+        (2 * refine[2] + 1)
+    if mocks:
+        ngb_bytes = _malloc_bytes(max_ngb_cells * _POINTER_BYTES)
+    else:
+        ngb_bytes = 3 * _malloc_bytes(max_ngb_cells * element_size) + \
+            _malloc_bytes(max_ngb_cells * _POINTER_BYTES)
+    components['ngb_cells'] = int(grid1[2] * ngb_bytes)
+    # The cartesian positions are freed after the gridding in the mocks
+    setup = components['lattice'] + components['ngb_cells']
+    phases['assign_ngb_cells'] = setup
+
+    # Every thread keeps its histograms (the pair counts, and the average
+    # separation and weight) on the stack
+    nbins = _total_nbins(routine, bins, pimax, nmu_bins)
+    components['histograms'] = max(nthreads, 1) * nbins * 3 * 8
+    phases['kernel'] = setup + components['histograms']
+
+    phases = dict((phase, int(value)) for phase, value in phases.items())
+    components = dict((name, int(value))
+                      for name, value in components.items())
+    estimate = dict(nmesh=nmesh, refine_factors=tuple(refine),
+                    ncells=ncells, phases=phases,
+                    peak=max(phases.values()), components=components)
+    return estimate
+
+
+# Version of the format of the runtime calibration file
+CALIBRATION_FORMAT = 2
+CALIBRATION_FILENAME = 'runtime_calibration.json'
+
+# The catalogs that the runtime model is calibrated on: (number of points,
+# boxsize, number of bins). The points are uniform, with rmax = pimax = 10
+_CALIBRATION_RUNS = ((25000, 100.0, 15), (200000, 100.0, 15),
+                     (25000, 250.0, 15), (200000, 250.0, 15),
+                     (200000, 100.0, 5), (200000, 100.0, 40),
+                     (200000, 1000.0, 15))
+_CALIBRATION_RMAX = 10.0
+_CALIBRATION_NMU_BINS = 10
+
+
+def _axis_offsets(nmesh, refine_factor, periodic):
+    """
+    The offsets (in cells) to the neighbouring cells along one axis, and the
+    number of pairs of cells with that offset
+    """
+    return [(d, nmesh if periodic else max(nmesh - abs(d), 0))
+            for d in range(-refine_factor, refine_factor + 1)]
+
+
+def _fraction_within(offset, cellsize, search):
+    """
+    Fraction of the pairs of points (uniformly distributed within two cells
+    that are ``offset`` cells apart along an axis) that are closer than
+    ``search`` along that axis, i.e., the pairs that are not skipped by the
+    kernels on the (sorted) z-positions
+    """
+    # The separation has a triangular distribution around offset * cellsize
+    center = offset * cellsize
+
+    def cdf(t):
+        if t <= center - cellsize:
+            return 0.0
+        if t >= center + cellsize:
+            return 1.0
+        if t <= center:
+            return 0.5 * ((t - center + cellsize) / cellsize) ** 2
+        return 1.0 - 0.5 * ((center + cellsize - t) / cellsize) ** 2
+
+    return cdf(search) - cdf(-search)
+
+
+def _pair_model(lattice, N1):
+    """
+    The expected amount of work in every phase for uniformly distributed
+    points on ``lattice``, i.e., the features of the runtime model
+    """
+    nmesh = lattice['nmesh']
+    refine = lattice['refine_factors']
+    periodic = lattice['periodic']
+    ncells = lattice['ncells']
+    N2 = N1 if lattice['autocorr'] else lattice['N2']
+
+    lam1 = N1 / ncells
+    lam2 = N2 / ncells
+    occupied1 = 1.0 - math.exp(-lam1)
+    occupied2 = 1.0 - math.exp(-lam2)
+
+    # Pairs of cells within the stencil, and the pairs of points within them
+    # that are closer than the search size along z
+    xpairs = sum(m for _, m in _axis_offsets(nmesh[0], refine[0], periodic))
+    ypairs = sum(m for _, m in _axis_offsets(nmesh[1], refine[1], periodic))
+    zoffsets = _axis_offsets(nmesh[2], refine[2], periodic)
+    zpairs = sum(m for _, m in zoffsets)
+    zcellsize = lattice['boxsize'] / nmesh[2]
+    zweight = sum(m * _fraction_within(d, zcellsize, lattice['search'][2])
+                  for d, m in zoffsets)
+    cell_pairs = xpairs * ypairs * zpairs * occupied1 * occupied2
+    # Every particle in the first cell is compared against the (sorted)
+    # particles of every neighbouring cell
+    point_cell_pairs = xpairs * ypairs * zpairs * lam1 * occupied2
+    candidate_pairs = xpairs * ypairs * zweight * lam1 * lam2
+    if lattice['autocorr']:
+        # Every pair of cells (and of points) is only counted once
+        cell_pairs *= 0.5
+        point_cell_pairs *= 0.5
+        candidate_pairs *= 0.5
+
+    Ntot = N1 if lattice['autocorr'] else N1 + N2
+    # The first lattice is gridded twice if the refine factors are boosted
+    ngridded = Ntot + (N1 if lattice['boosted'] else 0)
+    ncells_gridded = ncells * (1 if lattice['autocorr'] else 2)
+    if lattice['boosted']:
+        initial = lattice['initial_nmesh']
+        ncells_gridded += initial[0] * initial[1] * initial[2]
+    nsort = N1 * math.log(lam1 + 2.0, 2)
+    if not lattice['autocorr']:
+        nsort += N2 * math.log(lam2 + 2.0, 2)
+    max_ngb_cells = (2 * refine[0] + 1) * (2 * refine[1] + 1) * \
+        (2 * refine[2] + 1)
+
+    return dict(npoints=Ntot, ngridded=ngridded,
+                ncells_gridded=ncells_gridded, nsort=nsort,
+                ngb_cells=ncells * occupied1 * max_ngb_cells,
+                cell_pairs=cell_pairs, point_cell_pairs=point_cell_pairs,
+                candidate_pairs=candidate_pairs)
+
+
+def _phase_features(model, nbins, nthreads, mocks):
+    """
+    The features of the runtime model for every phase. The sorting and the
+    kernels are spread over the threads
+    """
+    parallel = 1.0 / max(nthreads, 1)
+    candidates = model['candidate_pairs'] * parallel
+    # Assigning the particles to the cells gets slower (more cache misses)
+    # with the number of cells
+    ngridded = model['ngridded']
+    features = dict(max_min=[model['npoints']],
+                    gridlink=[ngridded, model['ncells_gridded'],
+                              ngridded * math.log(model['ncells_gridded'],
+                                                  2)],
+                    sort=[model['nsort'] * parallel,
+                          model['ncells_gridded'] * parallel],
+                    assign_ngb_cells=[model['ngb_cells'],
+                                      model['ncells_gridded']],
+                    kernel=[candidates, candidates * nbins,
+                            model['point_cell_pairs'] * parallel,
+                            model['cell_pairs'] * parallel],
+                    reduction=[nbins * max(nthreads, 1)],
+                    cleanup=[model['ncells_gridded']],
+                    overhead=[1.0, model['npoints']])
+    if mocks:
+        features['distance'] = [model['npoints']]
+    return features
+
+
+def _fit_coefficients(rows, times):
+    """
+    Least-squares fit (of the relative errors) of the non-negative
+    coefficients of the runtime model for one phase
+    """
+    import numpy as np
+
+    X = np.asarray(rows, dtype=np.float64)
+    y = np.asarray(times, dtype=np.float64)
+    scale = 1.0 / np.maximum(y, 1e-6)
+    active = list(range(X.shape[1]))
+    coefficients = np.zeros(X.shape[1])
+    while active:
+        A = X[:, active] * scale[:, None]
+        solution = np.linalg.lstsq(A, y * scale, rcond=None)[0]
+        if (solution >= 0).all():
+            coefficients[active] = np.maximum(solution, 0.0)
+            break
+        # Drop the most negative coefficient, and fit again
+        del active[int(np.argmin(solution))]
+
+    return [float(c) for c in coefficients]
+
+
+def _machine():
+    """
+    Identifies the machine (and the version of Corrfunc) that a calibration
+    is valid for
+    """
+    import platform
+    import multiprocessing
+    from Corrfunc import __version__
+
+    model = platform.processor()
+    try:
+        with open('/proc/cpuinfo', 'r') as f:
+            for line in f:
+                if line.startswith('model name'):
+                    model = line.split(':', 1)[1].strip()
+                    break
+    except (IOError, OSError):
+        pass
+
+    return dict(corrfunc_version=__version__, node=platform.node(),
+                machine=platform.machine(), processor=model,
+                cpu_count=multiprocessing.cpu_count())
+
+
+def _calibration_key(routine, precision, isa, weight_type):
+    return '{0}/{1}/{2}/{3}'.format(routine, precision, isa,
+                                    weight_type if weight_type else 'none')
+
+
+def _read_calibrations(filename):
+    import json
+
+    try:
+        with open(filename, 'r') as f:
+            calibrations = json.load(f)
+    except (IOError, OSError, ValueError):
+        return dict()
+    if calibrations.get('format') != CALIBRATION_FORMAT:
+        return dict()
+    return calibrations.get('calibrations', dict())
+
+
+def _write_calibration(filename, key, calibration):
+    """
+    Adds the calibration to the file. The file is replaced atomically, so
+    that concurrent readers never see a partially written file
+    """
+    import os
+    import json
+    import tempfile
+
+    directory = os.path.dirname(os.path.abspath(filename))
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    calibrations = _read_calibrations(filename)
+    calibrations[key] = calibration
+    fd, tmpname = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(dict(format=CALIBRATION_FORMAT,
+                           calibrations=calibrations), f, indent=1,
+                      sort_keys=True)
+        os.rename(tmpname, filename)
+    except Exception:
+        os.remove(tmpname)
+        raise
+
+
+def _run_calibration(routine, npts, boxsize, bins, precision, isa,
+                     weight_type):
+    """
+    Runs the pair-counter (on a single thread) on a uniform catalog, and
+    returns the time for every phase and the total wall time (in seconds)
+    """
+    import time
+    import numpy as np
+    from .benchmarks.catalogs import uniform_catalog, box_to_sky
+
+    dtype = np.float64 if precision == 'double' else np.float32
+    positions = uniform_catalog(npts, boxsize, dtype=dtype)
+    kwargs = dict(isa=isa, c_api_timer=True, c_api_phase_timer=True)
+    if weight_type is not None:
+        rng = np.random.RandomState(43)
+        weights = rng.uniform(0.5, 1.5, npts).astype(dtype)
+        key = 'weights' if routine in ('wp', 'xi') else 'weights1'
+        kwargs.update({key: weights, 'weight_type': weight_type})
+
+    pimax = _CALIBRATION_RMAX
+    nmu_bins = _CALIBRATION_NMU_BINS
+    t0 = time.time()
+    if routine == 'DD':
+        from Corrfunc.theory import DD
+        ret = DD(1, 1, bins, positions1=positions, periodic=True,
+                 boxsize=boxsize, **kwargs)
+    elif routine == 'DDrppi':
+        from Corrfunc.theory import DDrppi
+        ret = DDrppi(1, 1, pimax, bins, positions1=positions, periodic=True,
+                     boxsize=boxsize, **kwargs)
+    elif routine == 'DDsmu':
+        from Corrfunc.theory import DDsmu
+        ret = DDsmu(1, 1, bins, 1.0, nmu_bins, positions1=positions,
+                    periodic=True, boxsize=boxsize, **kwargs)
+    elif routine == 'wp':
+        from Corrfunc.theory import wp
+        ret = wp(boxsize, pimax, 1, bins, positions=positions, **kwargs)
+    elif routine == 'xi':
+        from Corrfunc.theory import xi
+        ret = xi(boxsize, 1, bins, positions=positions, **kwargs)
+    elif routine == 'DDrppi_mocks':
+        from Corrfunc.mocks import DDrppi_mocks
+        ret = DDrppi_mocks(1, 1, 1, pimax, bins,
+                           positions1=box_to_sky(positions, boxsize),
+                           is_comoving_dist=True, **kwargs)
+    else:
+        from Corrfunc.mocks import DDsmu_mocks
+        ret = DDsmu_mocks(1, 1, 1, 1.0, nmu_bins, bins,
+                          positions1=box_to_sky(positions, boxsize),
+                          is_comoving_dist=True, **kwargs)
+    wall_time = time.time() - t0
+
+    return ret[2], wall_time
+
+
+def calibrate_runtime(routine, precision='double', isa='fastest',
+                      weight_type=None, cache_dir=None, force=False,
+                      nrepeats=2, verbose=False):
+    """
+    Calibrates the runtime model of ``estimate_runtime`` for one pair-counter
+    on this machine, and stores the calibration in the cache.
+
+    The pair-counter is run (on a single thread) on a few small uniform
+    catalogs, with different numbers of particles per cell and of bins, and
+    the coefficients of the model for every phase (the time per particle,
+    per cell, per pair of cells and per candidate pair of particles) are
+    fitted to the phase timings. A calibration takes a few seconds, and is
+    only repeated when the machine or the version of Corrfunc changes (or
+    with ``force=True``).
+
+    Parameters
+    -----------
+
+    routine: string
+        One of ``DD``, ``DDrppi``, ``DDsmu``, ``wp`` and ``xi`` (theory), or
+        ``DDrppi_mocks`` and ``DDsmu_mocks``.
+
+    precision: string, default 'double'
+        ``double`` or ``float``.
+
+    isa: string, default 'fastest'
+        The instruction set, as passed to the pair-counter.
+
+    weight_type: string, optional
+        The weighting scheme (with one weight per particle).
+
+    cache_dir: string, optional
+        Directory of the calibration file. Defaults to the
+        ``CORRFUNC_CACHE_DIR`` environment variable, or ``corrfunc`` within
+        ``XDG_CACHE_HOME`` (``~/.cache``).
+
+    force: boolean, default False
+        Calibrate, even if the cache already contains a valid calibration.
+
+    nrepeats: integer, default 2
+        Number of times every catalog is counted (the fastest is used).
+
+    verbose: boolean, default False
+        Print the progress.
+
+    Returns
+    --------
+
+    calibration: dict
+        The coefficients of every phase (``coefficients``), the machine that
+        the calibration is valid for (``machine``) and the relative errors of
+        the fitted total runtimes for the calibration catalogs
+        (``residuals``).
+
+    """
+    import os
+    import datetime
+    import numpy as np
+    from Corrfunc.utils import default_cache_dir
+
+    if routine not in _THEORY_ROUTINES + _MOCKS_ROUTINES:
+        msg = "Error: Runtime can only be calibrated for {0}. Found routine "\
+              "= {1}".format(', '.join(_THEORY_ROUTINES + _MOCKS_ROUTINES),
+                             routine)
+        raise ValueError(msg)
+    _element_size(precision)
+    precision = precision.lower()
+
+    if cache_dir is None:
+        cache_dir = default_cache_dir()
+    filename = os.path.join(cache_dir, CALIBRATION_FILENAME)
+    key = _calibration_key(routine, precision, isa, weight_type)
+    machine = _machine()
+    if not force:
+        calibration = _read_calibrations(filename).get(key)
+        if calibration is not None and calibration.get('machine') == machine:
+            return calibration
+
+    mocks = routine in _MOCKS_ROUTINES
+    rows = dict()
+    times = dict()
+    totals = []
+    for npts, boxsize, nbins in _CALIBRATION_RUNS:
+        bins = np.linspace(0.1, _CALIBRATION_RMAX, nbins + 1)
+        best = None
+        for _ in range(max(nrepeats, 1)):
+            phases, wall_time = _run_calibration(routine, npts, boxsize, bins,
+                                                 precision, isa, weight_type)
+            if best is None or wall_time < best[1]:
+                best = (phases, wall_time)
+        phases, wall_time = best
+        if verbose:
+            print("Calibrating {0}: npts = {1} boxsize = {2} nbins = {3} "
+                  "time = {4:.3f} sec".format(routine, npts, boxsize, nbins,
+                                              wall_time))
+
+        lattice = _setup_lattice('Runtime', routine, npts, None, bins, None,
+                                 boxsize, _CALIBRATION_RMAX, 1.0, not mocks,
+                                 (2, 2, 1), NLATMAX)
+        total_nbins = _total_nbins(routine, bins, _CALIBRATION_RMAX,
+                                   _CALIBRATION_NMU_BINS)
+        features = _phase_features(_pair_model(lattice, npts), total_nbins,
+                                   1, mocks)
+        phases = dict(phases)
+        phases['overhead'] = max(wall_time - sum(phases.values()), 0.0)
+        for phase, row in features.items():
+            rows.setdefault(phase, []).append(row)
+            times.setdefault(phase, []).append(phases.get(phase, 0.0))
+        totals.append((features, wall_time))
+
+    coefficients = dict((phase, _fit_coefficients(rows[phase], times[phase]))
+                        for phase in rows)
+    residuals = []
+    for features, wall_time in totals:
+        predicted = sum(np.dot(coefficients[phase], row)
+                        for phase, row in features.items())
+        residuals.append(float(predicted / wall_time - 1.0))
+
+    calibration = dict(coefficients=coefficients, machine=machine,
+                       residuals=residuals,
+                       date=datetime.datetime.utcnow().isoformat())
+    try:
+        _write_calibration(filename, key, calibration)
+    except (IOError, OSError) as e:
+        print("Warning: Could not save the runtime calibration in {0}: {1}"
+              .format(filename, e), file=sys.stderr)
+
+    return calibration
+
+
+def estimate_runtime(routine, N1, N2=None, bins=None, rmax=None,
+                     boxsize=None, nthreads=1, pimax=None, mu_max=1.0,
+                     nmu_bins=1, periodic=True, weight_type=None,
+                     precision='double', isa='fastest',
+                     xbin_refine_factor=2, ybin_refine_factor=2,
+                     zbin_refine_factor=1, max_cells_per_dim=100,
+                     cache_dir=None, calibration=None):
+    """
+    Predicts the runtime of a pair-counter, per phase, for (uniformly
+    distributed) catalogs of ``N1`` (and ``N2``) particles.
+
+    The lattice is set up as in ``estimate_memory``, and the work in every
+    phase is counted analytically: the particles that are gridded and sorted,
+    the neighbouring cells that are assigned, and the pairs of cells (and
+    the candidate pairs of particles within them) in the stencil of
+    neighbouring cells. The candidate pairs exclude the pairs that the
+    kernels skip on the sorted z-positions. The time per unit of work is
+    calibrated on this machine with ``calibrate_runtime`` (the first call
+    runs the calibration, which takes a few seconds, and caches it on disk).
+
+    Clustered catalogs have more pairs, and take longer than the prediction.
+    The kernels (and the sorting) are assumed to scale perfectly with the
+    number of threads.
+
+    Parameters
+    -----------
+
+    routine: string
+        One of ``DD``, ``DDrppi``, ``DDsmu``, ``wp`` and ``xi`` (theory), or
+        ``DDrppi_mocks`` and ``DDsmu_mocks``.
+
+    N1, N2, bins, rmax, boxsize, nthreads, pimax, mu_max, nmu_bins, periodic,
+    weight_type, precision, (xyz)bin_refine_factor, max_cells_per_dim:
+        As in ``estimate_memory``.
+
+    isa: string, default 'fastest'
+        The instruction set, as passed to the pair-counter.
+
+    cache_dir: string, optional
+        Directory of the calibration file (see ``calibrate_runtime``).
+
+    calibration: dict, optional
+        A calibration returned by ``calibrate_runtime``. The cached
+        calibration is used (or created) by default.
+
+    Returns
+    --------
+
+    estimate: dict
+        ``phases`` (the predicted time of every phase, in seconds, with the
+        same names as returned with ``c_api_phase_timer=True``), ``overhead``
+        (the time spent outside of the phases, including the Python
+        wrapper), ``total`` (in seconds), ``candidate_pairs`` and
+        ``cell_pairs`` (the expected number of pairs of particles and of
+        cells that the kernels examine), ``nmesh``, ``refine_factors`` and
+        ``ncells``.
+
+    Example
+    --------
+
+    >>> from Corrfunc.estimators import estimate_runtime
+    >>> calibration = dict(coefficients=dict(kernel=[1e-9, 0.0, 0.0, 0.0]))
+    >>> estimate = estimate_runtime('DD', 100000, rmax=10.0, boxsize=100.0,
+    ...                             nthreads=2, calibration=calibration)
+    >>> print(estimate['nmesh'], estimate['refine_factors'])
+    (20, 20, 10) (2, 2, 1)
+    >>> print('{0:.3g}'.format(estimate['candidate_pairs']))
+    6.25e+07
+    >>> print('{0:.3g}'.format(estimate['phases']['kernel']))
+    0.0312
+
+    """
+    import numpy as np
+
+    lattice = _setup_lattice('Runtime', routine, N1, N2, bins, rmax, boxsize,
+                             pimax, mu_max, periodic,
+                             (xbin_refine_factor, ybin_refine_factor,
+                              zbin_refine_factor), max_cells_per_dim)
+    _element_size(precision)
+    if calibration is None:
+        calibration = calibrate_runtime(routine, precision=precision,
+                                        isa=isa, weight_type=weight_type,
+                                        cache_dir=cache_dir)
+
+    model = _pair_model(lattice, N1)
+    features = _phase_features(model,
+                               _total_nbins(routine, bins, pimax, nmu_bins),
+                               nthreads, lattice['mocks'])
+    coefficients = calibration['coefficients']
+    phases = dict()
+    for phase, row in features.items():
+        coefs = coefficients.get(phase)
+        phases[phase] = float(np.dot(coefs, row)) if coefs else 0.0
+    overhead = phases.pop('overhead')
+
+    return dict(phases=phases, overhead=overhead,
+                total=sum(phases.values()) + overhead,
+                candidate_pairs=model['candidate_pairs'],
+                cell_pairs=model['cell_pairs'], nmesh=lattice['nmesh'],
+                refine_factors=lattice['refine_factors'],
+                ncells=lattice['ncells'])
@@ -16,7 +16,8 @@ except ImportError:
     pd = None
 
 
-__all__ = ('read_fastfood_catalog', 'read_ascii_catalog', 'read_catalog')
+__all__ = ('read_fastfood_catalog', 'read_ascii_catalog', 'read_catalog',
+           'read_catalog_chunks', 'memmap_fastfood_catalog')
 
 
 def read_fastfood_catalog(filename, return_dtype=None, need_header=None):
@@ -241,6 +242,169 @@ def read_ascii_catalog(filename, return_dtype=None):
     return x, y, z
 
 
+def memmap_fastfood_catalog(filename):
+    """
+    Memory-maps the X/Y/Z positions in a fast-food binary file, without
+    reading them into memory.
+
+    Parameters
+    -----------
+    filename: string
+        Filename containing the galaxy positions
+
+    Returns
+    --------
+
+    X, Y, Z: numpy memmaps
+        Read-only memory-maps of the X/Y/Z positions (float or double, as
+        stored in the file)
+
+    """
+    if not file_exists(filename):
+        msg = "Could not find file = {0}".format(filename)
+        raise IOError(msg)
+
+    header = np.fromfile(filename, dtype=np.int32, count=7)
+    if len(header) < 7 or header[0] != 20 or header[6] != 20:
+        msg = "fast-food file = {0} seems to be incorrect (reading idat)"\
+              .format(filename)
+        raise IOError(msg)
+    ngal = int(header[2])
+
+    # idat, fdat and znow, each with the 4 padding bytes on either side
+    offset = (4 + 20 + 4) + (4 + 36 + 4) + (4 + 4 + 4)
+    pos = []
+    for field in 'xyz':
+        skip1 = int(np.memmap(filename, dtype=np.int32, mode='r',
+                              offset=offset, shape=(1, ))[0])
+        if skip1 != ngal * 4 and skip1 != ngal * 8:
+            msg = "fast-food file = {0} seems to be corrupt (padding bytes)"\
+                  .format(filename)
+            raise IOError(msg)
+
+        # the next division must be the integer division
+        input_dtype = np.float32 if ngal == 0 or skip1 // ngal == 4 \
+            else np.float64
+        pos.append(np.memmap(filename, dtype=input_dtype, mode='r',
+                             offset=offset + 4, shape=(ngal, )))
+        offset += 4 + skip1 + 4
+
+    return pos[0], pos[1], pos[2]
+
+
+def _chunk_to_columns(chunk):
+    """
+    Returns the chunk (a tuple of X/Y/Z[/weights] arrays, or an array of
+    shape ``(N, 3)`` or ``(N, 4)``) as a list of 1-D arrays
+    """
+    if isinstance(chunk, np.ndarray) and chunk.ndim == 2:
+        if chunk.shape[1] not in (3, 4):
+            msg = "Chunks of positions must have shape (N, 3) or (N, 4) "\
+                  "(with the weights in the last column). Found shape = "\
+                  "{0}".format(chunk.shape)
+            raise ValueError(msg)
+        return [chunk[:, i] for i in range(chunk.shape[1])]
+
+    columns = [np.asanyarray(c) for c in chunk]
+    if len(columns) not in (3, 4) or \
+       any(c.ndim != 1 or len(c) != len(columns[0]) for c in columns):
+        msg = "Chunks of positions must be a sequence of X/Y/Z "\
+              "(and optionally, weights) 1-D arrays of the same length"
+        raise ValueError(msg)
+    return columns
+
+
+def read_catalog_chunks(source, chunksize=1000000):
+    """
+    Iterates over a galaxy catalog in chunks, without reading the entire
+    catalog into memory.
+
+    Parameters
+    -----------
+    source: string, array-like, iterable or callable
+        The catalog. Can be one of:
+
+        - the filename of a fast-food file (the positions are memory-mapped)
+        - the filename of an HDF5 file (extension ``.h5`` or ``.hdf5``) with
+          the datasets ``x``, ``y``, ``z`` and optionally, ``weights``.
+          Requires ``h5py``.
+        - a tuple of X/Y/Z (and optionally, weights) arrays, e.g.,
+          ``numpy.memmap`` arrays
+        - an array of shape ``(N, 3)`` or ``(N, 4)``
+        - an iterable (e.g., a generator) or a callable returning an
+          iterable, that yields chunks in any of the two previous forms
+
+    chunksize: integer, default 1000000
+        The number of particles in each chunk. Chunks yielded by an iterable
+        source are passed on as is.
+
+    Returns
+    --------
+
+    chunks: generator
+        Yields a list of X/Y/Z (and weights, if present in the source) 1-D
+        arrays for every chunk
+
+    Example
+    --------
+    >>> import numpy as np
+    >>> from Corrfunc.io import read_catalog_chunks
+    >>> positions = np.arange(30.0).reshape(10, 3)
+    >>> for x, y, z in read_catalog_chunks(positions, chunksize=4):
+    ...     print(len(x), x[0], z[-1])
+    4 0.0 11.0
+    4 12.0 23.0
+    2 24.0 29.0
+
+    """
+    chunksize = int(chunksize)
+    if chunksize < 1:
+        msg = "chunksize = {0} must be at least 1".format(chunksize)
+        raise ValueError(msg)
+
+    if callable(source):
+        source = source()
+
+    try:
+        is_filename = isinstance(source, (str, unicode))
+    except NameError:
+        is_filename = isinstance(source, str)
+
+    if is_filename:
+        extension = splitext(source)[1].lower()
+        if extension in ('.h5', '.hdf5'):
+            try:
+                import h5py
+            except ImportError:
+                msg = "Reading HDF5 catalogs requires h5py"
+                raise ImportError(msg)
+
+            if not file_exists(source):
+                msg = "Could not find file = {0}".format(source)
+                raise IOError(msg)
+            with h5py.File(source, 'r') as f:
+                names = ['x', 'y', 'z']
+                if 'weights' in f:
+                    names.append('weights')
+                columns = [f[n] for n in names]
+                for start in range(0, len(columns[0]), chunksize):
+                    yield [c[start:start + chunksize] for c in columns]
+            return
+
+        columns = list(memmap_fastfood_catalog(source))
+    elif (isinstance(source, (tuple, list)) and
+          all(np.ndim(c) == 1 for c in source)) or \
+            (isinstance(source, np.ndarray) and source.ndim == 2):
+        columns = _chunk_to_columns(source)
+    else:
+        for chunk in source:
+            yield _chunk_to_columns(chunk)
+        return
+
+    for start in range(0, len(columns[0]), chunksize):
+        yield [c[start:start + chunksize] for c in columns]
+
+
 def read_catalog(filebase=None, return_dtype=np.float):
     """
     Reads a galaxy/randoms catalog and returns 3 XYZ arrays.
@@ -12,16 +12,24 @@ from __future__ import (division, print_function, absolute_import,
 __author__ = ('Manodeep Sinha', 'Nick Hand')
 __all__ = ('DDsmu_mocks', )
 
+from Corrfunc.cache import cached_counter
 
+
+@cached_counter('DDsmu_mocks')
 def DDsmu_mocks(autocorr, cosmology, nthreads, mu_max, nmu_bins, binfile,
-                RA1, DEC1, CZ1, weights1=None,
+                RA1=None, DEC1=None, CZ1=None, weights1=None,
                 RA2=None, DEC2=None, CZ2=None, weights2=None,
                 is_comoving_dist=False,
                 verbose=False, output_savg=False,
                 fast_divide_and_NR_steps=0,
                 xbin_refine_factor=2, ybin_refine_factor=2,
                 zbin_refine_factor=1, max_cells_per_dim=100,
-                c_api_timer=False, isa='fastest', weight_type=None):
+                c_api_timer=False, isa='fastest', weight_type=None,
+                query_mode=False,
+                positions1=None, positions2=None,
+                c_api_phase_timer=False, c_cell_timer=False,
+                c_perf_counters=False,
+                c_api_phase_memory=False, grid_file=None):
     """
     Calculate the 2-D pair-counts corresponding to the projected correlation
     function, :math:`\\xi(s, \mu)`. The pairs are counted in bins of
@@ -191,6 +199,34 @@ def DDsmu_mocks(autocorr, cosmology, nthreads, mu_max, nmu_bins, binfile,
         Boolean flag to measure actual time spent in the C libraries. Here
         to allow for benchmarking and scaling studies.
 
+    c_api_phase_timer: boolean (default false)
+        Boolean flag to also measure the time spent in every phase of the
+        C library (e.g., finding the bounding box, gridding, sorting the
+        particles within the cells, counting the pairs). If the
+        ``CORRFUNC_TRACE`` environment variable is set to a file name, the
+        phases of every call are also appended to that file as one line of
+        JSON.
+
+    c_cell_timer: boolean or integer (default false)
+        Boolean flag to measure the time spent **per cell-pair** within the
+        C libraries, with the cycle counter. An integer ``k`` only times
+        every k-th cell pair (on every thread), which keeps the overhead
+        low for large runs. The timings are returned in ``cell_time``.
+
+    c_perf_counters: boolean (default false)
+        Boolean flag to count the cycles, instructions, cache misses, branch
+        misses etc with the (Linux) ``perf_event_open`` interface while
+        gridding, assigning the neighbouring cells and counting the pairs (on
+        every thread). Events that are not available (e.g., in a virtual
+        machine) are ``None``. The counts are returned in ``perf_counters``.
+
+    c_api_phase_memory: boolean (default false)
+        Boolean flag to measure the peak memory allocated by the C library
+        (above the memory allocated at the start of the call) during every
+        phase. The bytes are counted by the Corrfunc allocators, so the peaks
+        do not depend on earlier calls. They are returned in
+        ``api_phase_memory``.
+
     isa: string (default ``fastest``)
         Controls the runtime dispatch for the instruction set to use. Possible
         options are: [``fastest``, ``avx``, ``sse42``, ``fallback``]
@@ -209,6 +245,37 @@ def DDsmu_mocks(autocorr, cosmology, nthreads, mu_max, nmu_bins, binfile,
     weight_type: string, optional
         The type of weighting to apply.  One of ["pair_product", None].  Default: None.
 
+    query_mode: boolean (default false)
+        Only used for cross-correlations (``autocorr=0``). Only the second
+        set of points is gridded, and the first set is streamed through the
+        neighbouring cells of the second, a few points at a time. Much
+        faster when the first set is much smaller than the second, e.g., a
+        few thousand galaxies against a large catalog of randoms.
+
+    grid_file: string (default None)
+        Name of a gridded catalog of the first set of points, i.e., of the
+        lattice and the points (converted to Cartesian co-ordinates) sorted
+        into its cells. If the file does not exist, the lattice is written
+        to it. Otherwise, the file is memory-mapped (read-only) and used
+        instead of converting and gridding the points again, and every
+        process that uses the file shares the same copy in the page cache.
+        ``RA1/DEC1/CZ1`` (and ``weights1``) must then be ``None`` (the file
+        does not record which points were gridded, so passing them is an
+        error). The file can only be used with the same ``cosmology`` (or
+        ``is_comoving_dist``), number of weights and precision of the
+        positions, for separations up to the ones it was written for, and
+        with a second set of points within the bounds of the points it was
+        written with (both sets, for a cross-correlation). It can not be
+        combined with ``query_mode``.
+
+    positions1: array-like, real (float/double), optional
+        An array of shape ``(N, 3)`` with the RA/DEC/CZ of the first set
+        of points, instead of ``RA1/DEC1/CZ1``.
+
+    positions2: array-like, real (float/double), optional
+        An array of shape ``(N, 3)`` with the RA/DEC/CZ of the second
+        set of points, instead of ``RA2/DEC2/CZ2``.
+
     Returns
     --------
 
@@ -223,6 +290,34 @@ def DDsmu_mocks(autocorr, cosmology, nthreads, mu_max, nmu_bins, binfile,
     api_time: float, optional
         Only returned if ``c_api_timer`` is set.  ``api_time`` measures only
         the time spent within the C library and ignores all python overhead.
+
+    api_phases: dict, optional
+        Only returned if ``c_api_phase_timer`` is set. The time (in seconds)
+        spent in every phase of the C library, keyed by the name of the
+        phase, e.g., ``gridlink``, ``sort`` and ``kernel``.
+
+    cell_time: numpy structured array, optional
+        Only returned if ``c_cell_timer`` is set. Contains detailed stats
+        about every (timed) cell-pair visited during pair-counting, sorted
+        on the cell indices: the number of particles in each cell (``N1``,
+        ``N2``), the time in nano-seconds (``time_in_ns``) and in cycles
+        (``cycles``) taken to process the pair, the 1-D index of each cell
+        (``cellidx1``, ``cellidx2``) and the thread-id (``tid``) of the
+        thread that processed the pair.
+
+    perf_counters: dict, optional
+        Only returned if ``c_perf_counters`` is set. Keyed by the name of the
+        phase (``gridlink``, ``assign_ngb_cells`` and ``kernel``); every entry
+        holds the total count of every event over the threads, the
+        instructions per cycle (``ipc``), the ``cache_miss_rate``, the
+        ``branch_miss_rate`` and the per-thread counts (``per_thread``). See
+        :py:func:`Corrfunc.utils.summarize_perf_counters`.
+
+    api_phase_memory: dict, optional
+        Only returned if ``c_api_phase_memory`` is set. The peak memory
+        allocated (in bytes, above the memory allocated at the start of the call)
+        reached during every phase, keyed by the name of the phase as in
+        ``api_phases``. ``None`` if the memory can not be measured.
     """
     try:
         from Corrfunc._countpairs_mocks import countpairs_s_mu_mocks as\
@@ -234,9 +329,33 @@ def DDsmu_mocks(autocorr, cosmology, nthreads, mu_max, nmu_bins, binfile,
 
     import numpy as np
     from Corrfunc.utils import translate_isa_string_to_enum, fix_ra_dec,\
-        return_file_with_rbins, sys_pipes
+        translate_cell_timer_to_sampling, summarize_perf_counters,\
+        return_file_with_rbins, sys_pipes, unpack_positions,\
+        trace_enabled, write_trace, gridded_catalog_info
     from future.utils import bytes_to_native_str
 
+    # The columns of an (N, 3) array of positions are passed on as views
+    RA1, DEC1, CZ1 = unpack_positions(positions1, RA1, DEC1, CZ1)
+    RA2, DEC2, CZ2 = unpack_positions(positions2, RA2, DEC2, CZ2)
+
+    # The first set of points can be read from a gridded catalog
+    grid_info = gridded_catalog_info(grid_file) if grid_file is not None\
+        else None
+    from_grid_file = grid_info is not None
+    if from_grid_file and not (RA1 is None and DEC1 is None and
+                               CZ1 is None and weights1 is None):
+        msg = "The first set of points is read from the existing "\
+              "grid_file = `{0}`. Please pass None for RA1/DEC1/CZ1 (or "\
+              "positions1) and weights1, or remove the file to grid new "\
+              "points".format(grid_file)
+        raise ValueError(msg)
+    if from_grid_file:
+        RA1 = DEC1 = CZ1 = np.empty(0, dtype=grid_info['dtype'])
+    if RA1 is None or DEC1 is None or CZ1 is None:
+        msg = "Must pass valid arrays for RA1/DEC1/CZ1 (or positions1, or "\
+              "an existing grid_file)"
+        raise ValueError(msg)
+
     # Broadcast scalar weights to arrays
     if weights1 is not None:
         weights1 = np.atleast_1d(weights1)
@@ -263,7 +382,7 @@ def DDsmu_mocks(autocorr, cosmology, nthreads, mu_max, nmu_bins, binfile,
             raise ValueError(msg)
 
         # If only one set of points has weights, set the other to uniform weights
-        if weights1 is None and weights2 is not None:
+        if weights1 is None and weights2 is not None and not from_grid_file:
             weights1 = np.ones_like(weights2)
         if weights2 is None and weights1 is not None:
             weights2 = np.ones_like(weights1)
@@ -273,19 +392,23 @@ def DDsmu_mocks(autocorr, cosmology, nthreads, mu_max, nmu_bins, binfile,
         DEC2 = np.empty(1)
         CZ2 = np.empty(1)
 
-    fix_ra_dec(RA1, DEC1)
+    if not from_grid_file:
+        fix_ra_dec(RA1, DEC1)
     if autocorr == 0:
         fix_ra_dec(RA2, DEC2)
 
     # Passing None parameters breaks the parsing code, so avoid this
     kwargs = {}
-    for k in ['weights1', 'weights2', 'weight_type', 'RA2', 'DEC2', 'CZ2']:
+    for k in ['weights1', 'weights2', 'weight_type', 'RA2', 'DEC2', 'CZ2',
+              'grid_file']:
         v = locals()[k]
         if v is not None:
             kwargs[k] = v
 
     integer_isa = translate_isa_string_to_enum(isa)
+    cell_timer_sampling = translate_cell_timer_to_sampling(c_cell_timer)
     sbinfile, delete_after_use = return_file_with_rbins(binfile)
+    phase_timer = c_api_phase_timer or trace_enabled()
     with sys_pipes():
         extn_results = DDsmu_extn(autocorr, cosmology, nthreads,
                                   mu_max, nmu_bins, sbinfile,
@@ -299,12 +422,34 @@ def DDsmu_mocks(autocorr, cosmology, nthreads, mu_max, nmu_bins, binfile,
                                   zbin_refine_factor=zbin_refine_factor,
                                   max_cells_per_dim=max_cells_per_dim,
                                   c_api_timer=c_api_timer,
+                                  c_api_phase_timer=phase_timer,
+                                  c_cell_timer=cell_timer_sampling,
+                                  c_perf_counters=c_perf_counters,
+                                  c_api_phase_memory=c_api_phase_memory,
+                                  query_mode=query_mode,
                                   isa=integer_isa, **kwargs)
     if extn_results is None:
         msg = "RuntimeError occurred"
         raise RuntimeError(msg)
     else:
-        extn_results, api_time = extn_results
+        # (results, api_time[, cell_time][, api_phases][, perf_counts]
+        #  [, phase_memory])
+        cell_time = extn_results[2] if c_cell_timer else None
+        api_phases = extn_results[3 if c_cell_timer else 2]\
+            if phase_timer else None
+        api_phase_memory = dict((phase, peak if peak >= 0 else None)
+                                for phase, peak in extn_results[-1].items())\
+            if c_api_phase_memory else None
+        perf_counters = summarize_perf_counters(
+            extn_results[-2 if c_api_phase_memory else -1])\
+            if c_perf_counters else None
+        extn_results, api_time = extn_results[:2]
+
+    if phase_timer:
+        N1 = grid_info['np'] if from_grid_file else len(RA1)
+        write_trace('DDsmu_mocks', api_time, api_phases,
+                    nthreads=nthreads, autocorr=bool(autocorr),
+                    N1=N1, N2=N1 if autocorr else len(RA2))
 
     if delete_after_use:
         import os
@@ -327,10 +472,27 @@ def DDsmu_mocks(autocorr, cosmology, nthreads, mu_max, nmu_bins, binfile,
         results['npairs'][ii] = r[4]
         results['weightavg'][ii] = r[5]
 
-    if not c_api_timer:
+    if not (c_api_timer or c_api_phase_timer or c_cell_timer or
+            c_perf_counters or c_api_phase_memory):
         return results
-    else:
-        return results, api_time
+
+    ret = (results, )
+    if c_api_timer:
+        ret += (api_time, )
+
+    if c_api_phase_timer:
+        ret += (api_phases, )
+
+    if c_cell_timer:
+        ret += (cell_time, )
+
+    if c_perf_counters:
+        ret += (perf_counters, )
+
+    if c_api_phase_memory:
+        ret += (api_phase_memory, )
+
+    return ret
 
 if __name__ == '__main__':
     import doctest
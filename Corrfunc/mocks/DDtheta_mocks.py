@@ -14,15 +14,22 @@ from __future__ import (division, print_function, absolute_import,
 __author__ = ('Manodeep Sinha')
 __all__ = ('DDtheta_mocks',)
 
+from Corrfunc.cache import cached_counter
 
+
+@cached_counter('DDtheta_mocks')
 def DDtheta_mocks(autocorr, nthreads, binfile,
-                  RA1, DEC1, weights1=None,
+                  RA1=None, DEC1=None, weights1=None,
                   RA2=None, DEC2=None, weights2=None,
                   link_in_dec=True, link_in_ra=True,
                   verbose=False, output_thetaavg=False,
                   fast_acos=False, ra_refine_factor=2,
                   dec_refine_factor=2, max_cells_per_dim=100,
-                  c_api_timer=False, isa=r'fastest', weight_type=None):
+                  c_api_timer=False, isa=r'fastest', weight_type=None,
+                  positions1=None, positions2=None,
+                  c_api_phase_timer=False, c_cell_timer=False,
+                  c_perf_counters=False,
+                  c_api_phase_memory=False, query_mode=False):
     """
     Function to compute the angular correlation function for points on
     the sky (i.e., mock catalogs or observed galaxies).
@@ -163,6 +170,40 @@ def DDtheta_mocks(autocorr, nthreads, binfile,
        Boolean flag to measure actual time spent in the C libraries. Here
        to allow for benchmarking and scaling studies.
 
+    c_api_phase_timer : boolean (default false)
+       Boolean flag to also measure the time spent in every phase of the
+       C library (e.g., finding the bounding box, gridding, sorting the
+       particles within the cells, counting the pairs). If the
+       ``CORRFUNC_TRACE`` environment variable is set to a file name, the
+       phases of every call are also appended to that file as one line of
+       JSON.
+
+    c_cell_timer : boolean or integer (default false)
+       Boolean flag to measure the time spent **per cell-pair** within the
+       C libraries, with the cycle counter. An integer ``k`` only times
+       every k-th cell pair (on every thread), which keeps the overhead
+       low for large runs. The timings are returned in ``cell_time``.
+
+    c_perf_counters : boolean (default false)
+       Boolean flag to count the cycles, instructions, cache misses, branch
+       misses etc with the (Linux) ``perf_event_open`` interface while
+       gridding, assigning the neighbouring cells and counting the pairs (on
+       every thread). Events that are not available (e.g., in a virtual
+       machine) are ``None``. The counts are returned in ``perf_counters``.
+
+    c_api_phase_memory : boolean (default false)
+       Boolean flag to measure the peak memory allocated by the C library
+       (above the memory allocated at the start of the call) during every
+       phase. The bytes are counted by the Corrfunc allocators, so the peaks
+       do not depend on earlier calls. They are returned in
+       ``api_phase_memory``.
+
+    query_mode : boolean (default false)
+       Only used for cross-correlations (``autocorr=0``). Only the second
+       set of points is gridded, and the first set is streamed through the
+       neighbouring cells of the second, a few points at a time. Much
+       faster when the first set is much smaller than the second.
+
     isa : string (default ``fastest``)
        Controls the runtime dispatch for the instruction set to use. Possible
        options are: [``fastest``, ``avx``, ``sse42``, ``fallback``]
@@ -177,6 +218,14 @@ def DDtheta_mocks(autocorr, nthreads, binfile,
        benchmarking, then the string supplied here gets translated into an
        ``enum`` for the instruction set defined in ``utils/defs.h``.
 
+    positions1 : array-like, real (float/double), optional
+        An array of shape ``(N, 2)`` with the RA/DEC of the first set of
+        points, instead of ``RA1/DEC1``.
+
+    positions2 : array-like, real (float/double), optional
+        An array of shape ``(N, 2)`` with the RA/DEC of the second set
+        of points, instead of ``RA2/DEC2``.
+
     Returns
     --------
 
@@ -191,6 +240,36 @@ def DDtheta_mocks(autocorr, nthreads, binfile,
        Only returned if ``c_api_timer`` is set.  ``api_time`` measures only the time
        spent within the C library and ignores all python overhead.
 
+    api_phases : dict, optional
+       Only returned if ``c_api_phase_timer`` is set. The time (in seconds)
+       spent in every phase of the C library, keyed by the name of the
+       phase, e.g., ``gridlink``, ``sort`` and ``kernel``.
+
+    cell_time : numpy structured array, optional
+       Only returned if ``c_cell_timer`` is set. Contains detailed stats
+       about every (timed) cell-pair visited during pair-counting, sorted
+       on the cell indices: the number of particles in each cell (``N1``,
+       ``N2``), the time in nano-seconds (``time_in_ns``) and in cycles
+       (``cycles``) taken to process the pair, the 1-D index of each cell
+       (``cellidx1``, ``cellidx2``) and the thread-id (``tid``) of the
+       thread that processed the pair.
+       Empty for the brute-force pair counts (``link_in_dec=False``).
+
+    perf_counters : dict, optional
+       Only returned if ``c_perf_counters`` is set. Keyed by the name of the
+       phase (``gridlink``, ``assign_ngb_cells`` and ``kernel``); every entry
+       holds the total count of every event over the threads, the
+       instructions per cycle (``ipc``), the ``cache_miss_rate``, the
+       ``branch_miss_rate`` and the per-thread counts (``per_thread``). See
+       :py:func:`Corrfunc.utils.summarize_perf_counters`.
+       Empty for the brute-force pair counts (``link_in_dec=False``).
+
+    api_phase_memory : dict, optional
+       Only returned if ``c_api_phase_memory`` is set. The peak memory
+       allocated (in bytes, above the memory allocated at the start of the call)
+       reached during every phase, keyed by the name of the phase as in
+       ``api_phases``. ``None`` if the memory can not be measured.
+
     Example
     --------
 
@@ -258,10 +337,19 @@ def DDtheta_mocks(autocorr, nthreads, binfile,
     import numpy as np
     from warnings import warn
     from Corrfunc.utils import translate_isa_string_to_enum, fix_ra_dec,\
+        translate_cell_timer_to_sampling, summarize_perf_counters,\
         return_file_with_rbins, convert_to_native_endian,\
-        is_native_endian, sys_pipes
+        is_native_endian, sys_pipes, unpack_positions,\
+        trace_enabled, write_trace
     from future.utils import bytes_to_native_str
-    
+
+    # The columns of an (N, 2) array of positions are passed on as views
+    RA1, DEC1 = unpack_positions(positions1, RA1, DEC1)
+    RA2, DEC2 = unpack_positions(positions2, RA2, DEC2)
+    if RA1 is None or DEC1 is None:
+        msg = "Must pass valid arrays for RA1/DEC1 (or positions1)"
+        raise ValueError(msg)
+
     # Broadcast scalar weights to arrays
     if weights1 is not None:
         weights1 = np.atleast_1d(weights1)
@@ -304,7 +392,9 @@ def DDtheta_mocks(autocorr, nthreads, binfile,
             kwargs[k] = v
 
     integer_isa = translate_isa_string_to_enum(isa)
+    cell_timer_sampling = translate_cell_timer_to_sampling(c_cell_timer)
     rbinfile, delete_after_use = return_file_with_rbins(binfile)
+    phase_timer = c_api_phase_timer or trace_enabled()
     with sys_pipes():
       extn_results = DDtheta_mocks_extn(autocorr, nthreads, rbinfile,
                                         RA1, DEC1,
@@ -317,12 +407,33 @@ def DDtheta_mocks(autocorr, nthreads, binfile,
                                         dec_refine_factor=dec_refine_factor,
                                         max_cells_per_dim=max_cells_per_dim,
                                         c_api_timer=c_api_timer,
+                                        c_api_phase_timer=phase_timer,
+                                        c_cell_timer=cell_timer_sampling,
+                                        c_perf_counters=c_perf_counters,
+                                        c_api_phase_memory=c_api_phase_memory,
+                                        query_mode=query_mode,
                                         isa=integer_isa, **kwargs)
     if extn_results is None:
         msg = "RuntimeError occurred"
         raise RuntimeError(msg)
     else:
-        extn_results, api_time = extn_results
+        # (results, api_time[, cell_time][, api_phases][, perf_counts]
+        #  [, phase_memory])
+        cell_time = extn_results[2] if c_cell_timer else None
+        api_phases = extn_results[3 if c_cell_timer else 2]\
+            if phase_timer else None
+        api_phase_memory = dict((phase, peak if peak >= 0 else None)
+                                for phase, peak in extn_results[-1].items())\
+            if c_api_phase_memory else None
+        perf_counters = summarize_perf_counters(
+            extn_results[-2 if c_api_phase_memory else -1])\
+            if c_perf_counters else None
+        extn_results, api_time = extn_results[:2]
+
+    if phase_timer:
+        write_trace('DDtheta_mocks', api_time, api_phases,
+                    nthreads=nthreads, autocorr=bool(autocorr),
+                    N1=len(RA1), N2=len(RA1) if autocorr else len(RA2))
 
     if delete_after_use:
         import os
@@ -335,10 +446,27 @@ def DDtheta_mocks(autocorr, nthreads, binfile,
                               (bytes_to_native_str(b'weightavg'), np.float)])
     results = np.array(extn_results, dtype=results_dtype)
 
-    if not c_api_timer:
+    if not (c_api_timer or c_api_phase_timer or c_cell_timer or
+            c_perf_counters or c_api_phase_memory):
         return results
-    else:
-        return results, api_time
+
+    ret = (results, )
+    if c_api_timer:
+        ret += (api_time, )
+
+    if c_api_phase_timer:
+        ret += (api_phases, )
+
+    if c_cell_timer:
+        ret += (cell_time, )
+
+    if c_perf_counters:
+        ret += (perf_counters, )
+
+    if c_api_phase_memory:
+        ret += (api_phase_memory, )
+
+    return ret
 
 
 if __name__ == '__main__':
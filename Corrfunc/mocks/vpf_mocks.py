@@ -13,15 +13,20 @@ from __future__ import (division, print_function, absolute_import,
 __author__ = ('Manodeep Sinha')
 __all__ = ('vpf_mocks', )
 
+from Corrfunc.cache import cached_counter
 
+
+@cached_counter('vpf_mocks')
 def vpf_mocks(rmax, nbins, nspheres, numpN,
               threshold_ngb, centers_file, cosmology,
-              RA, DEC, CZ,
-              RAND_RA, RAND_DEC, RAND_CZ,
+              RA=None, DEC=None, CZ=None,
+              RAND_RA=None, RAND_DEC=None, RAND_CZ=None,
               verbose=False, is_comoving_dist=False,
               xbin_refine_factor=1, ybin_refine_factor=1,
               zbin_refine_factor=1, max_cells_per_dim=100,
-              c_api_timer=False, isa=r'fastest'):
+              c_api_timer=False, isa=r'fastest',
+              positions=None, rand_positions=None,
+              c_api_phase_timer=False):
     """
     Function to compute the counts-in-cells on points on the sky. Suitable
     for mock catalogs and observed galaxies.
@@ -175,6 +180,14 @@ def vpf_mocks(rmax, nbins, nspheres, numpN,
        Boolean flag to measure actual time spent in the C libraries. Here
        to allow for benchmarking and scaling studies.
 
+    c_api_phase_timer : boolean (default false)
+       Boolean flag to also measure the time spent in every phase of the
+       C library (e.g., finding the bounding box, gridding, sorting the
+       particles within the cells, counting the pairs). If the
+       ``CORRFUNC_TRACE`` environment variable is set to a file name, the
+       phases of every call are also appended to that file as one line of
+       JSON.
+
     isa : string (default ``fastest``)
        Controls the runtime dispatch for the instruction set to use. Possible
        options are: [``fastest``, ``avx``, ``sse42``, ``fallback``]
@@ -190,6 +203,14 @@ def vpf_mocks(rmax, nbins, nspheres, numpN,
        ``enum`` for the instruction set defined in ``utils/defs.h``.
 
 
+    positions : array-like, real (float/double), optional
+       An array of shape ``(N, 3)`` with the RA/DEC/CZ of the points,
+       instead of ``RA/DEC/CZ``.
+
+    rand_positions : array-like, real (float/double), optional
+       An array of shape ``(N, 3)`` with the RA/DEC/CZ of the randoms,
+       instead of ``RAND_RA/RAND_DEC/RAND_CZ``.
+
     Returns
     --------
 
@@ -206,6 +227,11 @@ def vpf_mocks(rmax, nbins, nspheres, numpN,
        Only returned if ``c_api_timer`` is set.  ``api_time`` measures only the time
        spent within the C library and ignores all python overhead.
 
+    api_phases : dict, optional
+       Only returned if ``c_api_phase_timer`` is set. The time (in seconds)
+       spent in every phase of the C library, keyed by the name of the
+       phase, e.g., ``gridlink``, ``sort`` and ``kernel``.
+
 
     Example
     --------
@@ -278,8 +304,19 @@ def vpf_mocks(rmax, nbins, nspheres, numpN,
     from future.utils import bytes_to_native_str
     from Corrfunc.utils import translate_isa_string_to_enum,\
         return_file_with_rbins, convert_to_native_endian,\
-        is_native_endian, sys_pipes
-        
+        is_native_endian, sys_pipes, unpack_positions,\
+        trace_enabled, write_trace
+
+    # The columns of an (N, 3) array of positions are passed on as views
+    RA, DEC, CZ = unpack_positions(positions, RA, DEC, CZ)
+    RAND_RA, RAND_DEC, RAND_CZ = unpack_positions(rand_positions, RAND_RA, RAND_DEC, RAND_CZ)
+    if RA is None or DEC is None or CZ is None:
+        msg = "Must pass valid arrays for RA/DEC/CZ (or positions)"
+        raise ValueError(msg)
+    if RAND_RA is None or RAND_DEC is None or RAND_CZ is None:
+        msg = "Must pass valid arrays for RAND_RA/RAND_DEC/RAND_CZ (or rand_positions)"
+        raise ValueError(msg)
+
     # Warn about non-native endian arrays
     if not all(is_native_endian(arr) for arr in [RA, DEC, CZ, RAND_RA, RAND_DEC, RAND_CZ]):
         warn('One or more input array has non-native endianness!  A copy will be made with the correct endianness.')
@@ -287,6 +324,7 @@ def vpf_mocks(rmax, nbins, nspheres, numpN,
 
 
     integer_isa = translate_isa_string_to_enum(isa)
+    phase_timer = c_api_phase_timer or trace_enabled()
     with sys_pipes():
       extn_results = vpf_extn(rmax, nbins, nspheres, numpN,
                               threshold_ngb, centers_file,
@@ -300,12 +338,20 @@ def vpf_mocks(rmax, nbins, nspheres, numpN,
                               zbin_refine_factor=zbin_refine_factor,
                               max_cells_per_dim=max_cells_per_dim,
                               c_api_timer=c_api_timer,
+                              c_api_phase_timer=phase_timer,
                               isa=integer_isa)
     if extn_results is None:
         msg = "RuntimeError occurred"
         raise RuntimeError(msg)
     else:
-        extn_results, api_time = extn_results
+        if phase_timer:
+            extn_results, api_time, api_phases = extn_results
+        else:
+            extn_results, api_time = extn_results
+
+    if phase_timer:
+        write_trace('vpf_mocks', api_time, api_phases,
+                    N=len(RA), nspheres=nspheres)
 
     results_dtype = np.dtype([(bytes_to_native_str(b'rmax'), np.float),
                               (bytes_to_native_str(b'pN'),
@@ -321,10 +367,17 @@ def vpf_mocks(rmax, nbins, nspheres, numpN,
             for j in range(numpN):
                 results['pN'][ii][j] = r[1 + j]
 
-    if not c_api_timer:
+    if not (c_api_timer or c_api_phase_timer):
         return results
-    else:
-        return results, api_time
+
+    ret = (results, )
+    if c_api_timer:
+        ret += (api_time, )
+
+    if c_api_phase_timer:
+        ret += (api_phases, )
+
+    return ret
 
 
 if __name__ == '__main__':
@@ -5,15 +5,920 @@ from __future__ import (absolute_import, division, print_function,
 import sys
 
 
-__all__ = ['tests', ]
+__all__ = ['tests', 'test_weighted_randoms_self_pairs',
+           'test_los_and_rsd',
+           'test_wp_multiple_pimax',
+           'test_low_latency_path',
+           'test_DD_streaming',
+           'test_distributed_single_rank',
+           'test_query_mode',
+           'test_incremental',
+           'test_batch',
+           'test_estimators',
+           'test_result_cache',
+           'test_grid_file',
+           'test_permute_in_place',
+           'test_positions',
+           'test_optional_returns',
+           'test_cell_timer',
+           'test_perf_counters', ]
 if sys.version_info[0] < 3:
     __all__ = [n.encode('ascii') for n in __all__]
 
 
+def _uniform_box(N, boxsize, seed=42):
+    """
+    Uniformly distributed points (as three arrays) in a periodic box
+    """
+    import numpy as np
+
+    rng = np.random.RandomState(seed)
+    return tuple(rng.uniform(0.0, boxsize, N) for _ in range(3))
+
+
+def test_weighted_randoms_self_pairs():
+    """
+    Unit weights must give the same ``wp`` and ``xi`` as no weights. The
+    weighted randoms of the bins starting at 0 include the self-pairs (the
+    sum of the squared weights), which used to start from the number of
+    particles instead of 0
+    """
+    import numpy as np
+    from Corrfunc.theory import wp, xi
+
+    boxsize = 100.0
+    x, y, z = _uniform_box(2000, boxsize)
+    weights = np.ones_like(x)
+    bins = np.linspace(0.0, 10.0, 6)
+
+    unweighted = wp(boxsize, 20.0, 1, bins, x, y, z)
+    weighted = wp(boxsize, 20.0, 1, bins, x, y, z, weights=weights,
+                  weight_type='pair_product')
+    assert np.allclose(weighted['wp'], unweighted['wp'])
+
+    unweighted = xi(boxsize, 1, bins, x, y, z)
+    weighted = xi(boxsize, 1, bins, x, y, z, weights=weights,
+                  weight_type='pair_product')
+    assert np.allclose(weighted['xi'], unweighted['xi'])
+
+
+def test_los_and_rsd():
+    """
+    ``DDrppi`` and ``DDsmu`` along the ``x`` (and every) line-of-sight must
+    give the same counts as along ``z`` with the axes relabelled, and the
+    on-the-fly redshift-space displacements the same counts as the
+    displaced positions
+    """
+    import numpy as np
+    from Corrfunc.theory import DDrppi, DDsmu
+
+    boxsize = 100.0
+    x, y, z = _uniform_box(3000, boxsize)
+    bins = np.linspace(0.1, 10.0, 6)
+
+    along_z = DDrppi(1, 1, 10.0, bins, y, z, x, boxsize=boxsize)
+    along_x = DDrppi(1, 1, 10.0, bins, x, y, z, boxsize=boxsize, los='x')
+    assert np.array_equal(along_x['npairs'], along_z['npairs'])
+    along_all = DDrppi(1, 1, 10.0, bins, x, y, z, boxsize=boxsize,
+                       los='all')
+    assert np.array_equal(along_all[0]['npairs'], along_z['npairs'])
+
+    along_z = DDsmu(1, 1, bins, 1.0, 5, y, z, x, boxsize=boxsize)
+    along_x = DDsmu(1, 1, bins, 1.0, 5, x, y, z, boxsize=boxsize, los='x')
+    assert np.array_equal(along_x['npairs'], along_z['npairs'])
+
+    # Displacements that are exactly representable, so that the displaced
+    # positions are identical
+    rng = np.random.RandomState(7)
+    velocities = np.round(rng.normal(0.0, 2.0, (3, len(x))))
+    displaced = np.fmod(z + 0.5 * velocities[2] + boxsize, boxsize)
+    rsd = DDrppi(1, 1, 10.0, bins, x, y, z, boxsize=boxsize,
+                 velocities1=velocities, rsd_factor=0.5)
+    shifted = DDrppi(1, 1, 10.0, bins, x, y, displaced, boxsize=boxsize)
+    assert np.array_equal(rsd['npairs'], shifted['npairs'])
+
+
+def test_wp_multiple_pimax():
+    """
+    ``wp`` with an array of ``pimax`` must give the same results as one call
+    per ``pimax``, and a 0-d array the same results as a scalar
+    """
+    import numpy as np
+    from Corrfunc.theory import wp
+
+    boxsize = 100.0
+    x, y, z = _uniform_box(3000, boxsize)
+    bins = np.linspace(0.1, 10.0, 6)
+    pimax = [10.0, 20.0, 25.0]
+
+    results = wp(boxsize, pimax, 1, bins, x, y, z)
+    assert results.shape == (len(pimax), len(bins) - 1)
+    for p, result in zip(pimax, results):
+        single = wp(boxsize, p, 1, bins, x, y, z)
+        assert np.array_equal(result['npairs'], single['npairs'])
+        assert np.allclose(result['wp'], single['wp'])
+
+    scalar = wp(boxsize, 20.0, 1, bins, x, y, z)
+    zero_d = wp(boxsize, np.array(20.0), 1, bins, x, y, z)
+    assert zero_d.shape == scalar.shape
+    assert np.array_equal(zero_d['npairs'], scalar['npairs'])
+
+
+def test_low_latency_path():
+    """
+    Bins passed as an array (without a temporary bin file) and the
+    automatic number of threads must give the same results as a bin file
+    and an explicit number of threads
+    """
+    import os
+    import numpy as np
+    from Corrfunc.theory import DD, wp
+    from Corrfunc.utils import return_file_with_rbins
+
+    boxsize = 100.0
+    x, y, z = _uniform_box(3000, boxsize)
+    bins = np.linspace(0.1, 10.0, 6)
+    binfile, _ = return_file_with_rbins(bins)
+    try:
+        from_file = DD(1, 1, binfile, x, y, z, boxsize=boxsize)
+        from_array = DD(1, 0, bins, x, y, z, boxsize=boxsize)
+        assert np.array_equal(from_array['npairs'], from_file['npairs'])
+
+        from_file = wp(boxsize, 20.0, 1, binfile, x, y, z)
+        from_array = wp(boxsize, 20.0, 0, bins, x, y, z)
+        assert np.array_equal(from_array['npairs'], from_file['npairs'])
+        assert np.allclose(from_array['wp'], from_file['wp'])
+    finally:
+        os.remove(binfile)
+
+
+def test_DD_streaming():
+    """
+    ``DD_streaming`` (with a memory budget that splits the box into several
+    slabs) must give the same counts as ``DD``
+    """
+    import numpy as np
+    from Corrfunc.theory import DD, DD_streaming
+
+    boxsize = 100.0
+    x, y, z = _uniform_box(5000, boxsize)
+    x2, y2, z2 = _uniform_box(2000, boxsize, seed=7)
+    bins = np.linspace(0.1, 10.0, 6)
+    # About half of the particles (with their halo) at a time
+    budget = len(x) * 9 * x.itemsize // 2
+
+    for periodic in [True, False]:
+        full = DD(1, 1, bins, x, y, z, periodic=periodic, boxsize=boxsize)
+        streamed = DD_streaming(1, 1, bins, (x, y, z), boxsize,
+                                periodic=periodic, memory_budget=budget,
+                                chunksize=1000)
+        assert np.array_equal(streamed['npairs'], full['npairs'])
+
+    full = DD(0, 1, bins, x, y, z, X2=x2, Y2=y2, Z2=z2, boxsize=boxsize)
+    streamed = DD_streaming(0, 1, bins, (x, y, z), boxsize,
+                            source2=(x2, y2, z2), memory_budget=budget,
+                            chunksize=1000)
+    assert np.array_equal(streamed['npairs'], full['npairs'])
+
+
+def test_distributed_single_rank():
+    """
+    On a single rank, ``DD_mpi`` and ``wp_mpi`` must give the same results
+    as ``DD`` and ``wp``. Skipped if ``mpi4py`` is not installed
+    """
+    import numpy as np
+    try:
+        from mpi4py import MPI
+    except ImportError:
+        print("Skipping the tests of the distributed pair counters "
+              "(mpi4py is not installed)")
+        return
+    from Corrfunc.theory import DD, wp
+    from Corrfunc.theory.distributed import DD_mpi, wp_mpi
+
+    boxsize = 100.0
+    x, y, z = _uniform_box(3000, boxsize)
+    bins = np.linspace(0.1, 10.0, 6)
+    comm = MPI.COMM_SELF
+
+    full = DD(1, 1, bins, x, y, z, boxsize=boxsize)
+    distributed = DD_mpi(1, 1, bins, x, y, z, boxsize=boxsize, comm=comm)
+    assert np.array_equal(distributed['npairs'], full['npairs'])
+
+    pimax = [10.0, 20.5]
+    distributed = wp_mpi(boxsize, pimax, 1, bins, x, y, z, comm=comm)
+    for p, result in zip(pimax, distributed):
+        full = wp(boxsize, p, 1, bins, x, y, z)
+        assert np.array_equal(result['npairs'], full['npairs'])
+        assert np.allclose(result['wp'], full['wp'])
+    distributed = wp_mpi(boxsize, np.array(20.0), 1, bins, x, y, z,
+                         comm=comm)
+    assert distributed.shape == (len(bins) - 1, )
+
+
+def test_query_mode():
+    """
+    Cross-correlations in ``query_mode`` must give the same counts as the
+    default (symmetric) gridding
+    """
+    import numpy as np
+    from Corrfunc.theory import DD, DDrppi, DDsmu
+    from Corrfunc.mocks import DDrppi_mocks, DDtheta_mocks
+
+    boxsize = 100.0
+    x, y, z = _uniform_box(200, boxsize)
+    x2, y2, z2 = _uniform_box(5000, boxsize, seed=7)
+    weights = np.linspace(0.5, 1.5, len(x))
+    weights2 = np.linspace(1.5, 0.5, len(x2))
+    bins = np.linspace(0.1, 10.0, 6)
+
+    for periodic in [True, False]:
+        kwargs = dict(X2=x2, Y2=y2, Z2=z2, weights1=weights,
+                      weights2=weights2, weight_type='pair_product',
+                      periodic=periodic, boxsize=boxsize)
+        default = DD(0, 1, bins, x, y, z, **kwargs)
+        query = DD(0, 1, bins, x, y, z, query_mode=True, **kwargs)
+        assert np.array_equal(query['npairs'], default['npairs'])
+        assert np.allclose(query['weightavg'], default['weightavg'])
+
+        for los in ['z', 'all']:
+            default = DDrppi(0, 1, 10.0, bins, x, y, z, los=los, **kwargs)
+            query = DDrppi(0, 1, 10.0, bins, x, y, z, los=los,
+                           query_mode=True, **kwargs)
+            assert np.array_equal(query['npairs'], default['npairs'])
+            assert np.allclose(query['weightavg'], default['weightavg'])
+
+            default = DDsmu(0, 1, bins, 1.0, 5, x, y, z, los=los, **kwargs)
+            query = DDsmu(0, 1, bins, 1.0, 5, x, y, z, los=los,
+                          query_mode=True, **kwargs)
+            assert np.array_equal(query['npairs'], default['npairs'])
+            assert np.allclose(query['weightavg'], default['weightavg'])
+
+    # The points of the mocks are in a shell of comoving distances
+    rng = np.random.RandomState(7)
+    ra, dec = rng.uniform(0.0, 90.0, 200), rng.uniform(0.0, 60.0, 200)
+    dist = rng.uniform(100.0, 200.0, 200)
+    ra2, dec2 = rng.uniform(0.0, 90.0, 5000), rng.uniform(0.0, 60.0, 5000)
+    dist2 = rng.uniform(100.0, 200.0, 5000)
+    kwargs = dict(RA2=ra2, DEC2=dec2, CZ2=dist2, is_comoving_dist=True)
+    default = DDrppi_mocks(0, 1, 1, 10.0, bins, ra, dec, dist, **kwargs)
+    query = DDrppi_mocks(0, 1, 1, 10.0, bins, ra, dec, dist,
+                         query_mode=True, **kwargs)
+    assert np.array_equal(query['npairs'], default['npairs'])
+
+    # Both the declination-only and the RA-DEC lattices of DDtheta_mocks
+    theta_bins = np.logspace(-1.0, 1.0, 6)
+    for link_in_ra in [True, False]:
+        kwargs = dict(RA2=ra2, DEC2=dec2, link_in_ra=link_in_ra)
+        default = DDtheta_mocks(0, 1, theta_bins, ra, dec, **kwargs)
+        query = DDtheta_mocks(0, 1, theta_bins, ra, dec, query_mode=True,
+                              **kwargs)
+        assert np.array_equal(query['npairs'], default['npairs'])
+
+
+def test_incremental():
+    """
+    The incremental pair counts must match a full recount after every
+    insertion, deletion and move
+    """
+    import numpy as np
+    from Corrfunc.theory import DD, wp
+    from Corrfunc.theory.incremental import IncrementalDD, IncrementalWP
+
+    boxsize = 100.0
+    x, y, z = _uniform_box(3000, boxsize)
+    bins = np.linspace(0.0, 10.0, 6)
+    rng = np.random.RandomState(7)
+
+    counts = IncrementalDD(1, bins, x, y, z, boxsize=boxsize)
+    wp_counts = IncrementalWP(boxsize, 20.0, 1, bins, x, y, z)
+    for _ in range(3):
+        new = rng.uniform(0.0, boxsize, (3, 50))
+        ids = counts.insert(*new)
+        assert np.array_equal(wp_counts.insert(*new), ids)
+        deleted = rng.choice(counts.ids, 30, replace=False)
+        counts.delete(deleted)
+        wp_counts.delete(deleted)
+        moved = rng.choice(counts.ids, 40, replace=False)
+        new = rng.uniform(0.0, boxsize, (3, 40))
+        counts.update(moved, *new)
+        wp_counts.update(moved, *new)
+
+        X, Y, Z, _ = counts.positions()
+        full = DD(1, 1, bins, X, Y, Z, boxsize=boxsize)
+        assert np.array_equal(counts.results['npairs'], full['npairs'])
+        full = wp(boxsize, 20.0, 1, bins, X, Y, Z)
+        assert np.array_equal(wp_counts.results['npairs'], full['npairs'])
+        assert np.allclose(wp_counts.results['wp'], full['wp'])
+
+
+def test_batch():
+    """
+    ``DD_batch`` and ``wp_batch`` must give the same results as calling
+    ``DD`` and ``wp`` on every catalog
+    """
+    import numpy as np
+    from Corrfunc.theory import DD, DD_batch, wp, wp_batch
+
+    boxsize = 100.0
+    catalogs = [_uniform_box(n, boxsize, seed=n) for n in [500, 1000, 1500]]
+    bins = np.linspace(0.1, 10.0, 6)
+
+    results = DD_batch(1, 2, bins, catalogs, boxsize=boxsize)
+    for catalog, result in zip(catalogs, results):
+        single = DD(1, 1, bins, *catalog, boxsize=boxsize)
+        assert np.array_equal(result['npairs'], single['npairs'])
+
+    results = DD_batch(0, 2, bins, catalogs, catalogs2=catalogs[::-1],
+                       boxsize=boxsize)
+    for catalog, catalog2, result in zip(catalogs, catalogs[::-1], results):
+        x2, y2, z2 = catalog2
+        single = DD(0, 1, bins, *catalog, X2=x2, Y2=y2, Z2=z2,
+                    boxsize=boxsize)
+        assert np.array_equal(result['npairs'], single['npairs'])
+
+    results = wp_batch(boxsize, 20.0, 2, bins, catalogs)
+    for catalog, result in zip(catalogs, results):
+        single = wp(boxsize, 20.0, 1, bins, *catalog)
+        assert np.array_equal(result['npairs'], single['npairs'])
+        assert np.allclose(result['wp'], single['wp'])
+
+
+def test_estimators():
+    """
+    The estimated lattice must match the one used by the pair counter, and
+    the estimated memory and runtime must be sane: positive, growing with
+    the number of particles, and with at least as many candidate pairs as
+    pairs counted
+    """
+    import os
+    import shutil
+    import tempfile
+    import numpy as np
+    from Corrfunc.theory import DD
+    from Corrfunc.estimators import estimate_memory, estimate_runtime
+    from Corrfunc.utils import gridded_catalog_info
+
+    boxsize = 100.0
+    x, y, z = _uniform_box(100000, boxsize)
+    bins = np.linspace(0.1, 10.0, 6)
+
+    # The lattice written to a grid file by the pair counter, with the cap
+    # on the number of cells for small catalogs and the boost of the refine
+    # factors
+    directory = tempfile.mkdtemp()
+    grid_file = os.path.join(directory, 'catalog.grid')
+    try:
+        for N, rmax in [(len(x), 10.0), (1000, 10.0), (len(x), 30.0),
+                        (20000, 3.0)]:
+            lattice_bins = np.linspace(0.1, rmax, 6)
+            DD(1, 1, lattice_bins, x[:N], y[:N], z[:N], boxsize=boxsize,
+               grid_file=grid_file)
+            info = gridded_catalog_info(grid_file)
+            os.remove(grid_file)
+            lattice = estimate_memory('DD', N, bins=lattice_bins,
+                                      boxsize=boxsize)
+            assert tuple(lattice['nmesh']) == tuple(info['nmesh'])
+            assert tuple(lattice['refine_factors']) == \
+                tuple(info['bin_refine_factors'])
+    finally:
+        shutil.rmtree(directory)
+
+    small = estimate_memory('DD', 10000, bins=bins, boxsize=boxsize)
+    estimate = estimate_memory('DD', len(x), bins=bins, boxsize=boxsize)
+    assert 0 < small['peak'] < estimate['peak']
+    assert estimate['peak'] == max(estimate['phases'].values())
+    results, phase_memory = DD(1, 1, bins, x, y, z, boxsize=boxsize,
+                               c_api_phase_memory=True)
+    if phase_memory['gridlink'] is None:
+        print("Skipping the comparison of the estimated and the measured "
+              "peak memory (the allocations can not be counted)")
+    else:
+        measured = max(m for m in phase_memory.values() if m is not None)
+        assert 0.8 < estimate['peak'] / measured < 1.25
+
+    calibration = dict(coefficients=dict(kernel=[1e-9, 0.0, 0.0, 0.0]))
+    small = estimate_runtime('DD', 10000, bins=bins, boxsize=boxsize,
+                             calibration=calibration)
+    estimate = estimate_runtime('DD', len(x), bins=bins, boxsize=boxsize,
+                                calibration=calibration)
+    assert 0 < small['total'] < estimate['total']
+    assert estimate['candidate_pairs'] >= results['npairs'].sum()
+
+
+def test_result_cache():
+    """
+    The result cache must return the stored results for the same inputs
+    (even with a different number of threads), and recount when the
+    positions or the bins change
+    """
+    import os
+    import shutil
+    import tempfile
+    import numpy as np
+    from Corrfunc.cache import enable_result_cache, disable_result_cache
+    from Corrfunc.theory import DD
+
+    boxsize = 100.0
+    x, y, z = _uniform_box(2000, boxsize)
+    bins = np.linspace(0.1, 10.0, 6)
+    directory = tempfile.mkdtemp()
+
+    def entries():
+        return sorted(f for f in os.listdir(directory) if f.endswith('.npy'))
+
+    enable_result_cache(directory)
+    try:
+        first = DD(1, 1, bins, x, y, z, boxsize=boxsize)
+        assert len(entries()) == 1
+
+        # Hit: the stored results are returned, even if they were changed
+        path = os.path.join(directory, entries()[0])
+        stored = np.load(path)
+        stored['npairs'] += 1
+        np.save(path, stored)
+        second = DD(1, 2, bins, x, y, z, boxsize=boxsize)
+        assert np.array_equal(second['npairs'], first['npairs'] + 1)
+        assert len(entries()) == 1
+
+        # Miss: new positions or new bins
+        x[0] = np.fmod(x[0] + 5.0, boxsize)
+        moved = DD(1, 1, bins, x, y, z, boxsize=boxsize)
+        assert len(entries()) == 2
+        disable_result_cache()
+        assert np.array_equal(moved['npairs'],
+                              DD(1, 1, bins, x, y, z,
+                                 boxsize=boxsize)['npairs'])
+        enable_result_cache(directory)
+        DD(1, 1, bins[:-1], x, y, z, boxsize=boxsize)
+        assert len(entries()) == 3
+    finally:
+        disable_result_cache()
+        shutil.rmtree(directory)
+
+
+def test_grid_file():
+    """
+    Counts that re-use a gridded catalog must match the counts of the
+    points, and passing the points along with an existing grid file must be
+    rejected
+    """
+    import os
+    import shutil
+    import tempfile
+    import numpy as np
+    from Corrfunc.theory import DD, DDrppi
+    from Corrfunc.mocks import DDrppi_mocks, DDsmu_mocks
+    from Corrfunc.utils import gridded_catalog_info
+
+    boxsize = 100.0
+    x, y, z = _uniform_box(3000, boxsize)
+    x2, y2, z2 = _uniform_box(1000, boxsize, seed=7)
+    bins = np.linspace(0.1, 10.0, 6)
+    directory = tempfile.mkdtemp()
+    grid_file = os.path.join(directory, 'catalog.grid')
+    try:
+        full = DD(1, 1, bins, x, y, z, boxsize=boxsize)
+        written = DD(1, 1, bins, x, y, z, boxsize=boxsize,
+                     grid_file=grid_file)
+        assert os.path.exists(grid_file)
+        reused = DD(1, 1, bins, None, None, None, boxsize=boxsize,
+                    grid_file=grid_file)
+        assert np.array_equal(written['npairs'], full['npairs'])
+        assert np.array_equal(reused['npairs'], full['npairs'])
+
+        full = DDrppi(0, 1, 10.0, bins, x, y, z, X2=x2, Y2=y2, Z2=z2,
+                      boxsize=boxsize)
+        reused = DDrppi(0, 1, 10.0, bins, None, None, None, X2=x2, Y2=y2,
+                        Z2=z2, boxsize=boxsize, grid_file=grid_file)
+        assert np.array_equal(reused['npairs'], full['npairs'])
+
+        try:
+            DD(1, 1, bins, x2, y2, z2, boxsize=boxsize, grid_file=grid_file)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("Passing the points along with an existing "
+                                 "grid_file must be rejected")
+
+        # The mocks lattice is gridded from the converted redshifts (and
+        # the weights), and can be re-used by both DDrppi_mocks and
+        # DDsmu_mocks for separations up to sqrt(rpmax^2 + pimax^2)
+        rng = np.random.RandomState(7)
+        ra, dec = rng.uniform(0.0, 90.0, 2000), rng.uniform(0.0, 60.0, 2000)
+        cz = rng.uniform(9000.0, 15000.0, 2000)
+        weights = rng.uniform(0.5, 1.5, 2000)
+        ra2, dec2 = rng.uniform(0.0, 90.0, 3000), rng.uniform(0.0, 60.0, 3000)
+        cz2 = rng.uniform(9000.0, 15000.0, 3000)
+        weights2 = rng.uniform(0.5, 1.5, 3000)
+        kwargs = dict(RA2=ra2, DEC2=dec2, CZ2=cz2, weights2=weights2,
+                      weight_type='pair_product')
+        mocks_file = os.path.join(directory, 'mocks.grid')
+        full = DDrppi_mocks(0, 1, 1, 10.0, bins, ra, dec, cz,
+                            weights1=weights, **kwargs)
+        written = DDrppi_mocks(0, 1, 1, 10.0, bins, ra, dec, cz,
+                               weights1=weights, grid_file=mocks_file,
+                               **kwargs)
+        info = gridded_catalog_info(mocks_file)
+        assert info['mocks'] and info['np'] == len(ra)
+        assert info['num_weights'] == 1 and info['cosmology'] == 1
+        reused = DDrppi_mocks(0, 1, 1, 10.0, bins, None, None, None,
+                              grid_file=mocks_file, **kwargs)
+        for results in [written, reused]:
+            assert np.array_equal(results['npairs'], full['npairs'])
+            assert np.allclose(results['weightavg'], full['weightavg'])
+
+        full = DDsmu_mocks(0, 1, 1, 1.0, 5, bins, ra, dec, cz,
+                           weights1=weights, **kwargs)
+        reused = DDsmu_mocks(0, 1, 1, 1.0, 5, bins, None, None, None,
+                             grid_file=mocks_file, **kwargs)
+        assert np.array_equal(reused['npairs'], full['npairs'])
+        assert np.allclose(reused['weightavg'], full['weightavg'])
+
+        try:
+            DDrppi_mocks(0, 1, 1, 10.0, bins, ra, dec, cz, weights1=weights,
+                         grid_file=mocks_file, **kwargs)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("Passing the points along with an existing "
+                                 "grid_file must be rejected")
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_permute_in_place():
+    """
+    With ``permute_in_place``, the inputs are reordered into cell order and
+    indexing the original arrays with the returned indices must recover them
+    """
+    import numpy as np
+    from Corrfunc.theory import DD, DDrppi
+
+    boxsize = 100.0
+    x, y, z = _uniform_box(3000, boxsize)
+    x2, y2, z2 = _uniform_box(2000, boxsize, seed=7)
+    weights = np.linspace(0.5, 1.5, len(x))
+    bins = np.linspace(0.1, 10.0, 6)
+
+    default = DD(1, 1, bins, x, y, z, weights1=weights,
+                 weight_type='pair_product', periodic=True, boxsize=boxsize)
+    X, Y, Z, W = x.copy(), y.copy(), z.copy(), weights.copy()
+    out = DD(1, 1, bins, X, Y, Z, weights1=W, weight_type='pair_product',
+             periodic=True, boxsize=boxsize, permute_in_place=True)
+    assert len(out) == 2
+    results, index = out
+    assert np.array_equal(results['npairs'], default['npairs'])
+    assert np.allclose(results['weightavg'], default['weightavg'])
+    assert np.array_equal(np.sort(index), np.arange(len(x)))
+    for permuted, orig in zip([X, Y, Z, W], [x, y, z, weights]):
+        assert np.array_equal(permuted, orig[index])
+
+    # Cross-correlations return the indices for both sets of points
+    default = DD(0, 1, bins, x, y, z, X2=x2, Y2=y2, Z2=z2,
+                 periodic=True, boxsize=boxsize)
+    X, Y, Z = x.copy(), y.copy(), z.copy()
+    X2, Y2, Z2 = x2.copy(), y2.copy(), z2.copy()
+    out = DD(0, 1, bins, X, Y, Z, X2=X2, Y2=Y2, Z2=Z2, periodic=True,
+             boxsize=boxsize, permute_in_place=True)
+    assert len(out) == 3
+    results, index, index2 = out
+    assert np.array_equal(results['npairs'], default['npairs'])
+    for permuted, orig in zip([X, Y, Z], [x, y, z]):
+        assert np.array_equal(permuted, orig[index])
+    for permuted, orig in zip([X2, Y2, Z2], [x2, y2, z2]):
+        assert np.array_equal(permuted, orig[index2])
+
+    # All three components of the velocities are reordered, whether or not
+    # they are needed for the redshift-space displacements
+    rng = np.random.RandomState(42)
+    velocities = rng.normal(0.0, 1.0, (3, len(x)))
+    for rsd_factor in [0.0, 1.0]:
+        default = DDrppi(1, 1, 10.0, bins, x, y, z, periodic=True,
+                         boxsize=boxsize, velocities1=velocities,
+                         rsd_factor=rsd_factor)
+        X, Y, Z, V = x.copy(), y.copy(), z.copy(), velocities.copy()
+        results, index = DDrppi(1, 1, 10.0, bins, X, Y, Z, periodic=True,
+                                boxsize=boxsize, velocities1=V,
+                                rsd_factor=rsd_factor, permute_in_place=True)
+        assert np.array_equal(results['npairs'], default['npairs'])
+        assert np.array_equal(V, velocities[:, index])
+        assert np.array_equal(Z, z[index])
+
+    # The arrays must be writeable and contiguous
+    readonly = x.copy()
+    readonly.flags.writeable = False
+    strided = np.column_stack([x, y, z])
+    for X, Y, Z in [(readonly, y.copy(), z.copy()),
+                    (strided[:, 0], strided[:, 1], strided[:, 2])]:
+        try:
+            DD(1, 1, bins, X, Y, Z, periodic=True, boxsize=boxsize,
+               permute_in_place=True)
+        except RuntimeError:
+            pass
+        else:
+            raise AssertionError("Expected a RuntimeError for arrays that "
+                                 "can not be permuted in place")
+    assert np.array_equal(readonly, x)
+
+
+def test_positions():
+    """
+    Positions passed as an ``(N, 3)`` array, as strided columns or as the
+    fields of a structured array must give the same counts as separate,
+    contiguous X/Y/Z arrays
+    """
+    import numpy as np
+    from Corrfunc.theory import DD
+    from Corrfunc.mocks import DDrppi_mocks
+
+    def layouts(a, b, c):
+        # The columns of an (N, 3) array and the fields of a structured
+        # array are views with a stride of 24 and 32 bytes respectively
+        pos = np.column_stack([a, b, c])
+        rec = np.zeros(len(a), dtype=[('a', 'f8'), ('b', 'f8'),
+                                      ('c', 'f8'), ('w', 'f8')])
+        rec['a'], rec['b'], rec['c'] = a, b, c
+        assert pos[:, 0].strides[0] == 24 and rec['a'].strides[0] == 32
+        return [(pos, None),
+                (None, (pos[:, 0], pos[:, 1], pos[:, 2])),
+                (None, (rec['a'], rec['b'], rec['c']))]
+
+    boxsize = 100.0
+    x, y, z = _uniform_box(3000, boxsize)
+    x2, y2, z2 = _uniform_box(2000, boxsize, seed=7)
+    bins = np.linspace(0.1, 10.0, 6)
+
+    for periodic in [True, False]:
+        kwargs = dict(periodic=periodic, boxsize=boxsize, output_ravg=True)
+        auto = DD(1, 1, bins, x, y, z, **kwargs)
+        cross = DD(0, 1, bins, x, y, z, X2=x2, Y2=y2, Z2=z2, **kwargs)
+        for (pos1, cols1), (pos2, cols2) in zip(layouts(x, y, z),
+                                                layouts(x2, y2, z2)):
+            if pos1 is not None:
+                results = DD(1, 1, bins, positions1=pos1, **kwargs)
+                results2 = DD(0, 1, bins, positions1=pos1, positions2=pos2,
+                              **kwargs)
+            else:
+                results = DD(1, 1, bins, *cols1, **kwargs)
+                results2 = DD(0, 1, bins, *cols1, X2=cols2[0], Y2=cols2[1],
+                              Z2=cols2[2], **kwargs)
+            assert np.array_equal(results['npairs'], auto['npairs'])
+            assert np.allclose(results['ravg'], auto['ravg'])
+            assert np.array_equal(results2['npairs'], cross['npairs'])
+            assert np.allclose(results2['ravg'], cross['ravg'])
+
+    # The points of the mocks are in a shell of comoving distances
+    rng = np.random.RandomState(7)
+    ra, dec = rng.uniform(0.0, 90.0, 2000), rng.uniform(0.0, 60.0, 2000)
+    dist = rng.uniform(100.0, 200.0, 2000)
+    default = DDrppi_mocks(1, 1, 1, 10.0, bins, ra, dec, dist,
+                           is_comoving_dist=True)
+    for pos, cols in layouts(ra, dec, dist):
+        if pos is not None:
+            results = DDrppi_mocks(1, 1, 1, 10.0, bins, positions1=pos,
+                                   is_comoving_dist=True)
+        else:
+            results = DDrppi_mocks(1, 1, 1, 10.0, bins, *cols,
+                                   is_comoving_dist=True)
+        assert np.array_equal(results['npairs'], default['npairs'])
+
+
+def test_optional_returns():
+    """
+    Every combination of the diagnostic flags (and ``permute_in_place``)
+    must return the optional values in the documented order, and the phases
+    of every call must be appended to the ``CORRFUNC_TRACE`` file
+    """
+    import os
+    import json
+    import shutil
+    import tempfile
+    import itertools
+    import numpy as np
+    from Corrfunc.theory import DD
+    from Corrfunc.mocks import DDrppi_mocks
+
+    phases = set(['max_min', 'gridlink', 'sort', 'assign_ngb_cells',
+                  'kernel', 'reduction', 'distance', 'cleanup'])
+    flags = ['c_api_timer', 'c_api_phase_timer', 'c_cell_timer',
+             'c_perf_counters', 'c_api_phase_memory', 'permute_in_place']
+
+    def check(ret, npairs, kwargs, nindex):
+        # (results, api_time, api_phases, cell_time, perf_counters,
+        #  api_phase_memory, original_index1, original_index2)
+        ret = list(ret) if isinstance(ret, tuple) else [ret]
+        assert np.array_equal(ret.pop(0)['npairs'], npairs)
+        if kwargs['c_api_timer']:
+            assert isinstance(ret.pop(0), float)
+        if kwargs['c_api_phase_timer']:
+            assert set(ret.pop(0)) == phases
+        if kwargs['c_cell_timer']:
+            assert 'cellidx1' in ret.pop(0).dtype.names
+        if kwargs['c_perf_counters']:
+            assert set(ret.pop(0)) == set(['gridlink', 'assign_ngb_cells',
+                                           'kernel'])
+        if kwargs['c_api_phase_memory']:
+            assert set(ret.pop(0)) == phases
+        if kwargs.get('permute_in_place'):
+            for _ in range(nindex):
+                assert ret.pop(0).dtype == np.int64
+        assert len(ret) == 0
+
+    boxsize = 100.0
+    x, y, z = _uniform_box(500, boxsize)
+    x2, y2, z2 = _uniform_box(500, boxsize, seed=7)
+    bins = np.linspace(0.1, 10.0, 6)
+    rng = np.random.RandomState(7)
+    ra, dec = rng.uniform(0.0, 90.0, 500), rng.uniform(0.0, 60.0, 500)
+    dist = rng.uniform(100.0, 200.0, 500)
+
+    directory = tempfile.mkdtemp()
+    tracefile = os.path.join(directory, 'trace.jsonl')
+    os.environ['CORRFUNC_TRACE'] = tracefile
+    ncalls = 0
+    try:
+        full = DD(0, 1, bins, x, y, z, X2=x2, Y2=y2, Z2=z2, boxsize=boxsize)
+        ncalls += 1
+        for on in itertools.product([False, True], repeat=len(flags)):
+            kwargs = dict(zip(flags, on))
+            # permute_in_place reorders the points
+            ret = DD(0, 1, bins, x.copy(), y.copy(), z.copy(), X2=x2.copy(),
+                     Y2=y2.copy(), Z2=z2.copy(), boxsize=boxsize, **kwargs)
+            check(ret, full['npairs'], kwargs, 2)
+            ncalls += 1
+
+        full = DDrppi_mocks(1, 1, 1, 10.0, bins, ra, dec, dist,
+                            is_comoving_dist=True)
+        ncalls += 1
+        for on in itertools.product([False, True], repeat=len(flags) - 1):
+            kwargs = dict(zip(flags, on))
+            ret = DDrppi_mocks(1, 1, 1, 10.0, bins, ra, dec, dist,
+                               is_comoving_dist=True, **kwargs)
+            check(ret, full['npairs'], kwargs, 0)
+            ncalls += 1
+
+        with open(tracefile) as f:
+            records = [json.loads(line) for line in f]
+    finally:
+        del os.environ['CORRFUNC_TRACE']
+        shutil.rmtree(directory)
+
+    assert len(records) == ncalls
+    for record in records:
+        assert record['routine'] in ['DD', 'DDrppi_mocks']
+        assert set(record['api_phases']) == phases
+        assert record['api_time'] > 0.0
+        assert record['N1'] == len(x)
+
+
+def test_cell_timer():
+    """
+    ``c_cell_timer=True`` must return one record per visited cell pair, and
+    ``c_cell_timer=k`` about one in every ``k`` of them
+    """
+    import os
+    import shutil
+    import tempfile
+    import numpy as np
+    from Corrfunc.theory import DD
+    from Corrfunc.mocks import DDrppi_mocks
+    from Corrfunc.utils import gridded_catalog_info
+
+    names = ('N1', 'N2', 'time_in_ns', 'cycles', 'cellidx1', 'cellidx2',
+             'tid')
+    nthreads = 2
+
+    def check(timings, N):
+        assert timings.dtype.names == names
+        assert (timings['N1'] > 0).all() and (timings['N2'] > 0).all()
+        assert (timings['time_in_ns'] >= 0).all()
+        # Every cell pair is visited once, and every (non-empty) cell is
+        # paired with itself once in an auto-correlation
+        pairs = timings[['cellidx1', 'cellidx2']]
+        assert len(np.unique(pairs)) == len(timings)
+        same = timings[timings['cellidx1'] == timings['cellidx2']]
+        assert len(same) == len(np.unique(timings['cellidx1']))
+        assert same['N1'].sum() == N
+
+    def check_sampling(sampled, ncell_pairs, k):
+        # Every thread times its 1st, (k+1)-th, (2k+1)-th ... cell pair
+        assert sampled.dtype.names == names
+        assert abs(len(sampled) - ncell_pairs / k) <= nthreads
+
+    # Enough points that none of the cells are empty
+    boxsize = 100.0
+    x, y, z = _uniform_box(50000, boxsize)
+    bins = np.linspace(0.1, 10.0, 6)
+    directory = tempfile.mkdtemp()
+    grid_file = os.path.join(directory, 'catalog.grid')
+    try:
+        _, timings = DD(1, nthreads, bins, x, y, z, boxsize=boxsize,
+                        c_cell_timer=True, grid_file=grid_file)
+        info = gridded_catalog_info(grid_file)
+    finally:
+        shutil.rmtree(directory)
+    check(timings, len(x))
+    # Every cell, and half of its neighbours (of the auto-correlation)
+    nmesh = np.array(info['nmesh'])
+    nngb = np.prod(2 * np.array(info['bin_refine_factors']) + 1)
+    assert (nmesh >= 2 * np.array(info['bin_refine_factors']) + 1).all()
+    assert len(timings) == np.prod(nmesh) * (1 + (nngb - 1) // 2)
+    for k in [3, 10]:
+        _, sampled = DD(1, nthreads, bins, x, y, z, boxsize=boxsize,
+                        c_cell_timer=k)
+        check_sampling(sampled, len(timings), k)
+
+    rng = np.random.RandomState(7)
+    ra, dec = rng.uniform(0.0, 90.0, 5000), rng.uniform(0.0, 60.0, 5000)
+    dist = rng.uniform(100.0, 200.0, 5000)
+    _, timings = DDrppi_mocks(1, 1, nthreads, 10.0, bins, ra, dec, dist,
+                              is_comoving_dist=True, c_cell_timer=True)
+    check(timings, len(ra))
+    for k in [3, 10]:
+        _, sampled = DDrppi_mocks(1, 1, nthreads, 10.0, bins, ra, dec, dist,
+                                  is_comoving_dist=True, c_cell_timer=k)
+        check_sampling(sampled, len(timings), k)
+
+
+def test_perf_counters():
+    """
+    The performance counters must degrade gracefully: the events that can
+    not be counted (e.g., the hardware events in a virtual machine) are
+    ``None``, and so are the ratios derived from them
+    """
+    import numpy as np
+    from Corrfunc.theory import DD
+    from Corrfunc.mocks import DDrppi_mocks
+    from Corrfunc.utils import summarize_perf_counters
+
+    events = ['cycles', 'instructions', 'cache_references', 'cache_misses',
+              'branches', 'branch_misses', 'task_clock_ns', 'page_faults']
+    ratios = dict(ipc=('instructions', 'cycles'),
+                  cache_miss_rate=('cache_misses', 'cache_references'),
+                  branch_miss_rate=('branch_misses', 'branches'))
+    nthreads = 2
+
+    def check(perf_counters):
+        assert set(perf_counters) == set(['gridlink', 'assign_ngb_cells',
+                                          'kernel'])
+        for phase, summary in perf_counters.items():
+            per_thread = summary['per_thread']
+            assert per_thread.dtype.names == tuple(['tid'] + events)
+            assert summary['nthreads'] == len(per_thread)
+            assert 1 <= len(per_thread) <= nthreads
+            for event in events:
+                # Either counted on every thread, or None
+                if summary[event] is None:
+                    assert (per_thread[event] == -1).any()
+                else:
+                    assert (per_thread[event] >= 0).all()
+                    assert summary[event] == per_thread[event].sum()
+            for ratio, (numerator, denominator) in ratios.items():
+                if summary[numerator] is None or not summary[denominator]:
+                    assert summary[ratio] is None
+                else:
+                    assert np.isclose(summary[ratio], summary[numerator] /
+                                      float(summary[denominator]))
+
+    # Missing events (-1) on any thread are reported as None
+    dtype = np.dtype([(str(name), np.int32 if name == 'tid' else np.int64)
+                      for name in ['tid'] + events])
+    counts = np.array([(0, -1, -1, -1, -1, 10, 1, 1000, 3),
+                       (1, -1, 200, -1, -1, 30, 0, 3000, 4)], dtype=dtype)
+    summary = summarize_perf_counters({'kernel': counts})['kernel']
+    assert summary['cycles'] is None and summary['instructions'] is None
+    assert summary['ipc'] is None and summary['cache_miss_rate'] is None
+    assert summary['branches'] == 40
+    assert np.isclose(summary['branch_miss_rate'], 0.025)
+    assert summary['task_clock_ns'] == 4000 and summary['page_faults'] == 7
+    assert summary['nthreads'] == 2
+
+    boxsize = 100.0
+    x, y, z = _uniform_box(5000, boxsize)
+    bins = np.linspace(0.1, 10.0, 6)
+    full = DD(1, nthreads, bins, x, y, z, boxsize=boxsize)
+    results, perf_counters = DD(1, nthreads, bins, x, y, z, boxsize=boxsize,
+                                c_perf_counters=True)
+    assert np.array_equal(results['npairs'], full['npairs'])
+    check(perf_counters)
+
+    rng = np.random.RandomState(7)
+    ra, dec = rng.uniform(0.0, 90.0, 5000), rng.uniform(0.0, 60.0, 5000)
+    dist = rng.uniform(100.0, 200.0, 5000)
+    full = DDrppi_mocks(1, 1, nthreads, 10.0, bins, ra, dec, dist,
+                        is_comoving_dist=True)
+    results, perf_counters = DDrppi_mocks(1, 1, nthreads, 10.0, bins, ra,
+                                          dec, dist, is_comoving_dist=True,
+                                          c_perf_counters=True)
+    assert np.array_equal(results['npairs'], full['npairs'])
+    check(perf_counters)
+
+
 def tests():
     """
     Wrapper to run the two scripts that should have been installed
-    with the Corrfunc package.
+    with the Corrfunc package, and the tests in this module.
 
     If the two scripts (one for theory extensions, one for mocks extensions)
     run successfully, then the package is working correctly.
@@ -30,6 +935,24 @@ def tests():
     # Run the mocks script
     cm.main()
 
+    test_weighted_randoms_self_pairs()
+    test_los_and_rsd()
+    test_wp_multiple_pimax()
+    test_low_latency_path()
+    test_DD_streaming()
+    test_distributed_single_rank()
+    test_query_mode()
+    test_incremental()
+    test_batch()
+    test_estimators()
+    test_result_cache()
+    test_grid_file()
+    test_permute_in_place()
+    test_positions()
+    test_optional_returns()
+    test_cell_timer()
+    test_perf_counters()
+
 
 if __name__ == '__main__':
     tests()
@@ -0,0 +1,362 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Out-of-core version of the pair counter in ``theory/DD/``, for catalogs
+that do not fit in memory. This wrapper is in
+:py:mod:`Corrfunc.theory.DD_streaming`
+"""
+
+from __future__ import (division, print_function, absolute_import,
+                        unicode_literals)
+
+__author__ = ('Manodeep Sinha')
+__all__ = ('DD_streaming', )
+
+# Number of thin slabs (along X) that the catalogs are spilled into.
+# The slabs counted at a time are built from consecutive thin slabs.
+NUM_SPILL_SLABS = 128
+
+
+def _spill_catalog(source, boxsize, nslabs, chunksize, dirname, prefix):
+    """
+    Reads the catalog chunk by chunk and appends every particle to the
+    file of the thin slab (along X) containing it. Returns the number of
+    particles in every slab, the number of columns (3, or 4 with weights)
+    and the dtype of the spilled positions
+    """
+    import numpy as np
+    from os.path import join as pjoin
+    from Corrfunc.io import read_catalog_chunks
+
+    counts = np.zeros(nslabs, dtype=np.int64)
+    files = []
+    dtype = None
+    ncols = None
+    try:
+        for i in range(nslabs):
+            files.append(open(pjoin(dirname, '{0}_{1:04d}.bin'
+                                    .format(prefix, i)), 'wb'))
+
+        for columns in read_catalog_chunks(source, chunksize=chunksize):
+            if dtype is None:
+                dtype = np.float32 if columns[0].dtype == np.float32 \
+                    else np.float64
+                ncols = len(columns)
+            elif len(columns) != ncols:
+                msg = "All chunks must have the same number of columns "\
+                      "(with or without weights)"
+                raise ValueError(msg)
+
+            n = len(columns[0])
+            if n == 0:
+                continue
+
+            rows = np.empty((n, ncols), dtype=dtype)
+            for i, c in enumerate(columns):
+                rows[:, i] = c
+
+            # Positions outside [0, boxsize) are assigned to the edge slabs
+            slab = np.floor(rows[:, 0] * (nslabs / boxsize)).astype(np.int64)
+            np.clip(slab, 0, nslabs - 1, out=slab)
+            order = np.argsort(slab, kind='mergesort')
+            rows = rows[order]
+            nslab = np.bincount(slab, minlength=nslabs)
+            start = 0
+            for i in np.nonzero(nslab)[0]:
+                rows[start:start + nslab[i]].tofile(files[i])
+                start += nslab[i]
+            counts += nslab
+    finally:
+        for f in files:
+            f.close()
+
+    if dtype is None:
+        msg = "Found no particles in the catalog"
+        raise ValueError(msg)
+
+    return counts, ncols, dtype
+
+
+def _load_slabs(dirname, prefix, slabs, ncols, dtype):
+    """
+    Reads the particles in the (thin) slabs and returns the X/Y/Z (and
+    weights) as C-contiguous arrays
+    """
+    import numpy as np
+    from os.path import join as pjoin
+
+    rows = [np.fromfile(pjoin(dirname, '{0}_{1:04d}.bin'.format(prefix, i)),
+                        dtype=dtype).reshape(-1, ncols) for i in slabs]
+    rows = np.concatenate(rows) if rows else np.empty((0, ncols), dtype)
+    return [np.ascontiguousarray(rows[:, i]) for i in range(ncols)]
+
+
+def _slab_groups(counts1, counts2, nhalo, periodic, max_particles):
+    """
+    Groups consecutive thin slabs so that the particles in a group (from
+    the first catalog) plus the particles within ``nhalo`` thin slabs of
+    the group (from the second catalog) do not exceed ``max_particles``.
+    Yields the list of thin slabs in the group and in its extended region
+    """
+    nslabs = len(counts1)
+
+    def extended(first, last):
+        if periodic:
+            if last - first + 2 * nhalo >= nslabs:
+                return list(range(nslabs))
+            return [i % nslabs for i in range(first - nhalo, last + nhalo)]
+        return list(range(max(first - nhalo, 0), min(last + nhalo, nslabs)))
+
+    first = 0
+    while first < nslabs:
+        last = first + 1
+        while last < nslabs:
+            npart = counts1[first:last + 1].sum() + \
+                counts2[extended(first, last + 1)].sum()
+            if npart > max_particles:
+                break
+            last += 1
+
+        npart = counts1[first:last].sum() + counts2[extended(first, last)].sum()
+        if npart > max_particles:
+            msg = "The particles in a single slab (and its halo) need more "\
+                  "than the memory budget. Please increase memory_budget"
+            raise ValueError(msg)
+
+        yield list(range(first, last)), extended(first, last)
+        first = last
+
+
+def DD_streaming(autocorr, nthreads, binfile, source1, boxsize,
+                 periodic=True, source2=None, memory_budget=4 * 1024**3,
+                 chunksize=1000000, tmpdir=None, output_ravg=False,
+                 xbin_refine_factor=2, ybin_refine_factor=2,
+                 zbin_refine_factor=1, max_cells_per_dim=100,
+                 c_api_timer=False, isa=r'fastest', weight_type=None):
+    """
+    Calculate the 3-D pair-counts (same as :py:mod:`Corrfunc.theory.DD`)
+    for catalogs that do not fit in memory.
+
+    The catalogs are read in chunks and spilled to disk into thin slabs
+    along the X axis. Consecutive slabs are then grouped into slabs that fit
+    within ``memory_budget``, and every slab is counted against itself plus
+    a halo of width ``rmax`` (wrapped around for periodic boxes). The next
+    slab is read from disk while the current one is counted, and the counts
+    are accumulated into one histogram.
+
+    .. note:: The temporary files need as much disk space as the
+       (binary) catalogs. Every particle is read from the source once.
+
+
+    Parameters
+    -----------
+
+    autocorr: boolean, required
+        Boolean flag for auto/cross-correlation. If autocorr is set to 1,
+        then ``source2`` is not required.
+
+    nthreads: integer
+        The number of OpenMP threads to use within every slab. If
+        ``nthreads <= 0``, the number of threads is picked from the number
+        of particles.
+
+    binfile: string or an list/array of floats
+        The ``r`` bins, same as for :py:mod:`Corrfunc.theory.DD`.
+
+    source1: string, array-like, iterable or callable
+        The first catalog, in any form accepted by
+        :py:func:`Corrfunc.io.read_catalog_chunks`: a fast-food or HDF5
+        file, a tuple of (memory-mapped) X/Y/Z arrays, an array of shape
+        ``(N, 3)``, or a generator of chunks. A fourth column holds the
+        weights.
+
+    boxsize: double
+        The side-length of the cube containing the particles. The positions
+        are expected within ``[0, boxsize)``; this is also the period for
+        periodic boundary conditions.
+
+    periodic: boolean
+       Boolean flag to indicate periodic boundary conditions.
+
+    source2: string, array-like, iterable or callable
+        The second catalog, only required when ``autocorr==0``.
+
+    memory_budget: integer, default 4 GB
+        The maximum number of bytes used for the particles in memory. Sets
+        the number of particles counted at a time.
+
+    chunksize: integer, default 1000000
+        The number of particles read from the sources at a time.
+
+    tmpdir: string, optional
+        The directory for the temporary slab files. Defaults to the system
+        temporary directory.
+
+    output_ravg, (xyz)bin_refine_factor, max_cells_per_dim, c_api_timer,
+    isa, weight_type:
+        Same as for :py:mod:`Corrfunc.theory.DD`
+
+    Returns
+    --------
+
+    results: Numpy structured array
+       A numpy structured array containing [rmin, rmax, ravg, npairs,
+       weightavg] for each radial bin, identical to the results of
+       :py:mod:`Corrfunc.theory.DD` on the full catalogs.
+
+    api_time: float, optional
+       Only returned if ``c_api_timer`` is set. The total time spent within
+       the C library, over all the slabs.
+
+    Example
+    --------
+
+    >>> from __future__ import print_function
+    >>> import numpy as np
+    >>> from Corrfunc.theory.DD import DD
+    >>> from Corrfunc.theory.DD_streaming import DD_streaming
+    >>> np.random.seed(42)
+    >>> boxsize = 420.0
+    >>> positions = np.random.uniform(0, boxsize, (100000, 3))
+    >>> bins = np.logspace(-1, np.log10(25.0), 15)
+    >>> results = DD_streaming(1, 1, bins, positions, boxsize,
+    ...                        memory_budget=2 * 1024**2)
+    >>> full = DD(1, 1, bins, positions1=positions, boxsize=boxsize)
+    >>> print(np.all(results['npairs'] == full['npairs']))
+    True
+
+    """
+    import shutil
+    import tempfile
+    import threading
+    import numpy as np
+    from Corrfunc.theory.DD import DD
+    from Corrfunc.utils import return_rbins_for_extension
+
+    if boxsize <= 0:
+        msg = "boxsize = {0} must be positive".format(boxsize)
+        raise ValueError(msg)
+
+    if not autocorr and source2 is None:
+        msg = "Must pass a valid source2 for cross-correlations"
+        raise ValueError(msg)
+
+    rbins = return_rbins_for_extension(binfile)
+    if isinstance(rbins, np.ndarray):
+        rmax = rbins[-1]
+    else:
+        rmax = np.max(np.loadtxt(rbins, ndmin=2)[:, 1])
+
+    nslabs = NUM_SPILL_SLABS
+    nhalo = int(np.ceil(rmax * nslabs / boxsize))
+
+    dirname = tempfile.mkdtemp(prefix='Corrfunc_DD_', dir=tmpdir)
+    try:
+        counts1, ncols1, dtype = _spill_catalog(source1, boxsize, nslabs,
+                                                chunksize, dirname, 'cat1')
+        if autocorr:
+            counts2, ncols2, prefix2 = counts1, ncols1, 'cat1'
+        else:
+            counts2, ncols2, dtype2 = _spill_catalog(source2, boxsize, nslabs,
+                                                     chunksize, dirname,
+                                                     'cat2')
+            if dtype2 != dtype:
+                msg = "Both catalogs must have the same precision"
+                raise ValueError(msg)
+            prefix2 = 'cat2'
+
+        # Two slabs are in memory (one is counted, the next one is read),
+        # plus the rows while they are being split into columns
+        bytes_per_particle = 3 * max(ncols1, ncols2) * np.dtype(dtype).itemsize
+        max_particles = max(int(memory_budget // bytes_per_particle), 1)
+        groups = list(_slab_groups(counts1, counts2, nhalo, periodic,
+                                   max_particles))
+
+        def load(group):
+            slabs, ext = group
+            return (_load_slabs(dirname, 'cat1', slabs, ncols1, dtype),
+                    _load_slabs(dirname, prefix2, ext, ncols2, dtype))
+
+        def prefetch(group, out):
+            try:
+                out.append(load(group))
+            except Exception as e:
+                out.append(e)
+
+        results = None
+        api_time = 0.0
+        next_group = []
+        loader = threading.Thread(target=prefetch,
+                                  args=(groups[0], next_group))
+        loader.start()
+        for igroup in range(len(groups)):
+            loader.join()
+            loaded = next_group.pop()
+            if isinstance(loaded, Exception):
+                raise loaded
+            if igroup + 1 < len(groups):
+                loader = threading.Thread(target=prefetch,
+                                          args=(groups[igroup + 1],
+                                                next_group))
+                loader.start()
+
+            columns1, columns2 = loaded
+            del loaded
+            if len(columns1[0]) == 0 or len(columns2[0]) == 0:
+                continue
+
+            # Every particle in the slab is counted against all of its
+            # neighbours, so a cross-correlation gives the (ordered) pairs
+            # of the auto-correlation. The arrays are temporary and can be
+            # reordered in place.
+            kwargs = {}
+            if len(columns1) == 4 or len(columns2) == 4:
+                kwargs['weights1'] = columns1[3] if len(columns1) == 4 \
+                    else np.ones_like(columns1[0])
+                kwargs['weights2'] = columns2[3] if len(columns2) == 4 \
+                    else np.ones_like(columns2[0])
+                kwargs['weight_type'] = weight_type
+            r, t = DD(0, nthreads, rbins, columns1[0], columns1[1],
+                      columns1[2], X2=columns2[0], Y2=columns2[1],
+                      Z2=columns2[2], periodic=periodic, boxsize=boxsize,
+                      output_ravg=output_ravg,
+                      xbin_refine_factor=xbin_refine_factor,
+                      ybin_refine_factor=ybin_refine_factor,
+                      zbin_refine_factor=zbin_refine_factor,
+                      max_cells_per_dim=max_cells_per_dim,
+                      c_api_timer=True, isa=isa, permute_in_place=True,
+                      **kwargs)[0:2]
+            del columns1, columns2
+            api_time += t
+
+            # ravg and weightavg are averages -> accumulate the sums
+            if results is None:
+                results = r.copy()
+                results['ravg'] *= r['npairs']
+                results['weightavg'] *= r['npairs']
+            else:
+                results['npairs'] += r['npairs']
+                results['ravg'] += r['ravg'] * r['npairs']
+                results['weightavg'] += r['weightavg'] * r['npairs']
+        loader.join()
+    finally:
+        shutil.rmtree(dirname, ignore_errors=True)
+
+    if results is None:
+        msg = "Found no particles to count pairs"
+        raise ValueError(msg)
+
+    nonzero = results['npairs'] > 0
+    for field in ['ravg', 'weightavg']:
+        results[field][nonzero] /= results['npairs'][nonzero]
+
+    if c_api_timer:
+        return results, api_time
+
+    return results
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
@@ -9,7 +9,8 @@ from __future__ import (division, print_function, absolute_import,
                         unicode_literals)
 
 __author__ = ('Manodeep Sinha')
-__all__ = ('DD', 'DDrppi', 'wp', 'xi', 'vpf', 'DDsmu',)
+__all__ = ('DD', 'DDrppi', 'wp', 'xi', 'vpf', 'DDsmu', 'DD_streaming',
+           'DD_batch', 'wp_batch',)
 
 import sys
 
@@ -19,6 +20,8 @@ from .wp import wp
 from .xi import xi
 from .vpf import vpf
 from .DDsmu import DDsmu
+from .DD_streaming import DD_streaming
+from .batch import DD_batch, wp_batch
 
 if sys.version_info[0] < 3:
     __all__ = [n.encode('ascii') for n in __all__]
@@ -0,0 +1,351 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Batched versions of the pair counters in ``theory/DD/`` and
+``theory/wp/``, for many small catalogs (e.g., HOD realisations,
+sub-boxes or light-cone shells). Whole catalogs are distributed over the
+threads, and every catalog is counted by a single thread, in one call to
+the C library. These wrappers are in :py:mod:`Corrfunc.theory.batch`
+"""
+
+from __future__ import (division, print_function, absolute_import,
+                        unicode_literals)
+
+__author__ = ('Manodeep Sinha')
+__all__ = ('DD_batch', 'wp_batch')
+
+
+def _concatenate_catalogs(catalogs, weights=None):
+    """
+    Concatenates a sequence of catalogs into contiguous X/Y/Z (and weights)
+    arrays, and returns them along with the offset of the first particle of
+    every catalog (and the total number of particles).
+
+    Every catalog is either an array of shape (N, 3), or a sequence of the
+    X, Y and Z arrays. ``weights`` is either None or a sequence with the
+    weights of every catalog (each of shape (N, ) or (n_weights, N))
+    """
+    import numpy as np
+    from Corrfunc.utils import unpack_positions
+
+    columns = []
+    for catalog in catalogs:
+        if isinstance(catalog, np.ndarray) and catalog.ndim == 2:
+            X, Y, Z = unpack_positions(catalog, None, None, None)
+        else:
+            X, Y, Z = catalog
+        X, Y, Z = [np.atleast_1d(c) for c in (X, Y, Z)]
+        if not (len(X) == len(Y) == len(Z)) or len(X) == 0:
+            msg = "The X/Y/Z arrays of every catalog must have the same "\
+                  "(non-zero) length"
+            raise ValueError(msg)
+        columns.append((X, Y, Z))
+
+    if len(columns) == 0:
+        msg = "Must pass at least one catalog"
+        raise ValueError(msg)
+
+    counts = np.array([len(c[0]) for c in columns], dtype=np.int64)
+    offsets = np.zeros(len(columns) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(counts)
+
+    # All catalogs are counted in the precision of the first
+    dtype = np.float32 if columns[0][0].dtype == np.float32 else np.float64
+    X, Y, Z = [np.concatenate([c[i] for c in columns]).astype(dtype, copy=False)
+               for i in range(3)]
+
+    if weights is not None:
+        if len(weights) != len(columns):
+            msg = "Must pass one set of weights for every catalog"
+            raise ValueError(msg)
+        weights = [np.atleast_2d(w) for w in weights]
+        for w, n in zip(weights, counts):
+            if w.shape != (weights[0].shape[0], n):
+                msg = "The weights of every catalog must have shape "\
+                      "(n_weights, n_positions) or (n_positions, ), with "\
+                      "the same number of weights"
+                raise ValueError(msg)
+        weights = np.concatenate(weights, axis=1).astype(dtype, copy=False)
+
+    return X, Y, Z, weights, offsets
+
+
+def DD_batch(autocorr, nthreads, binfile, catalogs1, weights1=None,
+             periodic=True, catalogs2=None, weights2=None, boxsize=0.0,
+             output_ravg=False, xbin_refine_factor=2, ybin_refine_factor=2,
+             zbin_refine_factor=1, max_cells_per_dim=100,
+             c_api_timer=False, isa=r'fastest', weight_type=None,
+             mixed_precision=False, max_position_error=0.0):
+    """
+    Batched version of :py:mod:`Corrfunc.theory.DD`, for many independent
+    (small) catalogs.
+
+    The pair counter in :py:mod:`Corrfunc.theory.DD` parallelises over the
+    cells of one catalog, which scales poorly for small catalogs. Here,
+    whole catalogs are distributed over the threads instead, and every
+    catalog is counted by a single thread (with its own lattice and
+    histograms). All catalogs are counted in one call, and the results are
+    returned as one stacked array.
+
+    Parameters
+    -----------
+
+    autocorr, nthreads, binfile, periodic, boxsize, output_ravg,
+    (xyz)bin_refine_factor, max_cells_per_dim, c_api_timer, isa,
+    weight_type, mixed_precision, max_position_error:
+        Same as for :py:mod:`Corrfunc.theory.DD`, and used for every
+        catalog. ``nthreads`` is the number of catalogs counted at the same
+        time (``nthreads <= 0`` uses all the cores).
+
+    catalogs1: sequence of catalogs
+        Every catalog is either an array of shape ``(N, 3)``, or a
+        sequence of the ``X``, ``Y`` and ``Z`` arrays. The catalogs can have
+        different numbers of particles, and are all counted in the
+        precision of the first catalog.
+
+    weights1: sequence of array-like, optional
+        The weights of every catalog in ``catalogs1``, each of shape
+        ``(N, )`` or ``(n_weights, N)``.
+
+    catalogs2, weights2: optional
+        Same as ``catalogs1`` and ``weights1``, with one catalog for every
+        catalog in ``catalogs1``. Only used for cross-correlations
+        (``autocorr=0``): catalog ``i`` of ``catalogs1`` is counted
+        against catalog ``i`` of ``catalogs2``.
+
+    Returns
+    --------
+
+    results: Numpy structured array
+        An array of shape ``(ncatalogs, nbins)``, with ``results[i]``
+        containing the same fields as :py:mod:`Corrfunc.theory.DD` for
+        catalog ``i``.
+
+    api_time: float, optional
+        Only returned if ``c_api_timer`` is set. The time spent within the
+        C library for the full batch.
+
+    Example
+    --------
+
+    >>> import numpy as np
+    >>> from Corrfunc.theory.batch import DD_batch
+    >>> from Corrfunc.theory.DD import DD
+    >>> rng = np.random.RandomState(42)
+    >>> catalogs = [rng.uniform(0, 100., (n, 3)) for n in [500, 1000, 2000]]
+    >>> bins = np.linspace(0.1, 10.0, 10)
+    >>> results = DD_batch(1, 2, bins, catalogs, boxsize=100.)
+    >>> results.shape
+    (3, 9)
+    >>> single = DD(1, 1, bins, positions1=catalogs[1], boxsize=100.)
+    >>> np.all(results[1]['npairs'] == single['npairs'])
+    True
+
+    """
+    try:
+        from Corrfunc._countpairs import countpairs_batch as DD_batch_extn
+    except ImportError:
+        msg = "Could not import the C extension for the batched 3-D "\
+              "real-space pair counter."
+        raise ImportError(msg)
+
+    import numpy as np
+    from future.utils import bytes_to_native_str
+    from Corrfunc.utils import translate_isa_string_to_enum,\
+        return_rbins_for_extension, sys_pipes
+
+    X1, Y1, Z1, weights1, offsets1 = _concatenate_catalogs(catalogs1,
+                                                          weights1)
+    kwargs = {}
+    if autocorr:
+        weights2 = None
+    else:
+        if catalogs2 is None:
+            msg = "Must pass the second set of catalogs for computing "\
+                  "cross-correlations"
+            raise ValueError(msg)
+        X2, Y2, Z2, weights2, offsets2 = _concatenate_catalogs(catalogs2,
+                                                              weights2)
+        if len(offsets2) != len(offsets1):
+            msg = "Must pass the same number of catalogs in both sets"
+            raise ValueError(msg)
+
+        # If only one set of points has weights, set the other to uniform weights
+        if weights1 is None and weights2 is not None:
+            weights1 = np.ones((len(weights2), len(X1)), dtype=X1.dtype)
+        if weights2 is None and weights1 is not None:
+            weights2 = np.ones((len(weights1), len(X2)), dtype=X2.dtype)
+        kwargs.update(X2=X2, Y2=Y2, Z2=Z2, offsets2=offsets2)
+
+    # Passing None parameters breaks the parsing code, so avoid this
+    for k, v in [('weights1', weights1), ('weights2', weights2),
+                 ('weight_type', weight_type)]:
+        if v is not None:
+            kwargs[k] = v
+
+    integer_isa = translate_isa_string_to_enum(isa)
+    rbinfile = return_rbins_for_extension(binfile)
+
+    with sys_pipes():
+        extn_results = DD_batch_extn(autocorr, nthreads, rbinfile,
+                                     X1, Y1, Z1, offsets1,
+                                     periodic=periodic,
+                                     boxsize=boxsize,
+                                     output_ravg=output_ravg,
+                                     xbin_refine_factor=xbin_refine_factor,
+                                     ybin_refine_factor=ybin_refine_factor,
+                                     zbin_refine_factor=zbin_refine_factor,
+                                     max_cells_per_dim=max_cells_per_dim,
+                                     c_api_timer=c_api_timer,
+                                     mixed_precision=mixed_precision,
+                                     max_position_error=max_position_error,
+                                     isa=integer_isa, **kwargs)
+    if extn_results is None:
+        msg = "RuntimeError occurred"
+        raise RuntimeError(msg)
+
+    rupp, npairs, ravg, weightavg, api_time = extn_results
+    results_dtype = np.dtype([(bytes_to_native_str(b'rmin'), np.float64),
+                              (bytes_to_native_str(b'rmax'), np.float64),
+                              (bytes_to_native_str(b'ravg'), np.float64),
+                              (bytes_to_native_str(b'npairs'), np.uint64),
+                              (bytes_to_native_str(b'weightavg'), np.float64)])
+    results = np.zeros(npairs.shape, dtype=results_dtype)
+    results['rmin'] = rupp[:-1]
+    results['rmax'] = rupp[1:]
+    results['ravg'] = ravg
+    results['npairs'] = npairs
+    results['weightavg'] = weightavg
+
+    if c_api_timer:
+        return results, api_time
+
+    return results
+
+
+def wp_batch(boxsize, pimax, nthreads, binfile, catalogs, weights=None,
+             weight_type=None, output_rpavg=False, xbin_refine_factor=2,
+             ybin_refine_factor=2, zbin_refine_factor=1,
+             max_cells_per_dim=100, c_api_timer=False, isa=r'fastest',
+             mixed_precision=False, max_position_error=0.0):
+    """
+    Batched version of :py:mod:`Corrfunc.theory.wp`, for many independent
+    (small) catalogs in periodic boxes of the same ``boxsize``.
+
+    Whole catalogs are distributed over the threads, and every catalog is
+    counted by a single thread (with its own lattice and histograms). All
+    catalogs are counted in one call, and the results are returned as one
+    stacked array.
+
+    Parameters
+    -----------
+
+    boxsize, pimax, nthreads, binfile, weight_type, output_rpavg,
+    (xyz)bin_refine_factor, max_cells_per_dim, c_api_timer, isa,
+    mixed_precision, max_position_error:
+        Same as for :py:mod:`Corrfunc.theory.wp`, and used for every
+        catalog. ``nthreads`` is the number of catalogs counted at the same
+        time (``nthreads <= 0`` uses all the cores). Multiple values of
+        ``pimax`` are supported.
+
+    catalogs: sequence of catalogs
+        Every catalog is either an array of shape ``(N, 3)``, or a
+        sequence of the ``X``, ``Y`` and ``Z`` arrays. The catalogs can have
+        different numbers of particles, and are all counted in the
+        precision of the first catalog.
+
+    weights: sequence of array-like, optional
+        The weights of every catalog, each of shape ``(N, )`` or
+        ``(n_weights, N)``.
+
+    Returns
+    --------
+
+    results: Numpy structured array
+        An array of shape ``(ncatalogs, nbins)`` (or
+        ``(ncatalogs, len(pimax), nbins)`` for multiple values of
+        ``pimax``), with ``results[i]`` containing the same fields as
+        :py:mod:`Corrfunc.theory.wp` for catalog ``i``.
+
+    api_time: float, optional
+        Only returned if ``c_api_timer`` is set. The time spent within the
+        C library for the full batch.
+
+    """
+    try:
+        from Corrfunc._countpairs import countpairs_wp_batch as wp_batch_extn
+    except ImportError:
+        msg = "Could not import the C extension for the batched projected "\
+              "correlation function."
+        raise ImportError(msg)
+
+    import numpy as np
+    from future.utils import bytes_to_native_str
+    from Corrfunc.utils import translate_isa_string_to_enum,\
+        return_rbins_for_extension, sys_pipes
+
+    X, Y, Z, weights, offsets = _concatenate_catalogs(catalogs, weights)
+
+    # Multiple pimax values are passed on as a list;
+    # the pairs are counted out to the largest pimax
+    pimax_list = None
+    if np.ndim(pimax) == 0:
+        pimax = float(pimax)
+    else:
+        pimax_list = np.array(pimax, dtype=np.float64).ravel()
+        if pimax_list.size == 0 or np.any(np.diff(pimax_list) <= 0.0):
+            msg = "The parameter `pimax` = {0} must contain at least one "\
+                  "value and be in strictly increasing order".format(pimax)
+            raise ValueError(msg)
+        pimax = pimax_list[-1]
+
+    # Passing None parameters breaks the parsing code, so avoid this
+    kwargs = {}
+    for k, v in [('weights', weights), ('weight_type', weight_type),
+                 ('pimax_list', pimax_list)]:
+        if v is not None:
+            kwargs[k] = v
+
+    integer_isa = translate_isa_string_to_enum(isa)
+    rbinfile = return_rbins_for_extension(binfile)
+
+    with sys_pipes():
+        extn_results = wp_batch_extn(boxsize, pimax, nthreads, rbinfile,
+                                     X, Y, Z, offsets,
+                                     output_rpavg=output_rpavg,
+                                     xbin_refine_factor=xbin_refine_factor,
+                                     ybin_refine_factor=ybin_refine_factor,
+                                     zbin_refine_factor=zbin_refine_factor,
+                                     max_cells_per_dim=max_cells_per_dim,
+                                     c_api_timer=c_api_timer,
+                                     mixed_precision=mixed_precision,
+                                     max_position_error=max_position_error,
+                                     isa=integer_isa, **kwargs)
+    if extn_results is None:
+        msg = "RuntimeError occurred"
+        raise RuntimeError(msg)
+
+    rupp, npairs, wp, rpavg, weightavg, api_time = extn_results
+    results_dtype = np.dtype([(bytes_to_native_str(b'rmin'), np.float64),
+                              (bytes_to_native_str(b'rmax'), np.float64),
+                              (bytes_to_native_str(b'rpavg'), np.float64),
+                              (bytes_to_native_str(b'wp'), np.float64),
+                              (bytes_to_native_str(b'npairs'), np.uint64),
+                              (bytes_to_native_str(b'weightavg'), np.float64)])
+    nbins = len(rupp) - 1
+    shape = (len(npairs), -1, nbins)
+    results = np.zeros(npairs.shape, dtype=results_dtype).reshape(shape)
+    results['rmin'] = rupp[:-1]
+    results['rmax'] = rupp[1:]
+    results['rpavg'] = rpavg.reshape(shape)
+    results['wp'] = wp.reshape(shape)
+    results['npairs'] = npairs.reshape(shape)
+    results['weightavg'] = weightavg.reshape(shape)
+    if pimax_list is None:
+        results = results[:, 0]
+
+    if c_api_timer:
+        return results, api_time
+
+    return results
@@ -0,0 +1,750 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Distributed (MPI) drivers for the pair counters in ``theory/``, through
+``mpi4py``. The volume is decomposed into slabs along X, one per rank; every
+rank counts the pairs of the particles in its slab against its slab plus
+a ghost zone, with the existing pair counters, and the histograms are
+summed over all ranks. These drivers are in
+:py:mod:`Corrfunc.theory.distributed`
+
+Every rank passes in its own (arbitrary) subset of the particles, and every
+rank receives the results for the full catalog::
+
+    $ mpirun -n 4 python -c "from Corrfunc.theory.distributed import DD_mpi; ..."
+
+"""
+
+from __future__ import (division, print_function, absolute_import,
+                        unicode_literals)
+
+__author__ = ('Manodeep Sinha')
+__all__ = ('DD_mpi', 'DDrppi_mpi', 'DDsmu_mpi', 'wp_mpi', 'xi_mpi')
+
+
+def _get_comm(comm):
+    """
+    Returns the communicator, ``MPI.COMM_WORLD`` by default
+    """
+    if comm is not None:
+        return comm
+
+    try:
+        from mpi4py import MPI
+    except ImportError:
+        msg = "The distributed pair counters require mpi4py"
+        raise ImportError(msg)
+
+    return MPI.COMM_WORLD
+
+
+def _pack_catalog(X, Y, Z, weights=None, velocities=None):
+    """
+    Packs the positions, weights and velocities of the local particles into
+    one array of shape (N, ncols), so that they can be exchanged together.
+    Returns the array and the number of weights
+    """
+    import numpy as np
+
+    X = np.asanyarray(X)
+    dtype = np.float32 if X.dtype == np.float32 else np.float64
+    columns = [X, np.asanyarray(Y), np.asanyarray(Z)]
+    nweights = 0
+    if weights is not None:
+        weights = np.atleast_2d(weights)
+        if weights.shape[-1] != len(X):
+            msg = "The weights must have shape (n_weights, n_positions) or "\
+                  "(n_positions, )"
+            raise ValueError(msg)
+        nweights = weights.shape[0]
+        columns.extend(weights)
+    if velocities is not None:
+        velocities = np.atleast_2d(velocities)
+        if velocities.shape != (3, len(X)):
+            msg = "The velocities must have shape (3, n_positions)"
+            raise ValueError(msg)
+        columns.extend(velocities)
+
+    rows = np.empty((len(X), len(columns)), dtype=dtype)
+    for i, c in enumerate(columns):
+        rows[:, i] = c
+
+    return rows, nweights
+
+
+def _unpack_catalog(rows, nweights, has_velocities):
+    """
+    Returns the positions, weights and velocities packed into ``rows`` as
+    C-contiguous arrays
+    """
+    import numpy as np
+
+    X, Y, Z = [np.ascontiguousarray(rows[:, i]) for i in range(3)]
+    weights = None
+    if nweights > 0:
+        weights = np.ascontiguousarray(rows[:, 3:3 + nweights].T)
+    velocities = None
+    if has_velocities:
+        velocities = np.ascontiguousarray(rows[:, 3 + nweights:].T)
+
+    return X, Y, Z, weights, velocities
+
+
+def _exchange(comm, rows, dest):
+    """
+    Sends every row to the rank ``dest`` (a boolean mask of shape
+    (nranks, N), or an integer array of shape (N, )) and returns the rows
+    received from all ranks
+    """
+    import numpy as np
+
+    nranks = comm.Get_size()
+    if dest.ndim == 1:
+        order = np.argsort(dest, kind='mergesort')
+        sendbuf = rows[order]
+        sendcounts = np.bincount(dest, minlength=nranks)
+    else:
+        sendbuf = np.concatenate([rows[dest[d]] for d in range(nranks)])
+        sendcounts = dest.sum(axis=1)
+
+    recvcounts = np.array(comm.alltoall([int(n) for n in sendcounts]),
+                          dtype=np.int64)
+    recvbuf = np.empty((recvcounts.sum(), rows.shape[1]), dtype=rows.dtype)
+
+    # The counts and offsets are in elements, not rows
+    ncols = rows.shape[1]
+    senddispls = np.concatenate([[0], np.cumsum(sendcounts)[:-1]]) * ncols
+    recvdispls = np.concatenate([[0], np.cumsum(recvcounts)[:-1]]) * ncols
+    comm.Alltoallv([np.ascontiguousarray(sendbuf),
+                    (sendcounts * ncols, senddispls)],
+                   [recvbuf, (recvcounts * ncols, recvdispls)])
+
+    return recvbuf
+
+
+def _decompose(comm, catalogs, boxsize, periodic, halo):
+    """
+    Redistributes the particles into slabs along X (one per rank), and
+    returns, for every catalog, the particles in the slab of this rank and
+    the ghost particles within ``halo`` of the slab
+    """
+    import numpy as np
+    from mpi4py import MPI
+
+    nranks = comm.Get_size()
+    rank = comm.Get_rank()
+
+    if periodic:
+        xlo, xhi = 0.0, boxsize
+    else:
+        local = [(rows[:, 0].min(), rows[:, 0].max())
+                 for rows in catalogs if len(rows) > 0]
+        xlo = comm.allreduce(min([l[0] for l in local] or [np.inf]),
+                             op=MPI.MIN)
+        xhi = comm.allreduce(max([l[1] for l in local] or [-np.inf]),
+                             op=MPI.MAX)
+    width = (xhi - xlo) / nranks
+    if not width > 0:
+        width = 1.0
+
+    decomposed = []
+    for rows in catalogs:
+        owner = np.floor((rows[:, 0] - xlo) / width).astype(np.int64)
+        np.clip(owner, 0, nranks - 1, out=owner)
+        primary = _exchange(comm, rows, owner)
+
+        # Distance (along X) from every particle to the slab of every rank.
+        # Without periodic boundaries, the first and the last slab extend
+        # to infinity (the positions were clipped into them)
+        x = primary[:, 0]
+        dest = np.zeros((nranks, len(primary)), dtype=np.bool_)
+        for d in range(nranks):
+            if d == rank:
+                continue
+            lo = xlo + d * width
+            hi = xlo + (d + 1) * width
+            if not periodic:
+                lo = -np.inf if d == 0 else lo
+                hi = np.inf if d == nranks - 1 else hi
+                dist = np.maximum(np.maximum(lo - x, x - hi), 0.0)
+            else:
+                dist = np.full(len(x), np.inf)
+                for shift in (-boxsize, 0.0, boxsize):
+                    xs = x + shift
+                    dist = np.minimum(dist, np.maximum(np.maximum(lo - xs,
+                                                                  xs - hi),
+                                                       0.0))
+            dest[d] = dist <= halo
+
+        ghosts = _exchange(comm, primary, dest)
+        decomposed.append((primary, ghosts))
+
+    return decomposed
+
+
+def _allreduce_results(comm, results, avg_fields):
+    """
+    Sums the pair counts over all ranks, and averages the ``avg_fields``
+    (e.g., ``ravg`` and ``weightavg``) with the pair counts
+    """
+    import numpy as np
+
+    results = results.copy()
+    npairs = comm.allreduce(results['npairs'])
+    for field in avg_fields:
+        total = comm.allreduce(results[field] * results['npairs'])
+        nonzero = npairs > 0
+        total[nonzero] /= npairs[nonzero]
+        total[~nonzero] = 0.0
+        results[field] = total
+    results['npairs'] = npairs
+
+    return results
+
+
+def _distribute(comm, autocorr, catalog1, catalog2, boxsize, periodic, halo,
+                kwargs, rsd_axis=None):
+    """
+    Decomposes the catalogs, and returns the arguments of the pair counter
+    on this rank: the particles in the slab (X1/Y1/Z1), the particles in the
+    slab and its ghosts (X2/Y2/Z2), and the keyword arguments with their
+    weights and velocities. Returns None if this rank has no pairs to count
+    """
+    import numpy as np
+    from mpi4py import MPI
+
+    if periodic and not boxsize > 0:
+        msg = "The distributed pair counters need a positive boxsize "\
+              "for periodic boundary conditions"
+        raise ValueError(msg)
+
+    kwargs = dict(kwargs)
+    has_velocities = catalog1[4] is not None
+    if not autocorr and has_velocities != (catalog2[4] is not None):
+        msg = "Must pass velocities for both or neither set of points"
+        raise ValueError(msg)
+
+    # The line-of-sight displacements can move a particle out of its slab
+    if has_velocities and rsd_axis is not None:
+        rsd_factor = abs(kwargs.get('rsd_factor', 1.0))
+        vmax = 0.0
+        for catalog in [catalog1] if autocorr else [catalog1, catalog2]:
+            if len(catalog[0]) > 0:
+                vmax = max(vmax, np.max(np.abs(np.atleast_2d(catalog[4])[rsd_axis])))
+        vmax = comm.allreduce(vmax, op=MPI.MAX)
+        halo += 2.0 * vmax * rsd_factor
+
+    rows1, nweights1 = _pack_catalog(*catalog1)
+    catalogs = [rows1]
+    if not autocorr:
+        rows2, nweights2 = _pack_catalog(*catalog2)
+        if rows2.dtype != rows1.dtype:
+            msg = "Both sets of points must have the same precision"
+            raise ValueError(msg)
+        catalogs.append(rows2)
+
+    decomposed = _decompose(comm, catalogs, boxsize, periodic, halo)
+    del catalogs, rows1
+    primary1, _ = decomposed[0]
+    if autocorr:
+        primary2, ghosts2 = decomposed[0]
+        nweights2 = nweights1
+    else:
+        primary2, ghosts2 = decomposed[1]
+    ext2 = np.concatenate([primary2, ghosts2])
+    del decomposed, primary2, ghosts2
+
+    X1, Y1, Z1, weights1, velocities1 = _unpack_catalog(primary1, nweights1,
+                                                         has_velocities)
+    X2, Y2, Z2, weights2, velocities2 = _unpack_catalog(ext2, nweights2,
+                                                         has_velocities)
+    del primary1, ext2
+
+    if weights1 is not None:
+        kwargs['weights1'] = weights1
+    if weights2 is not None:
+        kwargs['weights2'] = weights2
+    if has_velocities:
+        kwargs['velocities1'] = velocities1
+        kwargs['velocities2'] = velocities2
+
+    # The arrays are private copies and can be reordered into the cells
+    if not kwargs.get('mixed_precision', False) and \
+       not kwargs.get('max_position_error', 0.0) > 0.0:
+        kwargs['permute_in_place'] = True
+
+    if len(X1) == 0 or len(X2) == 0:
+        return None
+
+    kwargs.update(X1=X1, Y1=Y1, Z1=Z1, X2=X2, Y2=Y2, Z2=Z2,
+                  periodic=periodic, boxsize=boxsize)
+    return kwargs
+
+
+def _count_local(func, args, local):
+    """
+    Counts the pairs on this rank with ``func`` (a cross-correlation of the
+    slab against the slab and its ghosts, with the arguments from
+    ``_distribute``) and returns the results (before the reduction) and the
+    C API time. The particles on this rank are only reordered, so they can
+    be counted again (e.g., for another ``pimax``)
+    """
+    # Every particle in the slab is counted against all of its neighbours,
+    # so the cross-correlations sum to the (ordered) pairs of the
+    # auto-correlation
+    if local is None:
+        return None, 0.0
+
+    ret = func(0, *args, c_api_timer=True, **local)
+    return ret[0], ret[1]
+
+
+def _count(comm, func, args, autocorr, catalog1, catalog2, boxsize,
+           periodic, halo, kwargs, rsd_axis=None):
+    """
+    Decomposes the catalogs, counts the pairs on every rank with ``func``
+    and returns the results (before the reduction) and the C API time
+    """
+    local = _distribute(comm, autocorr, catalog1, catalog2, boxsize,
+                        periodic, halo, kwargs, rsd_axis=rsd_axis)
+    return _count_local(func, args, local)
+
+
+def _reduce_count(comm, local, avg_fields, api_time):
+    """
+    All-reduces the results from ``_count`` (ranks without particles do not
+    have results)
+    """
+    from mpi4py import MPI
+
+    template = comm.allreduce([local] if local is not None else [])
+    if not template:
+        msg = "Found no particles to count pairs"
+        raise ValueError(msg)
+    if local is None:
+        local = template[0].copy()
+        local['npairs'] = 0
+        for field in avg_fields:
+            local[field] = 0.0
+
+    results = _allreduce_results(comm, local, avg_fields)
+    api_time = comm.allreduce(api_time, op=MPI.MAX)
+    return results, api_time
+
+
+def _check_kwargs(kwargs, names):
+    """
+    Rejects options that can not be used with the distributed drivers
+    """
+    for name in names:
+        if kwargs.get(name, False):
+            msg = "The option `{0}` is not supported by the distributed "\
+                  "pair counters".format(name)
+            raise ValueError(msg)
+
+
+def DD_mpi(autocorr, nthreads, binfile, X1, Y1, Z1, weights1=None,
+           periodic=True, X2=None, Y2=None, Z2=None, weights2=None,
+           boxsize=0.0, c_api_timer=False, comm=None, **kwargs):
+    """
+    Distributed version of :py:mod:`Corrfunc.theory.DD`.
+
+    Every rank passes in its own subset of the particles (in any order); the
+    particles are redistributed into slabs along X with a ghost zone of
+    ``rmax``, and every rank receives the pair counts of the full catalog.
+
+    Parameters
+    -----------
+
+    autocorr, nthreads, binfile, X1/Y1/Z1, weights1, periodic, X2/Y2/Z2,
+    weights2, boxsize, c_api_timer:
+        Same as for :py:mod:`Corrfunc.theory.DD`, for the particles on this
+        rank. ``boxsize`` is required for periodic boundary conditions.
+
+    comm: MPI communicator, optional
+        Defaults to ``mpi4py.MPI.COMM_WORLD``.
+
+    kwargs:
+        Any other options for :py:mod:`Corrfunc.theory.DD` (e.g.,
+        ``output_ravg``, ``weight_type``, ``isa``)
+
+    Returns
+    --------
+
+    results: Numpy structured array
+        Same as :py:mod:`Corrfunc.theory.DD`, on every rank.
+
+    api_time: float, optional
+        Only returned if ``c_api_timer`` is set. The maximum time spent
+        within the C library over all ranks.
+
+    """
+    from Corrfunc.theory.DD import DD
+
+    comm = _get_comm(comm)
+    _check_kwargs(kwargs, ['permute_in_place', 'positions1', 'positions2'])
+    rbins = _bins_as_array(binfile)
+    rmax = rbins[-1]
+
+    local, api_time = _count(comm, DD, (nthreads, rbins), autocorr,
+                             (X1, Y1, Z1, weights1, None),
+                             (X2, Y2, Z2, weights2, None),
+                             boxsize, periodic, rmax, kwargs)
+    results, api_time = _reduce_count(comm, local, ['ravg', 'weightavg'],
+                                      api_time)
+    if c_api_timer:
+        return results, api_time
+
+    return results
+
+
+def DDrppi_mpi(autocorr, nthreads, pimax, binfile, X1, Y1, Z1,
+               weights1=None, periodic=True, X2=None, Y2=None, Z2=None,
+               weights2=None, boxsize=0.0, c_api_timer=False,
+               velocities1=None, velocities2=None, los='z', comm=None,
+               **kwargs):
+    """
+    Distributed version of :py:mod:`Corrfunc.theory.DDrppi`.
+
+    Every rank passes in its own subset of the particles (in any order); the
+    particles are redistributed into slabs along X with a ghost zone that
+    covers ``rpmax`` and ``pimax`` (plus the largest line-of-sight
+    displacement, for velocities along X), and every rank receives the pair
+    counts of the full catalog.
+
+    Parameters
+    -----------
+
+    autocorr, nthreads, pimax, binfile, X1/Y1/Z1, weights1, periodic,
+    X2/Y2/Z2, weights2, boxsize, c_api_timer, velocities1, velocities2, los:
+        Same as for :py:mod:`Corrfunc.theory.DDrppi`, for the particles on
+        this rank. ``boxsize`` is required for periodic boundary conditions.
+
+    comm: MPI communicator, optional
+        Defaults to ``mpi4py.MPI.COMM_WORLD``.
+
+    kwargs:
+        Any other options for :py:mod:`Corrfunc.theory.DDrppi`
+
+    Returns
+    --------
+
+    results: Numpy structured array
+        Same as :py:mod:`Corrfunc.theory.DDrppi`, on every rank.
+
+    api_time: float, optional
+        Only returned if ``c_api_timer`` is set. The maximum time spent
+        within the C library over all ranks.
+
+    """
+    import numpy as np
+    from Corrfunc.theory.DDrppi import DDrppi
+
+    comm = _get_comm(comm)
+    _check_kwargs(kwargs, ['permute_in_place', 'positions1', 'positions2'])
+    rbins = _bins_as_array(binfile)
+    halo = np.sqrt(rbins[-1]**2 + pimax**2)
+    kwargs['los'] = los
+
+    local, api_time = _count(comm, DDrppi, (nthreads, pimax, rbins),
+                             autocorr,
+                             (X1, Y1, Z1, weights1, velocities1),
+                             (X2, Y2, Z2, weights2, velocities2),
+                             boxsize, periodic, halo, kwargs,
+                             rsd_axis=0 if los in ('x', 'all') else None)
+    results, api_time = _reduce_count(comm, local, ['rpavg', 'weightavg'],
+                                      api_time)
+    if c_api_timer:
+        return results, api_time
+
+    return results
+
+
+def DDsmu_mpi(autocorr, nthreads, binfile, mu_max, nmu_bins, X1, Y1, Z1,
+              weights1=None, periodic=True, X2=None, Y2=None, Z2=None,
+              weights2=None, boxsize=0.0, c_api_timer=False,
+              velocities1=None, velocities2=None, los='z', comm=None,
+              **kwargs):
+    """
+    Distributed version of :py:mod:`Corrfunc.theory.DDsmu`.
+
+    Every rank passes in its own subset of the particles (in any order); the
+    particles are redistributed into slabs along X with a ghost zone of
+    ``smax`` (plus the largest line-of-sight displacement, for velocities
+    along X), and every rank receives the pair counts of the full catalog.
+
+    Parameters
+    -----------
+
+    autocorr, nthreads, binfile, mu_max, nmu_bins, X1/Y1/Z1, weights1,
+    periodic, X2/Y2/Z2, weights2, boxsize, c_api_timer, velocities1,
+    velocities2, los:
+        Same as for :py:mod:`Corrfunc.theory.DDsmu`, for the particles on
+        this rank. ``boxsize`` is required for periodic boundary conditions.
+
+    comm: MPI communicator, optional
+        Defaults to ``mpi4py.MPI.COMM_WORLD``.
+
+    kwargs:
+        Any other options for :py:mod:`Corrfunc.theory.DDsmu`
+
+    Returns
+    --------
+
+    results: Numpy structured array
+        Same as :py:mod:`Corrfunc.theory.DDsmu`, on every rank.
+
+    api_time: float, optional
+        Only returned if ``c_api_timer`` is set. The maximum time spent
+        within the C library over all ranks.
+
+    """
+    from Corrfunc.theory.DDsmu import DDsmu
+
+    comm = _get_comm(comm)
+    _check_kwargs(kwargs, ['permute_in_place', 'positions1', 'positions2'])
+    rbins = _bins_as_array(binfile)
+    kwargs['los'] = los
+
+    local, api_time = _count(comm, DDsmu, (nthreads, rbins, mu_max, nmu_bins),
+                             autocorr,
+                             (X1, Y1, Z1, weights1, velocities1),
+                             (X2, Y2, Z2, weights2, velocities2),
+                             boxsize, periodic, rbins[-1], kwargs,
+                             rsd_axis=0 if los in ('x', 'all') else None)
+    results, api_time = _reduce_count(comm, local, ['savg', 'weightavg'],
+                                      api_time)
+
+    # Pairs at zero separation are not counted in cross-correlations, but
+    # the auto-correlation adds the self-pairs to the first (s, mu) bin
+    if autocorr and rbins[0] <= 0.0:
+        N, _, weight_sqr_sum = _weight_sums(comm, X1, weights1,
+                                            kwargs.get('weight_type'))
+        first = results[..., 0]
+        npairs = first['npairs'] + N
+        if weights1 is not None and kwargs.get('weight_type') == 'pair_product':
+            first['weightavg'] = (first['weightavg'] * first['npairs'] +
+                                  weight_sqr_sum) / npairs
+        first['savg'] = first['savg'] * first['npairs'] / npairs
+        first['npairs'] = npairs
+        results[..., 0] = first
+    if c_api_timer:
+        return results, api_time
+
+    return results
+
+
+def _bins_as_array(binfile):
+    """
+    Returns the bin-edges as an array (reading them from the file, if
+    required)
+    """
+    import numpy as np
+    from Corrfunc.utils import return_rbins_for_extension
+
+    rbins = return_rbins_for_extension(binfile)
+    if isinstance(rbins, np.ndarray):
+        return rbins
+
+    bins = np.loadtxt(rbins, ndmin=2)
+    return np.append(bins[:, 0], bins[-1, 1])
+
+
+def _weight_sums(comm, X, weights, weight_type):
+    """
+    Returns the total number of particles, and the sum of the weights and of
+    the squared weights, over all ranks (as used for the analytic randoms)
+    """
+    import numpy as np
+
+    N = comm.allreduce(len(X))
+    if weights is not None and weight_type == 'pair_product':
+        w = np.atleast_2d(weights)[0].astype(np.float64)
+        return N, comm.allreduce(w.sum()), comm.allreduce((w * w).sum())
+
+    return N, float(N), float(N)
+
+
+def wp_mpi(boxsize, pimax, nthreads, binfile, X, Y, Z, weights=None,
+           weight_type=None, output_rpavg=False, c_api_timer=False,
+           comm=None, **kwargs):
+    """
+    Distributed version of :py:mod:`Corrfunc.theory.wp`.
+
+    Every rank passes in its own subset of the particles (in any order); the
+    particles are redistributed into slabs along X with a ghost zone of
+    ``rpmax``. The pairs are counted in ``(rp, pi)`` bins (as in
+    :py:mod:`Corrfunc.theory.DDrppi`), summed over all ranks, and ``wp`` is
+    computed with the same analytic randoms as :py:mod:`Corrfunc.theory.wp`.
+
+    Parameters
+    -----------
+
+    boxsize, pimax, nthreads, binfile, X/Y/Z, weights, weight_type,
+    output_rpavg, c_api_timer:
+        Same as for :py:mod:`Corrfunc.theory.wp`, for the particles on this
+        rank. Multiple values of ``pimax`` are supported.
+
+    comm: MPI communicator, optional
+        Defaults to ``mpi4py.MPI.COMM_WORLD``.
+
+    kwargs:
+        Any of ``(xyz)bin_refine_factor``, ``max_cells_per_dim``, ``isa``,
+        ``mixed_precision`` and ``max_position_error``
+
+    Returns
+    --------
+
+    results: Numpy structured array
+        Same as :py:mod:`Corrfunc.theory.wp`, on every rank.
+
+    api_time: float, optional
+        Only returned if ``c_api_timer`` is set. The maximum time spent
+        within the C library over all ranks.
+
+    """
+    import numpy as np
+    from Corrfunc.theory.DDrppi import DDrppi
+    from Corrfunc.utils import _rp_pi_counts_to_wp
+
+    comm = _get_comm(comm)
+    _check_kwargs(kwargs, ['permute_in_place', 'positions', 'c_cell_timer'])
+    rbins = _bins_as_array(binfile)
+
+    pimax_list = np.atleast_1d(np.asarray(pimax, dtype=np.float64))
+    if pimax_list.size == 0 or np.any(np.diff(pimax_list) <= 0.0):
+        msg = "The parameter `pimax` = {0} must contain at least one "\
+              "value and be in strictly increasing order".format(pimax)
+        raise ValueError(msg)
+
+    if weight_type is not None:
+        kwargs['weight_type'] = weight_type
+    kwargs['output_rpavg'] = output_rpavg
+
+    # The particles are decomposed once (the ghost zone only depends on
+    # rpmax), and the pairs are counted out to the largest pimax. Every
+    # other pimax that is not an edge of the (unit-width) pi bins needs its
+    # own count, of the same particles
+    local = _distribute(comm, True, (X, Y, Z, weights, None), None, boxsize,
+                        True, rbins[-1], kwargs)
+    counts = []
+    api_time = 0.0
+    edges = None
+    for p in pimax_list[::-1]:
+        if edges is not None and np.any(np.isclose(edges, p)):
+            continue
+        local_counts, t = _count_local(DDrppi, (nthreads, p, rbins), local)
+        r, t = _reduce_count(comm, local_counts, ['rpavg', 'weightavg'], t)
+        api_time += t
+        counts.append(r)
+        if edges is None:
+            edges = np.unique(r['pimax'])
+
+    N, weightsum, weight_sqr_sum = _weight_sums(comm, X, weights,
+                                                weight_type)
+    pair_product = weights is not None and weight_type == 'pair_product'
+    results = []
+    for p in pimax_list:
+        # Sum the pi bins of the first count that has p as a bin-edge
+        for r in counts:
+            if np.any(np.isclose(np.unique(r['pimax']), p)):
+                break
+        results.append(_rp_pi_counts_to_wp(r, boxsize, p, N, weightsum,
+                                           weight_sqr_sum, pair_product))
+    results = np.array(results)
+
+    if np.ndim(pimax) == 0:
+        results = results[0]
+
+    if c_api_timer:
+        return results, api_time
+
+    return results
+
+
+def xi_mpi(boxsize, nthreads, binfile, X, Y, Z, weights=None,
+           weight_type=None, output_ravg=False, c_api_timer=False,
+           comm=None, **kwargs):
+    """
+    Distributed version of :py:mod:`Corrfunc.theory.xi`.
+
+    Every rank passes in its own subset of the particles (in any order); the
+    particles are redistributed into slabs along X with a ghost zone of
+    ``rmax``. The pairs are counted (as in :py:mod:`Corrfunc.theory.DD`),
+    summed over all ranks, and ``xi`` is computed with the same analytic
+    randoms as :py:mod:`Corrfunc.theory.xi`.
+
+    Parameters
+    -----------
+
+    boxsize, nthreads, binfile, X/Y/Z, weights, weight_type, output_ravg,
+    c_api_timer:
+        Same as for :py:mod:`Corrfunc.theory.xi`, for the particles on this
+        rank.
+
+    comm: MPI communicator, optional
+        Defaults to ``mpi4py.MPI.COMM_WORLD``.
+
+    kwargs:
+        Any of ``(xyz)bin_refine_factor``, ``max_cells_per_dim``, ``isa``,
+        ``mixed_precision`` and ``max_position_error``
+
+    Returns
+    --------
+
+    results: Numpy structured array
+        Same as :py:mod:`Corrfunc.theory.xi`, on every rank.
+
+    api_time: float, optional
+        Only returned if ``c_api_timer`` is set. The maximum time spent
+        within the C library over all ranks.
+
+    """
+    import numpy as np
+    from Corrfunc.theory.DD import DD
+    from future.utils import bytes_to_native_str
+
+    comm = _get_comm(comm)
+    _check_kwargs(kwargs, ['permute_in_place', 'positions'])
+    rbins = _bins_as_array(binfile)
+
+    if weight_type is not None:
+        kwargs['weight_type'] = weight_type
+    kwargs['output_ravg'] = output_ravg
+
+    local, api_time = _count(comm, DD, (nthreads, rbins), True,
+                             (X, Y, Z, weights, None), None, boxsize, True,
+                             rbins[-1], kwargs)
+    counts, api_time = _reduce_count(comm, local, ['ravg', 'weightavg'],
+                                     api_time)
+
+    N, weightsum, weight_sqr_sum = _weight_sums(comm, X, weights,
+                                                weight_type)
+    prefac_density = weightsum * (weightsum - weightsum / N) / boxsize**3
+
+    results_dtype = np.dtype([(bytes_to_native_str(b'rmin'), np.float64),
+                              (bytes_to_native_str(b'rmax'), np.float64),
+                              (bytes_to_native_str(b'ravg'), np.float64),
+                              (bytes_to_native_str(b'xi'), np.float64),
+                              (bytes_to_native_str(b'npairs'), np.uint64),
+                              (bytes_to_native_str(b'weightavg'), np.float64)])
+    results = np.zeros(len(counts), dtype=results_dtype)
+    for field in ['rmin', 'rmax', 'ravg', 'npairs', 'weightavg']:
+        results[field] = counts[field]
+
+    weight0 = results['npairs'].astype(np.float64)
+    if weights is not None and weight_type == 'pair_product':
+        weight0 *= results['weightavg']
+    vol = 4.0 / 3.0 * np.pi * (results['rmax']**3 - results['rmin']**3)
+    weightrandom = prefac_density * vol
+    weightrandom[results['rmin'] <= 0.0] += weight_sqr_sum
+    # Empty bins can not occur, -2 signals invalid
+    valid = vol > 0.0
+    weightrandom[~valid] = 1.0
+    results['xi'] = np.where(valid, weight0 / weightrandom - 1.0, -2.0)
+
+    if c_api_timer:
+        return results, api_time
+
+    return results
@@ -0,0 +1,619 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Incremental versions of the pair counters in ``theory/DD/`` and
+``theory/wp/``, for catalogs where only a few particles change between
+calls (e.g., the satellites in an HOD fit). The counted state is held in
+an object, and every insertion, deletion or move of particles only counts
+the pairs involving the changed particles. These wrappers are in
+:py:mod:`Corrfunc.theory.incremental`
+"""
+
+from __future__ import (division, print_function, absolute_import,
+                        unicode_literals)
+
+import abc
+
+from future.utils import with_metaclass
+
+__author__ = ('Manodeep Sinha')
+__all__ = ('IncrementalDD', 'IncrementalWP')
+
+
+def _grow(array, size):
+    """
+    Returns ``array`` with room for at least ``size`` elements along its last
+    axis (doubling the capacity, so that appends are amortised)
+    """
+    import numpy as np
+
+    capacity = array.shape[-1]
+    if capacity >= size:
+        return array
+
+    grown = np.empty(array.shape[:-1] + (max(size, 2 * capacity), ),
+                     dtype=array.dtype)
+    grown[..., :capacity] = array
+    return grown
+
+
+class _IncrementalCounts(with_metaclass(abc.ABCMeta, object)):
+    """
+    Holds the catalog and the (un-normalised) pair counts of an
+    auto-correlation, and updates the counts as particles are inserted,
+    deleted or moved.
+
+    Every particle carries an integer id: the initial particles have the
+    ids ``0 ... N-1``, and every insertion returns the ids of the new
+    particles. The particles are stored in slots (reused after deletions)
+    and binned into a lattice of cells at least as wide as the largest
+    separation. A change only counts the pairs of the changed particles
+    against the particles in the neighbouring cells, so neither the catalog
+    nor the lattice is copied or regridded.
+    """
+
+    # Name of the average separation in the results
+    avg_sep_field = 'ravg'
+
+    def __init__(self, X, Y, Z, weights, weight_type, periodic, boxsize,
+                 min_cell_width, kwargs):
+        import numpy as np
+
+        X = np.asanyarray(X)
+        self._dtype = np.float32 if X.dtype == np.float32 else np.float64
+        self._weight_type = weight_type
+        self._kwargs = dict(kwargs)
+        for name in ['permute_in_place', 'query_mode', 'positions',
+                     'c_api_timer', 'c_cell_timer']:
+            if self._kwargs.pop(name, False):
+                msg = "The option `{0}` is not supported by the incremental "\
+                      "pair counters".format(name)
+                raise ValueError(msg)
+
+        # The neighbours are gathered into private copies, which can be
+        # reordered into the cells
+        self._in_place = not self._kwargs.get('mixed_precision', False) and \
+            not self._kwargs.get('max_position_error', 0.0) > 0.0
+
+        self._periodic = periodic
+        self._boxsize = boxsize
+        min_cell_width = np.asarray(min_cell_width, dtype=np.float64)
+        if periodic:
+            self._ncells = np.maximum(boxsize // min_cell_width,
+                                      1).astype(np.int64)
+            self._cell_width = boxsize / self._ncells
+        else:
+            self._ncells = None
+            self._cell_width = min_cell_width
+        self._cells = {}
+
+        self._nweights = None
+        self._X, self._Y, self._Z = [np.empty(0, dtype=self._dtype)
+                                     for _ in range(3)]
+        self._weights = None
+        self._slot_ids = np.empty(0, dtype=np.int64)
+        self._slot_of_id = np.empty(0, dtype=np.int64)
+        self._free_slots = []
+        self._nslots = 0
+        self._next_id = 0
+        self._n = 0
+        self._weight_totals = np.zeros(2, dtype=np.float64)
+
+        self._template = None
+        self._npairs = None
+        self._avg_sep_sum = None
+        self._weight_sum = None
+        self.insert(X, Y, Z, weights)
+
+    def _as_catalog(self, X, Y, Z, weights):
+        """
+        Returns private, C-contiguous copies of the positions and of the
+        weights (with shape (n_weights, N)) in the precision of the catalog
+        """
+        import numpy as np
+
+        columns = [np.array(c, dtype=self._dtype, order='C', ndmin=1)
+                   for c in [X, Y, Z]]
+        if not (len(columns[0]) == len(columns[1]) == len(columns[2])):
+            msg = "The X/Y/Z arrays must have the same length"
+            raise ValueError(msg)
+
+        if self._nweights is None:
+            self._nweights = 0 if weights is None else \
+                np.atleast_2d(weights).shape[0]
+            if self._nweights > 0:
+                self._weights = np.empty((self._nweights, 0),
+                                         dtype=self._dtype)
+        if (weights is None) != (self._nweights == 0):
+            msg = "Must pass weights for all particles or for none"
+            raise ValueError(msg)
+        if weights is not None:
+            weights = np.array(np.atleast_2d(weights), dtype=self._dtype,
+                               order='C')
+            if weights.shape != (self._nweights, len(columns[0])):
+                msg = "The weights must have shape (n_weights, n_positions) "\
+                      "or (n_positions, ), with the same number of weights "\
+                      "as the initial catalog"
+                raise ValueError(msg)
+
+        return columns + [weights]
+
+    def _catalog(self, slots):
+        """
+        Returns copies of the positions and weights of the particles in
+        ``slots``
+        """
+        catalog = [self._X, self._Y, self._Z, self._weights]
+        return [c[..., slots].copy(order='C') if c is not None else None
+                for c in catalog]
+
+    def _store(self, slots, catalog):
+        """
+        Writes the positions and weights in ``catalog`` into ``slots``
+        """
+        X, Y, Z, weights = catalog
+        self._X[slots], self._Y[slots], self._Z[slots] = X, Y, Z
+        if weights is not None:
+            self._weights[:, slots] = weights
+
+    def _slots(self, ids):
+        """
+        Returns the slots of the particles with the (unique) ``ids``
+        """
+        import numpy as np
+
+        ids = np.atleast_1d(np.asarray(ids, dtype=np.int64))
+        if np.any(ids < 0) or np.any(ids >= self._next_id):
+            msg = "Found particle ids that are not in the catalog"
+            raise ValueError(msg)
+        slots = self._slot_of_id[ids]
+        if np.any(slots < 0):
+            msg = "Found particle ids that are not in the catalog"
+            raise ValueError(msg)
+        if len(np.unique(slots)) != len(slots):
+            msg = "The particle ids must be unique"
+            raise ValueError(msg)
+
+        return slots
+
+    def _pair_kwargs(self, weights1, weights2=None):
+        kwargs = dict(self._kwargs)
+        if weights1 is not None:
+            kwargs['weights1'] = weights1
+            kwargs['weight_type'] = self._weight_type
+        if weights2 is not None:
+            kwargs['weights2'] = weights2
+        return kwargs
+
+    def _allocate(self, n):
+        """
+        Returns ``n`` free slots (reusing the slots of deleted particles
+        first), growing the storage if required
+        """
+        import numpy as np
+
+        nreused = min(n, len(self._free_slots))
+        reused = self._free_slots[len(self._free_slots) - nreused:]
+        del self._free_slots[len(self._free_slots) - nreused:]
+        fresh = np.arange(self._nslots, self._nslots + n - nreused,
+                          dtype=np.int64)
+        self._nslots += n - nreused
+
+        self._X, self._Y, self._Z = [_grow(c, self._nslots)
+                                     for c in [self._X, self._Y, self._Z]]
+        if self._weights is not None:
+            self._weights = _grow(self._weights, self._nslots)
+        self._slot_ids = _grow(self._slot_ids, self._nslots)
+        return np.concatenate([np.array(reused, dtype=np.int64), fresh])
+
+    def _cell_index(self, X, Y, Z):
+        """
+        Returns the (integer) lattice coordinates of the cells of the
+        positions, with shape (N, 3)
+        """
+        import numpy as np
+
+        index = np.floor(np.stack([np.asarray(c, dtype=np.float64)
+                                   for c in [X, Y, Z]], axis=-1) /
+                         self._cell_width).astype(np.int64)
+        if self._periodic:
+            index %= self._ncells
+        return index
+
+    def _group_by_cell(self, slots):
+        """
+        Yields the cells of the particles in ``slots``, and the slots in
+        each cell
+        """
+        import numpy as np
+
+        index = self._cell_index(self._X[slots], self._Y[slots],
+                                 self._Z[slots])
+        cells, inverse = np.unique(index, axis=0, return_inverse=True)
+        inverse = inverse.ravel()
+        order = np.argsort(inverse, kind='mergesort')
+        groups = np.split(slots[order], np.cumsum(np.bincount(inverse))[:-1])
+        return zip([tuple(c) for c in cells.tolist()], groups)
+
+    def _add_to_cells(self, slots):
+        import numpy as np
+
+        for cell, group in self._group_by_cell(slots):
+            if cell in self._cells:
+                group = np.concatenate([self._cells[cell], group])
+            self._cells[cell] = group
+
+    def _remove_from_cells(self, slots):
+        import numpy as np
+
+        for cell, group in self._group_by_cell(slots):
+            remaining = self._cells[cell]
+            remaining = remaining[~np.isin(remaining, group)]
+            if len(remaining) > 0:
+                self._cells[cell] = remaining
+            else:
+                del self._cells[cell]
+
+    def _neighbours(self, catalog):
+        """
+        Returns the slots of the particles in the cells that neighbour the
+        particles in ``catalog``
+        """
+        import numpy as np
+
+        if not self._cells:
+            return np.empty(0, dtype=np.int64)
+
+        index = np.unique(self._cell_index(*catalog[:3]), axis=0)
+        offsets = np.array([[i, j, k] for i in (-1, 0, 1)
+                            for j in (-1, 0, 1) for k in (-1, 0, 1)])
+        index = (index[:, np.newaxis, :] + offsets).reshape(-1, 3)
+        if self._periodic:
+            index %= self._ncells
+        index = np.unique(index, axis=0)
+        slots = [self._cells[c] for c in [tuple(c) for c in index.tolist()]
+                 if c in self._cells]
+        if not slots:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate(slots)
+
+    @abc.abstractmethod
+    def _count_auto(self, catalog):
+        """
+        Counts the (ordered) pairs within ``catalog``, including the
+        self-pairs for bins starting at 0
+        """
+
+    @abc.abstractmethod
+    def _count_cross(self, catalog1, catalog2):
+        """
+        Counts the pairs of ``catalog1`` against ``catalog2`` (both private
+        copies, and ``catalog2`` can be reordered in place)
+        """
+
+    def _accumulate(self, results, sign):
+        """
+        Adds (or subtracts, with ``sign=-1``) the pairs in ``results`` to the
+        counted state
+        """
+        import numpy as np
+
+        npairs = results['npairs'].astype(np.int64)
+        if self._template is None:
+            self._template = results.copy()
+            self._npairs = np.zeros(npairs.shape, dtype=np.int64)
+            self._avg_sep_sum = np.zeros(npairs.shape, dtype=np.float64)
+            self._weight_sum = np.zeros(npairs.shape, dtype=np.float64)
+
+        self._npairs += sign * npairs
+        self._avg_sep_sum += sign * npairs * results[self.avg_sep_field]
+        self._weight_sum += sign * npairs * results['weightavg']
+
+    def _change(self, catalog, sign):
+        """
+        Adds (or removes) the pairs of the particles in ``catalog`` with
+        themselves and with the particles in the lattice
+        """
+        import numpy as np
+
+        if len(catalog[0]) == 0:
+            return
+        self._n += sign * len(catalog[0])
+        if catalog[3] is not None:
+            w = catalog[3][0].astype(np.float64)
+            self._weight_totals += sign * np.array([w.sum(), (w * w).sum()])
+
+        self._accumulate(self._count_auto(catalog), sign)
+        neighbours = self._neighbours(catalog)
+        if len(neighbours) > 0:
+            cross = self._count_cross(catalog, self._catalog(neighbours))
+            # Every cross pair is counted twice in the auto-correlation
+            self._accumulate(cross, 2 * sign)
+
+    @property
+    def ids(self):
+        """
+        The ids of the particles in the catalog (in the order of the slots)
+        """
+        ids = self._slot_ids[:self._nslots]
+        return ids[ids >= 0]
+
+    def __len__(self):
+        return self._n
+
+    def positions(self, ids=None):
+        """
+        Returns the X/Y/Z positions and the weights of the particles with
+        ``ids`` (all particles, in the order of ``ids``, by default)
+        """
+        import numpy as np
+
+        if ids is None:
+            ids = np.flatnonzero(self._slot_of_id[:self._next_id] >= 0)
+        X, Y, Z, weights = self._catalog(self._slots(ids))
+        return X, Y, Z, weights
+
+    def insert(self, X, Y, Z, weights=None):
+        """
+        Inserts new particles, and returns their ids
+        """
+        import numpy as np
+
+        new = self._as_catalog(X, Y, Z, weights)
+        self._change(new, 1)
+
+        slots = self._allocate(len(new[0]))
+        self._store(slots, new)
+        ids = np.arange(self._next_id, self._next_id + len(slots),
+                        dtype=np.int64)
+        self._next_id += len(ids)
+        self._slot_of_id = _grow(self._slot_of_id, self._next_id)
+        self._slot_of_id[ids] = slots
+        self._slot_ids[slots] = ids
+        if len(slots) > 0:
+            self._add_to_cells(slots)
+        return ids
+
+    def delete(self, ids):
+        """
+        Deletes the particles with ``ids``
+        """
+        slots = self._slots(ids)
+        removed = self._catalog(slots)
+        self._remove_from_cells(slots)
+        self._slot_of_id[self._slot_ids[slots]] = -1
+        self._slot_ids[slots] = -1
+        self._free_slots.extend(slots.tolist())
+        self._change(removed, -1)
+
+    def update(self, ids, X, Y, Z, weights=None):
+        """
+        Moves the particles with ``ids`` to new positions (and weights),
+        keeping their ids. Only the pairs of the moved particles are
+        recounted
+        """
+        slots = self._slots(ids)
+        new = self._as_catalog(X, Y, Z, weights)
+        if len(new[0]) != len(slots):
+            msg = "Must pass one new position for every particle id"
+            raise ValueError(msg)
+
+        old = self._catalog(slots)
+        self._remove_from_cells(slots)
+        self._change(old, -1)
+        self._change(new, 1)
+        self._store(slots, new)
+        self._add_to_cells(slots)
+
+    def _pair_results(self):
+        """
+        Returns the counted state as a structured array, in the format of
+        the underlying pair counter
+        """
+        import numpy as np
+
+        if self._template is None:
+            msg = "No pairs have been counted (the catalog is empty)"
+            raise ValueError(msg)
+
+        results = self._template.copy()
+        npairs = self._npairs
+        nonzero = npairs > 0
+        results['npairs'] = np.where(npairs > 0, npairs, 0)
+        for field, total in [(self.avg_sep_field, self._avg_sep_sum),
+                             ('weightavg', self._weight_sum)]:
+            avg = np.zeros(npairs.shape, dtype=np.float64)
+            avg[nonzero] = total[nonzero] / npairs[nonzero]
+            results[field] = avg
+
+        return results
+
+
+class IncrementalDD(_IncrementalCounts):
+    """
+    Incremental version of the auto-correlation in
+    :py:mod:`Corrfunc.theory.DD`.
+
+    The pairs of the initial catalog are counted once; after that,
+    :py:meth:`insert`, :py:meth:`delete` and :py:meth:`update` only count
+    the pairs involving the changed particles (with ``query_mode``, against
+    the particles in the neighbouring cells), and :py:attr:`results` always
+    holds the pair counts of the current catalog. The work for a change
+    scales with the number of changed particles and their neighbours, not
+    with the size of the catalog.
+
+    Parameters
+    -----------
+
+    nthreads, binfile, X/Y/Z, weights, periodic, boxsize, weight_type,
+    output_ravg:
+        Same as for :py:mod:`Corrfunc.theory.DD` (with ``autocorr=1``).
+        ``boxsize`` is required for periodic boundary conditions.
+
+    kwargs:
+        Any of ``verbose``, ``(xyz)bin_refine_factor``,
+        ``max_cells_per_dim``, ``isa``, ``mixed_precision`` and
+        ``max_position_error``
+
+    Example
+    --------
+
+    >>> import numpy as np
+    >>> from Corrfunc.theory.incremental import IncrementalDD
+    >>> from Corrfunc.theory.DD import DD
+    >>> rng = np.random.RandomState(42)
+    >>> X, Y, Z = rng.uniform(0, 420., (3, 10000))
+    >>> bins = np.linspace(0.1, 10.0, 10)
+    >>> counts = IncrementalDD(1, bins, X, Y, Z, boxsize=420.)
+    >>> new = counts.insert(*rng.uniform(0, 420., (3, 100)))
+    >>> counts.delete(new[:50])
+    >>> X, Y, Z, _ = counts.positions()
+    >>> full = DD(1, 1, bins, X, Y, Z, boxsize=420.)
+    >>> np.all(counts.results['npairs'] == full['npairs'])
+    True
+
+    """
+
+    def __init__(self, nthreads, binfile, X, Y, Z, weights=None,
+                 periodic=True, boxsize=0.0, weight_type=None,
+                 output_ravg=False, **kwargs):
+        from Corrfunc.theory.distributed import _bins_as_array
+        from Corrfunc.utils import return_rbins_for_extension
+
+        if periodic and not boxsize > 0.0:
+            msg = "The incremental pair counters need a positive boxsize "\
+                  "for periodic boundary conditions"
+            raise ValueError(msg)
+
+        self._nthreads = nthreads
+        self._binfile = return_rbins_for_extension(binfile)
+        rmax = _bins_as_array(self._binfile)[-1]
+        kwargs['output_ravg'] = output_ravg
+        super(IncrementalDD, self).__init__(X, Y, Z, weights, weight_type,
+                                            periodic, boxsize,
+                                            [rmax, rmax, rmax], kwargs)
+
+    def _count_auto(self, catalog):
+        from Corrfunc.theory.DD import DD
+
+        X, Y, Z, weights = catalog
+        return DD(1, self._nthreads, self._binfile, X, Y, Z,
+                  periodic=self._periodic, boxsize=self._boxsize,
+                  **self._pair_kwargs(weights))
+
+    def _count_cross(self, catalog1, catalog2):
+        from Corrfunc.theory.DD import DD
+
+        X1, Y1, Z1, weights1 = catalog1
+        X2, Y2, Z2, weights2 = catalog2
+        ret = DD(0, self._nthreads, self._binfile, X1, Y1, Z1,
+                 periodic=self._periodic, boxsize=self._boxsize,
+                 X2=X2, Y2=Y2, Z2=Z2, query_mode=True,
+                 permute_in_place=self._in_place,
+                 **self._pair_kwargs(weights1, weights2))
+        return ret[0] if self._in_place else ret
+
+    @property
+    def results(self):
+        """
+        The pair counts of the current catalog, in the same format as
+        :py:mod:`Corrfunc.theory.DD`
+        """
+        return self._pair_results()
+
+
+class IncrementalWP(_IncrementalCounts):
+    """
+    Incremental version of :py:mod:`Corrfunc.theory.wp`.
+
+    The pairs within ``pimax`` are counted in ``(rp, pi)`` bins (as in
+    :py:mod:`Corrfunc.theory.DDrppi`) and summed over ``pi`` for the
+    results; after the
+    initial count, :py:meth:`insert`, :py:meth:`delete` and
+    :py:meth:`update` only count the pairs involving the changed
+    particles, and :py:attr:`results` holds ``wp`` of the current catalog,
+    with the same analytic randoms as :py:mod:`Corrfunc.theory.wp`.
+
+    Parameters
+    -----------
+
+    boxsize, pimax, nthreads, binfile, X/Y/Z, weights, weight_type,
+    output_rpavg:
+        Same as for :py:mod:`Corrfunc.theory.wp`. Only a single value of
+        ``pimax`` is supported.
+
+    kwargs:
+        Any of ``verbose``, ``(xyz)bin_refine_factor``,
+        ``max_cells_per_dim``, ``isa``, ``mixed_precision`` and
+        ``max_position_error``
+
+    """
+
+    avg_sep_field = 'rpavg'
+
+    def __init__(self, boxsize, pimax, nthreads, binfile, X, Y, Z,
+                 weights=None, weight_type=None, output_rpavg=False,
+                 **kwargs):
+        import numpy as np
+        from Corrfunc.theory.distributed import _bins_as_array
+        from Corrfunc.utils import return_rbins_for_extension
+
+        if np.ndim(pimax) != 0 or not pimax > 0.0:
+            msg = "The parameter `pimax` = {0} must be a single positive "\
+                  "value".format(pimax)
+            raise ValueError(msg)
+        if not boxsize > 0.0:
+            msg = "The parameter `boxsize` = {0} must be positive"\
+                  .format(boxsize)
+            raise ValueError(msg)
+
+        self._pimax = float(pimax)
+        self._nthreads = nthreads
+        self._binfile = return_rbins_for_extension(binfile)
+        rpmax = _bins_as_array(self._binfile)[-1]
+        kwargs['output_rpavg'] = output_rpavg
+        super(IncrementalWP, self).__init__(X, Y, Z, weights, weight_type,
+                                            True, boxsize,
+                                            [rpmax, rpmax, self._pimax],
+                                            kwargs)
+
+    def _count_auto(self, catalog):
+        from Corrfunc.theory.DDrppi import DDrppi
+
+        X, Y, Z, weights = catalog
+        return DDrppi(1, self._nthreads, self._pimax, self._binfile,
+                      X, Y, Z, periodic=True, boxsize=self._boxsize,
+                      **self._pair_kwargs(weights))
+
+    def _count_cross(self, catalog1, catalog2):
+        from Corrfunc.theory.DDrppi import DDrppi
+
+        # Both sets of points are reordered in place, and the changed
+        # particles must keep their order
+        X1, Y1, Z1, weights1 = [c.copy() if c is not None else None
+                                for c in catalog1]
+        X2, Y2, Z2, weights2 = catalog2
+        ret = DDrppi(0, self._nthreads, self._pimax, self._binfile,
+                     X1, Y1, Z1, periodic=True, boxsize=self._boxsize,
+                     X2=X2, Y2=Y2, Z2=Z2, permute_in_place=self._in_place,
+                     **self._pair_kwargs(weights1, weights2))
+        return ret[0] if self._in_place else ret
+
+    @property
+    def results(self):
+        """
+        ``wp`` of the current catalog, in the same format as
+        :py:mod:`Corrfunc.theory.wp`
+        """
+        from Corrfunc.utils import _rp_pi_counts_to_wp
+
+        N = len(self)
+        weightsum, weight_sqr_sum = float(N), float(N)
+        pair_product = self._weights is not None and \
+            self._weight_type == 'pair_product'
+        if pair_product:
+            weightsum, weight_sqr_sum = self._weight_totals
+        return _rp_pi_counts_to_wp(self._pair_results(), self._boxsize,
+                                   self._pimax, N, weightsum, weight_sqr_sum,
+                                   pair_product)
@@ -13,13 +13,18 @@ from __future__ import (division, print_function, absolute_import,
 __author__ = ('Manodeep Sinha')
 __all__ = ('vpf', )
 
+from Corrfunc.cache import cached_counter
 
+
+@cached_counter('vpf')
 def vpf(rmax, nbins, nspheres, numpN, seed,
-        X, Y, Z,
+        X=None, Y=None, Z=None,
         verbose=False, periodic=True, boxsize=0.0,
         xbin_refine_factor=1, ybin_refine_factor=1,
         zbin_refine_factor=1, max_cells_per_dim=100,
-        c_api_timer=False, isa=r'fastest'):
+        c_api_timer=False, isa=r'fastest',
+        positions=None,
+        c_api_phase_timer=False):
     """
     Function to compute the counts-in-cells on 3-D real-space points.
 
@@ -106,6 +111,14 @@ def vpf(rmax, nbins, nspheres, numpN, seed,
        Boolean flag to measure actual time spent in the C libraries. Here
        to allow for benchmarking and scaling studies.
 
+    c_api_phase_timer: boolean (default false)
+       Boolean flag to also measure the time spent in every phase of the
+       C library (e.g., finding the bounding box, gridding, sorting the
+       particles within the cells, counting the pairs). If the
+       ``CORRFUNC_TRACE`` environment variable is set to a file name, the
+       phases of every call are also appended to that file as one line of
+       JSON.
+
     isa: string (default ``fastest``)
        Controls the runtime dispatch for the instruction set to use. Possible
        options are: [``fastest``, ``avx``, ``sse42``, ``fallback``]
@@ -120,6 +133,10 @@ def vpf(rmax, nbins, nspheres, numpN, seed,
        benchmarking, then the string supplied here gets translated into an
        ``enum`` for the instruction set defined in ``utils/defs.h``.
 
+    positions: array-like, real (float/double), optional
+       An array of shape ``(N, 3)`` with the X/Y/Z positions of the
+       points, instead of ``X/Y/Z``.
+
     Returns
     --------
 
@@ -137,6 +154,10 @@ def vpf(rmax, nbins, nspheres, numpN, seed,
        (results, api_time). ``api_time`` measures only the time spent within
        the C library and ignores all python overhead.
 
+       if ``c_api_phase_timer`` is set, then the dictionary ``api_phases``,
+       with the time (in seconds) spent in every phase of the C library, is
+       also returned (after ``api_time``, if that is returned).
+
     Example
     --------
 
@@ -187,9 +208,17 @@ def vpf(rmax, nbins, nspheres, numpN, seed,
     from warnings import warn
     from future.utils import bytes_to_native_str
     from Corrfunc.utils import translate_isa_string_to_enum,\
-        convert_to_native_endian, is_native_endian, sys_pipes
+        convert_to_native_endian, is_native_endian, sys_pipes,\
+        unpack_positions,\
+        trace_enabled, write_trace
     from math import pi
 
+    # The columns of an (N, 3) array of positions are passed on as views
+    X, Y, Z = unpack_positions(positions, X, Y, Z)
+    if X is None or Y is None or Z is None:
+        msg = "Must pass valid arrays for X/Y/Z (or positions)"
+        raise ValueError(msg)
+
     if numpN <= 0:
         msg = "Number of counts-in-cells wanted must be at least 1"
         raise ValueError(msg)
@@ -216,6 +245,7 @@ def vpf(rmax, nbins, nspheres, numpN, seed,
     X, Y, Z = [convert_to_native_endian(arr) for arr in [X, Y, Z]]
 
     integer_isa = translate_isa_string_to_enum(isa)
+    phase_timer = c_api_phase_timer or trace_enabled()
     with sys_pipes():
       extn_results = vpf_extn(rmax, nbins,
                               nspheres,
@@ -230,12 +260,20 @@ def vpf(rmax, nbins, nspheres, numpN, seed,
                               zbin_refine_factor=zbin_refine_factor,
                               max_cells_per_dim=max_cells_per_dim,
                               c_api_timer=c_api_timer,
+                              c_api_phase_timer=phase_timer,
                               isa=integer_isa)
     if extn_results is None:
         msg = "RuntimeError occurred"
         raise RuntimeError(msg)
     else:
-        extn_results, api_time = extn_results
+        if phase_timer:
+            extn_results, api_time, api_phases = extn_results
+        else:
+            extn_results, api_time = extn_results
+
+    if phase_timer:
+        write_trace('vpf', api_time, api_phases,
+                    N=len(X), nspheres=nspheres)
 
     results_dtype = np.dtype([(bytes_to_native_str(b'rmax'), np.float),
                               (bytes_to_native_str(b'pN'),
@@ -251,10 +289,17 @@ def vpf(rmax, nbins, nspheres, numpN, seed,
             for j in range(numpN):
                 results['pN'][ii][j] = r[1 + j]
 
-    if not c_api_timer:
+    if not (c_api_timer or c_api_phase_timer):
         return results
-    else:
-        return results, api_time
+
+    ret = (results, )
+    if c_api_timer:
+        ret += (api_time, )
+
+    if c_api_phase_timer:
+        ret += (api_phases, )
+
+    return ret
 
 
 if __name__ == '__main__':
@@ -14,12 +14,20 @@ from __future__ import (division, print_function, absolute_import,
 __author__ = ('Manodeep Sinha')
 __all__ = ('xi',)
 
+from Corrfunc.cache import cached_counter
 
-def xi(boxsize, nthreads, binfile, X, Y, Z,
+
+@cached_counter('xi')
+def xi(boxsize, nthreads, binfile, X=None, Y=None, Z=None,
        weights=None, weight_type=None, verbose=False, output_ravg=False,
        xbin_refine_factor=2, ybin_refine_factor=2,
        zbin_refine_factor=1, max_cells_per_dim=100,
-       c_api_timer=False, isa=r'fastest'):
+       c_api_timer=False, isa=r'fastest', mixed_precision=False,
+       max_position_error=0.0,
+       permute_in_place=False,
+       positions=None,
+       c_api_phase_timer=False, c_cell_timer=False, c_perf_counters=False,
+       c_api_phase_memory=False):
     """
     Function to compute the projected correlation function in a
     periodic cosmological box. Pairs which are separated by less
@@ -44,6 +52,8 @@ def xi(boxsize, nthreads, binfile, X, Y, Z,
 
     nthreads: integer
        Number of threads to use.
+       If ``nthreads <= 0``, the number of threads is picked from the
+       number of particles.
 
     binfile: string or an list/array of floats
         For string input: filename specifying the ``r`` bins for
@@ -98,6 +108,34 @@ def xi(boxsize, nthreads, binfile, X, Y, Z,
        Boolean flag to measure actual time spent in the C libraries. Here
        to allow for benchmarking and scaling studies.
 
+    c_api_phase_timer: boolean (default false)
+       Boolean flag to also measure the time spent in every phase of the
+       C library (e.g., finding the bounding box, gridding, sorting the
+       particles within the cells, counting the pairs). If the
+       ``CORRFUNC_TRACE`` environment variable is set to a file name, the
+       phases of every call are also appended to that file as one line of
+       JSON.
+
+    c_cell_timer: boolean or integer (default false)
+        Boolean flag to measure the time spent **per cell-pair** within the
+        C libraries, with the cycle counter. An integer ``k`` only times
+        every k-th cell pair (on every thread), which keeps the overhead
+        low for large runs. The timings are returned in ``cell_time``.
+
+    c_perf_counters: boolean (default false)
+        Boolean flag to count the cycles, instructions, cache misses, branch
+        misses etc with the (Linux) ``perf_event_open`` interface while
+        gridding, assigning the neighbouring cells and counting the pairs (on
+        every thread). Events that are not available (e.g., in a virtual
+        machine) are ``None``. The counts are returned in ``perf_counters``.
+
+    c_api_phase_memory: boolean (default false)
+        Boolean flag to measure the peak memory allocated by the C library
+        (above the memory allocated at the start of the call) during every
+        phase. The bytes are counted by the Corrfunc allocators, so the peaks
+        do not depend on earlier calls. They are returned in
+        ``api_phase_memory``.
+
     isa: string (default ``fastest``)
        Controls the runtime dispatch for the instruction set to use. Possible
        options are: [``fastest``, ``avx``, ``sse42``, ``fallback``]
@@ -116,6 +154,34 @@ def xi(boxsize, nthreads, binfile, X, Y, Z,
         The type of weighting to apply.  One of ["pair_product", None].  
 
 
+    mixed_precision: boolean (default false)
+       Grid the (double-precision) positions into a float lattice, with
+       every position stored relative to the corner of its cell, and count
+       the pairs with the faster float kernels. The separations remain
+       accurate even in large boxes, and the averages are still accumulated
+       in double precision. Only useful for double-precision inputs.
+
+    max_position_error: double (default 0.0)
+       If positive, the positions are stored as 16 or 32 bit integer
+       offsets within every cell, with at most this error along each
+       axis. Reduces the memory used for the positions by 2-4x, which
+       matters for very large catalogs. The default of 0.0 stores the
+       positions at full precision.
+
+    permute_in_place: boolean (default false)
+       Reorder the positions and weights in place into the order of the
+       cells, instead of copying them into the lattice. Halves the memory
+       needed for large catalogs, but the input arrays are *modified*; the
+       original index of every particle is returned in ``original_index``.
+       The arrays must be aligned, C-contiguous, writeable and in the
+       native byte-order, and this option can not be combined with
+       ``mixed_precision`` or ``max_position_error``.
+
+    positions: array-like, real (float/double), optional
+       An array of shape ``(N, 3)`` with the X/Y/Z positions of the
+       points, instead of ``X/Y/Z``. The columns are read in place
+       through their strides, and are not copied.
+
     Returns
     --------
 
@@ -131,6 +197,39 @@ def xi(boxsize, nthreads, binfile, X, Y, Z,
         Only returned if ``c_api_timer`` is set.  ``api_time`` measures only the time spent
         within the C library and ignores all python overhead.
 
+    api_phases: dict, optional
+        Only returned if ``c_api_phase_timer`` is set. The time (in seconds)
+        spent in every phase of the C library, keyed by the name of the
+        phase, e.g., ``gridlink``, ``sort`` and ``kernel``.
+
+    cell_time: numpy structured array, optional
+        Only returned if ``c_cell_timer`` is set. Contains detailed stats
+        about every (timed) cell-pair visited during pair-counting, sorted
+        on the cell indices: the number of particles in each cell (``N1``,
+        ``N2``), the time in nano-seconds (``time_in_ns``) and in cycles
+        (``cycles``) taken to process the pair, the 1-D index of each cell
+        (``cellidx1``, ``cellidx2``) and the thread-id (``tid``) of the
+        thread that processed the pair.
+
+    perf_counters: dict, optional
+        Only returned if ``c_perf_counters`` is set. Keyed by the name of the
+        phase (``gridlink``, ``assign_ngb_cells`` and ``kernel``); every entry
+        holds the total count of every event over the threads, the
+        instructions per cycle (``ipc``), the ``cache_miss_rate``, the
+        ``branch_miss_rate`` and the per-thread counts (``per_thread``). See
+        :py:func:`Corrfunc.utils.summarize_perf_counters`.
+
+    api_phase_memory: dict, optional
+        Only returned if ``c_api_phase_memory`` is set. The peak memory
+        allocated (in bytes, above the memory allocated at the start of the call)
+        reached during every phase, keyed by the name of the phase as in
+        ``api_phases``. ``None`` if the memory can not be measured.
+
+    original_index: numpy int64 array, optional
+       Only returned if ``permute_in_place`` is set. ``X[i]`` (and the
+       weights) now holds the particle that was originally at index
+       ``original_index[i]``.
+
     Example
     --------
 
@@ -183,15 +282,25 @@ def xi(boxsize, nthreads, binfile, X, Y, Z,
     from warnings import warn
     from future.utils import bytes_to_native_str
     from Corrfunc.utils import translate_isa_string_to_enum,\
-        return_file_with_rbins, convert_to_native_endian,\
-        is_native_endian, sys_pipes
-        
+        translate_cell_timer_to_sampling, summarize_perf_counters,\
+        return_rbins_for_extension, convert_to_native_endian,\
+        is_native_endian, sys_pipes, unpack_positions,\
+        trace_enabled, write_trace
+
+    # The columns of an (N, 3) array of positions are passed on as views
+    X, Y, Z = unpack_positions(positions, X, Y, Z)
+    if X is None or Y is None or Z is None:
+        msg = "Must pass valid arrays for X/Y/Z (or positions)"
+        raise ValueError(msg)
+
     # Broadcast scalar weights to arrays
     if weights is not None:
         weights = np.atleast_1d(weights)
         
     # Warn about non-native endian arrays
     if not all(is_native_endian(arr) for arr in [X, Y, Z, weights]):
+        if permute_in_place:
+            raise ValueError('permute_in_place requires arrays with the native byte-order')
         warn('One or more input array has non-native endianness!  A copy will be made with the correct endianness.')
     X, Y, Z, weights = [convert_to_native_endian(arr) for arr in [X, Y, Z, weights]]
     
@@ -202,8 +311,14 @@ def xi(boxsize, nthreads, binfile, X, Y, Z,
         if v is not None:
             kwargs[k] = v
 
+    # The C extension records where every (reordered) particle came from
+    if permute_in_place:
+        kwargs['original_index1'] = np.empty(len(X), dtype=np.int64)
+
     integer_isa = translate_isa_string_to_enum(isa)
-    rbinfile, delete_after_use = return_file_with_rbins(binfile)
+    cell_timer_sampling = translate_cell_timer_to_sampling(c_cell_timer)
+    rbinfile = return_rbins_for_extension(binfile)
+    phase_timer = c_api_phase_timer or trace_enabled()
     with sys_pipes():
       extn_results = xi_extn(boxsize, nthreads, rbinfile,
                                        X, Y, Z,
@@ -214,16 +329,34 @@ def xi(boxsize, nthreads, binfile, X, Y, Z,
                                        zbin_refine_factor=zbin_refine_factor,
                                        max_cells_per_dim=max_cells_per_dim,
                                        c_api_timer=c_api_timer,
+                                       c_api_phase_timer=phase_timer,
+                                       c_cell_timer=cell_timer_sampling,
+                                       c_perf_counters=c_perf_counters,
+                                       c_api_phase_memory=c_api_phase_memory,
+                                       mixed_precision=mixed_precision,
+                                       max_position_error=max_position_error,
+                                       permute_in_place=permute_in_place,
                                        isa=integer_isa, **kwargs)
     if extn_results is None:
         msg = "RuntimeError occurred"
         raise RuntimeError(msg)
     else:
-        extn_results, api_time = extn_results
-
-    if delete_after_use:
-        import os
-        os.remove(rbinfile)
+        # (results, api_time[, cell_time][, api_phases][, perf_counts]
+        #  [, phase_memory])
+        cell_time = extn_results[2] if c_cell_timer else None
+        api_phases = extn_results[3 if c_cell_timer else 2]\
+            if phase_timer else None
+        api_phase_memory = dict((phase, peak if peak >= 0 else None)
+                                for phase, peak in extn_results[-1].items())\
+            if c_api_phase_memory else None
+        perf_counters = summarize_perf_counters(
+            extn_results[-2 if c_api_phase_memory else -1])\
+            if c_perf_counters else None
+        extn_results, api_time = extn_results[:2]
+
+    if phase_timer:
+        write_trace('xi', api_time, api_phases,
+                    nthreads=nthreads, N=len(X))
 
     results_dtype = np.dtype([(bytes_to_native_str(b'rmin'), np.float),
                               (bytes_to_native_str(b'rmax'), np.float),
@@ -233,10 +366,31 @@ def xi(boxsize, nthreads, binfile, X, Y, Z,
                               (bytes_to_native_str(b'weightavg'), np.float)])
     results = np.array(extn_results, dtype=results_dtype)
 
-    if not c_api_timer:
+    optional_returns = c_api_timer or c_api_phase_timer or c_cell_timer or\
+        c_perf_counters or c_api_phase_memory or permute_in_place
+    if not optional_returns:
         return results
-    else:
-        return results, api_time
+
+    ret = (results, )
+    if c_api_timer:
+        ret += (api_time, )
+
+    if c_api_phase_timer:
+        ret += (api_phases, )
+
+    if c_cell_timer:
+        ret += (cell_time, )
+
+    if c_perf_counters:
+        ret += (perf_counters, )
+
+    if c_api_phase_memory:
+        ret += (api_phase_memory, )
+
+    if permute_in_place:
+        ret += (kwargs['original_index1'], )
+
+    return ret
 
 
 if __name__ == '__main__':
@@ -9,8 +9,12 @@ import sys
 from os.path import exists as file_exists
 
 __all__ = ['convert_3d_counts_to_cf', 'convert_rp_pi_counts_to_wp',
-           'translate_isa_string_to_enum', 'return_file_with_rbins',
-           'fix_ra_dec', 'fix_cz', 'compute_nbins', 'gridlink_sphere', ]
+           'translate_isa_string_to_enum', 'translate_cell_timer_to_sampling',
+           'return_file_with_rbins',
+           'return_rbins_for_extension',
+           'fix_ra_dec', 'fix_cz', 'compute_nbins', 'gridlink_sphere',
+           'unpack_positions', 'summarize_perf_counters',
+           'default_cache_dir', 'gridded_catalog_info', ]
 if sys.version_info[0] < 3:
     __all__ = [n.encode('ascii') for n in __all__]
 
@@ -315,6 +319,60 @@ def convert_rp_pi_counts_to_wp(ND1, ND2, NR1, NR2,
     return wp
 
 
+def _rp_pi_counts_to_wp(counts, boxsize, pimax, N, weightsum,
+                        weight_sqr_sum, pair_product):
+    """
+    Sums the ``(rp, pi)`` pair counts of a periodic auto-correlation (in the
+    format of :py:mod:`Corrfunc.theory.DDrppi`) over the ``pi`` bins up to
+    ``pimax``, and returns ``wp`` with the same analytic randoms (and in the
+    same format) as :py:mod:`Corrfunc.theory.wp`.
+
+    ``N``, ``weightsum`` and ``weight_sqr_sum`` are the number of particles
+    and the sums of their weights and squared weights (both equal to ``N``
+    without ``pair_product`` weights).
+    """
+    import numpy as np
+    from future.utils import bytes_to_native_str
+
+    results_dtype = np.dtype([(bytes_to_native_str(b'rmin'), np.float64),
+                              (bytes_to_native_str(b'rmax'), np.float64),
+                              (bytes_to_native_str(b'rpavg'), np.float64),
+                              (bytes_to_native_str(b'wp'), np.float64),
+                              (bytes_to_native_str(b'npairs'), np.uint64),
+                              (bytes_to_native_str(b'weightavg'), np.float64)])
+    nrpbins = len(np.unique(counts['rmin']))
+    counts = counts.reshape(nrpbins, -1)
+    sel = counts['pimax'] <= pimax * (1.0 + 1e-10)
+    npairs = np.where(sel, counts['npairs'], 0).sum(axis=1)
+    results = np.zeros(nrpbins, dtype=results_dtype)
+    results['rmin'] = counts['rmin'][:, 0]
+    results['rmax'] = counts['rmax'][:, 0]
+    results['npairs'] = npairs
+    nonzero = npairs > 0
+    for field in ['rpavg', 'weightavg']:
+        total = np.where(sel, counts[field] * counts['npairs'],
+                         0.0).sum(axis=1)
+        total[nonzero] /= npairs[nonzero]
+        results[field] = total
+
+    prefac_density = weightsum * (weightsum - weightsum / N) / \
+        boxsize**3 if N > 0 else 0.0
+    weight0 = results['npairs'].astype(np.float64)
+    if pair_product:
+        weight0 *= results['weightavg']
+    twice_pimax = 2.0 * pimax
+    vol = np.pi * (results['rmax']**2 - results['rmin']**2) * twice_pimax
+    weightrandom = prefac_density * vol
+    weightrandom[results['rmin'] <= 0.0] += weight_sqr_sum
+    # Empty bins can not occur, -2 * twice_pimax signals invalid
+    valid = (vol > 0.0) & (weightrandom > 0.0)
+    weightrandom[~valid] = 1.0
+    results['wp'] = np.where(valid,
+                             (weight0 / weightrandom - 1.0) * twice_pimax,
+                             -2.0 * twice_pimax)
+    return results
+
+
 def return_file_with_rbins(rbins):
     """
     Helper function to ensure that the ``binfile`` required by the Corrfunc
@@ -375,6 +433,63 @@ def return_file_with_rbins(rbins):
     raise TypeError(msg)
 
 
+def return_rbins_for_extension(rbins):
+    """
+    Helper function to pass the ``binfile`` to the theory extensions, which
+    accept either a filename or an array of bin-edges.
+
+    Unlike ``return_file_with_rbins``, an array of bins is not written to a
+    temporary file, but is returned as a sorted array of doubles that the
+    extensions pass straight through to the C library. Avoids the (file system)
+    overhead of the temporary file on every call.
+
+    Parameters
+    -----------
+    rbins: string or array-like
+       Expected to be a string or an array containing the bins
+
+    Returns
+    ---------
+    binfile: string, filename or array of doubles
+       If the input ``rbins`` was a valid filename, then returns the same
+       string. Otherwise, returns the (sorted) bin-edges as a contiguous
+       array of doubles.
+
+    Example
+    --------
+    >>> from Corrfunc.utils import return_rbins_for_extension
+    >>> print(return_rbins_for_extension([10.0, 0.1, 1.0]))
+    [ 0.1  1.  10. ]
+
+    """
+
+    is_string = False
+    try:
+        if isinstance(rbins, basestring):
+            is_string = True
+    except NameError:
+        if isinstance(rbins, str):
+            is_string = True
+
+    if is_string:
+        if file_exists(rbins):
+            return rbins
+
+        msg = "Could not find file = `{0}` containing the bins"\
+              .format(rbins)
+        raise IOError(msg)
+
+    import numpy as np
+    rbins = np.sort(np.asarray(rbins, dtype=np.float64).ravel())
+    # For a valid bin specifier, there must be at least 1 bin.
+    if len(rbins) < 2:
+        msg = "Input `binfile` was not a valid array (>= 2 elements). "\
+              "Num elements = {0}".format(len(rbins))
+        raise TypeError(msg)
+
+    return rbins
+
+
 def fix_cz(cz):
     """
     Multiplies the input array by speed of light, if the input values are
@@ -455,6 +570,10 @@ def fix_ra_dec(ra, dec):
     return ra.astype(input_dtype), dec.astype(input_dtype)
 
 
+# The (validated) enum for every isa string that has been translated so far
+_isa_enum_cache = {}
+
+
 def translate_isa_string_to_enum(isa):
     """
     Helper function to convert an user-supplied string to the
@@ -477,6 +596,12 @@ def translate_isa_string_to_enum(isa):
 
     """
 
+    # Repeated calls (with the same isa) skip the validation
+    try:
+        return _isa_enum_cache[isa]
+    except (KeyError, TypeError):
+        pass
+
     msg = "Input to translate_isa_string_to_enum must be "\
           "of string type. Found type = {0}".format(type(isa))
     try:
@@ -505,13 +630,48 @@ def translate_isa_string_to_enum(isa):
              'AVX512F': 9
              }
     try:
-        return enums[isa_upper]
+        _isa_enum_cache[isa] = enums[isa_upper]
+        return _isa_enum_cache[isa]
     except KeyError:
         print("Do not know instruction type = {0}".format(isa))
         print("Valid instructions are {0}".format(enums.keys()))
         raise
 
 
+def translate_cell_timer_to_sampling(c_cell_timer):
+    """
+    Helper function to convert the user-supplied ``c_cell_timer`` into the
+    sampling interval used by the C-API. ``False`` disables the per
+    cell-pair timer, ``True`` times every cell pair and an integer ``k``
+    times every k-th cell pair (on every thread).
+
+    Parameters
+    ------------
+    c_cell_timer: boolean or integer
+       Whether (and how often) to time the cell pairs
+
+    Returns
+    --------
+    sampling: integer
+       0 if the timer is disabled; otherwise, the interval between two
+       timed cell pairs
+
+    """
+    try:
+        sampling = int(c_cell_timer)
+    except (TypeError, ValueError):
+        msg = "Input to translate_cell_timer_to_sampling must be a boolean "\
+              "or an integer. Found type = {0}".format(type(c_cell_timer))
+        raise TypeError(msg)
+
+    if sampling < 0 or sampling != c_cell_timer:
+        msg = "c_cell_timer = {0} must be a boolean or a non-negative "\
+              "integer".format(c_cell_timer)
+        raise ValueError(msg)
+
+    return sampling
+
+
 def compute_nbins(max_diff, binsize,
                  refine_factor=1,
                  max_nbins=None):
@@ -906,6 +1066,61 @@ def convert_to_native_endian(array):
     else:
         return array
     
+def unpack_positions(positions, *columns):
+    """
+    Returns the columns of an array of ``positions`` with shape
+    ``(N, len(columns))``. The columns are views into ``positions``
+    (and not copies), so the theory extensions can read them in place
+    through their strides. If ``positions`` is None, then ``columns``
+    are returned unchanged.
+
+    Parameters
+    ----------
+    positions: array-like, or None
+        The positions, one point per row
+
+    columns: array-like, or None
+        The individual coordinate arrays. Must be None if ``positions``
+        is supplied.
+
+    Returns
+    -------
+    columns: tuple
+        The coordinate arrays
+
+    Example
+    -------
+    >>> import numpy as np
+    >>> pos = np.arange(12.0).reshape(4, 3)
+    >>> X, Y, Z = unpack_positions(pos, None, None, None)
+    >>> print(Y)
+    [ 1.  4.  7. 10.]
+    >>> np.shares_memory(X, pos)
+    True
+    >>> X, Y, Z = unpack_positions(None, pos[:, 0], pos[:, 1], pos[:, 2])
+    >>> print(Z)
+    [ 2.  5.  8. 11.]
+    """
+
+    if positions is None:
+        return columns
+
+    if any(col is not None for col in columns):
+        msg = "Pass either the positions as a single array or as "\
+              "separate coordinate arrays, not both"
+        raise ValueError(msg)
+
+    import numpy as np
+    positions = np.asanyarray(positions)
+    ncols = len(columns)
+    if positions.ndim != 2 or positions.shape[1] != ncols:
+        msg = "Expected the positions to have shape (N, {0}). Instead "\
+              "found shape {1}".format(ncols, positions.shape)
+        raise ValueError(msg)
+
+    return tuple(positions[:, i] for i in range(ncols))
+
+
 def is_native_endian(array):
     '''
     Checks whether the given array is native-endian.
@@ -949,7 +1164,236 @@ def is_native_endian(array):
     return (array_is_little_endian == system_is_little_endian) or (array.dtype.byteorder == '=')
 
 
+def trace_enabled():
+    '''
+    Returns True if the ``CORRFUNC_TRACE`` environment variable is set
+    to the name of a file. Every call to the pair-counters then appends
+    the time spent in every phase of the C library to that file, as one
+    JSON object per line (see :py:func:`write_trace`).
+    '''
+    import os
+    return bool(os.environ.get('CORRFUNC_TRACE'))
+
+
+def write_trace(routine, api_time, api_phases, **info):
+    '''
+    Appends one line to the JSON-lines trace file named by the
+    ``CORRFUNC_TRACE`` environment variable. Does nothing if the
+    variable is not set.
+
+    Parameters
+    ----------
+    routine: string
+        Name of the pair-counter, e.g., ``DD`` or ``DDrppi_mocks``
+
+    api_time: float
+        Total time spent in the C library (in seconds)
+
+    api_phases: dict
+        Time spent in every phase of the C library (in seconds)
+
+    info: keyword arguments
+        Any other (JSON-serializable) details of the call, e.g., the
+        number of particles and threads
+
+    Example
+    -------
+    >>> import os, json, tempfile
+    >>> from Corrfunc.utils import write_trace
+    >>> tracefile = os.path.join(tempfile.mkdtemp(), 'trace.jsonl')
+    >>> os.environ['CORRFUNC_TRACE'] = tracefile
+    >>> write_trace('DD', 0.5, {'gridlink': 0.1, 'kernel': 0.4}, N1=100)
+    >>> del os.environ['CORRFUNC_TRACE']
+    >>> with open(tracefile) as f:
+    ...     record = json.loads(f.readline())
+    >>> print(record['routine'], record['api_time'], record['N1'])
+    DD 0.5 100
+    '''
+    import os
+    import json
+    import time
+
+    tracefile = os.environ.get('CORRFUNC_TRACE')
+    if not tracefile:
+        return
+
+    record = dict(routine=routine, timestamp=time.time(), pid=os.getpid(),
+                  api_time=api_time, api_phases=api_phases)
+    record.update(info)
+    # A single write per record keeps the lines intact when several
+    # processes append to the same file
+    with open(tracefile, 'a') as f:
+        f.write(json.dumps(record, sort_keys=True) + '\n')
+
+
+def default_cache_dir():
+    '''
+    Returns the directory for the files that Corrfunc caches (e.g., the
+    runtime calibrations and the pair-count results): ``CORRFUNC_CACHE_DIR``
+    if that environment variable is set, otherwise ``corrfunc`` within
+    ``XDG_CACHE_HOME`` (default ``~/.cache``). The directory is not created.
+    '''
+    import os
+
+    cache_dir = os.environ.get('CORRFUNC_CACHE_DIR')
+    if cache_dir:
+        return cache_dir
+    cache_home = os.environ.get('XDG_CACHE_HOME') or \
+        os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'corrfunc')
+
+
+def gridded_catalog_info(filename):
+    '''
+    Reads the header of a gridded catalog, i.e., the lattice of the first
+    set of points that ``DD``, ``DDrppi``, ``DDsmu``, ``DDrppi_mocks`` and
+    ``DDsmu_mocks`` write to (and memory-map from) ``grid_file``.
+
+    Parameters
+    ----------
+    filename: string
+        Name of the gridded catalog.
+
+    Returns
+    -------
+    info: dict, or None
+        ``None`` if the file does not exist. Otherwise, the number of
+        particles (``np``) and of weights per particle (``num_weights``),
+        the ``dtype`` of the positions that were gridded, the lattice
+        (``nmesh``, ``bin_refine_factors``, ``max_cells_per_dim``, the
+        ``bounds`` as ``(xmin, xmax, ymin, ymax, zmin, zmax)`` and the
+        largest separation along every axis, ``max_size``, that the lattice
+        can be used for), ``periodic``, ``boxsize``, ``mixed_precision``,
+        whether the file was written by the ``mocks`` routines (and then the
+        ``cosmology``, or 0 for co-moving distances) and the ``file_size``
+        in bytes.
+
+    Raises ValueError if the file is not a gridded catalog that this version
+    of Corrfunc can read.
+    '''
+    import os
+    import numpy as np
+
+    if not os.path.exists(filename):
+        return None
+
+    # Same layout as `struct gridded_catalog_header' in utils/gridded_catalog.h
+    header_dtype = np.dtype([('magic', 'S8'), ('version', np.int64),
+                             ('byte_order', np.uint64), ('np', np.int64),
+                             ('totncells', np.int64),
+                             ('cells_offset', np.int64),
+                             ('data_offset', np.int64),
+                             ('file_size', np.int64),
+                             ('element_size', np.int64),
+                             ('input_element_size', np.int64),
+                             ('num_weights', np.int64),
+                             ('bounds', np.float64, 6),
+                             ('max_size', np.float64, 3),
+                             ('boxsize', np.float64),
+                             ('max_cz', np.float64),
+                             ('nmesh', np.int32, 3),
+                             ('bin_refine_factors', np.int32, 3),
+                             ('max_cells_per_dim', np.int32),
+                             ('periodic', np.int32), ('sort_on_z', np.int32),
+                             ('mixed_precision', np.int32),
+                             ('los', np.int32), ('mocks', np.int32),
+                             ('cosmology', np.int32)])
+    with open(filename, 'rb') as f:
+        header = np.fromfile(f, dtype=header_dtype, count=1)
+
+    if len(header) != 1 or header['magic'][0] != b'CORRGRID' or \
+       header['byte_order'][0] != 0x0102030405060708:
+        msg = "'{0}' is not a gridded catalog (written on a machine "\
+              "with the same byte-order)".format(filename)
+        raise ValueError(msg)
+    if header['version'][0] != 1:
+        msg = "The gridded catalog '{0}' has version {1}, but only "\
+              "version 1 is supported".format(filename,
+                                              header['version'][0])
+        raise ValueError(msg)
+
+    header = header[0]
+    return dict(np=int(header['np']),
+                num_weights=int(header['num_weights']),
+                dtype=np.dtype('f{0}'.format(header['input_element_size'])),
+                nmesh=tuple(int(n) for n in header['nmesh']),
+                bin_refine_factors=tuple(
+                    int(n) for n in header['bin_refine_factors']),
+                max_cells_per_dim=int(header['max_cells_per_dim']),
+                bounds=tuple(float(b) for b in header['bounds']),
+                max_size=tuple(float(m) for m in header['max_size']),
+                periodic=bool(header['periodic']),
+                boxsize=float(header['boxsize']),
+                mixed_precision=bool(header['mixed_precision']),
+                mocks=bool(header['mocks']),
+                cosmology=int(header['cosmology']),
+                file_size=int(header['file_size']))
+
+
+def summarize_perf_counters(perf_counts):
+    '''
+    Adds up the hardware performance counters returned by the C extensions
+    (with ``c_perf_counters=True``) over the threads, and derives the
+    instructions per cycle and the cache and branch miss rates.
+
+    Parameters
+    ----------
+    perf_counts: dict
+        Keyed by the name of the phase (``gridlink``, ``assign_ngb_cells``
+        and ``kernel``), of numpy structured arrays with the counts of every
+        event for every thread. Events that could not be counted are -1.
+
+    Returns
+    -------
+    summary: dict
+        Keyed by the name of the phase. Every entry is a dictionary with the
+        total count of every event over the threads (``None`` if the event
+        could not be counted, e.g., in a virtual machine or with a high
+        ``/proc/sys/kernel/perf_event_paranoid``), ``ipc``,
+        ``cache_miss_rate`` and ``branch_miss_rate`` (``None`` if the
+        counts are missing), ``nthreads``, and the per-thread counts
+        in ``per_thread``.
+
+    Example
+    -------
+    >>> import numpy as np
+    >>> from Corrfunc.utils import summarize_perf_counters
+    >>> dtype = np.dtype([('tid', np.int32), ('cycles', np.int64),
+    ...                   ('instructions', np.int64)])
+    >>> kernel = np.array([(0, 100, 300), (1, 100, 100)], dtype=dtype)
+    >>> summary = summarize_perf_counters({'kernel': kernel})
+    >>> print(summary['kernel']['instructions'], summary['kernel']['ipc'])
+    400 2.0
+    '''
+    def _ratio(numerator, denominator):
+        if numerator is None or not denominator:
+            return None
+        return numerator / denominator
+
+    summary = dict()
+    for phase, counts in perf_counts.items():
+        totals = dict()
+        for event in counts.dtype.names:
+            if event == 'tid':
+                continue
+            values = counts[event]
+            totals[event] = int(values.sum()) if (values >= 0).all() else None
+
+        get = totals.get
+        totals['ipc'] = _ratio(get('instructions'), get('cycles'))
+        totals['cache_miss_rate'] = _ratio(get('cache_misses'),
+                                           get('cache_references'))
+        totals['branch_miss_rate'] = _ratio(get('branch_misses'),
+                                            get('branches'))
+        totals['nthreads'] = len(counts)
+        totals['per_thread'] = counts
+        summary[phase] = totals
+
+    return summary
+
+
 import wurlitzer
+from contextlib import contextmanager
 
 def sys_pipes():
     '''
@@ -957,8 +1401,8 @@ def sys_pipes():
     from the command line into a Jupyter notebook.  But if we're not
     in a notebook, this isn't safe because we can't redirect stdout
     to itself.  This function is a thin wrapper that checks if the
-    stdout/err streams are TTYs and enables output redirection
-    based on that.
+    stdout/err streams are TTYs (or are the file descriptors that the
+    C code writes to) and enables output redirection based on that.
 
     Basic usage is:
 
@@ -969,9 +1413,33 @@ def sys_pipes():
     see also https://github.com/manodeep/Corrfunc/issues/157.
     '''
 
-    kwargs = {'stdout':None if sys.stdout.isatty() else sys.stdout,
-              'stderr':None if sys.stderr.isatty() else sys.stderr }
+    kwargs = {'stdout':None if _writes_to_fd(sys.stdout, 1) else sys.stdout,
+              'stderr':None if _writes_to_fd(sys.stderr, 2) else sys.stderr }
+
+    # Setting up the pipes (and the threads that forward the output) is
+    # comparable to the runtime for small catalogs; skip when not needed
+    if kwargs['stdout'] is None and kwargs['stderr'] is None:
+        return _no_pipes()
+
     return wurlitzer.pipes(**kwargs)
+
+
+def _writes_to_fd(stream, fd):
+    '''
+    Returns True if the output from the C extensions (written to the
+    file descriptor ``fd``) already ends up in ``stream``, i.e., if
+    ``stream`` is a TTY or is backed by ``fd`` itself.
+    '''
+    try:
+        return stream.isatty() or stream.fileno() == fd
+    except (AttributeError, ValueError, OSError):
+        # e.g., ``io.UnsupportedOperation`` for the streams in a Jupyter kernel
+        return False
+
+
+@contextmanager
+def _no_pipes():
+    yield
     
 if __name__ == '__main__':
     import doctest
@@ -8,6 +8,7 @@
 #define NPY_NO_DEPRECATED_API NPY_1_7_API_VERSION
 
 #include <Python.h>
+#include <stddef.h>
 
 /* Now, include the numpy header*/
 #include <arrayobject.h>
@@ -20,6 +21,9 @@
 //for the vpf
 #include "countspheres_mocks.h"
 
+//for reading the first set of points from a gridded catalog
+#include "gridded_catalog.h"
+
 //for the instruction set detection
 #include "cpu_features.h"
 
@@ -78,7 +82,7 @@ static PyMethodDef module_methods[] = {
      "                       fast_divide_and_NR_steps=0, xbin_refine_factor=2, \n"
      "                       ybin_refine_factor=2, zbin_refine_factor=1, \n"
      "                       max_cells_per_dim=100, \n"
-     "                       c_api_timer=False, isa=-1)\n"
+     "                       c_api_timer=False, isa=-1, query_mode=False)\n"
      "\n"
      "Calculate the 2-D pair-counts, "XI_CHAR"("RP_CHAR", "PI_CHAR"), auto/cross-correlation function given two\n"
      "sets of RA1/DEC1/CZ1 and RA2/DEC2/CZ2 arrays. This module is suitable for mock catalogs that have been\n"
@@ -194,6 +198,30 @@ static PyMethodDef module_methods[] = {
      "   Boolean flag to measure actual time spent in the C libraries. Here\n"
      "   to allow for benchmarking and scaling studies.\n"
      "\n"
+     "c_api_phase_timer : boolean (default false)\n"
+     "   Also measure the time spent in every phase of the calculation (e.g.,\n"
+     "   gridding, sorting, counting the pairs), and return the phases as a\n"
+     "   dictionary after ``time``. Implies ``c_api_timer``.\n\n"
+     "c_cell_timer : boolean or integer (default false)\n"
+     "   Measure the time spent **per cell-pair** within the C libraries with the\n"
+     "   cycle counter, and return the timings as a numpy structured array (after\n"
+     "   ``time``) with the fields ``N1``, ``N2``, ``time_in_ns``, ``cycles``,\n"
+     "   ``cellidx1``, ``cellidx2`` and ``tid``, sorted on the cell indices. An\n"
+     "   integer ``k > 1`` only times every k-th cell pair (per thread), to keep\n"
+     "   the overhead low for large runs.\n\n"
+     "c_perf_counters : boolean (default false)\n"
+     "   Count the cycles, instructions, cache references and misses, branches and\n"
+     "   branch misses, task-clock and page faults with the Linux ``perf_event_open``\n"
+     "   interface during the gridding, the neighbour assignment and the pair\n"
+     "   counting (on every thread), and return them as the last element of the\n"
+     "   tuple: a dictionary keyed by the name of the phase, of numpy structured\n"
+     "   arrays with one element per thread. Events that can not be counted are -1.\n\n"
+     "c_api_phase_memory : boolean (default false)\n"
+     "   Measure the peak memory allocated by the C library (in bytes, above the\n"
+     "   memory allocated at the start of the call) during every phase, and return\n"
+     "   it as the last element of the tuple (after the performance counters): a\n"
+     "   dictionary keyed by the name of the phase. The peaks are -1 if the\n"
+     "   allocations can not be counted.\n\n"
      "isa : integer (default -1)\n"
      "  Controls the runtime dispatch for the instruction set to use. Possible\n"
      "  options are: [-1, AVX, SSE42, FALLBACK]\n\n"
@@ -207,6 +235,11 @@ static PyMethodDef module_methods[] = {
      "  then the integer values correspond to the ``enum`` for the instruction set\n"
      "  defined in ``utils/defs.h``.\n"
      "\n"
+     "query_mode : boolean (default false)\n"
+     "   Only used for cross-correlations. Grid only the second set of points, and\n"
+     "   stream the first set through the neighbouring cells in small groups of\n"
+     "   points. Much faster when the first set is much smaller than the second.\n"
+     "\n"
      "Returns\n"
      "--------\n"
      "\n"
@@ -246,7 +279,7 @@ static PyMethodDef module_methods[] = {
          "                       fast_divide_and_NR_steps=0, xbin_refine_factor=2, \n"
          "                       ybin_refine_factor=2, zbin_refine_factor=1, \n"
          "                       max_cells_per_dim=100, \n"
-         "                       c_api_timer=False, isa=-1)\n"
+         "                       c_api_timer=False, isa=-1, query_mode=False)\n"
          "\n"
          "Calculate the 2-D pair-counts, "XI_CHAR"(s, "MU_CHAR"), auto/cross-correlation function given two\n"
          "sets of RA1/DEC1/CZ1 and RA2/DEC2/CZ2 arrays. This module is suitable for mock catalogs that have been\n"
@@ -358,6 +391,30 @@ static PyMethodDef module_methods[] = {
          "   Boolean flag to measure actual time spent in the C libraries. Here\n"
          "   to allow for benchmarking and scaling studies.\n"
          "\n"
+         "c_api_phase_timer : boolean (default false)\n"
+         "   Also measure the time spent in every phase of the calculation (e.g.,\n"
+         "   gridding, sorting, counting the pairs), and return the phases as a\n"
+         "   dictionary after ``time``. Implies ``c_api_timer``.\n\n"
+         "c_cell_timer : boolean or integer (default false)\n"
+         "   Measure the time spent **per cell-pair** within the C libraries with the\n"
+         "   cycle counter, and return the timings as a numpy structured array (after\n"
+         "   ``time``) with the fields ``N1``, ``N2``, ``time_in_ns``, ``cycles``,\n"
+         "   ``cellidx1``, ``cellidx2`` and ``tid``, sorted on the cell indices. An\n"
+         "   integer ``k > 1`` only times every k-th cell pair (per thread), to keep\n"
+         "   the overhead low for large runs.\n\n"
+         "c_perf_counters : boolean (default false)\n"
+         "   Count the cycles, instructions, cache references and misses, branches and\n"
+         "   branch misses, task-clock and page faults with the Linux ``perf_event_open``\n"
+         "   interface during the gridding, the neighbour assignment and the pair\n"
+         "   counting (on every thread), and return them as the last element of the\n"
+         "   tuple: a dictionary keyed by the name of the phase, of numpy structured\n"
+         "   arrays with one element per thread. Events that can not be counted are -1.\n\n"
+         "c_api_phase_memory : boolean (default false)\n"
+         "   Measure the peak memory allocated by the C library (in bytes, above the\n"
+         "   memory allocated at the start of the call) during every phase, and return\n"
+         "   it as the last element of the tuple (after the performance counters): a\n"
+         "   dictionary keyed by the name of the phase. The peaks are -1 if the\n"
+         "   allocations can not be counted.\n\n"
          "isa : integer (default -1)\n"
          "  Controls the runtime dispatch for the instruction set to use. Possible\n"
          "  options are: [-1, AVX, SSE42, FALLBACK]\n\n"
@@ -371,6 +428,11 @@ static PyMethodDef module_methods[] = {
          "  then the integer values correspond to the ``enum`` for the instruction set\n"
          "  defined in ``utils/defs.h``.\n"
          "\n"
+         "query_mode : boolean (default false)\n"
+         "   Only used for cross-correlations. Grid only the second set of points, and\n"
+         "   stream the first set through the neighbouring cells in small groups of\n"
+         "   points. Much faster when the first set is much smaller than the second.\n"
+         "\n"
          "Returns\n"
          "--------\n"
          "\n"
@@ -402,7 +464,7 @@ static PyMethodDef module_methods[] = {
      "                       verbose=False, output_thetaavg=False,\n"
      "                       fast_acos=False, ra_refine_factor=2,\n"
      "                       dec_refine_factor=2, max_cells_per_dim=100, \n"
-     "                       c_api_timer=False, isa='fastest')\n"
+     "                       c_api_timer=False, isa='fastest', query_mode=False)\n"
      "\n"
      "Calculate the angular pair-counts, required for "OMEGA_CHAR"("THETA_CHAR"), auto/cross-correlation function given two\n"
      "sets of RA1/DEC1 and RA2/DEC2 arrays. This module is suitable for mock catalogs that have been\n"
@@ -497,6 +559,34 @@ static PyMethodDef module_methods[] = {
      "   Boolean flag to measure actual time spent in the C libraries. Here\n"
      "   to allow for benchmarking and scaling studies.\n"
      "\n"
+     "c_api_phase_timer : boolean (default false)\n"
+     "   Also measure the time spent in every phase of the calculation (e.g.,\n"
+     "   gridding, sorting, counting the pairs), and return the phases as a\n"
+     "   dictionary after ``time``. Implies ``c_api_timer``.\n\n"
+     "c_cell_timer : boolean or integer (default false)\n"
+     "   Measure the time spent **per cell-pair** within the C libraries with the\n"
+     "   cycle counter, and return the timings as a numpy structured array (after\n"
+     "   ``time``) with the fields ``N1``, ``N2``, ``time_in_ns``, ``cycles``,\n"
+     "   ``cellidx1``, ``cellidx2`` and ``tid``, sorted on the cell indices. An\n"
+     "   integer ``k > 1`` only times every k-th cell pair (per thread), to keep\n"
+     "   the overhead low for large runs.\n\n"
+     "c_perf_counters : boolean (default false)\n"
+     "   Count the cycles, instructions, cache references and misses, branches and\n"
+     "   branch misses, task-clock and page faults with the Linux ``perf_event_open``\n"
+     "   interface during the gridding, the neighbour assignment and the pair\n"
+     "   counting (on every thread), and return them as the last element of the\n"
+     "   tuple: a dictionary keyed by the name of the phase, of numpy structured\n"
+     "   arrays with one element per thread. Events that can not be counted are -1.\n\n"
+     "c_api_phase_memory : boolean (default false)\n"
+     "   Measure the peak memory allocated by the C library (in bytes, above the\n"
+     "   memory allocated at the start of the call) during every phase, and return\n"
+     "   it as the last element of the tuple (after the performance counters): a\n"
+     "   dictionary keyed by the name of the phase. The peaks are -1 if the\n"
+     "   allocations can not be counted.\n\n"
+     "query_mode : boolean (default false)\n"
+     "   Only used for cross-correlations. Grid only the second set of points, and\n"
+     "   stream the first set through the neighbouring cells in small groups of\n"
+     "   points. Much faster when the first set is much smaller than the second.\n\n"
      "isa : integer (default -1)\n"
      "  Controls the runtime dispatch for the instruction set to use. Possible\n"
      "  options are: [-1, AVX, SSE42, FALLBACK]\n\n"
@@ -689,6 +779,10 @@ static PyMethodDef module_methods[] = {
      "   Boolean flag to measure actual time spent in the C libraries. Here\n"
      "   to allow for benchmarking and scaling studies.\n"
      "\n"
+     "c_api_phase_timer : boolean (default false)\n"
+     "   Also measure the time spent in every phase of the calculation (e.g.,\n"
+     "   gridding, sorting, counting the pairs), and return the phases as a\n"
+     "   dictionary after ``time``. Implies ``c_api_timer``.\n\n"
      "isa : integer (default -1)\n"
      "  Controls the runtime dispatch for the instruction set to use. Possible\n"
      "  options are: [-1, AVX, SSE42, FALLBACK]\n\n"
@@ -759,6 +853,146 @@ static PyMethodDef module_methods[] = {
 };
 
 
+/* Returns a dictionary with the time (in seconds) spent in every phase of the last call */
+static PyObject *api_phase_times_as_dict(const struct config_options *options)
+{
+    PyObject *phases = PyDict_New();
+    for(int i=0;i<NUM_API_PHASES;i++) {
+        PyObject *phase_time = PyFloat_FromDouble(options->c_api_phase_times[i]);
+        PyDict_SetItemString(phases, get_api_phase_name((api_phase) i), phase_time);
+        Py_XDECREF(phase_time);
+    }
+    return phases;
+}
+
+/* Returns the per cell-pair timings as a numpy structured array (and frees the timings) */
+static PyObject *cell_timings_as_array(struct config_options *options)
+{
+    PyObject *dtype_dict = Py_BuildValue("{s:[sssssss],s:[sssssss],s:[nnnnnnn],s:n}",
+                                         "names", "N1", "N2", "time_in_ns", "cycles", "cellidx1", "cellidx2", "tid",
+                                         "formats", "i8", "i8", "i8", "i8", "i4", "i4", "i4",
+                                         "offsets",
+                                         (Py_ssize_t) offsetof(struct api_cell_timings, N1),
+                                         (Py_ssize_t) offsetof(struct api_cell_timings, N2),
+                                         (Py_ssize_t) offsetof(struct api_cell_timings, time_in_ns),
+                                         (Py_ssize_t) offsetof(struct api_cell_timings, cycles),
+                                         (Py_ssize_t) offsetof(struct api_cell_timings, first_cellindex),
+                                         (Py_ssize_t) offsetof(struct api_cell_timings, second_cellindex),
+                                         (Py_ssize_t) offsetof(struct api_cell_timings, tid),
+                                         "itemsize", (Py_ssize_t) sizeof(struct api_cell_timings));
+    PyArray_Descr *dtype = NULL;
+    const int status = dtype_dict == NULL ? 0:PyArray_DescrConverter(dtype_dict, &dtype);
+    Py_XDECREF(dtype_dict);
+    if(status == 0) {
+        free_cell_timings(options);
+        return NULL;
+    }
+
+    npy_intp dims[] = {(npy_intp) options->totncells_timings};
+    /* PyArray_NewFromDescr steals the reference to dtype */
+    PyObject *timings = PyArray_NewFromDescr(&PyArray_Type, dtype, 1, dims, NULL, NULL, 0, NULL);
+    if(timings != NULL && options->totncells_timings > 0) {
+        memcpy(PyArray_DATA((PyArrayObject *) timings), options->cell_timings,
+               options->totncells_timings * sizeof(struct api_cell_timings));
+    }
+    free_cell_timings(options);
+    return timings;
+}
+
+/* Returns the hardware performance counters as a dictionary, keyed by the name of the phase, of
+   numpy structured arrays with one element per thread (and frees the counters) */
+static PyObject *perf_counts_as_dict(struct config_options *options)
+{
+    PyObject *names = PyList_New(0), *formats = PyList_New(0), *offsets = PyList_New(0);
+    if(names == NULL || formats == NULL || offsets == NULL) {
+        Py_XDECREF(names);Py_XDECREF(formats);Py_XDECREF(offsets);
+        free_perf_counts(options);
+        return NULL;
+    }
+    for(int i=-1;i<NUM_API_PERF_EVENTS;i++) {
+        PyObject *field_name = PyUnicode_FromString(i < 0 ? "tid":get_api_perf_event_name((api_perf_event) i));
+        PyObject *field_format = PyUnicode_FromString(i < 0 ? "i4":"i8");
+        PyObject *field_offset = PyLong_FromSsize_t(i < 0 ? (Py_ssize_t) offsetof(struct api_perf_counts, tid):
+                                                    (Py_ssize_t) (offsetof(struct api_perf_counts, counts) + i*sizeof(int64_t)));
+        PyList_Append(names, field_name);
+        PyList_Append(formats, field_format);
+        PyList_Append(offsets, field_offset);
+        Py_XDECREF(field_name);Py_XDECREF(field_format);Py_XDECREF(field_offset);
+    }
+    PyObject *dtype_dict = Py_BuildValue("{s:N,s:N,s:N,s:n}", "names", names, "formats", formats, "offsets", offsets,
+                                         "itemsize", (Py_ssize_t) sizeof(struct api_perf_counts));
+    PyArray_Descr *dtype = NULL;
+    const int status = dtype_dict == NULL ? 0:PyArray_DescrConverter(dtype_dict, &dtype);
+    Py_XDECREF(dtype_dict);
+    if(status == 0) {
+        free_perf_counts(options);
+        return NULL;
+    }
+
+    PyObject *perf_counts = PyDict_New();
+    for(int phase=0;phase<NUM_API_PHASES && perf_counts != NULL;phase++) {
+        npy_intp nthreads = 0;
+        for(int64_t i=0;i<options->nperf_counts;i++) {
+            nthreads += options->perf_counts[i].phase == phase ? 1:0;
+        }
+        if(nthreads == 0) {
+            continue;
+        }
+        /* PyArray_NewFromDescr steals a reference to dtype */
+        Py_INCREF(dtype);
+        PyObject *counts = PyArray_NewFromDescr(&PyArray_Type, dtype, 1, &nthreads, NULL, NULL, 0, NULL);
+        if(counts == NULL) {
+            Py_CLEAR(perf_counts);
+            break;
+        }
+        struct api_perf_counts *dst = (struct api_perf_counts *) PyArray_DATA((PyArrayObject *) counts);
+        for(int64_t i=0;i<options->nperf_counts;i++) {
+            if(options->perf_counts[i].phase == phase) {
+                *dst++ = options->perf_counts[i];
+            }
+        }
+        PyDict_SetItemString(perf_counts, get_api_phase_name((api_phase) phase), counts);
+        Py_DECREF(counts);
+    }
+    Py_DECREF(dtype);
+    free_perf_counts(options);
+    return perf_counts;
+}
+
+/* Appends the hardware performance counters (if requested) to the tuple of results */
+static PyObject *append_perf_counts(PyObject *results, struct config_options *options)
+{
+    if(results == NULL || options->c_perf_counters == 0) {
+        free_perf_counts(options);
+        return results;
+    }
+    PyObject *perf_counts = perf_counts_as_dict(options);
+    PyObject *perf_tuple = perf_counts == NULL ? NULL:Py_BuildValue("(N)", perf_counts);
+    PyObject *ret = perf_tuple == NULL ? NULL:PySequence_Concat(results, perf_tuple);
+    Py_DECREF(results);
+    Py_XDECREF(perf_tuple);
+    return ret;
+}
+
+/* Appends (to the tuple of results) a dictionary with the peak allocated memory (in bytes) of every phase */
+static PyObject *append_phase_memory(PyObject *results, const struct config_options *options)
+{
+    if(results == NULL || options->c_api_phase_memory == 0) {
+        return results;
+    }
+    PyObject *phases = PyDict_New();
+    for(int i=0;i<NUM_API_PHASES && phases != NULL;i++) {
+        PyObject *peak = PyLong_FromLongLong((long long) options->c_api_phase_peak_memory[i]);
+        PyDict_SetItemString(phases, get_api_phase_name((api_phase) i), peak);
+        Py_XDECREF(peak);
+    }
+    PyObject *memory_tuple = phases == NULL ? NULL:Py_BuildValue("(N)", phases);
+    PyObject *ret = memory_tuple == NULL ? NULL:PySequence_Concat(results, memory_tuple);
+    Py_DECREF(results);
+    Py_XDECREF(memory_tuple);
+    return ret;
+}
+
 static PyObject *countpairs_mocks_error_out(PyObject *module, const char *msg)
 {
 #if PY_MAJOR_VERSION < 3
@@ -856,6 +1090,27 @@ static int print_kwlist_into_msg(char *msg, const size_t totsize, size_t len, ch
 
 // weights1_obj may be NULL, in which case it is ignored.
 // If it is not NULL, it will be checked alongside the positions
+// Sets np to the number of particles (and num_weights to the number of weights per particle) in the
+// gridded catalog `grid_file', or np to -1 if grid_file is NULL or does not exist
+static int get_gridded_catalog_size(PyObject *module, const char *grid_file, int64_t *np, int *num_weights)
+{
+    struct gridded_catalog_header header;
+    int found = 0;
+    *np = -1;
+    *num_weights = 0;
+    if(read_gridded_catalog_header(grid_file, &header, &found) != EXIT_SUCCESS) {
+        char msg[1024];
+        snprintf(msg, 1024, "ValueError: In %s: Could not read the gridded catalog `%s'\n", __FUNCTION__, grid_file);
+        countpairs_mocks_error_out(module, msg);
+        return EXIT_FAILURE;
+    }
+    if(found) {
+        *np = header.np;
+        *num_weights = (int) header.num_weights;
+    }
+    return EXIT_SUCCESS;
+}
+
 static int64_t check_dims_and_datatype(PyObject *module, PyArrayObject *x1_obj, PyArrayObject *y1_obj, PyArrayObject *z1_obj, PyArrayObject *weights1_obj, size_t *element_size)
 {
     char msg[1024];
@@ -1066,6 +1321,8 @@ static PyObject *countpairs_countpairs_rp_pi_mocks(PyObject *self, PyObject *arg
     options.periodic = 0;
     options.fast_divide_and_NR_steps=0;
     options.c_api_timer = 0;
+    int8_t c_api_phase_timer = 0;
+    int c_cell_timer = 0;
     int8_t xbin_ref=options.bin_refine_factors[0],
         ybin_ref=options.bin_refine_factors[1],
         zbin_ref=options.bin_refine_factors[2];
@@ -1101,10 +1358,16 @@ static PyObject *countpairs_countpairs_rp_pi_mocks(PyObject *self, PyObject *arg
         "c_api_timer",
         "isa",/* instruction set to use of type enum isa; valid values are AVX, SSE, FALLBACK (enum) */
         "weight_type",
+        "query_mode",
+        "c_api_phase_timer",
+        "c_cell_timer",
+        "c_perf_counters",
+        "c_api_phase_memory",
+        "grid_file",
         NULL
     };
 
-    if ( ! PyArg_ParseTupleAndKeywords(args, kwargs, "iiidsO!O!O!|O!O!O!O!O!bbbbbbbhbis", kwlist,
+    if ( ! PyArg_ParseTupleAndKeywords(args, kwargs, "iiidsO!O!O!|O!O!O!O!O!bbbbbbbhbisbbibbz", kwlist,
                                        &autocorr,&cosmology,&nthreads,&pimax,&binfile,
                                        &PyArray_Type,&x1_obj,
                                        &PyArray_Type,&y1_obj,
@@ -1122,7 +1385,13 @@ static PyObject *countpairs_countpairs_rp_pi_mocks(PyObject *self, PyObject *arg
                                        &(options.max_cells_per_dim),
                                        &(options.c_api_timer),
                                        &(options.instruction_set),
-                                       &weighting_method_str)
+                                       &weighting_method_str,
+                                       &(options.query_mode),
+                                       &c_api_phase_timer,
+                                       &c_cell_timer,
+                                       &(options.c_perf_counters),
+                                       &(options.c_api_phase_memory),
+                                       &(options.grid_file))
 
          ) {
 
@@ -1162,12 +1431,28 @@ static PyObject *countpairs_countpairs_rp_pi_mocks(PyObject *self, PyObject *arg
     /* We have numpy arrays and all the required inputs*/
     /* How many data points are there? And are they all of floating point type */
     size_t element_size;
-    const int64_t ND1 = check_dims_and_datatype(module, x1_obj, y1_obj, z1_obj, weights1_obj, &element_size);
+    int64_t ND1 = check_dims_and_datatype(module, x1_obj, y1_obj, z1_obj, weights1_obj, &element_size);
     if(ND1 == -1) {
         //Error has already been set -> simply return
         Py_RETURN_NONE;
     }
 
+    /* With empty RA1/DEC1/CZ1, the first set of points is read from the gridded catalog in grid_file */
+    int64_t grid_np = -1;
+    int grid_num_weights = 0;
+    if(get_gridded_catalog_size(module, options.grid_file, &grid_np, &grid_num_weights) != EXIT_SUCCESS) {
+        Py_RETURN_NONE;
+    }
+    const int from_grid_file = grid_np >= 0 && ND1 == 0;
+    if(grid_np >= 0 && (! from_grid_file || weights1_obj != NULL)) {
+        char msg[1024];
+        snprintf(msg, 1024, "ValueError: In %s: The first set of points is read from the existing gridded catalog `%s'. "
+                 "Please pass empty RA1/DEC1/CZ1 and no weights1 (or remove the file to grid new points)\n",
+                 __FUNCTION__, options.grid_file);
+        countpairs_mocks_error_out(module, msg);
+        Py_RETURN_NONE;
+    }
+
     /* Ensure the weights are of the right shape (n_weights, n_particles) */
     if(weights1_obj != NULL){
         // A numpy dimension of length -1 will be expanded to n_weights
@@ -1185,7 +1470,7 @@ static PyObject *countpairs_countpairs_rp_pi_mocks(PyObject *self, PyObject *arg
         countpairs_mocks_error_out(module, msg);
         Py_RETURN_NONE;
     }
-    int found_weights = weights1_obj == NULL ? 0 : PyArray_SHAPE(weights1_obj)[0];
+    int found_weights = weights1_obj == NULL ? (from_grid_file ? grid_num_weights:0) : PyArray_SHAPE(weights1_obj)[0];
     struct extra_options extra = get_extra_options(weighting_method);
     if(extra.weights0.num_weights > 0 && extra.weights0.num_weights != found_weights){
         char msg[1024];
@@ -1212,7 +1497,7 @@ static PyObject *countpairs_countpairs_rp_pi_mocks(PyObject *self, PyObject *arg
             countpairs_mocks_error_out(module, msg);
             Py_RETURN_NONE;
         }
-        if((weights1_obj == NULL) != (weights2_obj == NULL)){
+        if(! from_grid_file && (weights1_obj == NULL) != (weights2_obj == NULL)){
             snprintf(msg, 1024, "ValueError: In %s: If autocorr is 0, must pass either zero or two sets of weights.\n",
                      __FUNCTION__);
             countpairs_mocks_error_out(module, msg);
@@ -1306,11 +1591,21 @@ static PyObject *countpairs_countpairs_rp_pi_mocks(PyObject *self, PyObject *arg
             extra.weights1.weights[w] = (char *) weights2 + w*ND2*element_size;
         }
     }
+    if(from_grid_file) {
+        ND1 = grid_np;
+        phiD1 = thetaD1 = czD1 = NULL;
+    }
 
     NPY_BEGIN_THREADS_DEF;
     NPY_BEGIN_THREADS;
 
     results_countpairs_mocks results;
+    if(c_api_phase_timer) {
+        options.c_api_timer = 1;
+    }
+    /* c_cell_timer=k times every k-th cell pair */
+    options.c_cell_timer = c_cell_timer > 0 ? 1:0;
+    options.c_cell_timer_sampling = c_cell_timer;
     double c_api_time = 0.0;
     int status = countpairs_mocks(ND1,phiD1,thetaD1,czD1,
                                   ND2,phiD2,thetaD2,czD2,
@@ -1366,7 +1661,17 @@ static PyObject *countpairs_countpairs_rp_pi_mocks(PyObject *self, PyObject *arg
         rlow=results.rupp[i];
     }
     free_results_mocks(&results);
-    return Py_BuildValue("(Od)", ret, c_api_time);
+    if(options.c_cell_timer) {
+        PyObject *c_cell_time = cell_timings_as_array(&options);
+        if(c_api_phase_timer) {
+            return append_phase_memory(append_perf_counts(Py_BuildValue("(OdNN)", ret, c_api_time, c_cell_time, api_phase_times_as_dict(&options)), &options), &options);
+        }
+        return append_phase_memory(append_perf_counts(Py_BuildValue("(OdN)", ret, c_api_time, c_cell_time), &options), &options);
+    }
+    if(c_api_phase_timer) {
+        return append_phase_memory(append_perf_counts(Py_BuildValue("(OdN)", ret, c_api_time, api_phase_times_as_dict(&options)), &options), &options);
+    }
+    return append_phase_memory(append_perf_counts(Py_BuildValue("(Od)", ret, c_api_time), &options), &options);
 }
 
 static PyObject *countpairs_countpairs_s_mu_mocks(PyObject *self, PyObject *args, PyObject *kwargs)
@@ -1392,6 +1697,8 @@ static PyObject *countpairs_countpairs_s_mu_mocks(PyObject *self, PyObject *args
     options.periodic = 0;
     options.fast_divide_and_NR_steps=0;
     options.c_api_timer = 0;
+    int8_t c_api_phase_timer = 0;
+    int c_cell_timer = 0;
     int8_t xbin_ref=options.bin_refine_factors[0],
         ybin_ref=options.bin_refine_factors[1],
         zbin_ref=options.bin_refine_factors[2];
@@ -1429,10 +1736,16 @@ static PyObject *countpairs_countpairs_s_mu_mocks(PyObject *self, PyObject *args
         "c_api_timer",
         "isa",/* instruction set to use of type enum isa; valid values are AVX, SSE, FALLBACK (enum) */
         "weight_type",
+        "query_mode",
+        "c_api_phase_timer",
+        "c_cell_timer",
+        "c_perf_counters",
+        "c_api_phase_memory",
+        "grid_file",
         NULL
     };
 
-    if ( ! PyArg_ParseTupleAndKeywords(args, kwargs, "iiidisO!O!O!|O!O!O!O!O!bbbbbbbhbis", kwlist,
+    if ( ! PyArg_ParseTupleAndKeywords(args, kwargs, "iiidisO!O!O!|O!O!O!O!O!bbbbbbbhbisbbibbz", kwlist,
                                        &autocorr,&cosmology,&nthreads,&mu_max,&nmu_bins,&binfile,
                                        &PyArray_Type,&x1_obj,
                                        &PyArray_Type,&y1_obj,
@@ -1450,7 +1763,13 @@ static PyObject *countpairs_countpairs_s_mu_mocks(PyObject *self, PyObject *args
                                        &(options.max_cells_per_dim),
                                        &(options.c_api_timer),
                                        &(options.instruction_set),
-                                       &weighting_method_str)
+                                       &weighting_method_str,
+                                       &(options.query_mode),
+                                       &c_api_phase_timer,
+                                       &c_cell_timer,
+                                       &(options.c_perf_counters),
+                                       &(options.c_api_phase_memory),
+                                       &(options.grid_file))
 
          ) {
 
@@ -1487,12 +1806,28 @@ static PyObject *countpairs_countpairs_s_mu_mocks(PyObject *self, PyObject *args
     /* We have numpy arrays and all the required inputs*/
     /* How many data points are there? And are they all of floating point type */
     size_t element_size;
-    const int64_t ND1 = check_dims_and_datatype(module, x1_obj, y1_obj, z1_obj, weights1_obj, &element_size);
+    int64_t ND1 = check_dims_and_datatype(module, x1_obj, y1_obj, z1_obj, weights1_obj, &element_size);
     if(ND1 == -1) {
         //Error has already been set -> simply return
         Py_RETURN_NONE;
     }
 
+    /* With empty RA1/DEC1/CZ1, the first set of points is read from the gridded catalog in grid_file */
+    int64_t grid_np = -1;
+    int grid_num_weights = 0;
+    if(get_gridded_catalog_size(module, options.grid_file, &grid_np, &grid_num_weights) != EXIT_SUCCESS) {
+        Py_RETURN_NONE;
+    }
+    const int from_grid_file = grid_np >= 0 && ND1 == 0;
+    if(grid_np >= 0 && (! from_grid_file || weights1_obj != NULL)) {
+        char msg[1024];
+        snprintf(msg, 1024, "ValueError: In %s: The first set of points is read from the existing gridded catalog `%s'. "
+                 "Please pass empty RA1/DEC1/CZ1 and no weights1 (or remove the file to grid new points)\n",
+                 __FUNCTION__, options.grid_file);
+        countpairs_mocks_error_out(module, msg);
+        Py_RETURN_NONE;
+    }
+
     /* Ensure the weights are of the right shape (n_weights, n_particles) */
     if(weights1_obj != NULL){
         // A numpy dimension of length -1 will be expanded to n_weights
@@ -1510,7 +1845,7 @@ static PyObject *countpairs_countpairs_s_mu_mocks(PyObject *self, PyObject *args
         countpairs_mocks_error_out(module, msg);
         Py_RETURN_NONE;
     }
-    int found_weights = weights1_obj == NULL ? 0 : PyArray_SHAPE(weights1_obj)[0];
+    int found_weights = weights1_obj == NULL ? (from_grid_file ? grid_num_weights:0) : PyArray_SHAPE(weights1_obj)[0];
     struct extra_options extra = get_extra_options(weighting_method);
     if(extra.weights0.num_weights > 0 && extra.weights0.num_weights != found_weights){
         char msg[1024];
@@ -1537,7 +1872,7 @@ static PyObject *countpairs_countpairs_s_mu_mocks(PyObject *self, PyObject *args
             countpairs_mocks_error_out(module, msg);
             Py_RETURN_NONE;
         }
-        if((weights1_obj == NULL) != (weights2_obj == NULL)){
+        if(! from_grid_file && (weights1_obj == NULL) != (weights2_obj == NULL)){
             snprintf(msg, 1024, "ValueError: In %s: If autocorr is 0, must pass either zero or two sets of weights.\n",
                      __FUNCTION__);
             countpairs_mocks_error_out(module, msg);
@@ -1631,11 +1966,21 @@ static PyObject *countpairs_countpairs_s_mu_mocks(PyObject *self, PyObject *args
             extra.weights1.weights[w] = (char *) weights2 + w*ND2*element_size;
         }
     }
+    if(from_grid_file) {
+        ND1 = grid_np;
+        phiD1 = thetaD1 = czD1 = NULL;
+    }
 
     NPY_BEGIN_THREADS_DEF;
     NPY_BEGIN_THREADS;
 
     results_countpairs_mocks_s_mu results;
+    if(c_api_phase_timer) {
+        options.c_api_timer = 1;
+    }
+    /* c_cell_timer=k times every k-th cell pair */
+    options.c_cell_timer = c_cell_timer > 0 ? 1:0;
+    options.c_cell_timer_sampling = c_cell_timer;
     double c_api_time = 0.0;
     int status = countpairs_mocks_s_mu(ND1,phiD1,thetaD1,czD1,
                                        ND2,phiD2,thetaD2,czD2,
@@ -1692,7 +2037,17 @@ static PyObject *countpairs_countpairs_s_mu_mocks(PyObject *self, PyObject *args
         rlow=results.supp[i];
     }
     free_results_mocks_s_mu(&results);
-    return Py_BuildValue("(Od)", ret, c_api_time);
+    if(options.c_cell_timer) {
+        PyObject *c_cell_time = cell_timings_as_array(&options);
+        if(c_api_phase_timer) {
+            return append_phase_memory(append_perf_counts(Py_BuildValue("(OdNN)", ret, c_api_time, c_cell_time, api_phase_times_as_dict(&options)), &options), &options);
+        }
+        return append_phase_memory(append_perf_counts(Py_BuildValue("(OdN)", ret, c_api_time, c_cell_time), &options), &options);
+    }
+    if(c_api_phase_timer) {
+        return append_phase_memory(append_perf_counts(Py_BuildValue("(OdN)", ret, c_api_time, api_phase_times_as_dict(&options)), &options), &options);
+    }
+    return append_phase_memory(append_perf_counts(Py_BuildValue("(Od)", ret, c_api_time), &options), &options);
 }
 
 static PyObject *countpairs_countpairs_theta_mocks(PyObject *self, PyObject *args, PyObject *kwargs)
@@ -1718,6 +2073,8 @@ static PyObject *countpairs_countpairs_theta_mocks(PyObject *self, PyObject *arg
     options.link_in_ra=1;
     options.fast_acos=0;
     options.c_api_timer=0;
+    int8_t c_api_phase_timer = 0;
+    int c_cell_timer = 0;
     int8_t ra_bin_ref=options.bin_refine_factors[0],
         dec_bin_ref=options.bin_refine_factors[1];
     static char *kwlist[] = {
@@ -1741,11 +2098,16 @@ static PyObject *countpairs_countpairs_theta_mocks(PyObject *self, PyObject *arg
         "c_api_timer",
         "isa",/* instruction set to use of type enum isa; valid values are AVX, SSE, FALLBACK */
         "weight_type",
+        "c_api_phase_timer",
+        "c_cell_timer",
+        "c_perf_counters",
+        "c_api_phase_memory",
+        "query_mode",
         NULL
     };
 
 
-    if ( ! PyArg_ParseTupleAndKeywords(args, kwargs, "iisO!O!|O!O!O!O!bbbbbbbhbis", kwlist,
+    if ( ! PyArg_ParseTupleAndKeywords(args, kwargs, "iisO!O!|O!O!O!O!bbbbbbbhbisbibbb", kwlist,
                                        &autocorr,&nthreads,&binfile,
                                        &PyArray_Type,&x1_obj,
                                        &PyArray_Type,&y1_obj,
@@ -1762,7 +2124,12 @@ static PyObject *countpairs_countpairs_theta_mocks(PyObject *self, PyObject *arg
                                        &(options.max_cells_per_dim),
                                        &(options.c_api_timer),
                                        &(options.instruction_set),
-                                       &weighting_method_str)
+                                       &weighting_method_str,
+                                       &c_api_phase_timer,
+                                       &c_cell_timer,
+                                       &(options.c_perf_counters),
+                                       &(options.c_api_phase_memory),
+                                       &(options.query_mode))
 
          ) {
         PyObject_Print(kwargs, stdout, 0);
@@ -1940,6 +2307,12 @@ static PyObject *countpairs_countpairs_theta_mocks(PyObject *self, PyObject *arg
 
     results_countpairs_theta results;
     options.float_type = element_size;
+    if(c_api_phase_timer) {
+        options.c_api_timer = 1;
+    }
+    /* c_cell_timer=k times every k-th cell pair */
+    options.c_cell_timer = c_cell_timer > 0 ? 1:0;
+    options.c_cell_timer_sampling = c_cell_timer;
     double c_api_time=0.0;
     int status = countpairs_theta_mocks(ND1,phiD1,thetaD1,
                                         ND2,phiD2,thetaD2,
@@ -1985,7 +2358,17 @@ static PyObject *countpairs_countpairs_theta_mocks(PyObject *self, PyObject *arg
         rlow=results.theta_upp[i];
     }
     free_results_countpairs_theta(&results);
-    return Py_BuildValue("(Od)", ret, c_api_time);
+    if(options.c_cell_timer) {
+        PyObject *c_cell_time = cell_timings_as_array(&options);
+        if(c_api_phase_timer) {
+            return append_phase_memory(append_perf_counts(Py_BuildValue("(OdNN)", ret, c_api_time, c_cell_time, api_phase_times_as_dict(&options)), &options), &options);
+        }
+        return append_phase_memory(append_perf_counts(Py_BuildValue("(OdN)", ret, c_api_time, c_cell_time), &options), &options);
+    }
+    if(c_api_phase_timer) {
+        return append_phase_memory(append_perf_counts(Py_BuildValue("(OdN)", ret, c_api_time, api_phase_times_as_dict(&options)), &options), &options);
+    }
+    return append_phase_memory(append_perf_counts(Py_BuildValue("(Od)", ret, c_api_time), &options), &options);
 }
 
 
@@ -2014,6 +2397,7 @@ static PyObject *countpairs_countspheres_vpf_mocks(PyObject *self, PyObject *arg
     options.verbose=0;
     options.instruction_set=-1;
     options.c_api_timer=0;
+    int8_t c_api_phase_timer = 0;
 
     /* Reset the bin refine factors default (since the VPF is symmetric in XYZ, conceptually the binning should be identical in all three directions)*/
     int bin_ref[] = {1,1,1};
@@ -2045,11 +2429,12 @@ static PyObject *countpairs_countspheres_vpf_mocks(PyObject *self, PyObject *arg
         "max_cells_per_dim",
         "c_api_timer",
         "isa",/* instruction set to use of type enum isa; valid values are AVX, SSE, FALLBACK */
+        "c_api_phase_timer",
         NULL
     };
 
 
-    if ( ! PyArg_ParseTupleAndKeywords(args, kwargs, "diiiisiO!O!O!O!O!O!|bbbbbhbi", kwlist,
+    if ( ! PyArg_ParseTupleAndKeywords(args, kwargs, "diiiisiO!O!O!O!O!O!|bbbbbhbib", kwlist,
                                        &rmax,&nbin,&num_spheres,&num_pN,&threshold_neighbors,&centers_file,&cosmology,
                                        &PyArray_Type,&x1_obj,
                                        &PyArray_Type,&y1_obj,
@@ -2062,7 +2447,8 @@ static PyObject *countpairs_countspheres_vpf_mocks(PyObject *self, PyObject *arg
                                        &xbin_ref, &ybin_ref, &zbin_ref,
                                        &(options.max_cells_per_dim),
                                        &(options.c_api_timer),
-                                       &(options.instruction_set))
+                                       &(options.instruction_set),
+                                       &c_api_phase_timer)
 
          ) {
 
@@ -2166,6 +2552,9 @@ static PyObject *countpairs_countspheres_vpf_mocks(PyObject *self, PyObject *arg
 
     results_countspheres_mocks results;
     options.float_type = element_size;
+    if(c_api_phase_timer) {
+        options.c_api_timer = 1;
+    }
     double c_api_time = 0.0;
     int status = countspheres_mocks(ND1, phiD1,thetaD1, czD1,
                                     ND2, phiD2,thetaD2, czD2,
@@ -2221,5 +2610,8 @@ static PyObject *countpairs_countspheres_vpf_mocks(PyObject *self, PyObject *arg
     }
     free_results_countspheres_mocks(&results);
 
+    if(c_api_phase_timer) {
+        return Py_BuildValue("(OdN)", ret, c_api_time, api_phase_times_as_dict(&options));
+    }
     return Py_BuildValue("(Od)", ret, c_api_time);
 }
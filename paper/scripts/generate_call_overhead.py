@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import numpy as np
+
+import sys
+import time
+
+
+def _run(name, nthreads, boxsize, pimax, bins, x, y, z):
+    from Corrfunc.theory import DD, wp
+
+    if name == 'DD':
+        _, api_time = DD(1, nthreads, bins, x, y, z, periodic=True,
+                         boxsize=boxsize, c_api_timer=True)
+    else:
+        _, api_time = wp(boxsize, pimax, nthreads, bins, x, y, z,
+                         c_api_timer=True)
+
+    return api_time
+
+
+def benchmark_call_overhead(npts=(1000, 10000, 100000), ncalls=200,
+                            keys=None, nthreads=0, seed=42):
+    """
+    Times repeated calls to the theory ``DD`` and ``wp`` routines on small
+    catalogs, and returns the median wall-clock time per call, the median
+    time spent within the C library and the difference between the two
+    (i.e., the per-call overhead of the python wrappers and extensions).
+
+    The bins are passed as an array, and ``nthreads=0`` lets the library
+    pick the number of threads from the number of particles.
+    """
+
+    allkeys = ['DD', 'wp']
+    if keys is None:
+        keys = allkeys
+    else:
+        for k in keys:
+            if k not in allkeys:
+                msg = "Valid routines to benchmark are: {0}\nFound routine"\
+                    " = {1}".format(allkeys, k)
+                raise ValueError(msg)
+
+    boxsize = 1000.0
+    rmax = 40.0
+    pimax = rmax
+    bins = np.logspace(np.log10(0.1), np.log10(rmax), 15)
+
+    dtype = np.dtype([('name', 'S16'),
+                      ('npts', np.int64),
+                      ('nthreads', np.int64),
+                      ('call_time', np.float64),
+                      ('api_time', np.float64),
+                      ('overhead', np.float64)])
+    runtimes = np.empty(len(keys) * len(npts), dtype=dtype)
+    runtimes['nthreads'][:] = nthreads
+
+    np.random.seed(seed)
+    index = 0
+    print("{0:8s} {1:>10s} {2:>14s} {3:>14s} {4:>14s}".format(
+        'routine', 'npts', 'call [ms]', 'C API [ms]', 'overhead [us]'))
+    for n in npts:
+        x, y, z = np.random.uniform(0.0, boxsize, (3, n))
+        for name in keys:
+            # The first call includes the one-time setup costs (imports etc)
+            _run(name, nthreads, boxsize, pimax, bins, x, y, z)
+
+            call_times = np.empty(ncalls)
+            api_times = np.empty(ncalls)
+            for i in range(ncalls):
+                t0 = time.time()
+                api_times[i] = _run(name, nthreads, boxsize, pimax, bins,
+                                    x, y, z)
+                call_times[i] = time.time() - t0
+
+            runtimes['name'][index] = name
+            runtimes['npts'][index] = n
+            runtimes['call_time'][index] = np.median(call_times)
+            runtimes['api_time'][index] = np.median(api_times)
+            runtimes['overhead'][index] = np.median(call_times - api_times)
+            print("{0:8s} {1:10d} {2:14.4f} {3:14.4f} {4:14.1f}".format(
+                name, n, 1e3 * runtimes['call_time'][index],
+                1e3 * runtimes['api_time'][index],
+                1e6 * runtimes['overhead'][index]))
+            sys.stdout.flush()
+            index += 1
+
+    return keys, runtimes
+
+
+def main():
+    keys, runtimes = benchmark_call_overhead()
+    np.savez('theory_call_overhead.npz', keys=keys, runtimes=runtimes)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import numpy as np
+
+import sys
+import multiprocessing
+max_threads = multiprocessing.cpu_count()
+
+
+def _run(name, weights, isa, nthreads, boxsize, pimax, bins, x, y, z):
+    from Corrfunc.theory import DD, DDrppi, DDsmu, wp, xi
+
+    weight_type = 'pair_product' if weights is not None else None
+    if name == 'DD':
+        _, api_time = DD(1, nthreads, bins, x, y, z, weights1=weights,
+                         weight_type=weight_type, periodic=True,
+                         boxsize=boxsize, isa=isa, c_api_timer=True)
+    elif name == 'DDrppi':
+        _, api_time = DDrppi(1, nthreads, pimax, bins, x, y, z,
+                             weights1=weights, weight_type=weight_type,
+                             periodic=True, boxsize=boxsize, isa=isa,
+                             c_api_timer=True)
+    elif name == 'DDsmu':
+        _, api_time = DDsmu(1, nthreads, bins, 1.0, 20, x, y, z,
+                            weights1=weights, weight_type=weight_type,
+                            periodic=True, boxsize=boxsize, isa=isa,
+                            c_api_timer=True)
+    elif name == 'wp':
+        _, api_time = wp(boxsize, pimax, nthreads, bins, x, y, z,
+                         weights=weights, weight_type=weight_type,
+                         isa=isa, c_api_timer=True)
+    else:
+        _, api_time = xi(boxsize, nthreads, bins, x, y, z,
+                         weights=weights, weight_type=weight_type,
+                         isa=isa, c_api_timer=True)
+
+    return api_time
+
+
+def benchmark_weights_overhead(npts=500000, nrepeats=3, keys=None, isa=None,
+                               nthreads=max_threads, seed=42):
+    """
+    Times every theory routine with and without ``pair_product`` weights
+    and returns the best-of-``nrepeats`` runtimes for each combination of
+    routine and instruction set.
+    """
+
+    allkeys = ['DD', 'DDrppi', 'DDsmu', 'wp', 'xi']
+    allisa = ['avx', 'sse42', 'fallback']
+    if keys is None:
+        keys = allkeys
+    else:
+        for k in keys:
+            if k not in allkeys:
+                msg = "Valid routines to benchmark are: {0}\nFound routine"\
+                    " = {1}".format(allkeys, k)
+                raise ValueError(msg)
+
+    if isa is None:
+        isa = allisa
+    else:
+        for i in isa:
+            if i not in allisa:
+                msg = "Valid instructions sets benchmark are: {0}\n"\
+                      "Found routine = {1}".format(allisa, i)
+                raise ValueError(msg)
+
+    boxsize = 420.0
+    rmax = 20.0
+    pimax = rmax
+    bins = np.logspace(np.log10(0.1), np.log10(rmax), 15)
+
+    np.random.seed(seed)
+    x, y, z = np.random.uniform(0.0, boxsize, (3, npts))
+    weights = np.random.uniform(0.5, 1.0, npts)
+
+    dtype = np.dtype([('name', 'S16'),
+                      ('isa', 'S16'),
+                      ('npts', np.int64),
+                      ('nthreads', np.int64),
+                      ('unweighted_time', np.float64),
+                      ('weighted_time', np.float64),
+                      ('ratio', np.float64)])
+    runtimes = np.empty(len(keys) * len(isa), dtype=dtype)
+    runtimes['npts'][:] = npts
+    runtimes['nthreads'][:] = nthreads
+
+    index = 0
+    print("{0:8s} {1:10s} {2:>12s} {3:>12s} {4:>8s}".format(
+        'routine', 'isa', 'unweighted', 'weighted', 'ratio'))
+    for run_isa in isa:
+        for name in keys:
+            times = []
+            for w in [None, weights]:
+                times.append(min(_run(name, w, run_isa, nthreads, boxsize,
+                                      pimax, bins, x, y, z)
+                                 for _ in range(nrepeats)))
+
+            runtimes['name'][index] = name
+            runtimes['isa'][index] = run_isa
+            runtimes['unweighted_time'][index] = times[0]
+            runtimes['weighted_time'][index] = times[1]
+            runtimes['ratio'][index] = times[1] / times[0]
+            print("{0:8s} {1:10s} {2:12.4f} {3:12.4f} {4:8.3f}".format(
+                name, run_isa, times[0], times[1], times[1] / times[0]))
+            sys.stdout.flush()
+            index += 1
+
+    return keys, isa, runtimes
+
+
+def main():
+    keys, isa, runtimes = benchmark_weights_overhead()
+    np.savez('theory_weights_overhead.npz', keys=keys, isa=isa,
+             runtimes=runtimes)
+
+
+if __name__ == '__main__':
+    main()
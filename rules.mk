@@ -11,6 +11,8 @@ cellarray_double.h:weight_functions_double.h
 cellarray_float.h:weight_functions_float.h
 weight_functions_double.h:weight_defs_double.h
 weight_functions_float.h:weight_defs_float.h
+kernel_context_double.h:weight_defs_double.h
+kernel_context_float.h:weight_defs_float.h
 gridlink_mocks_impl_double.h:cellarray_mocks_double.h
 gridlink_mocks_impl_float.h:cellarray_mocks_float.h
 
@@ -52,7 +52,9 @@ int countpairs(const int64_t ND1, void * restrict X1, void * restrict Y1, void
         return EXIT_FAILURE;
     }
   
-    if(options->float_type == sizeof(float)) {
+    /* The float kernels are also used in mixed-precision mode. The arrays then still hold
+       doubles -> they are only read (according to options->float_type) while gridding */
+    if(options->float_type == sizeof(float) || options->mixed_precision) {
         return countpairs_float(ND1, (float * restrict) X1, (float * restrict) Y1, (float * restrict) Z1,
                                 ND2, (float * restrict) X2, (float * restrict) Y2, (float * restrict) Z2,
                                 numthreads,
@@ -73,3 +75,48 @@ int countpairs(const int64_t ND1, void * restrict X1, void * restrict Y1, void
     }
     
 }
+
+
+int countpairs_batch(const int64_t ncatalogs,
+                     const int64_t *ND1, void **X1, void **Y1, void **Z1,
+                     const int64_t *ND2, void **X2, void **Y2, void **Z2,
+                     const int numthreads,
+                     const int autocorr,
+                     const char *binfile,
+                     results_countpairs *results,
+                     struct config_options *options,
+                     struct extra_options *extra)
+{
+    if( ! (options->float_type == sizeof(float) || options->float_type == sizeof(double))){
+        fprintf(stderr,"ERROR: In %s> Can only handle doubles or floats. Got an array of size = %zu\n",
+            __FUNCTION__, options->float_type);
+        return EXIT_FAILURE;
+    }
+
+    if( strncmp(options->version, STR(VERSION), sizeof(options->version)/sizeof(char)-1) != 0) {
+        fprintf(stderr,"Error: Do not know this API version = `%s'. Expected version = `%s'\n", options->version, STR(VERSION));
+        return EXIT_FAILURE;
+    }
+
+    if(options->float_type == sizeof(float) || options->mixed_precision) {
+        return countpairs_batch_float(ncatalogs,
+                                      ND1, (float **) X1, (float **) Y1, (float **) Z1,
+                                      ND2, (float **) X2, (float **) Y2, (float **) Z2,
+                                      numthreads,
+                                      autocorr,
+                                      binfile,
+                                      results,
+                                      options,
+                                      extra);
+    } else {
+        return countpairs_batch_double(ncatalogs,
+                                       ND1, (double **) X1, (double **) Y1, (double **) Z1,
+                                       ND2, (double **) X2, (double **) Y2, (double **) Z2,
+                                       numthreads,
+                                       autocorr,
+                                       binfile,
+                                       results,
+                                       options,
+                                       extra);
+    }
+}
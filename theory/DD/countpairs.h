@@ -34,6 +34,19 @@ extern "C" {
                         struct config_options *options,
                         struct extra_options *extra) __attribute__((warn_unused_result));
   
+  /* Counts `ncatalogs' independent catalogs (e.g., many small catalogs), distributing
+     whole catalogs over the threads. `results' must hold `ncatalogs' elements, and `extra'
+     is either NULL or an array of `ncatalogs' elements (with the weights of every catalog) */
+  extern int countpairs_batch(const int64_t ncatalogs,
+                              const int64_t *ND1, void **X1, void **Y1, void **Z1,
+                              const int64_t *ND2, void **X2, void **Y2, void **Z2,
+                              const int numthreads,
+                              const int autocorr,
+                              const char *binfile,
+                              results_countpairs *results,
+                              struct config_options *options,
+                              struct extra_options *extra) __attribute__((warn_unused_result));
+
   extern void free_results(results_countpairs *results);
 
 #ifdef __cplusplus
@@ -47,7 +47,9 @@ int countpairs_rp_pi(const int64_t ND1, void *X1, void *Y1, void *Z1,
         return EXIT_FAILURE;
     }
     
-    if(options->float_type == sizeof(float)) {
+    /* The float kernels are also used in mixed-precision mode. The arrays then still hold
+       doubles -> they are only read (according to options->float_type) while gridding */
+    if(options->float_type == sizeof(float) || options->mixed_precision) {
       return countpairs_rp_pi_float(ND1, (float *) X1, (float *) Y1, (float *) Z1,
                                     ND2, (float *) X2, (float *) Y2, (float *) Z2,
                                     numthreads,
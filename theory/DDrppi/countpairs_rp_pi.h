@@ -24,6 +24,7 @@ extern "C" {
         double pimax;
         int nbin;
         int npibin;
+        int nlos;//number of lines-of-sight; histograms for each los are stored contiguously
     } results_countpairs_rp_pi;
 
     extern int countpairs_rp_pi(const int64_t ND1, void *X1, void *Y1, void *Z1,
@@ -25,6 +25,7 @@ extern "C" {
         double *weightavg;
         int nsbin;
         int nmu_bins;
+        int nlos;//number of lines-of-sight; histograms for each los are stored contiguously
     } results_countpairs_s_mu;
 
     extern int countpairs_s_mu(const int64_t ND1, void *X1, void *Y1, void *Z1,
@@ -13,6 +13,7 @@
 #include <stdlib.h>
 #include <string.h>
 #include <stdint.h>
+#include <stddef.h>
 
 /* Now, include the numpy header*/
 #include <arrayobject.h>
@@ -33,6 +34,9 @@
 //for unicode characters
 #include "macros.h"
 
+//for reading the first set of points from a gridded catalog
+#include "gridded_catalog.h"
+
 struct module_state {
     PyObject *error;
 };
@@ -66,6 +70,8 @@ static char module_docstring[]             =    "Python extensions for calculati
     "countpairs_xi    : Calculate the 3-d auto-correlation function xi (assumes PERIODIC) given one set of arrays with Cartesian XYZ positions\n"
     "countpairs_s_mu  : Calculate the 2-D DD(s,"MU_CHAR") auto/cross-correlation function given two sets of arrays with Cartesian XYZ positions.\n"
     "countpairs_vpf   : Calculate the counts-in-spheres given one set of arrays with Cartesian XYZ positions\n"
+    "countpairs_batch : Calculate the 3-D pair counts for many (small) catalogs, with whole catalogs distributed over the threads\n"
+    "countpairs_wp_batch : Calculate wp for many (small) catalogs, with whole catalogs distributed over the threads\n"
     "\n"
     "See `Corrfunc/call_correlation_functions.py` for example calls to each function in the extension.\n";
 
@@ -78,6 +84,8 @@ static PyObject *countpairs_countpairs_wp(PyObject *self, PyObject *args, PyObje
 static PyObject *countpairs_countpairs_xi(PyObject *self, PyObject *args, PyObject *kwargs);
 static PyObject *countpairs_countpairs_s_mu(PyObject *self, PyObject *args, PyObject *kwargs);
 static PyObject *countpairs_countspheres_vpf(PyObject *self, PyObject *args, PyObject *kwargs);
+static PyObject *countpairs_countpairs_batch(PyObject *self, PyObject *args, PyObject *kwargs);
+static PyObject *countpairs_countpairs_wp_batch(PyObject *self, PyObject *args, PyObject *kwargs);
 static PyObject *countpairs_error_out(PyObject *module, const char *msg);
 
 /* Inline documentation for the methods so that help(function) has something reasonably useful*/
@@ -88,7 +96,9 @@ static PyMethodDef module_methods[] = {
      "           X2=None, Y2=None, Z2=None, weights2=None, verbose=False, boxsize=0.0,\n"
      "           output_ravg=False, xbin_refine_factor=2, ybin_refine_factor=2,\n"
      "           zbin_refine_factor=1, max_cells_per_dim=100, c_api_timer=False,\n"
-     "           isa=-1)\n"
+     "           isa=-1, mixed_precision=False, max_position_error=0.0,\n"
+     "           permute_in_place=False, original_index1=None, original_index2=None,\n"
+     "           query_mode=False)\n"
      "\n"
      "Calculate the 3-D pair-counts, "XI_CHAR"(r), auto/cross-correlation \n"
      "function given two sets of points represented by X1/Y1/Z1 and X2/Y2/Z2 \n"
@@ -110,13 +120,15 @@ static PyMethodDef module_methods[] = {
      "\n"
      "nthreads : integer\n"
      "   The number of OpenMP threads to use. Has no effect if OpenMP was not\n"
-     "   enabled during library compilation.\n\n"
+     "   enabled during library compilation. If ``nthreads <= 0``, the number of\n"
+     "   threads is picked from the number of particles.\n\n"
 
-     "binfile : string\n"
+     "binfile : string or array-like\n"
      "   Filename specifying the ``r`` bins for ``DD``. The file should\n"
      "   contain white-space separated values  of (rmin, rmax)  for each\n"
      "   ``r`` wanted. The bins do not need to be contiguous but must be in\n"
-     "   increasing order (smallest bins come first). \n\n"
+     "   increasing order (smallest bins come first). Alternatively, an array\n"
+     "   of (increasing) bin-edges, which is passed directly to the C library.\n\n"
 
      "X1/Y1/Z1 : array-like, real (float/double)\n"
      "   The array of X/Y/Z positions for the first set of points.\n"
@@ -168,6 +180,30 @@ static PyMethodDef module_methods[] = {
      "c_api_timer : boolean (default false)\n"
      "   Boolean flag to measure actual time spent in the C libraries. Here\n"
      "   to allow for benchmarking and scaling studies.\n\n"
+     "c_api_phase_timer : boolean (default false)\n"
+     "   Also measure the time spent in every phase of the calculation (e.g.,\n"
+     "   gridding, sorting, counting the pairs), and return the phases as a\n"
+     "   dictionary after ``time``. Implies ``c_api_timer``.\n\n"
+     "c_cell_timer : boolean or integer (default false)\n"
+     "   Measure the time spent **per cell-pair** within the C libraries with the\n"
+     "   cycle counter, and return the timings as a numpy structured array (after\n"
+     "   ``time``) with the fields ``N1``, ``N2``, ``time_in_ns``, ``cycles``,\n"
+     "   ``cellidx1``, ``cellidx2`` and ``tid``, sorted on the cell indices. An\n"
+     "   integer ``k > 1`` only times every k-th cell pair (per thread), to keep\n"
+     "   the overhead low for large runs.\n\n"
+     "c_perf_counters : boolean (default false)\n"
+     "   Count the cycles, instructions, cache references and misses, branches and\n"
+     "   branch misses, task-clock and page faults with the Linux ``perf_event_open``\n"
+     "   interface during the gridding, the neighbour assignment and the pair\n"
+     "   counting (on every thread), and return them as the last element of the\n"
+     "   tuple: a dictionary keyed by the name of the phase, of numpy structured\n"
+     "   arrays with one element per thread. Events that can not be counted are -1.\n\n"
+     "c_api_phase_memory : boolean (default false)\n"
+     "   Measure the peak memory allocated by the C library (in bytes, above the\n"
+     "   memory allocated at the start of the call) during every phase, and return\n"
+     "   it as the last element of the tuple (after the performance counters): a\n"
+     "   dictionary keyed by the name of the phase. The peaks are -1 if the\n"
+     "   allocations can not be counted.\n\n"
 
      "isa : integer (default -1)\n"
      "  Controls the runtime dispatch for the instruction set to use. Possible\n"
@@ -182,6 +218,36 @@ static PyMethodDef module_methods[] = {
      "  then the integer values correspond to the ``enum`` for the instruction set\n"
      "  defined in ``utils/defs.h``.\n\n"
 
+     "mixed_precision : boolean (default false)\n"
+     "   Grid the (double-precision) positions into a float lattice, storing\n"
+     "   every position relative to the corner of its cell, and count pairs\n"
+     "   with the (faster) float kernels. The separations remain accurate even\n"
+     "   for large boxes, and the averages are accumulated in double precision.\n\n"
+
+     "max_position_error : double (default 0.0)\n"
+     "   If positive, the positions are stored as 16 or 32 bit integer offsets\n"
+     "   within every cell, with at most this error (per axis). Reduces the\n"
+     "   memory used for the positions by 2-4x for large catalogs. The default\n"
+     "   of 0.0 stores the positions at full precision.\n\n"
+
+     "permute_in_place : boolean (default false)\n"
+     "   Reorder the positions and weights in place into cell order instead of\n"
+     "   copying them. Requires aligned, C-contiguous and writeable arrays with\n"
+     "   the same precision as the calculation, and can not be combined with\n"
+     "   ``mixed_precision`` or ``max_position_error``.\n\n"
+
+     "original_index1 : numpy int64 array of length N1, required with ``permute_in_place``\n"
+     "   Filled with the original index of every (reordered) particle.\n\n"
+
+     "original_index2 : numpy int64 array of length N2\n"
+     "   Same as ``original_index1`` for the second set of points.\n\n"
+
+     "query_mode : boolean (default false)\n"
+     "   Only used for cross-correlations. Grid only the second set of points, and\n"
+     "   stream the first set through the neighbouring cells in small groups of\n"
+     "   points. Much faster when the first set is much smaller than the second.\n"
+     "   The first set of points is never reordered with ``permute_in_place``.\n\n"
+
     "Returns\n"
     "--------\n\n"
     "A tuple (results, time) \n\n"
@@ -212,7 +278,11 @@ static PyMethodDef module_methods[] = {
      "countpairs_rp_pi(autocorr, nthreads, pimax, binfile, X1, Y1, Z1, weights1=None, weight_type=None,\n"
      "                 periodic=True, X2=None, Y2=None, Z2=None, weights2=None, verbose=False,\n"
      "                 boxsize=0.0, output_rpavg=False, xbin_refine_factor=2, ybin_refine_factor=2,\n"
-     "                 zbin_refine_factor=1, max_cells_per_dim=100, c_api_timer=False, isa=-1)\n"
+     "                 zbin_refine_factor=1, max_cells_per_dim=100, c_api_timer=False, isa=-1,\n"
+     "                 los='z', velocities1=None, velocities2=None, rsd_factor=1.0,\n"
+     "                 mixed_precision=False, max_position_error=0.0,\n"
+     "                 permute_in_place=False, original_index1=None, original_index2=None,\n"
+     "                 query_mode=False)\n"
      "\n"
      "Calculate the 3-D pair-counts corresponding to the real-space correlation\n"
      "function, "XI_CHAR"("RP_CHAR", "PI_CHAR") or wp("RP_CHAR"). Pairs which are separated\n"
@@ -236,7 +306,8 @@ static PyMethodDef module_methods[] = {
      "\n"
      "nthreads: integer\n"
      "    The number of OpenMP threads to use. Has no effect if OpenMP was not\n"
-     "    enabled during library compilation.\n"
+     "    enabled during library compilation. If ``nthreads <= 0``, the number of\n"
+     "    threads is picked from the number of particles.\n"
      "\n"
      "pimax: double\n"
      "   A double-precision value for the maximum separation along\n"
@@ -246,11 +317,12 @@ static PyMethodDef module_methods[] = {
      "   depth. For instance, if ``pimax=40``, then 40 bins will be created\n"
      "   along the ``"PI_CHAR"`` direction.\n\n"
 
-     "binfile : string\n"
+     "binfile : string or array-like\n"
      "   Filename specifying the ``rp`` bins for ``DDrppi``. The file should\n"
      "   contain white-space separated values  of (rpmin, rpmax)  for each\n"
      "   ``rp`` wanted. The bins do not need to be contiguous but must be in\n"
-     "   increasing order (smallest bins come first). \n\n"
+     "   increasing order (smallest bins come first). Alternatively, an array\n"
+     "   of (increasing) bin-edges, which is passed directly to the C library.\n\n"
 
      "X1/Y1/Z1 : array-like, real (float/double)\n"
      "   The array of X/Y/Z positions for the first set of points.\n"
@@ -303,6 +375,30 @@ static PyMethodDef module_methods[] = {
      "   Boolean flag to measure actual time spent in the C libraries. Here\n"
      "   to allow for benchmarking and scaling studies.\n"
      "\n"
+     "c_api_phase_timer : boolean (default false)\n"
+     "   Also measure the time spent in every phase of the calculation (e.g.,\n"
+     "   gridding, sorting, counting the pairs), and return the phases as a\n"
+     "   dictionary after ``time``. Implies ``c_api_timer``.\n\n"
+     "c_cell_timer : boolean or integer (default false)\n"
+     "   Measure the time spent **per cell-pair** within the C libraries with the\n"
+     "   cycle counter, and return the timings as a numpy structured array (after\n"
+     "   ``time``) with the fields ``N1``, ``N2``, ``time_in_ns``, ``cycles``,\n"
+     "   ``cellidx1``, ``cellidx2`` and ``tid``, sorted on the cell indices. An\n"
+     "   integer ``k > 1`` only times every k-th cell pair (per thread), to keep\n"
+     "   the overhead low for large runs.\n\n"
+     "c_perf_counters : boolean (default false)\n"
+     "   Count the cycles, instructions, cache references and misses, branches and\n"
+     "   branch misses, task-clock and page faults with the Linux ``perf_event_open``\n"
+     "   interface during the gridding, the neighbour assignment and the pair\n"
+     "   counting (on every thread), and return them as the last element of the\n"
+     "   tuple: a dictionary keyed by the name of the phase, of numpy structured\n"
+     "   arrays with one element per thread. Events that can not be counted are -1.\n\n"
+     "c_api_phase_memory : boolean (default false)\n"
+     "   Measure the peak memory allocated by the C library (in bytes, above the\n"
+     "   memory allocated at the start of the call) during every phase, and return\n"
+     "   it as the last element of the tuple (after the performance counters): a\n"
+     "   dictionary keyed by the name of the phase. The peaks are -1 if the\n"
+     "   allocations can not be counted.\n\n"
      "isa : integer (default -1)\n"
      "  Controls the runtime dispatch for the instruction set to use. Possible\n"
      "  options are: [-1, AVX, SSE42, FALLBACK]\n"
@@ -317,6 +413,50 @@ static PyMethodDef module_methods[] = {
      "  then the integer values correspond to the ``enum`` for the instruction set\n"
      "  defined in ``utils/defs.h``.\n"
      "\n"
+     "los : string (default 'z')\n"
+     "   The line-of-sight axis. One of 'x', 'y', 'z' or 'all'. With 'all', the\n"
+     "   counts along the x, y and z lines-of-sight are computed in a single pass\n"
+     "   and the results for the three lines-of-sight are returned one after the other.\n"
+     "\n"
+     "velocities1/velocities2 : array-like, real (float/double), shape (3, n_particles), optional\n"
+     "   Velocities used to displace the particles along the line-of-sight\n"
+     "   (redshift-space distortions) on the fly. The displacement is\n"
+     "   ``velocity * rsd_factor``. The positions themselves are not modified.\n"
+     "\n"
+     "rsd_factor : double (default 1.0)\n"
+     "   Conversion factor from velocities to displacements, e.g., 1/(aH) in\n"
+     "   units of the positions. Only used if velocities are supplied.\n"
+     "\n"
+     "mixed_precision : boolean (default false)\n"
+     "   Grid the (double-precision) positions into a float lattice, storing\n"
+     "   every position relative to the corner of its cell, and count pairs\n"
+     "   with the (faster) float kernels. The separations remain accurate even\n"
+     "   for large boxes, and the averages are accumulated in double precision.\n\n"
+
+     "max_position_error : double (default 0.0)\n"
+     "   If positive, the positions are stored as 16 or 32 bit integer offsets\n"
+     "   within every cell, with at most this error (per axis). Reduces the\n"
+     "   memory used for the positions by 2-4x for large catalogs. The default\n"
+     "   of 0.0 stores the positions at full precision.\n\n"
+
+     "permute_in_place : boolean (default false)\n"
+     "   Reorder the positions, weights and velocities in place into cell order instead of\n"
+     "   copying them. Requires aligned, C-contiguous and writeable arrays with\n"
+     "   the same precision as the calculation, and can not be combined with\n"
+     "   ``mixed_precision`` or ``max_position_error``.\n\n"
+
+     "original_index1 : numpy int64 array of length N1, required with ``permute_in_place``\n"
+     "   Filled with the original index of every (reordered) particle.\n\n"
+
+     "original_index2 : numpy int64 array of length N2\n"
+     "   Same as ``original_index1`` for the second set of points.\n\n"
+
+     "query_mode : boolean (default false)\n"
+     "   Only used for cross-correlations. Grid only the second set of points, and\n"
+     "   stream the first set through the neighbouring cells in small groups of\n"
+     "   points. Much faster when the first set is much smaller than the second.\n"
+     "   The first set of points is never reordered with ``permute_in_place``.\n\n"
+
      "Returns\n"
      "--------\n"
      "\n"
@@ -350,7 +490,8 @@ static PyMethodDef module_methods[] = {
      "countpairs_wp(boxsize, pimax, nthreads, binfile, X, Y, Z, weights=None, weight_type=None, verbose=False,\n"
      "              output_rpavg=False, xbin_refine_factor=2, ybin_refine_factor=2,\n"
      "              zbin_refine_factor=1, max_cells_per_dim=100, c_api_timer=False,\n"
-     "              c_cell_timer=False, isa=-1)\n"
+     "              c_cell_timer=False, isa=-1, pimax_list=None, mixed_precision=False,\n"
+     "              max_position_error=0.0, permute_in_place=False, original_index1=None)\n"
      "\n"
      "Function to compute the projected correlation function in a periodic\n"
      "cosmological box. Pairs which are separated by less than the ``"RP_CHAR"``\n"
@@ -388,13 +529,15 @@ static PyMethodDef module_methods[] = {
      "   along the ``"PI_CHAR"`` direction.\n"
      "\n"
      "nthreads: integer\n"
-     "   Number of threads to use.\n"
+     "   Number of threads to use. If ``nthreads <= 0``, the number of threads\n"
+     "   is picked from the number of particles.\n"
      "\n"
-     "binfile : string\n"
+     "binfile : string or array-like\n"
      "   Filename specifying the ``rp`` bins for ``wp``. The file should\n"
      "   contain white-space separated values  of (rpmin, rpmax)  for each\n"
      "   ``rp`` wanted. The bins do not need to be contiguous but must be in\n"
-     "   increasing order (smallest bins come first). \n"
+     "   increasing order (smallest bins come first). Alternatively, an array\n"
+     "   of (increasing) bin-edges, which is passed directly to the C library.\n"
      "\n"
      "X/Y/Z : array-like, real (float/double)\n"
      "   The array of X/Y/Z positions for the first set of points.\n"
@@ -431,13 +574,30 @@ static PyMethodDef module_methods[] = {
      "   Boolean flag to measure actual time spent in the C libraries. Here\n"
      "   to allow for benchmarking and scaling studies.\n"
      "\n"
-     "c_cell_timer : boolean (default false)\n"
-     "   Boolean flag to measure actual time spent **per cell-pair** within the C libraries.\n"
-     "   A very detailed timer that stores information about the number of particles in\n"
-     "   each cell, the thread id that processed that cell-pair and the amount of time in\n"
-     "   nano-seconds taken to process that cell pair. This timer can be used to study\n"
-     "   the instruction set efficiency, and load-balancing of the code\n"
-     "\n"
+     "c_api_phase_timer : boolean (default false)\n"
+     "   Also measure the time spent in every phase of the calculation (e.g.,\n"
+     "   gridding, sorting, counting the pairs), and return the phases as a\n"
+     "   dictionary after ``time``. Implies ``c_api_timer``.\n\n"
+     "c_cell_timer : boolean or integer (default false)\n"
+     "   Measure the time spent **per cell-pair** within the C libraries with the\n"
+     "   cycle counter, and return the timings as a numpy structured array (after\n"
+     "   ``time``) with the fields ``N1``, ``N2``, ``time_in_ns``, ``cycles``,\n"
+     "   ``cellidx1``, ``cellidx2`` and ``tid``, sorted on the cell indices. An\n"
+     "   integer ``k > 1`` only times every k-th cell pair (per thread), to keep\n"
+     "   the overhead low for large runs.\n\n"
+     "c_perf_counters : boolean (default false)\n"
+     "   Count the cycles, instructions, cache references and misses, branches and\n"
+     "   branch misses, task-clock and page faults with the Linux ``perf_event_open``\n"
+     "   interface during the gridding, the neighbour assignment and the pair\n"
+     "   counting (on every thread), and return them as the last element of the\n"
+     "   tuple: a dictionary keyed by the name of the phase, of numpy structured\n"
+     "   arrays with one element per thread. Events that can not be counted are -1.\n\n"
+     "c_api_phase_memory : boolean (default false)\n"
+     "   Measure the peak memory allocated by the C library (in bytes, above the\n"
+     "   memory allocated at the start of the call) during every phase, and return\n"
+     "   it as the last element of the tuple (after the performance counters): a\n"
+     "   dictionary keyed by the name of the phase. The peaks are -1 if the\n"
+     "   allocations can not be counted.\n\n"
      "isa : integer (default -1)\n"
      "  Controls the runtime dispatch for the instruction set to use. Possible\n"
      "  options are: [-1, AVX, SSE42, FALLBACK]\n"
@@ -452,6 +612,32 @@ static PyMethodDef module_methods[] = {
      "  then the integer values correspond to the ``enum`` for the instruction set\n"
      "  defined in ``utils/defs.h``.\n"
      "\n"
+     "pimax_list : array-like, double, optional\n"
+     "   A strictly increasing list of "PIMAX_CHAR" values. The pairs are counted\n"
+     "   once and wp("RP_CHAR") is computed for every "PIMAX_CHAR" in the list. The\n"
+     "   largest value must not exceed ``pimax``.\n"
+     "\n"
+
+     "mixed_precision : boolean (default false)\n"
+     "   Grid the (double-precision) positions into a float lattice, storing\n"
+     "   every position relative to the corner of its cell, and count pairs\n"
+     "   with the (faster) float kernels. The separations remain accurate even\n"
+     "   for large boxes, and the averages are accumulated in double precision.\n\n"
+
+     "max_position_error : double (default 0.0)\n"
+     "   If positive, the positions are stored as 16 or 32 bit integer offsets\n"
+     "   within every cell, with at most this error (per axis). Reduces the\n"
+     "   memory used for the positions by 2-4x for large catalogs. The default\n"
+     "   of 0.0 stores the positions at full precision.\n\n"
+
+     "permute_in_place : boolean (default false)\n"
+     "   Reorder the positions and weights in place into cell order instead of\n"
+     "   copying them. Requires aligned, C-contiguous and writeable arrays with\n"
+     "   the same precision as the calculation, and can not be combined with\n"
+     "   ``mixed_precision`` or ``max_position_error``.\n\n"
+
+     "original_index1 : numpy int64 array of length N, required with ``permute_in_place``\n"
+     "   Filled with the original index of every (reordered) particle.\n\n"
 
      "Returns\n"
      "--------\n"
@@ -464,15 +650,18 @@ static PyMethodDef module_methods[] = {
      "   ``rpavg`` will be set to 0.0 for all bins; similarly for ``weight_avg``. ``wp`` contains the projected\n"
      "   correlation function while ``npairs`` contains the number of unique pairs\n"
      "   in that bin.  If weight are used, then ``wp`` is weighted, while ``npairs`` is not.\n"
+     "   If ``pimax_list`` is supplied, then the list contains the radial bins for\n"
+     "   each "PIMAX_CHAR" (in the same order as ``pimax_list``).\n"
      "\n"
      "time : if ``c_api_timer`` is set, then the return value contains the time spent\n"
      "   in the API; otherwise time is set to 0.0\n"
      "\n"
-     "per_cell_time : if ``c_cell_timer`` is set, then a Python list is returned containing\n"
-     "   detailed stats about each cell-pair visited during pair-counting, viz., number of\n"
-     "   particles in each of the cells in the pair, 1-D cell-indices for each cell in the pair,\n"
-     "   time (in nano-seconds) to process the pair and the thread-id for the thread that \n"
-     "   processed that cell-pair.\n"
+     "per_cell_time : if ``c_cell_timer`` is set, then a numpy structured array containing\n"
+     "   detailed stats about each (timed) cell-pair visited during pair-counting, viz., number of\n"
+     "   particles in each of the cells in the pair (``N1``, ``N2``), the time (``time_in_ns``)\n"
+     "   and the cycles (``cycles``) to process the pair, the 1-D cell-indices for each cell\n"
+     "   in the pair (``cellidx1``, ``cellidx2``) and the thread-id (``tid``) for the thread that\n"
+     "   processed that cell-pair. Empty if ``c_cell_timer`` is not set.\n"
      "\n"
 
      "Example\n"
@@ -491,7 +680,9 @@ static PyMethodDef module_methods[] = {
     {"countpairs_xi"         ,(PyCFunction) countpairs_countpairs_xi    ,METH_VARARGS | METH_KEYWORDS,
      "countpairs_xi(boxsize, nthreads, binfile, X, Y, Z, weights=None, weight_type=None, verbose=False,\n"
      "              output_ravg=False, xbin_refine_factor=2, ybin_refine_factor=2,\n"
-     "              zbin_refine_factor=1, max_cells_per_dim=100, c_api_timer=False, isa=-1)\n"
+     "              zbin_refine_factor=1, max_cells_per_dim=100, c_api_timer=False, isa=-1,\n"
+     "              mixed_precision=False, max_position_error=0.0,\n"
+     "              permute_in_place=False, original_index1=None)\n"
      "\n"
      "Function to compute the projected correlation function in a periodic\n"
      "cosmological box. Pairs which are separated by less than the ``r``\n"
@@ -520,13 +711,15 @@ static PyMethodDef module_methods[] = {
      "   in same units as the particle positions and the ``r`` bins.\n"
      "\n"
      "nthreads: integer\n"
-     "   Number of threads to use.\n"
+     "   Number of threads to use. If ``nthreads <= 0``, the number of threads\n"
+     "   is picked from the number of particles.\n"
      "\n"
-     "binfile : string\n"
+     "binfile : string or array-like\n"
      "   Filename specifying the ``r`` bins for ``xi``. The file should\n"
      "   contain white-space separated values  of (rmin, rmax)  for each\n"
      "   ``r`` wanted. The bins do not need to be contiguous but must be in\n"
-     "   increasing order (smallest bins come first). \n"
+     "   increasing order (smallest bins come first). Alternatively, an array\n"
+     "   of (increasing) bin-edges, which is passed directly to the C library.\n"
      "\n"
      "X1/Y1/Z1 : array-like, real (float/double)\n"
      "   The array of X/Y/Z positions for the first set of points.\n"
@@ -563,6 +756,30 @@ static PyMethodDef module_methods[] = {
      "   Boolean flag to measure actual time spent in the C libraries. Here\n"
      "   to allow for benchmarking and scaling studies.\n"
      "\n"
+     "c_api_phase_timer : boolean (default false)\n"
+     "   Also measure the time spent in every phase of the calculation (e.g.,\n"
+     "   gridding, sorting, counting the pairs), and return the phases as a\n"
+     "   dictionary after ``time``. Implies ``c_api_timer``.\n\n"
+     "c_cell_timer : boolean or integer (default false)\n"
+     "   Measure the time spent **per cell-pair** within the C libraries with the\n"
+     "   cycle counter, and return the timings as a numpy structured array (after\n"
+     "   ``time``) with the fields ``N1``, ``N2``, ``time_in_ns``, ``cycles``,\n"
+     "   ``cellidx1``, ``cellidx2`` and ``tid``, sorted on the cell indices. An\n"
+     "   integer ``k > 1`` only times every k-th cell pair (per thread), to keep\n"
+     "   the overhead low for large runs.\n\n"
+     "c_perf_counters : boolean (default false)\n"
+     "   Count the cycles, instructions, cache references and misses, branches and\n"
+     "   branch misses, task-clock and page faults with the Linux ``perf_event_open``\n"
+     "   interface during the gridding, the neighbour assignment and the pair\n"
+     "   counting (on every thread), and return them as the last element of the\n"
+     "   tuple: a dictionary keyed by the name of the phase, of numpy structured\n"
+     "   arrays with one element per thread. Events that can not be counted are -1.\n\n"
+     "c_api_phase_memory : boolean (default false)\n"
+     "   Measure the peak memory allocated by the C library (in bytes, above the\n"
+     "   memory allocated at the start of the call) during every phase, and return\n"
+     "   it as the last element of the tuple (after the performance counters): a\n"
+     "   dictionary keyed by the name of the phase. The peaks are -1 if the\n"
+     "   allocations can not be counted.\n\n"
      "isa : integer (default -1)\n"
      "  Controls the runtime dispatch for the instruction set to use. Possible\n"
      "  options are: [-1, AVX, SSE42, FALLBACK]\n"
@@ -577,6 +794,27 @@ static PyMethodDef module_methods[] = {
      "  then the integer values correspond to the ``enum`` for the instruction set\n"
      "  defined in ``utils/defs.h``.\n"
      "\n"
+     "mixed_precision : boolean (default false)\n"
+     "   Grid the (double-precision) positions into a float lattice, storing\n"
+     "   every position relative to the corner of its cell, and count pairs\n"
+     "   with the (faster) float kernels. The separations remain accurate even\n"
+     "   for large boxes, and the averages are accumulated in double precision.\n\n"
+
+     "max_position_error : double (default 0.0)\n"
+     "   If positive, the positions are stored as 16 or 32 bit integer offsets\n"
+     "   within every cell, with at most this error (per axis). Reduces the\n"
+     "   memory used for the positions by 2-4x for large catalogs. The default\n"
+     "   of 0.0 stores the positions at full precision.\n\n"
+
+     "permute_in_place : boolean (default false)\n"
+     "   Reorder the positions and weights in place into cell order instead of\n"
+     "   copying them. Requires aligned, C-contiguous and writeable arrays with\n"
+     "   the same precision as the calculation, and can not be combined with\n"
+     "   ``mixed_precision`` or ``max_position_error``.\n\n"
+
+     "original_index1 : numpy int64 array of length N, required with ``permute_in_place``\n"
+     "   Filled with the original index of every (reordered) particle.\n\n"
+
      "Returns\n"
      "--------\n"
      "\n"
@@ -609,7 +847,11 @@ static PyMethodDef module_methods[] = {
      "                periodic=True, X2=None, Y2=None, Z2=None, weights2=None, verbose=False,\n"
      "                boxsize=0.0, output_savg=False, fast_divide_and_NR_steps=0,\n"
      "                xbin_refine_factor=2, ybin_refine_factor=2, zbin_refine_factor=1,\n"
-     "                max_cells_per_dim=100, c_api_timer=False, isa=-1)\n"
+     "                max_cells_per_dim=100, c_api_timer=False, isa=-1,\n"
+     "                los='z', velocities1=None, velocities2=None, rsd_factor=1.0,\n"
+     "                mixed_precision=False, max_position_error=0.0,\n"
+     "                permute_in_place=False, original_index1=None, original_index2=None,\n"
+     "                query_mode=False)\n"
      "\n"
      "Calculate the 2-D pair-counts corresponding to the real-space correlation\n"
      "function, "XI_CHAR"(s, "MU_CHAR"). Pairs which are separated\n"
@@ -632,13 +874,15 @@ static PyMethodDef module_methods[] = {
      "\n"
      "nthreads: integer\n"
      "    The number of OpenMP threads to use. Has no effect if OpenMP was not\n"
-     "    enabled during library compilation.\n"
+     "    enabled during library compilation. If ``nthreads <= 0``, the number of\n"
+     "    threads is picked from the number of particles.\n"
      "\n"
-     "binfile : string\n"
+     "binfile : string or array-like\n"
      "   Filename specifying the ``s`` bins for ``DDsmu``. The file should\n"
      "   contain white-space separated values  of (smin, smax)  for each\n"
      "   ``s`` wanted. The bins must be contiguous and in\n"
-     "   increasing order (smallest bins come first). \n"
+     "   increasing order (smallest bins come first). Alternatively, an array\n"
+     "   of (increasing) bin-edges, which is passed directly to the C library.\n"
      "\n"
      "mu_max: double. Must be in range (0.0, 1.0]\n"
      "   A double-precision value for the maximum cosine of the angular separation from\n"
@@ -712,6 +956,30 @@ static PyMethodDef module_methods[] = {
      "   Boolean flag to measure actual time spent in the C libraries. Here\n"
      "   to allow for benchmarking and scaling studies.\n"
      "\n"
+     "c_api_phase_timer : boolean (default false)\n"
+     "   Also measure the time spent in every phase of the calculation (e.g.,\n"
+     "   gridding, sorting, counting the pairs), and return the phases as a\n"
+     "   dictionary after ``time``. Implies ``c_api_timer``.\n\n"
+     "c_cell_timer : boolean or integer (default false)\n"
+     "   Measure the time spent **per cell-pair** within the C libraries with the\n"
+     "   cycle counter, and return the timings as a numpy structured array (after\n"
+     "   ``time``) with the fields ``N1``, ``N2``, ``time_in_ns``, ``cycles``,\n"
+     "   ``cellidx1``, ``cellidx2`` and ``tid``, sorted on the cell indices. An\n"
+     "   integer ``k > 1`` only times every k-th cell pair (per thread), to keep\n"
+     "   the overhead low for large runs.\n\n"
+     "c_perf_counters : boolean (default false)\n"
+     "   Count the cycles, instructions, cache references and misses, branches and\n"
+     "   branch misses, task-clock and page faults with the Linux ``perf_event_open``\n"
+     "   interface during the gridding, the neighbour assignment and the pair\n"
+     "   counting (on every thread), and return them as the last element of the\n"
+     "   tuple: a dictionary keyed by the name of the phase, of numpy structured\n"
+     "   arrays with one element per thread. Events that can not be counted are -1.\n\n"
+     "c_api_phase_memory : boolean (default false)\n"
+     "   Measure the peak memory allocated by the C library (in bytes, above the\n"
+     "   memory allocated at the start of the call) during every phase, and return\n"
+     "   it as the last element of the tuple (after the performance counters): a\n"
+     "   dictionary keyed by the name of the phase. The peaks are -1 if the\n"
+     "   allocations can not be counted.\n\n"
 
      "isa : integer (default -1)\n"
      "  Controls the runtime dispatch for the instruction set to use. Possible\n"
@@ -728,6 +996,50 @@ static PyMethodDef module_methods[] = {
      "  defined in ``utils/defs.h``.\n"
      "\n"
 
+     "los : string (default 'z')\n"
+     "   The line-of-sight axis. One of 'x', 'y', 'z' or 'all'. With 'all', the\n"
+     "   counts along the x, y and z lines-of-sight are computed in a single pass\n"
+     "   and the results for the three lines-of-sight are returned one after the other.\n"
+     "\n"
+     "velocities1/velocities2 : array-like, real (float/double), shape (3, n_particles), optional\n"
+     "   Velocities used to displace the particles along the line-of-sight\n"
+     "   (redshift-space distortions) on the fly. The displacement is\n"
+     "   ``velocity * rsd_factor``. The positions themselves are not modified.\n"
+     "\n"
+     "rsd_factor : double (default 1.0)\n"
+     "   Conversion factor from velocities to displacements, e.g., 1/(aH) in\n"
+     "   units of the positions. Only used if velocities are supplied.\n"
+     "\n"
+     "mixed_precision : boolean (default false)\n"
+     "   Grid the (double-precision) positions into a float lattice, storing\n"
+     "   every position relative to the corner of its cell, and count pairs\n"
+     "   with the (faster) float kernels. The separations remain accurate even\n"
+     "   for large boxes, and the averages are accumulated in double precision.\n\n"
+
+     "max_position_error : double (default 0.0)\n"
+     "   If positive, the positions are stored as 16 or 32 bit integer offsets\n"
+     "   within every cell, with at most this error (per axis). Reduces the\n"
+     "   memory used for the positions by 2-4x for large catalogs. The default\n"
+     "   of 0.0 stores the positions at full precision.\n\n"
+
+     "permute_in_place : boolean (default false)\n"
+     "   Reorder the positions, weights and velocities in place into cell order instead of\n"
+     "   copying them. Requires aligned, C-contiguous and writeable arrays with\n"
+     "   the same precision as the calculation, and can not be combined with\n"
+     "   ``mixed_precision`` or ``max_position_error``.\n\n"
+
+     "original_index1 : numpy int64 array of length N1, required with ``permute_in_place``\n"
+     "   Filled with the original index of every (reordered) particle.\n\n"
+
+     "original_index2 : numpy int64 array of length N2\n"
+     "   Same as ``original_index1`` for the second set of points.\n\n"
+
+     "query_mode : boolean (default false)\n"
+     "   Only used for cross-correlations. Grid only the second set of points, and\n"
+     "   stream the first set through the neighbouring cells in small groups of\n"
+     "   points. Much faster when the first set is much smaller than the second.\n"
+     "   The first set of points is never reordered with ``permute_in_place``.\n\n"
+
      "Returns\n"
      "--------\n"
      "\n"
@@ -836,6 +1148,10 @@ static PyMethodDef module_methods[] = {
      "   Boolean flag to measure actual time spent in the C libraries. Here\n"
      "   to allow for benchmarking and scaling studies.\n"
      "\n"
+     "c_api_phase_timer : boolean (default false)\n"
+     "   Also measure the time spent in every phase of the calculation (e.g.,\n"
+     "   gridding, sorting, counting the pairs), and return the phases as a\n"
+     "   dictionary after ``time``. Implies ``c_api_timer``.\n\n"
      "isa : integer (default -1)\n"
      "  Controls the runtime dispatch for the instruction set to use. Possible\n"
      "  options are: [-1, AVX, SSE42, FALLBACK]\n"
@@ -881,9 +1197,218 @@ static PyMethodDef module_methods[] = {
      "                                         periodic=True)\n"
      "\n"
     },
+    {"countpairs_batch"      ,(PyCFunction) countpairs_countpairs_batch ,METH_VARARGS | METH_KEYWORDS,
+     "countpairs_batch(autocorr, nthreads, binfile, X1, Y1, Z1, offsets1, weights1=None, X2=None, Y2=None,\n"
+     "                 Z2=None, offsets2=None, weights2=None, periodic=True, boxsize=0.0,\n"
+     "                 output_ravg=False, xbin_refine_factor=2, ybin_refine_factor=2,\n"
+     "                 zbin_refine_factor=1, max_cells_per_dim=100, c_api_timer=False,\n"
+     "                 isa=-1, weight_type=None, mixed_precision=False, max_position_error=0.0)\n"
+     "\n"
+     "Calculate the 3-D pair-counts for a batch of independent catalogs (or pairs of catalogs),\n"
+     "with whole catalogs distributed over the threads and every catalog counted by a single\n"
+     "thread. The catalogs are passed concatenated; catalog ``i`` consists of the points\n"
+     "``offsets1[i]:offsets1[i+1]`` of X1/Y1/Z1 (and of every row of weights1).\n"
+     "The python wrapper for this extension, `Corrfunc.theory.DD_batch`, is more user-friendly.\n"
+     UNICODE_WARNING
+     "\n"
+     "Parameters \n"
+     "-----------\n"
+     "offsets1 : numpy int64 array of length ncatalogs + 1\n"
+     "   The (increasing) index of the first point of every catalog, followed by the total\n"
+     "   number of points.\n\n"
+
+     "offsets2 : numpy int64 array of length ncatalogs + 1, required if autocorr is 0\n"
+     "   Same as ``offsets1``, for the second set of points.\n\n"
+
+     "All the other parameters are the same as for ``countpairs``, and apply to every catalog.\n\n"
+
+     "Returns\n"
+     "--------\n"
+     "\n"
+     "A tuple (rupp, npairs, ravg, weightavg, time) \n"
+     "\n"
+     "rupp : numpy array of the nbins + 1 bin-edges\n\n"
+     "npairs, ravg, weightavg : numpy arrays of shape (ncatalogs, nbins)\n\n"
+     "time : if ``c_api_timer`` is set, then the return value contains the time spent\n"
+     "   in the API; otherwise time is set to 0.0\n"
+     "\n"
+    },
+    {"countpairs_wp_batch"   ,(PyCFunction) countpairs_countpairs_wp_batch ,METH_VARARGS | METH_KEYWORDS,
+     "countpairs_wp_batch(boxsize, pimax, nthreads, binfile, X, Y, Z, offsets, weights=None,\n"
+     "                    weight_type=None, output_rpavg=False, xbin_refine_factor=2,\n"
+     "                    ybin_refine_factor=2, zbin_refine_factor=1, max_cells_per_dim=100,\n"
+     "                    c_api_timer=False, isa=-1, pimax_list=None, mixed_precision=False,\n"
+     "                    max_position_error=0.0)\n"
+     "\n"
+     "Calculate wp("RP_CHAR") for a batch of independent catalogs (all with the same ``boxsize``),\n"
+     "with whole catalogs distributed over the threads and every catalog counted by a single\n"
+     "thread. The catalogs are passed concatenated; catalog ``i`` consists of the points\n"
+     "``offsets[i]:offsets[i+1]`` of X/Y/Z (and of every row of weights).\n"
+     "The python wrapper for this extension, `Corrfunc.theory.wp_batch`, is more user-friendly.\n"
+     UNICODE_WARNING
+     "\n"
+     "Parameters \n"
+     "-----------\n"
+     "offsets : numpy int64 array of length ncatalogs + 1\n"
+     "   The (increasing) index of the first point of every catalog, followed by the total\n"
+     "   number of points.\n\n"
+
+     "All the other parameters are the same as for ``countpairs_wp``, and apply to every catalog.\n\n"
+
+     "Returns\n"
+     "--------\n"
+     "\n"
+     "A tuple (rupp, npairs, wp, rpavg, weightavg, time) \n"
+     "\n"
+     "rupp : numpy array of the nbins + 1 bin-edges\n\n"
+     "npairs, wp, rpavg, weightavg : numpy arrays of shape (ncatalogs, num_pimax * nbins)\n\n"
+     "time : if ``c_api_timer`` is set, then the return value contains the time spent\n"
+     "   in the API; otherwise time is set to 0.0\n"
+     "\n"
+    },
     {NULL, NULL, 0, NULL}
 };
 
+/* Returns a dictionary with the time (in seconds) spent in every phase of the last call */
+static PyObject *api_phase_times_as_dict(const struct config_options *options)
+{
+    PyObject *phases = PyDict_New();
+    for(int i=0;i<NUM_API_PHASES;i++) {
+        PyObject *phase_time = PyFloat_FromDouble(options->c_api_phase_times[i]);
+        PyDict_SetItemString(phases, get_api_phase_name((api_phase) i), phase_time);
+        Py_XDECREF(phase_time);
+    }
+    return phases;
+}
+
+/* Returns the per cell-pair timings as a numpy structured array (and frees the timings) */
+static PyObject *cell_timings_as_array(struct config_options *options)
+{
+    PyObject *dtype_dict = Py_BuildValue("{s:[sssssss],s:[sssssss],s:[nnnnnnn],s:n}",
+                                         "names", "N1", "N2", "time_in_ns", "cycles", "cellidx1", "cellidx2", "tid",
+                                         "formats", "i8", "i8", "i8", "i8", "i4", "i4", "i4",
+                                         "offsets",
+                                         (Py_ssize_t) offsetof(struct api_cell_timings, N1),
+                                         (Py_ssize_t) offsetof(struct api_cell_timings, N2),
+                                         (Py_ssize_t) offsetof(struct api_cell_timings, time_in_ns),
+                                         (Py_ssize_t) offsetof(struct api_cell_timings, cycles),
+                                         (Py_ssize_t) offsetof(struct api_cell_timings, first_cellindex),
+                                         (Py_ssize_t) offsetof(struct api_cell_timings, second_cellindex),
+                                         (Py_ssize_t) offsetof(struct api_cell_timings, tid),
+                                         "itemsize", (Py_ssize_t) sizeof(struct api_cell_timings));
+    PyArray_Descr *dtype = NULL;
+    const int status = dtype_dict == NULL ? 0:PyArray_DescrConverter(dtype_dict, &dtype);
+    Py_XDECREF(dtype_dict);
+    if(status == 0) {
+        free_cell_timings(options);
+        return NULL;
+    }
+
+    npy_intp dims[] = {(npy_intp) options->totncells_timings};
+    /* PyArray_NewFromDescr steals the reference to dtype */
+    PyObject *timings = PyArray_NewFromDescr(&PyArray_Type, dtype, 1, dims, NULL, NULL, 0, NULL);
+    if(timings != NULL && options->totncells_timings > 0) {
+        memcpy(PyArray_DATA((PyArrayObject *) timings), options->cell_timings,
+               options->totncells_timings * sizeof(struct api_cell_timings));
+    }
+    free_cell_timings(options);
+    return timings;
+}
+
+/* Returns the hardware performance counters as a dictionary, keyed by the name of the phase, of
+   numpy structured arrays with one element per thread (and frees the counters) */
+static PyObject *perf_counts_as_dict(struct config_options *options)
+{
+    PyObject *names = PyList_New(0), *formats = PyList_New(0), *offsets = PyList_New(0);
+    if(names == NULL || formats == NULL || offsets == NULL) {
+        Py_XDECREF(names);Py_XDECREF(formats);Py_XDECREF(offsets);
+        free_perf_counts(options);
+        return NULL;
+    }
+    for(int i=-1;i<NUM_API_PERF_EVENTS;i++) {
+        PyObject *field_name = PyUnicode_FromString(i < 0 ? "tid":get_api_perf_event_name((api_perf_event) i));
+        PyObject *field_format = PyUnicode_FromString(i < 0 ? "i4":"i8");
+        PyObject *field_offset = PyLong_FromSsize_t(i < 0 ? (Py_ssize_t) offsetof(struct api_perf_counts, tid):
+                                                    (Py_ssize_t) (offsetof(struct api_perf_counts, counts) + i*sizeof(int64_t)));
+        PyList_Append(names, field_name);
+        PyList_Append(formats, field_format);
+        PyList_Append(offsets, field_offset);
+        Py_XDECREF(field_name);Py_XDECREF(field_format);Py_XDECREF(field_offset);
+    }
+    PyObject *dtype_dict = Py_BuildValue("{s:N,s:N,s:N,s:n}", "names", names, "formats", formats, "offsets", offsets,
+                                         "itemsize", (Py_ssize_t) sizeof(struct api_perf_counts));
+    PyArray_Descr *dtype = NULL;
+    const int status = dtype_dict == NULL ? 0:PyArray_DescrConverter(dtype_dict, &dtype);
+    Py_XDECREF(dtype_dict);
+    if(status == 0) {
+        free_perf_counts(options);
+        return NULL;
+    }
+
+    PyObject *perf_counts = PyDict_New();
+    for(int phase=0;phase<NUM_API_PHASES && perf_counts != NULL;phase++) {
+        npy_intp nthreads = 0;
+        for(int64_t i=0;i<options->nperf_counts;i++) {
+            nthreads += options->perf_counts[i].phase == phase ? 1:0;
+        }
+        if(nthreads == 0) {
+            continue;
+        }
+        /* PyArray_NewFromDescr steals a reference to dtype */
+        Py_INCREF(dtype);
+        PyObject *counts = PyArray_NewFromDescr(&PyArray_Type, dtype, 1, &nthreads, NULL, NULL, 0, NULL);
+        if(counts == NULL) {
+            Py_CLEAR(perf_counts);
+            break;
+        }
+        struct api_perf_counts *dst = (struct api_perf_counts *) PyArray_DATA((PyArrayObject *) counts);
+        for(int64_t i=0;i<options->nperf_counts;i++) {
+            if(options->perf_counts[i].phase == phase) {
+                *dst++ = options->perf_counts[i];
+            }
+        }
+        PyDict_SetItemString(perf_counts, get_api_phase_name((api_phase) phase), counts);
+        Py_DECREF(counts);
+    }
+    Py_DECREF(dtype);
+    free_perf_counts(options);
+    return perf_counts;
+}
+
+/* Appends the hardware performance counters (if requested) to the tuple of results */
+static PyObject *append_perf_counts(PyObject *results, struct config_options *options)
+{
+    if(results == NULL || options->c_perf_counters == 0) {
+        free_perf_counts(options);
+        return results;
+    }
+    PyObject *perf_counts = perf_counts_as_dict(options);
+    PyObject *perf_tuple = perf_counts == NULL ? NULL:Py_BuildValue("(N)", perf_counts);
+    PyObject *ret = perf_tuple == NULL ? NULL:PySequence_Concat(results, perf_tuple);
+    Py_DECREF(results);
+    Py_XDECREF(perf_tuple);
+    return ret;
+}
+
+/* Appends (to the tuple of results) a dictionary with the peak allocated memory (in bytes) of every phase */
+static PyObject *append_phase_memory(PyObject *results, const struct config_options *options)
+{
+    if(results == NULL || options->c_api_phase_memory == 0) {
+        return results;
+    }
+    PyObject *phases = PyDict_New();
+    for(int i=0;i<NUM_API_PHASES && phases != NULL;i++) {
+        PyObject *peak = PyLong_FromLongLong((long long) options->c_api_phase_peak_memory[i]);
+        PyDict_SetItemString(phases, get_api_phase_name((api_phase) i), peak);
+        Py_XDECREF(peak);
+    }
+    PyObject *memory_tuple = phases == NULL ? NULL:Py_BuildValue("(N)", phases);
+    PyObject *ret = memory_tuple == NULL ? NULL:PySequence_Concat(results, memory_tuple);
+    Py_DECREF(results);
+    Py_XDECREF(memory_tuple);
+    return ret;
+}
+
 static PyObject *countpairs_error_out(PyObject *module, const char *msg)
 {
 #if PY_MAJOR_VERSION < 3
@@ -956,6 +1481,27 @@ PyMODINIT_FUNC init_countpairs(void)
 
 }
 
+// Sets np to the number of particles (and num_weights to the number of weights per particle) in the
+// gridded catalog `grid_file', or np to -1 if grid_file is NULL or does not exist
+static int get_gridded_catalog_size(PyObject *module, const char *grid_file, int64_t *np, int *num_weights)
+{
+    struct gridded_catalog_header header;
+    int found = 0;
+    *np = -1;
+    *num_weights = 0;
+    if(read_gridded_catalog_header(grid_file, &header, &found) != EXIT_SUCCESS) {
+        char msg[1024];
+        snprintf(msg, 1024, "ValueError: In %s: Could not read the gridded catalog `%s'\n", __FUNCTION__, grid_file);
+        countpairs_error_out(module, msg);
+        return EXIT_FAILURE;
+    }
+    if(found) {
+        *np = header.np;
+        *num_weights = (int) header.num_weights;
+    }
+    return EXIT_SUCCESS;
+}
+
 // weights1_obj may be NULL, in which case it is ignored.
 // If it is not NULL, it will be checked alongside the positions
 static int64_t check_dims_and_datatype(PyObject *module, PyArrayObject *x1_obj, PyArrayObject *y1_obj, PyArrayObject *z1_obj, PyArrayObject *weights1_obj, size_t *element_size)
@@ -1066,6 +1612,121 @@ static int64_t check_dims_and_datatype(PyObject *module, PyArrayObject *x1_obj,
     return nx1;
 }
 
+/* The velocities (for the redshift-space displacements) are passed as arrays of shape (3, N)
+   with the same data-type as the positions. On success, `vel_array' holds a reference to
+   the (possibly copied) array and `velocities' point to the x, y and z components. */
+static int get_velocities(PyObject *module, PyArrayObject *vel_obj, const int64_t N, const size_t element_size,
+                          PyObject **vel_array, void *velocities[3])
+{
+    char msg[1024];
+    *vel_array = NULL;
+    if(vel_obj == NULL) {
+        return EXIT_SUCCESS;
+    }
+
+    if(PyArray_NDIM(vel_obj) != 2 || PyArray_DIMS(vel_obj)[0] != 3 || (int64_t) PyArray_DIMS(vel_obj)[1] != N) {
+        snprintf(msg, 1024, "ValueError: In %s: Expected velocities to be a 2-D array of shape (3, %"PRId64")\n",
+                 __FUNCTION__, N);
+        countpairs_error_out(module, msg);
+        return EXIT_FAILURE;
+    }
+
+    const int vel_type = PyArray_TYPE(vel_obj);
+    const int expected_type = element_size == sizeof(float) ? NPY_FLOAT:NPY_DOUBLE;
+    if(vel_type != expected_type) {
+        snprintf(msg, 1024, "TypeError: In %s: The velocities must have the same data-type as the positions (%s)\n",
+                 __FUNCTION__, element_size == sizeof(float) ? "floats":"doubles");
+        countpairs_error_out(module, msg);
+        return EXIT_FAILURE;
+    }
+
+    *vel_array = PyArray_FromArray(vel_obj, NOTYPE_DESCR, NPY_ARRAY_IN_ARRAY);
+    if(*vel_array == NULL) {
+        snprintf(msg, 1024, "TypeError: In %s: Could not convert the velocities to an array of allowed floating point types (doubles or floats).\n",
+                 __FUNCTION__);
+        countpairs_error_out(module, msg);
+        return EXIT_FAILURE;
+    }
+    for(int i=0;i<3;i++) {
+        velocities[i] = (char *) PyArray_DATA((PyArrayObject *) *vel_array) + i*N*element_size;
+    }
+
+    return EXIT_SUCCESS;
+}
+
+/* The bins can be passed as the name of a file, or as a 1-D array of bin-edges. The bin-edges are passed
+   straight through to the C library (in options->bin_edges), instead of being written to a temporary file on
+   every call. `bin_edges_array' must be released once the C library returns */
+static int get_binfile_or_bin_edges(PyObject *module, PyObject *binfile_obj, const char **binfile,
+                                    PyObject **bin_edges_array, struct config_options *options)
+{
+    *binfile = NULL;
+    *bin_edges_array = NULL;
+    if(PyArg_Parse(binfile_obj, "s", binfile)) {
+        return EXIT_SUCCESS;
+    }
+    PyErr_Clear();
+
+    *bin_edges_array = PyArray_FromAny(binfile_obj, PyArray_DescrFromType(NPY_DOUBLE), 1, 1, NPY_ARRAY_IN_ARRAY, NULL);
+    if(*bin_edges_array == NULL) {
+        PyErr_Clear();
+        char msg[1024];
+        snprintf(msg, 1024, "TypeError: In %s: binfile must be a file name or a 1-D array of bin-edges",
+                 __FUNCTION__);
+        countpairs_error_out(module, msg);
+        return EXIT_FAILURE;
+    }
+    options->bin_edges = (double *) PyArray_DATA((PyArrayObject *) *bin_edges_array);
+    options->num_bin_edges = (int64_t) PyArray_SIZE((PyArrayObject *) *bin_edges_array);
+    return EXIT_SUCCESS;
+}
+
+/* Returns the (common) stride in bytes of the X/Y/Z arrays, if the C library can read them in place
+   (1-D, aligned and with the same non-zero stride, e.g., the columns of an (N, 3) array). Otherwise,
+   returns 0 and the arrays are copied into contiguous arrays */
+static int64_t get_position_stride(PyArrayObject *x_obj, PyArrayObject *y_obj, PyArrayObject *z_obj)
+{
+    PyArrayObject *arrays[] = {x_obj, y_obj, z_obj};
+    const npy_intp stride = PyArray_NDIM(x_obj) == 1 ? PyArray_STRIDES(x_obj)[0]:0;
+    if(stride == 0) {
+        return 0;
+    }
+    for(int i=0;i<3;i++) {
+        if(PyArray_NDIM(arrays[i]) != 1 || PyArray_STRIDES(arrays[i])[0] != stride || ! PyArray_ISALIGNED(arrays[i])) {
+            return 0;
+        }
+    }
+    return (int64_t) stride;
+}
+
+/* With permute_in_place, the C library reorders the user's arrays (positions, weights and velocities)
+   instead of copying them, and so they must be aligned, C-contiguous and writeable. The original
+   index of every particle is written into `index_obj', which must be a 1-D int64 array of length N. */
+static int check_in_place_arrays(PyObject *module, PyArrayObject *arrays[], const int narrays,
+                                 PyArrayObject *index_obj, const int64_t N)
+{
+    char msg[1024];
+    for(int i=0;i<narrays;i++) {
+        if(arrays[i] == NULL) continue;
+        if( ! PyArray_ISCARRAY(arrays[i])) {
+            snprintf(msg, 1024, "ValueError: In %s: permute_in_place requires the positions, weights and velocities "
+                     "to be aligned, C-contiguous and writeable numpy arrays\n", __FUNCTION__);
+            countpairs_error_out(module, msg);
+            return EXIT_FAILURE;
+        }
+    }
+
+    if(index_obj == NULL || PyArray_TYPE(index_obj) != NPY_INT64 || PyArray_NDIM(index_obj) != 1 ||
+       (int64_t) PyArray_SIZE(index_obj) != N || ! PyArray_ISCARRAY(index_obj)) {
+        snprintf(msg, 1024, "ValueError: In %s: permute_in_place requires a writeable, contiguous int64 array of "
+                 "length %"PRId64" to store the original index of every particle\n", __FUNCTION__, N);
+        countpairs_error_out(module, msg);
+        return EXIT_FAILURE;
+    }
+
+    return EXIT_SUCCESS;
+}
+
 static int print_kwlist_into_msg(char *msg, const size_t totsize, size_t len, char *kwlist[], const size_t nitems)
 {
     for(size_t i=0;i<nitems;i++) {
@@ -1086,6 +1747,158 @@ static int print_kwlist_into_msg(char *msg, const size_t totsize, size_t len, ch
 }
 
 
+/* A batch of catalogs is passed as concatenated arrays, along with an int64 array of ncatalogs + 1
+   offsets: catalog `i' consists of the points offsets[i]:offsets[i+1] (and the same columns of
+   every row of the weights) */
+struct batch_catalogs {
+    PyObject *x_array, *y_array, *z_array, *weights_array, *offsets_array;
+    int64_t ND;
+    int64_t ncatalogs;
+    const int64_t *offsets;
+    int64_t *N;
+    void **X, **Y, **Z;
+};
+
+static void free_batch_catalogs(struct batch_catalogs *cat)
+{
+    Py_XDECREF(cat->x_array);Py_XDECREF(cat->y_array);Py_XDECREF(cat->z_array);
+    Py_XDECREF(cat->weights_array);Py_XDECREF(cat->offsets_array);
+    free(cat->N);free(cat->X);free(cat->Y);free(cat->Z);
+    memset(cat, 0, sizeof(*cat));
+}
+
+static int get_batch_catalogs(PyObject *module, PyArrayObject *x_obj, PyArrayObject *y_obj, PyArrayObject *z_obj,
+                              PyArrayObject *weights_obj, PyArrayObject *offsets_obj, size_t *element_size,
+                              struct batch_catalogs *cat)
+{
+    char msg[1024];
+    memset(cat, 0, sizeof(*cat));
+    cat->ND = check_dims_and_datatype(module, x_obj, y_obj, z_obj, weights_obj, element_size);
+    if(cat->ND == -1) {
+        //Error has already been set -> simply return
+        return EXIT_FAILURE;
+    }
+
+    cat->offsets_array = PyArray_FromArray(offsets_obj, PyArray_DescrFromType(NPY_INT64), NPY_ARRAY_IN_ARRAY);
+    if(cat->offsets_array == NULL || PyArray_NDIM((PyArrayObject *) cat->offsets_array) != 1 ||
+       PyArray_SIZE((PyArrayObject *) cat->offsets_array) < 2) {
+        snprintf(msg, 1024, "TypeError: In %s: Could not convert the offsets to a 1-D array of (at least two) int64\n",
+                 __FUNCTION__);
+        countpairs_error_out(module, msg);
+        free_batch_catalogs(cat);
+        return EXIT_FAILURE;
+    }
+    cat->offsets = (const int64_t *) PyArray_DATA((PyArrayObject *) cat->offsets_array);
+    cat->ncatalogs = (int64_t) PyArray_SIZE((PyArrayObject *) cat->offsets_array) - 1;
+    if(cat->offsets[0] != 0 || cat->offsets[cat->ncatalogs] != cat->ND) {
+        snprintf(msg, 1024, "ValueError: In %s: The offsets must start at 0 and end at the number of points = %"PRId64"\n",
+                 __FUNCTION__, cat->ND);
+        countpairs_error_out(module, msg);
+        free_batch_catalogs(cat);
+        return EXIT_FAILURE;
+    }
+    for(int64_t i=0;i<cat->ncatalogs;i++) {
+        if(cat->offsets[i+1] <= cat->offsets[i]) {
+            snprintf(msg, 1024, "ValueError: In %s: Every catalog must contain at least one point. Found %"PRId64" points "
+                     "in catalog %"PRId64"\n", __FUNCTION__, cat->offsets[i+1] - cat->offsets[i], i);
+            countpairs_error_out(module, msg);
+            free_batch_catalogs(cat);
+            return EXIT_FAILURE;
+        }
+    }
+
+    const int requirements = NPY_ARRAY_IN_ARRAY;
+    cat->x_array = PyArray_FromArray(x_obj, NOTYPE_DESCR, requirements);
+    cat->y_array = PyArray_FromArray(y_obj, NOTYPE_DESCR, requirements);
+    cat->z_array = PyArray_FromArray(z_obj, NOTYPE_DESCR, requirements);
+    int weights_status = EXIT_SUCCESS;
+    if(weights_obj != NULL) {
+        /* Ensure the weights are of the right shape (n_weights, n_particles) */
+        npy_intp dims[2] = {-1, cat->ND};
+        PyArray_Dims pdims = {.ptr = &(dims[0]), .len = 2};
+        PyObject *reshaped = PyArray_Newshape(weights_obj, &pdims, NPY_CORDER);
+        if(reshaped != NULL) {
+            cat->weights_array = PyArray_FromArray((PyArrayObject *) reshaped, NOTYPE_DESCR, requirements);
+            Py_DECREF(reshaped);
+        }
+        weights_status = cat->weights_array == NULL ? EXIT_FAILURE:EXIT_SUCCESS;
+    }
+    cat->N = malloc(sizeof(*(cat->N))*cat->ncatalogs);
+    cat->X = malloc(sizeof(*(cat->X))*cat->ncatalogs);
+    cat->Y = malloc(sizeof(*(cat->Y))*cat->ncatalogs);
+    cat->Z = malloc(sizeof(*(cat->Z))*cat->ncatalogs);
+    if(cat->x_array == NULL || cat->y_array == NULL || cat->z_array == NULL || weights_status != EXIT_SUCCESS ||
+       cat->N == NULL || cat->X == NULL || cat->Y == NULL || cat->Z == NULL) {
+        snprintf(msg, 1024, "TypeError: In %s: Could not convert input to arrays of allowed floating point types (doubles or floats). Are you passing numpy arrays?",
+                 __FUNCTION__);
+        countpairs_error_out(module, msg);
+        free_batch_catalogs(cat);
+        return EXIT_FAILURE;
+    }
+
+    for(int64_t i=0;i<cat->ncatalogs;i++) {
+        const size_t start = (size_t) cat->offsets[i] * (*element_size);
+        cat->N[i] = cat->offsets[i+1] - cat->offsets[i];
+        cat->X[i] = (char *) PyArray_DATA((PyArrayObject *) cat->x_array) + start;
+        cat->Y[i] = (char *) PyArray_DATA((PyArrayObject *) cat->y_array) + start;
+        cat->Z[i] = (char *) PyArray_DATA((PyArrayObject *) cat->z_array) + start;
+    }
+
+    return EXIT_SUCCESS;
+}
+
+/* Returns the extra options for every catalog of the batch, with the weights of that catalog (cat2 is NULL
+   for auto-correlations) */
+static struct extra_options *get_batch_extra_options(const struct extra_options *extra, const struct batch_catalogs *cat1,
+                                                     const struct batch_catalogs *cat2, const size_t element_size)
+{
+    struct extra_options *all_extra = malloc(sizeof(*all_extra)*cat1->ncatalogs);
+    if(all_extra == NULL) {
+        return NULL;
+    }
+    for(int64_t i=0;i<cat1->ncatalogs;i++) {
+        all_extra[i] = *extra;
+        for(int64_t w = 0; w < extra->weights0.num_weights; w++){
+            all_extra[i].weights0.weights[w] = (char *) PyArray_DATA((PyArrayObject *) cat1->weights_array) +
+                (w*cat1->ND + cat1->offsets[i])*element_size;
+            if(cat2 != NULL) {
+                all_extra[i].weights1.weights[w] = (char *) PyArray_DATA((PyArrayObject *) cat2->weights_array) +
+                    (w*cat2->ND + cat2->offsets[i])*element_size;
+            }
+        }
+    }
+    return all_extra;
+}
+
+/* Checks that the weights match the requested weighting method (as for the single-catalog extensions) */
+static int check_weights_for_method(PyObject *module, const char *weighting_method_str, PyObject *weights_array,
+                                    struct extra_options *extra)
+{
+    char msg[1024];
+    weight_method_t weighting_method;
+    if(get_weight_method_by_name(weighting_method_str, &weighting_method) != EXIT_SUCCESS){
+        snprintf(msg, 1024, "ValueError: In %s: unknown weight_type %s!", __FUNCTION__, weighting_method_str);
+        countpairs_error_out(module, msg);
+        return EXIT_FAILURE;
+    }
+    const int found_weights = weights_array == NULL ? 0 : PyArray_SHAPE((PyArrayObject *) weights_array)[0];
+    *extra = get_extra_options(weighting_method);
+    if(extra->weights0.num_weights > 0 && extra->weights0.num_weights != found_weights){
+        snprintf(msg, 1024, "ValueError: In %s: specified weighting method %s which requires %"PRId64" weight(s)-per-particle, but found %d weight(s) instead!\n",
+                 __FUNCTION__, weighting_method_str, extra->weights0.num_weights, found_weights);
+        countpairs_error_out(module, msg);
+        return EXIT_FAILURE;
+    }
+    if(extra->weights0.num_weights > 0 && found_weights > MAX_NUM_WEIGHTS){
+        snprintf(msg, 1024, "ValueError: In %s: Provided %d weights-per-particle, but the code was compiled with MAX_NUM_WEIGHTS=%d.\n",
+                 __FUNCTION__, found_weights, MAX_NUM_WEIGHTS);
+        countpairs_error_out(module, msg);
+        return EXIT_FAILURE;
+    }
+    return EXIT_SUCCESS;
+}
+
+
 static PyObject *countpairs_countpairs(PyObject *self, PyObject *args, PyObject *kwargs)
 {
     //Error-handling is global in python2 -> stored in struct module_state _struct declared at the top of this file
@@ -1097,11 +1910,13 @@ static PyObject *countpairs_countpairs(PyObject *self, PyObject *args, PyObject
     PyObject *module = self;
 #endif
     PyArrayObject *x1_obj=NULL, *y1_obj=NULL, *z1_obj=NULL, *weights1_obj=NULL;
+    PyArrayObject *index1_obj=NULL, *index2_obj=NULL;
     PyArrayObject *x2_obj=NULL, *y2_obj=NULL, *z2_obj=NULL, *weights2_obj=NULL;
 
     int autocorr=0;
     int nthreads=4;
-    char *binfile, *weighting_method_str = NULL;
+    PyObject *binfile_obj = NULL;
+    char *weighting_method_str = NULL;
 
     struct config_options options = get_config_options();
     options.verbose = 0;
@@ -1109,6 +1924,8 @@ static PyObject *countpairs_countpairs(PyObject *self, PyObject *args, PyObject
     options.periodic = 1;
     options.need_avg_sep = 0;
     options.c_api_timer = 0;
+    int8_t c_api_phase_timer = 0;
+    int c_cell_timer = 0;
 
     int8_t xbin_ref=options.bin_refine_factors[0],
         ybin_ref=options.bin_refine_factors[1],
@@ -1137,12 +1954,23 @@ static PyObject *countpairs_countpairs(PyObject *self, PyObject *args, PyObject
         "c_api_timer",
         "isa",/* instruction set to use of type enum isa; valid values are AVX, SSE, FALLBACK */
         "weight_type",
+        "mixed_precision",
+        "max_position_error",
+        "permute_in_place",
+        "original_index1",
+        "original_index2",
+        "query_mode",
+        "c_api_phase_timer",
+        "c_cell_timer",
+        "c_perf_counters",
+        "c_api_phase_memory",
+        "grid_file",
         NULL
     };
 
     // Note: type 'O!' doesn't allow for None to be passed, which we might want to do.
-    if ( ! PyArg_ParseTupleAndKeywords(args, kwargs, "iisO!O!O!|O!O!O!O!O!bbdbbbbhbis", kwlist,
-                                       &autocorr,&nthreads,&binfile,
+    if ( ! PyArg_ParseTupleAndKeywords(args, kwargs, "iiOO!O!O!|O!O!O!O!O!bbdbbbbhbisbdbO!O!bbibbz", kwlist,
+                                       &autocorr,&nthreads,&binfile_obj,
                                        &PyArray_Type,&x1_obj,
                                        &PyArray_Type,&y1_obj,
                                        &PyArray_Type,&z1_obj,
@@ -1159,7 +1987,18 @@ static PyObject *countpairs_countpairs(PyObject *self, PyObject *args, PyObject
                                        &(options.max_cells_per_dim),
                                        &(options.c_api_timer),
                                        &(options.instruction_set),
-                                       &weighting_method_str)
+                                       &weighting_method_str,
+                                       &(options.mixed_precision),
+                                       &(options.max_position_error),
+                                       &(options.permute_in_place),
+                                       &PyArray_Type,&index1_obj,
+                                       &PyArray_Type,&index2_obj,
+                                       &(options.query_mode),
+                                       &c_api_phase_timer,
+                                       &c_cell_timer,
+                                       &(options.c_perf_counters),
+                                       &(options.c_api_phase_memory),
+                                       &(options.grid_file))
 
          ) {
 
@@ -1198,12 +2037,28 @@ static PyObject *countpairs_countpairs(PyObject *self, PyObject *args, PyObject
     /* We have numpy arrays and all the required inputs*/
     /* How many data points are there? And are they all of floating point type */
     size_t element_size;
-    const int64_t ND1 = check_dims_and_datatype(module, x1_obj, y1_obj, z1_obj, weights1_obj, &element_size);
+    int64_t ND1 = check_dims_and_datatype(module, x1_obj, y1_obj, z1_obj, weights1_obj, &element_size);
     if(ND1 == -1) {
         //Error has already been set -> simply return
         Py_RETURN_NONE;
     }
 
+    /* With empty positions, the first set of points is read from the gridded catalog in grid_file */
+    int64_t grid_np = -1;
+    int grid_num_weights = 0;
+    if(get_gridded_catalog_size(module, options.grid_file, &grid_np, &grid_num_weights) != EXIT_SUCCESS) {
+        Py_RETURN_NONE;
+    }
+    const int from_grid_file = grid_np >= 0 && ND1 == 0;
+    if(grid_np >= 0 && (! from_grid_file || weights1_obj != NULL)) {
+        char msg[1024];
+        snprintf(msg, 1024, "ValueError: In %s: The first set of points is read from the existing gridded catalog `%s'. "
+                 "Please pass empty X1/Y1/Z1 and no weights1 (or remove the file to grid new points)\n",
+                 __FUNCTION__, options.grid_file);
+        countpairs_error_out(module, msg);
+        Py_RETURN_NONE;
+    }
+
     /* Ensure the weights are of the right shape (n_weights, n_particles) */
     if(weights1_obj != NULL){
         // A numpy dimension of length -1 will be expanded to n_weights
@@ -1221,7 +2076,7 @@ static PyObject *countpairs_countpairs(PyObject *self, PyObject *args, PyObject
         countpairs_error_out(module, msg);
         Py_RETURN_NONE;
     }
-    int found_weights = weights1_obj == NULL ? 0 : PyArray_SHAPE(weights1_obj)[0];
+    int found_weights = weights1_obj == NULL ? (from_grid_file ? grid_num_weights:0) : PyArray_SHAPE(weights1_obj)[0];
     struct extra_options extra = get_extra_options(weighting_method);
     if(extra.weights0.num_weights > 0 && extra.weights0.num_weights != found_weights){
         char msg[1024];
@@ -1248,7 +2103,7 @@ static PyObject *countpairs_countpairs(PyObject *self, PyObject *args, PyObject
             countpairs_error_out(module, msg);
             Py_RETURN_NONE;
         }
-        if((weights1_obj == NULL) != (weights2_obj == NULL)){
+        if(! from_grid_file && (weights1_obj == NULL) != (weights2_obj == NULL)){
             snprintf(msg, 1024, "ValueError: In %s: If autocorr is 0, must pass either zero or two sets of weights.\n",
                      __FUNCTION__);
             countpairs_error_out(module, msg);
@@ -1277,16 +2132,47 @@ static PyObject *countpairs_countpairs(PyObject *self, PyObject *args, PyObject
     }
 
 
+    /* The positions and weights are reordered in place by the C library */
+    if(options.permute_in_place) {
+        PyArrayObject *in_place1[] = {x1_obj, y1_obj, z1_obj, weights1_obj};
+        if(check_in_place_arrays(module, in_place1, 4, index1_obj, ND1) != EXIT_SUCCESS) {
+            Py_RETURN_NONE;
+        }
+        options.original_index1 = (int64_t *) PyArray_DATA(index1_obj);
+        if(autocorr == 0) {
+            PyArrayObject *in_place2[] = {x2_obj, y2_obj, z2_obj, weights2_obj};
+            if(check_in_place_arrays(module, in_place2, 4, index2_obj, ND2) != EXIT_SUCCESS) {
+                Py_RETURN_NONE;
+            }
+            if(PyArray_DATA(x1_obj) == PyArray_DATA(x2_obj) || PyArray_DATA(index1_obj) == PyArray_DATA(index2_obj)) {
+                char msg[1024];
+                snprintf(msg, 1024, "ValueError: In %s: permute_in_place requires the two sets of points (and their "
+                         "original indices) to be separate arrays\n", __FUNCTION__);
+                countpairs_error_out(module, msg);
+                Py_RETURN_NONE;
+            }
+            options.original_index2 = (int64_t *) PyArray_DATA(index2_obj);
+        }
+    }
+
     /*
        Interpret the input objects as numpy arrays (of whatever the input type the python object has).
        NULL initialization is necessary since we might be calling XDECREF.
        The input objects can be converted into the required DOUBLE array.
     */
     const int requirements = NPY_ARRAY_IN_ARRAY;
+    /* The positions are read through their strides (e.g., the columns of an (N, 3) array) instead of being copied */
+    options.position_stride1 = get_position_stride(x1_obj, y1_obj, z1_obj);
+    const int position_requirements1 = options.position_stride1 != 0 ? NPY_ARRAY_ALIGNED:requirements;
+    int position_requirements2 = requirements;
+    if(autocorr == 0) {
+        options.position_stride2 = get_position_stride(x2_obj, y2_obj, z2_obj);
+        position_requirements2 = options.position_stride2 != 0 ? NPY_ARRAY_ALIGNED:requirements;
+    }
     PyObject *x1_array = NULL, *y1_array = NULL, *z1_array = NULL, *weights1_array = NULL;
-    x1_array = PyArray_FromArray(x1_obj, NOTYPE_DESCR, requirements);
-    y1_array = PyArray_FromArray(y1_obj, NOTYPE_DESCR, requirements);
-    z1_array = PyArray_FromArray(z1_obj, NOTYPE_DESCR, requirements);
+    x1_array = PyArray_FromArray(x1_obj, NOTYPE_DESCR, position_requirements1);
+    y1_array = PyArray_FromArray(y1_obj, NOTYPE_DESCR, position_requirements1);
+    z1_array = PyArray_FromArray(z1_obj, NOTYPE_DESCR, position_requirements1);
     if(weights1_obj != NULL){
         weights1_array = PyArray_FromArray(weights1_obj, NOTYPE_DESCR, requirements);
     }
@@ -1294,9 +2180,9 @@ static PyObject *countpairs_countpairs(PyObject *self, PyObject *args, PyObject
     /* NULL initialization is necessary since we might be calling XDECREF*/
     PyObject *x2_array = NULL, *y2_array = NULL, *z2_array = NULL, *weights2_array = NULL;
     if(autocorr == 0) {
-        x2_array = PyArray_FromArray(x2_obj, NOTYPE_DESCR, requirements);
-        y2_array = PyArray_FromArray(y2_obj, NOTYPE_DESCR, requirements);
-        z2_array = PyArray_FromArray(z2_obj, NOTYPE_DESCR, requirements);
+        x2_array = PyArray_FromArray(x2_obj, NOTYPE_DESCR, position_requirements2);
+        y2_array = PyArray_FromArray(y2_obj, NOTYPE_DESCR, position_requirements2);
+        z2_array = PyArray_FromArray(z2_obj, NOTYPE_DESCR, position_requirements2);
         if(weights2_obj != NULL){
             weights2_array = PyArray_FromArray(weights2_obj, NOTYPE_DESCR, requirements);
         }
@@ -1347,12 +2233,31 @@ static PyObject *countpairs_countpairs(PyObject *self, PyObject *args, PyObject
             extra.weights1.weights[w] = (char *) weights2 + w*ND2*element_size;
         }
     }
+    if(from_grid_file) {
+        ND1 = grid_np;
+        X1 = Y1 = Z1 = NULL;
+    }
+
+    /* The bins are either a file name, or an array of bin-edges that is passed on directly */
+    const char *binfile = NULL;
+    PyObject *bin_edges_array = NULL;
+    if(get_binfile_or_bin_edges(module, binfile_obj, &binfile, &bin_edges_array, &options) != EXIT_SUCCESS) {
+        Py_DECREF(x1_array);Py_DECREF(y1_array);Py_DECREF(z1_array);Py_XDECREF(weights1_array);
+        Py_XDECREF(x2_array);Py_XDECREF(y2_array);Py_XDECREF(z2_array);Py_XDECREF(weights2_array);
+        Py_RETURN_NONE;
+    }
 
     NPY_BEGIN_THREADS_DEF;
     NPY_BEGIN_THREADS;
 
     results_countpairs results;
     options.float_type = element_size;
+    if(c_api_phase_timer) {
+        options.c_api_timer = 1;
+    }
+    /* c_cell_timer=k times every k-th cell pair */
+    options.c_cell_timer = c_cell_timer > 0 ? 1:0;
+    options.c_cell_timer_sampling = c_cell_timer;
     double c_api_time = 0.0;
     int status = countpairs(ND1,X1,Y1,Z1,
                             ND2,X2,Y2,Z2,
@@ -1368,6 +2273,7 @@ static PyObject *countpairs_countpairs(PyObject *self, PyObject *args, PyObject
     NPY_END_THREADS;
 
     /* Clean up. */
+    Py_XDECREF(bin_edges_array);
     Py_DECREF(x1_array);Py_DECREF(y1_array);Py_DECREF(z1_array);Py_XDECREF(weights1_array);
     Py_XDECREF(x2_array);Py_XDECREF(y2_array);Py_XDECREF(z2_array);Py_XDECREF(weights2_array);
 
@@ -1389,7 +2295,17 @@ static PyObject *countpairs_countpairs(PyObject *self, PyObject *args, PyObject
     }
 
     free_results(&results);
-    return Py_BuildValue("(Od)", ret, c_api_time);
+    if(options.c_cell_timer) {
+        PyObject *c_cell_time = cell_timings_as_array(&options);
+        if(c_api_phase_timer) {
+            return append_phase_memory(append_perf_counts(Py_BuildValue("(OdNN)", ret, c_api_time, c_cell_time, api_phase_times_as_dict(&options)), &options), &options);
+        }
+        return append_phase_memory(append_perf_counts(Py_BuildValue("(OdN)", ret, c_api_time, c_cell_time), &options), &options);
+    }
+    if(c_api_phase_timer) {
+        return append_phase_memory(append_perf_counts(Py_BuildValue("(OdN)", ret, c_api_time, api_phase_times_as_dict(&options)), &options), &options);
+    }
+    return append_phase_memory(append_perf_counts(Py_BuildValue("(Od)", ret, c_api_time), &options), &options);
 }
 
 
@@ -1403,17 +2319,22 @@ static PyObject *countpairs_countpairs_rp_pi(PyObject *self, PyObject *args, PyO
     PyObject *module = self;
 #endif
     PyArrayObject *x1_obj=NULL, *y1_obj=NULL, *z1_obj=NULL, *weights1_obj=NULL;
+    PyArrayObject *index1_obj=NULL, *index2_obj=NULL;
     PyArrayObject *x2_obj=NULL, *y2_obj=NULL, *z2_obj=NULL, *weights2_obj=NULL;
     int autocorr=0;
     int nthreads=4;
 
-    double pimax;
-    char *binfile, *weighting_method_str = NULL;
+    PyArrayObject *velocities1_obj=NULL, *velocities2_obj=NULL;
+    double pimax, rsd_factor=1.0;
+    PyObject *binfile_obj = NULL;
+    char *weighting_method_str = NULL, *los_str = NULL;
     struct config_options options = get_config_options();
     options.verbose = 0;
     options.instruction_set = -1;
     options.periodic = 1;
     options.c_api_timer = 0;
+    int8_t c_api_phase_timer = 0;
+    int c_cell_timer = 0;
     int8_t xbin_ref=options.bin_refine_factors[0],
         ybin_ref=options.bin_refine_factors[1],
         zbin_ref=options.bin_refine_factors[2];
@@ -1442,11 +2363,26 @@ static PyObject *countpairs_countpairs_rp_pi(PyObject *self, PyObject *args, PyO
         "c_api_timer",
         "isa",/* instruction set to use of type enum isa; valid values are AVX, SSE, FALLBACK */
         "weight_type",
+        "los",
+        "velocities1",
+        "velocities2",
+        "rsd_factor",
+        "mixed_precision",
+        "max_position_error",
+        "permute_in_place",
+        "original_index1",
+        "original_index2",
+        "query_mode",
+        "c_api_phase_timer",
+        "c_cell_timer",
+        "c_perf_counters",
+        "c_api_phase_memory",
+        "grid_file",
         NULL
     };
 
-    if ( ! PyArg_ParseTupleAndKeywords(args, kwargs, "iidsO!O!O!|O!O!O!O!O!bbdbbbbhbis", kwlist,
-                                       &autocorr,&nthreads,&pimax,&binfile,
+    if ( ! PyArg_ParseTupleAndKeywords(args, kwargs, "iidOO!O!O!|O!O!O!O!O!bbdbbbbhbissO!O!dbdbO!O!bbibbz", kwlist,
+                                       &autocorr,&nthreads,&pimax,&binfile_obj,
                                        &PyArray_Type,&x1_obj,
                                        &PyArray_Type,&y1_obj,
                                        &PyArray_Type,&z1_obj,
@@ -1463,7 +2399,22 @@ static PyObject *countpairs_countpairs_rp_pi(PyObject *self, PyObject *args, PyO
                                        &(options.max_cells_per_dim),
                                        &(options.c_api_timer),
                                        &(options.instruction_set),
-                                       &weighting_method_str)
+                                       &weighting_method_str,
+                                       &los_str,
+                                       &PyArray_Type,&velocities1_obj,
+                                       &PyArray_Type,&velocities2_obj,
+                                       &rsd_factor,
+                                       &(options.mixed_precision),
+                                       &(options.max_position_error),
+                                       &(options.permute_in_place),
+                                       &PyArray_Type,&index1_obj,
+                                       &PyArray_Type,&index2_obj,
+                                       &(options.query_mode),
+                                       &c_api_phase_timer,
+                                       &c_cell_timer,
+                                       &(options.c_perf_counters),
+                                       &(options.c_api_phase_memory),
+                                       &(options.grid_file))
 
          ) {
         PyObject_Print(kwargs, stdout, 0);
@@ -1499,12 +2450,28 @@ static PyObject *countpairs_countpairs_rp_pi(PyObject *self, PyObject *args, PyO
 
     size_t element_size;
     /* How many data points are there? And are they all of floating point type */
-    const int64_t ND1 = check_dims_and_datatype(module, x1_obj, y1_obj, z1_obj, weights1_obj, &element_size);
+    int64_t ND1 = check_dims_and_datatype(module, x1_obj, y1_obj, z1_obj, weights1_obj, &element_size);
     if(ND1 == -1) {
         //Error has already been set -> simply return
         Py_RETURN_NONE;
     }
 
+    /* With empty positions, the first set of points is read from the gridded catalog in grid_file */
+    int64_t grid_np = -1;
+    int grid_num_weights = 0;
+    if(get_gridded_catalog_size(module, options.grid_file, &grid_np, &grid_num_weights) != EXIT_SUCCESS) {
+        Py_RETURN_NONE;
+    }
+    const int from_grid_file = grid_np >= 0 && ND1 == 0;
+    if(grid_np >= 0 && (! from_grid_file || weights1_obj != NULL)) {
+        char msg[1024];
+        snprintf(msg, 1024, "ValueError: In %s: The first set of points is read from the existing gridded catalog `%s'. "
+                 "Please pass empty X1/Y1/Z1 and no weights1 (or remove the file to grid new points)\n",
+                 __FUNCTION__, options.grid_file);
+        countpairs_error_out(module, msg);
+        Py_RETURN_NONE;
+    }
+
     /* Ensure the weights are of the right shape (n_weights, n_particles) */
     if(weights1_obj != NULL){
         // A numpy dimension of length -1 will be expanded to n_weights
@@ -1513,6 +2480,21 @@ static PyObject *countpairs_countpairs_rp_pi(PyObject *self, PyObject *args, PyO
         weights1_obj = (PyArrayObject *) PyArray_Newshape(weights1_obj, &pdims, NPY_CORDER);
     }
 
+    /* Validate the user's choice of line-of-sight */
+    if(get_los_by_name(los_str, &(options.los)) != EXIT_SUCCESS) {
+        char msg[1024];
+        snprintf(msg, 1024, "ValueError: In %s: unknown los = %s! Expected one of 'x', 'y', 'z' or 'all'", __FUNCTION__, los_str);
+        countpairs_error_out(module, msg);
+        Py_RETURN_NONE;
+    }
+    if(autocorr == 0 && (velocities1_obj == NULL) != (velocities2_obj == NULL)) {
+        char msg[1024];
+        snprintf(msg, 1024, "ValueError: In %s: If autocorr is 0, must pass either zero or two sets of velocities.\n",
+                 __FUNCTION__);
+        countpairs_error_out(module, msg);
+        Py_RETURN_NONE;
+    }
+
     /* Validate the user's choice of weighting method */
     weight_method_t weighting_method;
     int wstatus = get_weight_method_by_name(weighting_method_str, &weighting_method);
@@ -1522,7 +2504,7 @@ static PyObject *countpairs_countpairs_rp_pi(PyObject *self, PyObject *args, PyO
         countpairs_error_out(module, msg);
         Py_RETURN_NONE;
     }
-    int found_weights = weights1_obj == NULL ? 0 : PyArray_SHAPE(weights1_obj)[0];
+    int found_weights = weights1_obj == NULL ? (from_grid_file ? grid_num_weights:0) : PyArray_SHAPE(weights1_obj)[0];
     struct extra_options extra = get_extra_options(weighting_method);
     if(extra.weights0.num_weights > 0 && extra.weights0.num_weights != found_weights){
         char msg[1024];
@@ -1549,7 +2531,7 @@ static PyObject *countpairs_countpairs_rp_pi(PyObject *self, PyObject *args, PyO
             countpairs_error_out(module, msg);
             Py_RETURN_NONE;
         }
-        if((weights1_obj == NULL) != (weights2_obj == NULL)){
+        if(! from_grid_file && (weights1_obj == NULL) != (weights2_obj == NULL)){
             snprintf(msg, 1024, "ValueError: In %s: If autocorr is 0, must pass either zero or two sets of weights.\n",
                      __FUNCTION__);
             countpairs_error_out(module, msg);
@@ -1577,21 +2559,52 @@ static PyObject *countpairs_countpairs_rp_pi(PyObject *self, PyObject *args, PyO
         }
     }
 
+    /* The positions, weights and velocities are reordered in place by the C library */
+    if(options.permute_in_place) {
+        PyArrayObject *in_place1[] = {x1_obj, y1_obj, z1_obj, weights1_obj, velocities1_obj};
+        if(check_in_place_arrays(module, in_place1, 5, index1_obj, ND1) != EXIT_SUCCESS) {
+            Py_RETURN_NONE;
+        }
+        options.original_index1 = (int64_t *) PyArray_DATA(index1_obj);
+        if(autocorr == 0) {
+            PyArrayObject *in_place2[] = {x2_obj, y2_obj, z2_obj, weights2_obj, velocities2_obj};
+            if(check_in_place_arrays(module, in_place2, 5, index2_obj, ND2) != EXIT_SUCCESS) {
+                Py_RETURN_NONE;
+            }
+            if(PyArray_DATA(x1_obj) == PyArray_DATA(x2_obj) || PyArray_DATA(index1_obj) == PyArray_DATA(index2_obj)) {
+                char msg[1024];
+                snprintf(msg, 1024, "ValueError: In %s: permute_in_place requires the two sets of points (and their "
+                         "original indices) to be separate arrays\n", __FUNCTION__);
+                countpairs_error_out(module, msg);
+                Py_RETURN_NONE;
+            }
+            options.original_index2 = (int64_t *) PyArray_DATA(index2_obj);
+        }
+    }
+
     /* Interpret the input objects as numpy arrays. */
     const int requirements = NPY_ARRAY_IN_ARRAY;
+    /* The positions are read through their strides (e.g., the columns of an (N, 3) array) instead of being copied */
+    options.position_stride1 = get_position_stride(x1_obj, y1_obj, z1_obj);
+    const int position_requirements1 = options.position_stride1 != 0 ? NPY_ARRAY_ALIGNED:requirements;
+    int position_requirements2 = requirements;
+    if(autocorr == 0) {
+        options.position_stride2 = get_position_stride(x2_obj, y2_obj, z2_obj);
+        position_requirements2 = options.position_stride2 != 0 ? NPY_ARRAY_ALIGNED:requirements;
+    }
     PyObject *x1_array = NULL, *y1_array = NULL, *z1_array = NULL, *weights1_array = NULL;
     PyObject *x2_array = NULL, *y2_array = NULL, *z2_array = NULL, *weights2_array = NULL;
-    x1_array = PyArray_FromArray(x1_obj, NOTYPE_DESCR, requirements);
-    y1_array = PyArray_FromArray(y1_obj, NOTYPE_DESCR, requirements);
-    z1_array = PyArray_FromArray(z1_obj, NOTYPE_DESCR, requirements);
+    x1_array = PyArray_FromArray(x1_obj, NOTYPE_DESCR, position_requirements1);
+    y1_array = PyArray_FromArray(y1_obj, NOTYPE_DESCR, position_requirements1);
+    z1_array = PyArray_FromArray(z1_obj, NOTYPE_DESCR, position_requirements1);
     if(weights1_obj != NULL){
         weights1_array = PyArray_FromArray(weights1_obj, NOTYPE_DESCR, requirements);
     }
 
     if(autocorr == 0) {
-        x2_array = PyArray_FromArray(x2_obj, NOTYPE_DESCR, requirements);
-        y2_array = PyArray_FromArray(y2_obj, NOTYPE_DESCR, requirements);
-        z2_array = PyArray_FromArray(z2_obj, NOTYPE_DESCR, requirements);
+        x2_array = PyArray_FromArray(x2_obj, NOTYPE_DESCR, position_requirements2);
+        y2_array = PyArray_FromArray(y2_obj, NOTYPE_DESCR, position_requirements2);
+        z2_array = PyArray_FromArray(z2_obj, NOTYPE_DESCR, position_requirements2);
         if(weights2_obj != NULL){
             weights2_array = PyArray_FromArray(weights2_obj, NOTYPE_DESCR, requirements);
         }
@@ -1642,12 +2655,43 @@ static PyObject *countpairs_countpairs_rp_pi(PyObject *self, PyObject *args, PyO
             extra.weights1.weights[w] = (char *) weights2 + w*ND2*element_size;
         }
     }
+    if(from_grid_file) {
+        ND1 = grid_np;
+        X1 = Y1 = Z1 = NULL;
+    }
+
+    /* Pack the velocities (for the redshift-space displacements) into extra_options */
+    PyObject *velocities1_array = NULL, *velocities2_array = NULL;
+    if(get_velocities(module, velocities1_obj, ND1, element_size, &velocities1_array, extra.velocities0) != EXIT_SUCCESS ||
+       (autocorr == 0 && get_velocities(module, velocities2_obj, ND2, element_size, &velocities2_array, extra.velocities1) != EXIT_SUCCESS)) {
+        Py_DECREF(x1_array);Py_DECREF(y1_array);Py_DECREF(z1_array);Py_XDECREF(weights1_array);
+        Py_XDECREF(x2_array);Py_XDECREF(y2_array);Py_XDECREF(z2_array);Py_XDECREF(weights2_array);
+        Py_XDECREF(velocities1_array);
+        Py_RETURN_NONE;
+    }
+    extra.rsd_factor = velocities1_obj != NULL ? rsd_factor:0.0;
+
+    /* The bins are either a file name, or an array of bin-edges that is passed on directly */
+    const char *binfile = NULL;
+    PyObject *bin_edges_array = NULL;
+    if(get_binfile_or_bin_edges(module, binfile_obj, &binfile, &bin_edges_array, &options) != EXIT_SUCCESS) {
+        Py_DECREF(x1_array);Py_DECREF(y1_array);Py_DECREF(z1_array);Py_XDECREF(weights1_array);
+        Py_XDECREF(x2_array);Py_XDECREF(y2_array);Py_XDECREF(z2_array);Py_XDECREF(weights2_array);
+        Py_XDECREF(velocities1_array);Py_XDECREF(velocities2_array);
+        Py_RETURN_NONE;
+    }
 
     NPY_BEGIN_THREADS_DEF;
     NPY_BEGIN_THREADS;
 
     options.float_type = element_size;
     results_countpairs_rp_pi results;
+    if(c_api_phase_timer) {
+        options.c_api_timer = 1;
+    }
+    /* c_cell_timer=k times every k-th cell pair */
+    options.c_cell_timer = c_cell_timer > 0 ? 1:0;
+    options.c_cell_timer_sampling = c_cell_timer;
     double c_api_time = 0.0;
     int status = countpairs_rp_pi(ND1,X1,Y1,Z1,
                                   ND2,X2,Y2,Z2,
@@ -1664,33 +2708,49 @@ static PyObject *countpairs_countpairs_rp_pi(PyObject *self, PyObject *args, PyO
     NPY_END_THREADS;
 
     /* Clean up. */
+    Py_XDECREF(bin_edges_array);
     Py_DECREF(x1_array);Py_DECREF(y1_array);Py_DECREF(z1_array);Py_XDECREF(weights1_array);//x1 should absolutely not be NULL
     Py_XDECREF(x2_array);Py_XDECREF(y2_array);Py_XDECREF(z2_array);Py_XDECREF(weights2_array);//x2 might be NULL depending on value of autocorr
+    Py_XDECREF(velocities1_array);Py_XDECREF(velocities2_array);
     if(status != EXIT_SUCCESS) {
         Py_RETURN_NONE;
     }
 
 
     /* Build the output list */
+    /* With multiple lines-of-sight, the bins for each los follow one another */
     PyObject *ret = PyList_New(0);//create an empty list
-    double rlow=results.rupp[0];
     const double dpi = pimax/(double)results.npibin ;
-
-    for(int i=1;i<results.nbin;i++) {
-        for(int j=0;j<results.npibin;j++) {
-            const int bin_index = i*(results.npibin + 1) + j;
-            PyObject *item = NULL;
-            const double rpavg = results.rpavg[bin_index];
-            const double weight_avg = results.weightavg[bin_index];
-            item = Py_BuildValue("(ddddkd)", rlow,results.rupp[i],rpavg,(j+1)*dpi,results.npairs[bin_index], weight_avg);
-            PyList_Append(ret, item);
-            Py_XDECREF(item);
+    const int64_t nbins_per_los = (int64_t) (results.nbin + 1) * (results.npibin + 1);
+
+    for(int ilos=0;ilos<results.nlos;ilos++) {
+        double rlow=results.rupp[0];
+        for(int i=1;i<results.nbin;i++) {
+            for(int j=0;j<results.npibin;j++) {
+                const int64_t bin_index = ilos*nbins_per_los + i*(results.npibin + 1) + j;
+                PyObject *item = NULL;
+                const double rpavg = results.rpavg[bin_index];
+                const double weight_avg = results.weightavg[bin_index];
+                item = Py_BuildValue("(ddddkd)", rlow,results.rupp[i],rpavg,(j+1)*dpi,results.npairs[bin_index], weight_avg);
+                PyList_Append(ret, item);
+                Py_XDECREF(item);
+            }
+            rlow=results.rupp[i];
         }
-        rlow=results.rupp[i];
     }
     free_results_rp_pi(&results);
 
-    return Py_BuildValue("(Od)", ret, c_api_time);
+    if(options.c_cell_timer) {
+        PyObject *c_cell_time = cell_timings_as_array(&options);
+        if(c_api_phase_timer) {
+            return append_phase_memory(append_perf_counts(Py_BuildValue("(OdNN)", ret, c_api_time, c_cell_time, api_phase_times_as_dict(&options)), &options), &options);
+        }
+        return append_phase_memory(append_perf_counts(Py_BuildValue("(OdN)", ret, c_api_time, c_cell_time), &options), &options);
+    }
+    if(c_api_phase_timer) {
+        return append_phase_memory(append_perf_counts(Py_BuildValue("(OdN)", ret, c_api_time, api_phase_times_as_dict(&options)), &options), &options);
+    }
+    return append_phase_memory(append_perf_counts(Py_BuildValue("(Od)", ret, c_api_time), &options), &options);
 }
 
 static PyObject *countpairs_countpairs_wp(PyObject *self, PyObject *args, PyObject *kwargs)
@@ -1702,10 +2762,12 @@ static PyObject *countpairs_countpairs_wp(PyObject *self, PyObject *args, PyObje
     //In python3, self is simply the module object that was returned earlier by init
     PyObject *module = self;
 #endif
-    PyArrayObject *x1_obj=NULL, *y1_obj=NULL, *z1_obj=NULL, *weights1_obj=NULL;
+    PyArrayObject *x1_obj=NULL, *y1_obj=NULL, *z1_obj=NULL, *weights1_obj=NULL, *pimax_list_obj=NULL;
+    PyArrayObject *index1_obj=NULL;
     double boxsize,pimax;
     int nthreads=1;
-    char *binfile, *weighting_method_str = NULL;
+    PyObject *binfile_obj = NULL;
+    char *weighting_method_str = NULL;
     size_t element_size;
 
     struct config_options options = get_config_options();
@@ -1714,7 +2776,8 @@ static PyObject *countpairs_countpairs_wp(PyObject *self, PyObject *args, PyObje
     options.need_avg_sep = 0;
     options.periodic = 1;
     options.c_api_timer = 0;
-    options.c_cell_timer = 0;
+    int8_t c_api_phase_timer = 0;
+    int c_cell_timer = 0;
     int8_t xbin_ref=options.bin_refine_factors[0],
         ybin_ref=options.bin_refine_factors[1],
         zbin_ref=options.bin_refine_factors[2];
@@ -1738,11 +2801,19 @@ static PyObject *countpairs_countpairs_wp(PyObject *self, PyObject *args, PyObje
         "c_api_timer",
         "c_cell_timer",
         "isa",/* instruction set to use of type enum isa; valid values are AVX, SSE, FALLBACK */
+        "pimax_list",
+        "mixed_precision",
+        "max_position_error",
+        "permute_in_place",
+        "original_index1",
+        "c_api_phase_timer",
+        "c_perf_counters",
+        "c_api_phase_memory",
         NULL
     };
 
-    if( ! PyArg_ParseTupleAndKeywords(args, kwargs, "ddisO!O!O!|O!sbbbbbhbbi", kwlist,
-                                      &boxsize,&pimax,&nthreads,&binfile,
+    if( ! PyArg_ParseTupleAndKeywords(args, kwargs, "ddiOO!O!O!|O!sbbbbbhbiiO!bdbO!bbb", kwlist,
+                                      &boxsize,&pimax,&nthreads,&binfile_obj,
                                       &PyArray_Type,&x1_obj,
                                       &PyArray_Type,&y1_obj,
                                       &PyArray_Type,&z1_obj,
@@ -1753,8 +2824,16 @@ static PyObject *countpairs_countpairs_wp(PyObject *self, PyObject *args, PyObje
                                       &xbin_ref, &ybin_ref, &zbin_ref,
                                       &(options.max_cells_per_dim),
                                       &(options.c_api_timer),
-                                      &(options.c_cell_timer),
-                                      &(options.instruction_set))
+                                      &c_cell_timer,
+                                      &(options.instruction_set),
+                                      &PyArray_Type,&pimax_list_obj,
+                                      &(options.mixed_precision),
+                                      &(options.max_position_error),
+                                      &(options.permute_in_place),
+                                      &PyArray_Type,&index1_obj,
+                                       &c_api_phase_timer,
+                                       &(options.c_perf_counters),
+                                       &(options.c_api_phase_memory))
 
         ){
         PyObject_Print(kwargs, stdout, 0);
@@ -1831,12 +2910,24 @@ static PyObject *countpairs_countpairs_wp(PyObject *self, PyObject *args, PyObje
         Py_RETURN_NONE;
     }
 
+    /* The positions and weights are reordered in place by the C library */
+    if(options.permute_in_place) {
+        PyArrayObject *in_place1[] = {x1_obj, y1_obj, z1_obj, weights1_obj};
+        if(check_in_place_arrays(module, in_place1, 4, index1_obj, ND1) != EXIT_SUCCESS) {
+            Py_RETURN_NONE;
+        }
+        options.original_index1 = (int64_t *) PyArray_DATA(index1_obj);
+    }
+
     /* Interpret the input objects as numpy arrays. */
     const int requirements = NPY_ARRAY_IN_ARRAY;
+    /* The positions are read through their strides (e.g., the columns of an (N, 3) array) instead of being copied */
+    options.position_stride1 = get_position_stride(x1_obj, y1_obj, z1_obj);
+    const int position_requirements1 = options.position_stride1 != 0 ? NPY_ARRAY_ALIGNED:requirements;
     PyObject *x1_array = NULL, *y1_array = NULL, *z1_array = NULL, *weights1_array = NULL;
-    x1_array = PyArray_FromArray(x1_obj, NOTYPE_DESCR, requirements);
-    y1_array = PyArray_FromArray(y1_obj, NOTYPE_DESCR, requirements);
-    z1_array = PyArray_FromArray(z1_obj, NOTYPE_DESCR, requirements);
+    x1_array = PyArray_FromArray(x1_obj, NOTYPE_DESCR, position_requirements1);
+    y1_array = PyArray_FromArray(y1_obj, NOTYPE_DESCR, position_requirements1);
+    z1_array = PyArray_FromArray(z1_obj, NOTYPE_DESCR, position_requirements1);
     if(weights1_obj != NULL){
         weights1_array = PyArray_FromArray(weights1_obj, NOTYPE_DESCR, requirements);
     }
@@ -1870,12 +2961,44 @@ static PyObject *countpairs_countpairs_wp(PyObject *self, PyObject *args, PyObje
         extra.weights0.weights[w] = (char *) weights1 + w*ND1*element_size;
     }
 
+    /* The list of pimax values is always in double precision */
+    PyObject *pimax_list_array = NULL;
+    if(pimax_list_obj != NULL) {
+        pimax_list_array = PyArray_FromArray(pimax_list_obj, PyArray_DescrFromType(NPY_DOUBLE), NPY_ARRAY_IN_ARRAY);
+        if(pimax_list_array == NULL || PyArray_NDIM((PyArrayObject *) pimax_list_array) != 1) {
+            Py_DECREF(x1_array);Py_DECREF(y1_array);Py_DECREF(z1_array);Py_XDECREF(weights1_array);
+            Py_XDECREF(pimax_list_array);
+            char msg[1024];
+            snprintf(msg, 1024, "TypeError: In %s: Could not convert pimax_list to a 1-D array of doubles",
+                     __FUNCTION__);
+            countpairs_error_out(module, msg);
+            Py_RETURN_NONE;
+        }
+        extra.pimax_list = (double *) PyArray_DATA((PyArrayObject *) pimax_list_array);
+        extra.num_pimax = (int) PyArray_SIZE((PyArrayObject *) pimax_list_array);
+    }
+
+    /* The bins are either a file name, or an array of bin-edges that is passed on directly */
+    const char *binfile = NULL;
+    PyObject *bin_edges_array = NULL;
+    if(get_binfile_or_bin_edges(module, binfile_obj, &binfile, &bin_edges_array, &options) != EXIT_SUCCESS) {
+        Py_DECREF(x1_array);Py_DECREF(y1_array);Py_DECREF(z1_array);Py_XDECREF(weights1_array);
+        Py_XDECREF(pimax_list_array);
+        Py_RETURN_NONE;
+    }
+
     NPY_BEGIN_THREADS_DEF;
     NPY_BEGIN_THREADS;
 
 
     results_countpairs_wp results;
     options.float_type = element_size;
+    if(c_api_phase_timer) {
+        options.c_api_timer = 1;
+    }
+    /* c_cell_timer=k times every k-th cell pair */
+    options.c_cell_timer = c_cell_timer > 0 ? 1:0;
+    options.c_cell_timer_sampling = c_cell_timer;
     double c_api_time = 0.0;
     int status = countpairs_wp(ND1,X1,Y1,Z1,
                                boxsize,
@@ -1891,7 +3014,9 @@ static PyObject *countpairs_countpairs_wp(PyObject *self, PyObject *args, PyObje
     NPY_END_THREADS;
 
     /* Clean up. */
+    Py_XDECREF(bin_edges_array);
     Py_DECREF(x1_array);Py_DECREF(y1_array);Py_DECREF(z1_array);Py_XDECREF(weights1_array);
+    Py_XDECREF(pimax_list_array);
 
     if(status != EXIT_SUCCESS) {
         Py_RETURN_NONE;
@@ -1906,30 +3031,28 @@ static PyObject *countpairs_countpairs_wp(PyObject *self, PyObject *args, PyObje
 
     /* Build the output list */
     PyObject *ret = PyList_New(0);
-    double rlow=results.rupp[0];
-    for(int i=1;i<results.nbin;i++) {
-        PyObject *item = NULL;
-        const double rpavg = results.rpavg[i];
-        const double weight_avg = results.weightavg[i];
-        item = Py_BuildValue("(ddddkd)", rlow,results.rupp[i],rpavg,results.wp[i],results.npairs[i], weight_avg);
-        PyList_Append(ret, item);
-        Py_XDECREF(item);
-        rlow=results.rupp[i];
+    for(int ipi=0;ipi<results.num_pimax;ipi++) {
+        const int64_t pimax_offset = ipi*(int64_t) results.nbin;
+        double rlow=results.rupp[0];
+        for(int i=1;i<results.nbin;i++) {
+            PyObject *item = NULL;
+            const int64_t ibin = pimax_offset + i;
+            const double rpavg = results.rpavg[ibin];
+            const double weight_avg = results.weightavg[ibin];
+            item = Py_BuildValue("(ddddkd)", rlow,results.rupp[i],rpavg,results.wp[ibin],results.npairs[ibin], weight_avg);
+            PyList_Append(ret, item);
+            Py_XDECREF(item);
+            rlow=results.rupp[i];
+        }
     }
     free_results_wp(&results);
 
-    PyObject *c_cell_time=PyList_New(0);
-    if(options.c_cell_timer) {
-        struct api_cell_timings *t = options.cell_timings;
-        for(int i=0;i<options.totncells_timings;i++) {
-            PyObject *item = Py_BuildValue("(kkkiii)", t->N1, t->N2, t->time_in_ns, t->first_cellindex, t->second_cellindex, t->tid);
-            PyList_Append(c_cell_time, item);
-            Py_XDECREF(item);
-            t++;
-        }
-        free_cell_timings(&options);
+    /* Empty array if c_cell_timer is not set */
+    PyObject *c_cell_time = cell_timings_as_array(&options);
+    if(c_api_phase_timer) {
+        return append_phase_memory(append_perf_counts(Py_BuildValue("(OdNN)", ret, c_api_time, c_cell_time, api_phase_times_as_dict(&options)), &options), &options);
     }
-    return Py_BuildValue("(OdO)", ret, c_api_time, c_cell_time);
+    return append_phase_memory(append_perf_counts(Py_BuildValue("(OdN)", ret, c_api_time, c_cell_time), &options), &options);
 }
 
 
@@ -1944,14 +3067,18 @@ static PyObject *countpairs_countpairs_xi(PyObject *self, PyObject *args, PyObje
 #endif
 
     PyArrayObject *x1_obj, *y1_obj, *z1_obj, *weights1_obj = NULL;
+    PyArrayObject *index1_obj=NULL;
     double boxsize;
     int nthreads=4;
-    char *binfile, *weighting_method_str = NULL;
+    PyObject *binfile_obj = NULL;
+    char *weighting_method_str = NULL;
     struct config_options options = get_config_options();
     options.verbose = 0;
     options.periodic=1;
     options.instruction_set = -1; //from enum
     options.c_api_timer = 0;
+    int8_t c_api_phase_timer = 0;
+    int c_cell_timer = 0;
     int8_t xbin_ref=options.bin_refine_factors[0],
         ybin_ref=options.bin_refine_factors[1],
         zbin_ref=options.bin_refine_factors[2];
@@ -1973,12 +3100,20 @@ static PyObject *countpairs_countpairs_xi(PyObject *self, PyObject *args, PyObje
         "max_cells_per_dim",
         "c_api_timer",
         "isa",/* instruction set to use of type enum isa; valid values are AVX, SSE, FALLBACK */
+        "mixed_precision",
+        "max_position_error",
+        "permute_in_place",
+        "original_index1",
+        "c_api_phase_timer",
+        "c_cell_timer",
+        "c_perf_counters",
+        "c_api_phase_memory",
         NULL
     };
 
 
-    if( ! PyArg_ParseTupleAndKeywords(args, kwargs, "disO!O!O!|O!sbbbbbhbi", kwlist,
-                                      &boxsize,&nthreads,&binfile,
+    if( ! PyArg_ParseTupleAndKeywords(args, kwargs, "diOO!O!O!|O!sbbbbbhbibdbO!bibb", kwlist,
+                                      &boxsize,&nthreads,&binfile_obj,
                                       &PyArray_Type,&x1_obj,
                                       &PyArray_Type,&y1_obj,
                                       &PyArray_Type,&z1_obj,
@@ -1989,7 +3124,15 @@ static PyObject *countpairs_countpairs_xi(PyObject *self, PyObject *args, PyObje
                                       &xbin_ref, &ybin_ref, &zbin_ref,
                                       &(options.max_cells_per_dim),
                                       &(options.c_api_timer),
-                                      &(options.instruction_set))
+                                      &(options.instruction_set),
+                                      &(options.mixed_precision),
+                                      &(options.max_position_error),
+                                      &(options.permute_in_place),
+                                      &PyArray_Type,&index1_obj,
+                                       &c_api_phase_timer,
+                                       &c_cell_timer,
+                                       &(options.c_perf_counters),
+                                       &(options.c_api_phase_memory))
         ) {
 
         PyObject_Print(kwargs, stdout, 0);
@@ -2066,12 +3209,24 @@ static PyObject *countpairs_countpairs_xi(PyObject *self, PyObject *args, PyObje
         Py_RETURN_NONE;
     }
 
+    /* The positions and weights are reordered in place by the C library */
+    if(options.permute_in_place) {
+        PyArrayObject *in_place1[] = {x1_obj, y1_obj, z1_obj, weights1_obj};
+        if(check_in_place_arrays(module, in_place1, 4, index1_obj, ND1) != EXIT_SUCCESS) {
+            Py_RETURN_NONE;
+        }
+        options.original_index1 = (int64_t *) PyArray_DATA(index1_obj);
+    }
+
     /* Interpret the input objects as numpy arrays. */
     const int requirements = NPY_ARRAY_IN_ARRAY;
+    /* The positions are read through their strides (e.g., the columns of an (N, 3) array) instead of being copied */
+    options.position_stride1 = get_position_stride(x1_obj, y1_obj, z1_obj);
+    const int position_requirements1 = options.position_stride1 != 0 ? NPY_ARRAY_ALIGNED:requirements;
     PyObject *x1_array = NULL, *y1_array = NULL, *z1_array = NULL, *weights1_array = NULL;
-    x1_array = PyArray_FromArray(x1_obj, NOTYPE_DESCR, requirements);
-    y1_array = PyArray_FromArray(y1_obj, NOTYPE_DESCR, requirements);
-    z1_array = PyArray_FromArray(z1_obj, NOTYPE_DESCR, requirements);
+    x1_array = PyArray_FromArray(x1_obj, NOTYPE_DESCR, position_requirements1);
+    y1_array = PyArray_FromArray(y1_obj, NOTYPE_DESCR, position_requirements1);
+    z1_array = PyArray_FromArray(z1_obj, NOTYPE_DESCR, position_requirements1);
     if(weights1_obj != NULL){
         weights1_array = PyArray_FromArray(weights1_obj, NOTYPE_DESCR, requirements);
     }
@@ -2102,12 +3257,26 @@ static PyObject *countpairs_countpairs_xi(PyObject *self, PyObject *args, PyObje
         extra.weights0.weights[w] = (char *) weights1 + w*ND1*element_size;
     }
 
+    /* The bins are either a file name, or an array of bin-edges that is passed on directly */
+    const char *binfile = NULL;
+    PyObject *bin_edges_array = NULL;
+    if(get_binfile_or_bin_edges(module, binfile_obj, &binfile, &bin_edges_array, &options) != EXIT_SUCCESS) {
+        Py_DECREF(x1_array);Py_DECREF(y1_array);Py_DECREF(z1_array);Py_XDECREF(weights1_array);
+        Py_RETURN_NONE;
+    }
+
     NPY_BEGIN_THREADS_DEF;
     NPY_BEGIN_THREADS;
 
     results_countpairs_xi results;
     options.periodic = 1;
     options.float_type = element_size;
+    if(c_api_phase_timer) {
+        options.c_api_timer = 1;
+    }
+    /* c_cell_timer=k times every k-th cell pair */
+    options.c_cell_timer = c_cell_timer > 0 ? 1:0;
+    options.c_cell_timer_sampling = c_cell_timer;
     double c_api_time=0.0;
     int status = countpairs_xi(ND1,X1,Y1,Z1,
                                boxsize,
@@ -2122,6 +3291,7 @@ static PyObject *countpairs_countpairs_xi(PyObject *self, PyObject *args, PyObje
     NPY_END_THREADS;
 
     /* Clean up. */
+    Py_XDECREF(bin_edges_array);
     Py_DECREF(x1_array);Py_DECREF(y1_array);Py_DECREF(z1_array);Py_XDECREF(weights1_array);
     if(status != EXIT_SUCCESS) {
         Py_RETURN_NONE;
@@ -2149,7 +3319,17 @@ static PyObject *countpairs_countpairs_xi(PyObject *self, PyObject *args, PyObje
     }
     free_results_xi(&results);
 
-    return Py_BuildValue("(Od)", ret, c_api_time);
+    if(options.c_cell_timer) {
+        PyObject *c_cell_time = cell_timings_as_array(&options);
+        if(c_api_phase_timer) {
+            return append_phase_memory(append_perf_counts(Py_BuildValue("(OdNN)", ret, c_api_time, c_cell_time, api_phase_times_as_dict(&options)), &options), &options);
+        }
+        return append_phase_memory(append_perf_counts(Py_BuildValue("(OdN)", ret, c_api_time, c_cell_time), &options), &options);
+    }
+    if(c_api_phase_timer) {
+        return append_phase_memory(append_perf_counts(Py_BuildValue("(OdN)", ret, c_api_time, api_phase_times_as_dict(&options)), &options), &options);
+    }
+    return append_phase_memory(append_perf_counts(Py_BuildValue("(Od)", ret, c_api_time), &options), &options);
 }
 
 
@@ -2163,18 +3343,23 @@ static PyObject *countpairs_countpairs_s_mu(PyObject *self, PyObject *args, PyOb
     PyObject *module = self;
 #endif
     PyArrayObject *x1_obj=NULL, *y1_obj=NULL, *z1_obj=NULL, *weights1_obj=NULL;
+    PyArrayObject *index1_obj=NULL, *index2_obj=NULL;
     PyArrayObject *x2_obj=NULL, *y2_obj=NULL, *z2_obj=NULL, *weights2_obj=NULL;
     int autocorr=0;
     int nthreads=4;
 
-    double mu_max;
+    PyArrayObject *velocities1_obj=NULL, *velocities2_obj=NULL;
+    double mu_max, rsd_factor=1.0;
     int nmu_bins;
-    char *binfile, *weighting_method_str = NULL;
+    PyObject *binfile_obj = NULL;
+    char *weighting_method_str = NULL, *los_str = NULL;
     struct config_options options = get_config_options();
     options.verbose = 0;
     options.instruction_set = -1;
     options.periodic = 1;
     options.c_api_timer = 0;
+    int8_t c_api_phase_timer = 0;
+    int c_cell_timer = 0;
     options.fast_divide_and_NR_steps = 0;
     int8_t xbin_ref=options.bin_refine_factors[0],
         ybin_ref=options.bin_refine_factors[1],
@@ -2206,11 +3391,26 @@ static PyObject *countpairs_countpairs_s_mu(PyObject *self, PyObject *args, PyOb
         "c_api_timer",
         "isa",/* instruction set to use of type enum isa; valid values are AVX, SSE, FALLBACK */
         "weight_type",
+        "los",
+        "velocities1",
+        "velocities2",
+        "rsd_factor",
+        "mixed_precision",
+        "max_position_error",
+        "permute_in_place",
+        "original_index1",
+        "original_index2",
+        "query_mode",
+        "c_api_phase_timer",
+        "c_cell_timer",
+        "c_perf_counters",
+        "c_api_phase_memory",
+        "grid_file",
         NULL
     };
 
-    if ( ! PyArg_ParseTupleAndKeywords(args, kwargs, "iisdiO!O!O!|O!O!O!O!O!bbdbbbbbhbis", kwlist,
-                                       &autocorr,&nthreads,&binfile, &mu_max, &nmu_bins,
+    if ( ! PyArg_ParseTupleAndKeywords(args, kwargs, "iiOdiO!O!O!|O!O!O!O!O!bbdbbbbbhbissO!O!dbdbO!O!bbibbz", kwlist,
+                                       &autocorr,&nthreads,&binfile_obj, &mu_max, &nmu_bins,
                                        &PyArray_Type,&x1_obj,
                                        &PyArray_Type,&y1_obj,
                                        &PyArray_Type,&z1_obj,
@@ -2228,7 +3428,22 @@ static PyObject *countpairs_countpairs_s_mu(PyObject *self, PyObject *args, PyOb
                                        &(options.max_cells_per_dim),
                                        &(options.c_api_timer),
                                        &(options.instruction_set),
-                                       &weighting_method_str)
+                                       &weighting_method_str,
+                                       &los_str,
+                                       &PyArray_Type,&velocities1_obj,
+                                       &PyArray_Type,&velocities2_obj,
+                                       &rsd_factor,
+                                       &(options.mixed_precision),
+                                       &(options.max_position_error),
+                                       &(options.permute_in_place),
+                                       &PyArray_Type,&index1_obj,
+                                       &PyArray_Type,&index2_obj,
+                                       &(options.query_mode),
+                                       &c_api_phase_timer,
+                                       &c_cell_timer,
+                                       &(options.c_perf_counters),
+                                       &(options.c_api_phase_memory),
+                                       &(options.grid_file))
 
          ) {
         PyObject_Print(kwargs, stdout, 0);
@@ -2264,12 +3479,28 @@ static PyObject *countpairs_countpairs_s_mu(PyObject *self, PyObject *args, PyOb
 
     size_t element_size;
     /* How many data points are there? And are they all of floating point type */
-    const int64_t ND1 = check_dims_and_datatype(module, x1_obj, y1_obj, z1_obj, weights1_obj, &element_size);
+    int64_t ND1 = check_dims_and_datatype(module, x1_obj, y1_obj, z1_obj, weights1_obj, &element_size);
     if(ND1 == -1) {
         //Error has already been set -> simply return
         Py_RETURN_NONE;
     }
 
+    /* With empty positions, the first set of points is read from the gridded catalog in grid_file */
+    int64_t grid_np = -1;
+    int grid_num_weights = 0;
+    if(get_gridded_catalog_size(module, options.grid_file, &grid_np, &grid_num_weights) != EXIT_SUCCESS) {
+        Py_RETURN_NONE;
+    }
+    const int from_grid_file = grid_np >= 0 && ND1 == 0;
+    if(grid_np >= 0 && (! from_grid_file || weights1_obj != NULL)) {
+        char msg[1024];
+        snprintf(msg, 1024, "ValueError: In %s: The first set of points is read from the existing gridded catalog `%s'. "
+                 "Please pass empty X1/Y1/Z1 and no weights1 (or remove the file to grid new points)\n",
+                 __FUNCTION__, options.grid_file);
+        countpairs_error_out(module, msg);
+        Py_RETURN_NONE;
+    }
+
     /* Ensure the weights are of the right shape (n_weights, n_particles) */
     if(weights1_obj != NULL){
         // A numpy dimension of length -1 will be expanded to n_weights
@@ -2278,6 +3509,21 @@ static PyObject *countpairs_countpairs_s_mu(PyObject *self, PyObject *args, PyOb
         weights1_obj = (PyArrayObject *) PyArray_Newshape(weights1_obj, &pdims, NPY_CORDER);
     }
 
+    /* Validate the user's choice of line-of-sight */
+    if(get_los_by_name(los_str, &(options.los)) != EXIT_SUCCESS) {
+        char msg[1024];
+        snprintf(msg, 1024, "ValueError: In %s: unknown los = %s! Expected one of 'x', 'y', 'z' or 'all'", __FUNCTION__, los_str);
+        countpairs_error_out(module, msg);
+        Py_RETURN_NONE;
+    }
+    if(autocorr == 0 && (velocities1_obj == NULL) != (velocities2_obj == NULL)) {
+        char msg[1024];
+        snprintf(msg, 1024, "ValueError: In %s: If autocorr is 0, must pass either zero or two sets of velocities.\n",
+                 __FUNCTION__);
+        countpairs_error_out(module, msg);
+        Py_RETURN_NONE;
+    }
+
     /* Validate the user's choice of weighting method */
     weight_method_t weighting_method;
     int wstatus = get_weight_method_by_name(weighting_method_str, &weighting_method);
@@ -2287,7 +3533,7 @@ static PyObject *countpairs_countpairs_s_mu(PyObject *self, PyObject *args, PyOb
         countpairs_error_out(module, msg);
         Py_RETURN_NONE;
     }
-    int found_weights = weights1_obj == NULL ? 0 : PyArray_SHAPE(weights1_obj)[0];
+    int found_weights = weights1_obj == NULL ? (from_grid_file ? grid_num_weights:0) : PyArray_SHAPE(weights1_obj)[0];
     struct extra_options extra = get_extra_options(weighting_method);
     if(extra.weights0.num_weights > 0 && extra.weights0.num_weights != found_weights){
         char msg[1024];
@@ -2314,7 +3560,7 @@ static PyObject *countpairs_countpairs_s_mu(PyObject *self, PyObject *args, PyOb
             countpairs_error_out(module, msg);
             Py_RETURN_NONE;
         }
-        if((weights1_obj == NULL) != (weights2_obj == NULL)){
+        if(! from_grid_file && (weights1_obj == NULL) != (weights2_obj == NULL)){
             snprintf(msg, 1024, "ValueError: In %s: If autocorr is 0, must pass either zero or two sets of weights.\n",
                      __FUNCTION__);
             countpairs_error_out(module, msg);
@@ -2342,21 +3588,52 @@ static PyObject *countpairs_countpairs_s_mu(PyObject *self, PyObject *args, PyOb
         }
     }
 
+    /* The positions, weights and velocities are reordered in place by the C library */
+    if(options.permute_in_place) {
+        PyArrayObject *in_place1[] = {x1_obj, y1_obj, z1_obj, weights1_obj, velocities1_obj};
+        if(check_in_place_arrays(module, in_place1, 5, index1_obj, ND1) != EXIT_SUCCESS) {
+            Py_RETURN_NONE;
+        }
+        options.original_index1 = (int64_t *) PyArray_DATA(index1_obj);
+        if(autocorr == 0) {
+            PyArrayObject *in_place2[] = {x2_obj, y2_obj, z2_obj, weights2_obj, velocities2_obj};
+            if(check_in_place_arrays(module, in_place2, 5, index2_obj, ND2) != EXIT_SUCCESS) {
+                Py_RETURN_NONE;
+            }
+            if(PyArray_DATA(x1_obj) == PyArray_DATA(x2_obj) || PyArray_DATA(index1_obj) == PyArray_DATA(index2_obj)) {
+                char msg[1024];
+                snprintf(msg, 1024, "ValueError: In %s: permute_in_place requires the two sets of points (and their "
+                         "original indices) to be separate arrays\n", __FUNCTION__);
+                countpairs_error_out(module, msg);
+                Py_RETURN_NONE;
+            }
+            options.original_index2 = (int64_t *) PyArray_DATA(index2_obj);
+        }
+    }
+
     /* Interpret the input objects as numpy arrays. */
     const int requirements = NPY_ARRAY_IN_ARRAY;
+    /* The positions are read through their strides (e.g., the columns of an (N, 3) array) instead of being copied */
+    options.position_stride1 = get_position_stride(x1_obj, y1_obj, z1_obj);
+    const int position_requirements1 = options.position_stride1 != 0 ? NPY_ARRAY_ALIGNED:requirements;
+    int position_requirements2 = requirements;
+    if(autocorr == 0) {
+        options.position_stride2 = get_position_stride(x2_obj, y2_obj, z2_obj);
+        position_requirements2 = options.position_stride2 != 0 ? NPY_ARRAY_ALIGNED:requirements;
+    }
     PyObject *x1_array = NULL, *y1_array = NULL, *z1_array = NULL, *weights1_array = NULL;
     PyObject *x2_array = NULL, *y2_array = NULL, *z2_array = NULL, *weights2_array = NULL;
-    x1_array = PyArray_FromArray(x1_obj, NOTYPE_DESCR, requirements);
-    y1_array = PyArray_FromArray(y1_obj, NOTYPE_DESCR, requirements);
-    z1_array = PyArray_FromArray(z1_obj, NOTYPE_DESCR, requirements);
+    x1_array = PyArray_FromArray(x1_obj, NOTYPE_DESCR, position_requirements1);
+    y1_array = PyArray_FromArray(y1_obj, NOTYPE_DESCR, position_requirements1);
+    z1_array = PyArray_FromArray(z1_obj, NOTYPE_DESCR, position_requirements1);
     if(weights1_obj != NULL){
         weights1_array = PyArray_FromArray(weights1_obj, NOTYPE_DESCR, requirements);
     }
 
     if(autocorr == 0) {
-        x2_array = PyArray_FromArray(x2_obj, NOTYPE_DESCR, requirements);
-        y2_array = PyArray_FromArray(y2_obj, NOTYPE_DESCR, requirements);
-        z2_array = PyArray_FromArray(z2_obj, NOTYPE_DESCR, requirements);
+        x2_array = PyArray_FromArray(x2_obj, NOTYPE_DESCR, position_requirements2);
+        y2_array = PyArray_FromArray(y2_obj, NOTYPE_DESCR, position_requirements2);
+        z2_array = PyArray_FromArray(z2_obj, NOTYPE_DESCR, position_requirements2);
         if(weights2_obj != NULL){
             weights2_array = PyArray_FromArray(weights2_obj, NOTYPE_DESCR, requirements);
         }
@@ -2407,12 +3684,43 @@ static PyObject *countpairs_countpairs_s_mu(PyObject *self, PyObject *args, PyOb
             extra.weights1.weights[w] = (char *) weights2 + w*ND2*element_size;
         }
     }
+    if(from_grid_file) {
+        ND1 = grid_np;
+        X1 = Y1 = Z1 = NULL;
+    }
+
+    /* Pack the velocities (for the redshift-space displacements) into extra_options */
+    PyObject *velocities1_array = NULL, *velocities2_array = NULL;
+    if(get_velocities(module, velocities1_obj, ND1, element_size, &velocities1_array, extra.velocities0) != EXIT_SUCCESS ||
+       (autocorr == 0 && get_velocities(module, velocities2_obj, ND2, element_size, &velocities2_array, extra.velocities1) != EXIT_SUCCESS)) {
+        Py_DECREF(x1_array);Py_DECREF(y1_array);Py_DECREF(z1_array);Py_XDECREF(weights1_array);
+        Py_XDECREF(x2_array);Py_XDECREF(y2_array);Py_XDECREF(z2_array);Py_XDECREF(weights2_array);
+        Py_XDECREF(velocities1_array);
+        Py_RETURN_NONE;
+    }
+    extra.rsd_factor = velocities1_obj != NULL ? rsd_factor:0.0;
+
+    /* The bins are either a file name, or an array of bin-edges that is passed on directly */
+    const char *binfile = NULL;
+    PyObject *bin_edges_array = NULL;
+    if(get_binfile_or_bin_edges(module, binfile_obj, &binfile, &bin_edges_array, &options) != EXIT_SUCCESS) {
+        Py_DECREF(x1_array);Py_DECREF(y1_array);Py_DECREF(z1_array);Py_XDECREF(weights1_array);
+        Py_XDECREF(x2_array);Py_XDECREF(y2_array);Py_XDECREF(z2_array);Py_XDECREF(weights2_array);
+        Py_XDECREF(velocities1_array);Py_XDECREF(velocities2_array);
+        Py_RETURN_NONE;
+    }
 
     NPY_BEGIN_THREADS_DEF;
     NPY_BEGIN_THREADS;
 
     options.float_type = element_size;
     results_countpairs_s_mu results;
+    if(c_api_phase_timer) {
+        options.c_api_timer = 1;
+    }
+    /* c_cell_timer=k times every k-th cell pair */
+    options.c_cell_timer = c_cell_timer > 0 ? 1:0;
+    options.c_cell_timer_sampling = c_cell_timer;
     double c_api_time = 0.0;
     int status = countpairs_s_mu(ND1,X1,Y1,Z1,
                                  ND2,X2,Y2,Z2,
@@ -2430,8 +3738,10 @@ static PyObject *countpairs_countpairs_s_mu(PyObject *self, PyObject *args, PyOb
     NPY_END_THREADS;
 
     /* Clean up. */
+    Py_XDECREF(bin_edges_array);
     Py_DECREF(x1_array);Py_DECREF(y1_array);Py_DECREF(z1_array);Py_XDECREF(weights1_array);//x1 should absolutely not be NULL
     Py_XDECREF(x2_array);Py_XDECREF(y2_array);Py_XDECREF(z2_array);Py_XDECREF(weights2_array);//x2 might be NULL depending on value of autocorr
+    Py_XDECREF(velocities1_array);Py_XDECREF(velocities2_array);
     if(status != EXIT_SUCCESS) {
         Py_RETURN_NONE;
     }
@@ -2439,24 +3749,37 @@ static PyObject *countpairs_countpairs_s_mu(PyObject *self, PyObject *args, PyOb
 
     /* Build the output list */
     PyObject *ret = PyList_New(0);//create an empty list
-    double smin=results.supp[0];
     const double dmu = mu_max/(double)nmu_bins;//mu_min is assumed to be 0.0
-    for(int i=1;i<results.nsbin;i++) {
-        const double smax=results.supp[i];
-        for(int j=0;j<results.nmu_bins;j++) {
-            const int bin_index = i*(results.nmu_bins + 1) + j;
-            PyObject *item = NULL;
-            const double savg = results.savg[bin_index];
-            const double weight_avg = results.weightavg[bin_index];
-            item = Py_BuildValue("(ddddkd)", smin, smax,savg,(j+1)*dmu,results.npairs[bin_index], weight_avg);
-            PyList_Append(ret, item);
-            Py_XDECREF(item);
+    const int64_t nbins_per_los = (int64_t) (results.nsbin + 1) * (results.nmu_bins + 1);
+    for(int ilos=0;ilos<results.nlos;ilos++) {
+        double smin=results.supp[0];
+        for(int i=1;i<results.nsbin;i++) {
+            const double smax=results.supp[i];
+            for(int j=0;j<results.nmu_bins;j++) {
+                const int64_t bin_index = ilos*nbins_per_los + i*(results.nmu_bins + 1) + j;
+                PyObject *item = NULL;
+                const double savg = results.savg[bin_index];
+                const double weight_avg = results.weightavg[bin_index];
+                item = Py_BuildValue("(ddddkd)", smin, smax,savg,(j+1)*dmu,results.npairs[bin_index], weight_avg);
+                PyList_Append(ret, item);
+                Py_XDECREF(item);
+            }
+            smin=smax;
         }
-        smin=smax;
     }
     free_results_s_mu(&results);
 
-    return Py_BuildValue("(Od)", ret, c_api_time);
+    if(options.c_cell_timer) {
+        PyObject *c_cell_time = cell_timings_as_array(&options);
+        if(c_api_phase_timer) {
+            return append_phase_memory(append_perf_counts(Py_BuildValue("(OdNN)", ret, c_api_time, c_cell_time, api_phase_times_as_dict(&options)), &options), &options);
+        }
+        return append_phase_memory(append_perf_counts(Py_BuildValue("(OdN)", ret, c_api_time, c_cell_time), &options), &options);
+    }
+    if(c_api_phase_timer) {
+        return append_phase_memory(append_perf_counts(Py_BuildValue("(OdN)", ret, c_api_time, api_phase_times_as_dict(&options)), &options), &options);
+    }
+    return append_phase_memory(append_perf_counts(Py_BuildValue("(Od)", ret, c_api_time), &options), &options);
 }
 
 
@@ -2480,6 +3803,7 @@ static PyObject *countpairs_countspheres_vpf(PyObject *self, PyObject *args, PyO
     options.periodic = 1;
     options.instruction_set = -1;
     options.c_api_timer = 0;
+    int8_t c_api_phase_timer = 0;
 
     /* Reset the bin refine factors default (since the VPF is symmetric in XYZ, conceptually the binning should be identical in all three directions)*/
     int bin_ref[] = {1,1,1};
@@ -2507,11 +3831,12 @@ static PyObject *countpairs_countspheres_vpf(PyObject *self, PyObject *args, PyO
         "max_cells_per_dim",
         "c_api_timer",
         "isa",/* instruction set to use of type enum isa; valid values are AVX, SSE, FALLBACK */
+        "c_api_phase_timer",
         NULL
     };
 
     if( ! PyArg_ParseTupleAndKeywords(args, kwargs,
-                                      "diiikO!O!O!|bbdbbbhbi", kwlist,
+                                      "diiikO!O!O!|bbdbbbhbib", kwlist,
                                       &rmax,&nbin,&nc,&num_pN,&seed,
                                       &PyArray_Type,&x1_obj,
                                       &PyArray_Type,&y1_obj,
@@ -2522,7 +3847,8 @@ static PyObject *countpairs_countspheres_vpf(PyObject *self, PyObject *args, PyO
                                       &xbin_ref, &ybin_ref, &zbin_ref,
                                       &(options.max_cells_per_dim),
                                       &(options.c_api_timer),
-                                      &(options.instruction_set))
+                                      &(options.instruction_set),
+                                       &c_api_phase_timer)
 
         ) {
 
@@ -2589,6 +3915,9 @@ static PyObject *countpairs_countspheres_vpf(PyObject *self, PyObject *args, PyO
     /* Do the VPF calculation */
     results_countspheres results;
     options.float_type = element_size;
+    if(c_api_phase_timer) {
+        options.c_api_timer = 1;
+    }
     double c_api_time=0.0;
     int status = countspheres(ND1, X1, Y1, Z1,
                               rmax, nbin, nc,
@@ -2626,5 +3955,462 @@ static PyObject *countpairs_countspheres_vpf(PyObject *self, PyObject *args, PyO
     }
 
     free_results_countspheres(&results);
+    if(c_api_phase_timer) {
+        return Py_BuildValue("(OdN)", ret, c_api_time, api_phase_times_as_dict(&options));
+    }
     return Py_BuildValue("(Od)", ret, c_api_time);
 }
+
+
+static PyObject *countpairs_countpairs_batch(PyObject *self, PyObject *args, PyObject *kwargs)
+{
+#if PY_MAJOR_VERSION < 3
+    (void) self;
+    PyObject *module = NULL;//should not be used -> setting to NULL so any attempts to dereference will result in a crash.
+#else
+    //In python3, self is simply the module object that was returned earlier by init
+    PyObject *module = self;
+#endif
+    PyArrayObject *x1_obj=NULL, *y1_obj=NULL, *z1_obj=NULL, *offsets1_obj=NULL, *weights1_obj=NULL;
+    PyArrayObject *x2_obj=NULL, *y2_obj=NULL, *z2_obj=NULL, *offsets2_obj=NULL, *weights2_obj=NULL;
+
+    int autocorr=0;
+    int nthreads=4;
+    PyObject *binfile_obj = NULL;
+    char *weighting_method_str = NULL;
+
+    struct config_options options = get_config_options();
+    options.verbose = 0;
+    options.instruction_set = -1;
+    options.periodic = 1;
+    options.need_avg_sep = 0;
+    options.c_api_timer = 0;
+
+    int8_t xbin_ref=options.bin_refine_factors[0],
+        ybin_ref=options.bin_refine_factors[1],
+        zbin_ref=options.bin_refine_factors[2];
+
+    static char *kwlist[] = {
+        "autocorr",
+        "nthreads",
+        "binfile",
+        "X1",
+        "Y1",
+        "Z1",
+        "offsets1",
+        "weights1",
+        "X2",
+        "Y2",
+        "Z2",
+        "offsets2",
+        "weights2",
+        "periodic",
+        "boxsize",
+        "output_ravg",
+        "xbin_refine_factor",
+        "ybin_refine_factor",
+        "zbin_refine_factor",
+        "max_cells_per_dim",
+        "c_api_timer",
+        "isa",/* instruction set to use of type enum isa; valid values are AVX, SSE, FALLBACK */
+        "weight_type",
+        "mixed_precision",
+        "max_position_error",
+        NULL
+    };
+
+    if ( ! PyArg_ParseTupleAndKeywords(args, kwargs, "iiOO!O!O!O!|O!O!O!O!O!O!bdbbbbhbisbd", kwlist,
+                                       &autocorr,&nthreads,&binfile_obj,
+                                       &PyArray_Type,&x1_obj,
+                                       &PyArray_Type,&y1_obj,
+                                       &PyArray_Type,&z1_obj,
+                                       &PyArray_Type,&offsets1_obj,
+                                       &PyArray_Type,&weights1_obj,
+                                       &PyArray_Type,&x2_obj,
+                                       &PyArray_Type,&y2_obj,
+                                       &PyArray_Type,&z2_obj,
+                                       &PyArray_Type,&offsets2_obj,
+                                       &PyArray_Type,&weights2_obj,
+                                       &(options.periodic),
+                                       &(options.boxsize),
+                                       &(options.need_avg_sep),
+                                       &xbin_ref, &ybin_ref, &zbin_ref,
+                                       &(options.max_cells_per_dim),
+                                       &(options.c_api_timer),
+                                       &(options.instruction_set),
+                                       &weighting_method_str,
+                                       &(options.mixed_precision),
+                                       &(options.max_position_error))
+
+         ) {
+
+        char msg[1024];
+        int len=snprintf(msg, 1024,"ArgumentError: In DD_batch> Could not parse the arguments. Input parameters are: \n");
+
+        /* How many keywords do we have? Subtract 1 because of the last NULL */
+        const size_t nitems = sizeof(kwlist)/sizeof(*kwlist) - 1;
+        int status = print_kwlist_into_msg(msg, 1024, len, kwlist, nitems);
+        if(status != EXIT_SUCCESS) {
+            fprintf(stderr,"Error message does not contain all of the keywords\n");
+        }
+
+        countpairs_error_out(module,msg);
+        Py_RETURN_NONE;
+    }
+
+    /*This is for the fastest isa */
+    if(options.instruction_set == -1) {
+        options.instruction_set = highest_isa;
+    }
+
+    if(xbin_ref != options.bin_refine_factors[0] ||
+       ybin_ref != options.bin_refine_factors[1] ||
+       zbin_ref != options.bin_refine_factors[2]) {
+        options.bin_refine_factors[0] = xbin_ref;
+        options.bin_refine_factors[1] = ybin_ref;
+        options.bin_refine_factors[2] = zbin_ref;
+        set_bin_refine_scheme(&options, BINNING_CUST);//custom binning -> code will honor requested binning scheme
+    }
+
+    size_t element_size;
+    struct batch_catalogs cat1, cat2;
+    memset(&cat2, 0, sizeof(cat2));
+    if(get_batch_catalogs(module, x1_obj, y1_obj, z1_obj, weights1_obj, offsets1_obj, &element_size, &cat1) != EXIT_SUCCESS) {
+        Py_RETURN_NONE;
+    }
+
+    if(autocorr == 0) {
+        char msg[1024];
+        if(x2_obj == NULL || y2_obj == NULL || z2_obj == NULL || offsets2_obj == NULL) {
+            snprintf(msg, 1024, "ValueError: In %s: If autocorr is 0, need to pass the second set of positions and offsets "
+                     "(X2, Y2, Z2 and offsets2 as numpy arrays).\n", __FUNCTION__);
+            countpairs_error_out(module, msg);
+            free_batch_catalogs(&cat1);
+            Py_RETURN_NONE;
+        }
+        if((weights1_obj == NULL) != (weights2_obj == NULL)){
+            snprintf(msg, 1024, "ValueError: In %s: If autocorr is 0, must pass either zero or two sets of weights.\n",
+                     __FUNCTION__);
+            countpairs_error_out(module, msg);
+            free_batch_catalogs(&cat1);
+            Py_RETURN_NONE;
+        }
+        size_t element_size2;
+        if(get_batch_catalogs(module, x2_obj, y2_obj, z2_obj, weights2_obj, offsets2_obj, &element_size2, &cat2) != EXIT_SUCCESS) {
+            free_batch_catalogs(&cat1);
+            Py_RETURN_NONE;
+        }
+        if(element_size != element_size2 || cat1.ncatalogs != cat2.ncatalogs) {
+            snprintf(msg, 1024, "TypeError: In %s: The two sets of catalogs must have the same data-type and the same number "
+                     "of catalogs\n", __FUNCTION__);
+            countpairs_error_out(module, msg);
+            free_batch_catalogs(&cat1);free_batch_catalogs(&cat2);
+            Py_RETURN_NONE;
+        }
+    }
+
+    struct extra_options extra;
+    if(check_weights_for_method(module, weighting_method_str, cat1.weights_array, &extra) != EXIT_SUCCESS) {
+        free_batch_catalogs(&cat1);free_batch_catalogs(&cat2);
+        Py_RETURN_NONE;
+    }
+
+    /* The bins are either a file name, or an array of bin-edges that is passed on directly */
+    const char *binfile = NULL;
+    PyObject *bin_edges_array = NULL;
+    if(get_binfile_or_bin_edges(module, binfile_obj, &binfile, &bin_edges_array, &options) != EXIT_SUCCESS) {
+        free_batch_catalogs(&cat1);free_batch_catalogs(&cat2);
+        Py_RETURN_NONE;
+    }
+
+    const int64_t ncatalogs = cat1.ncatalogs;
+    struct extra_options *all_extra = get_batch_extra_options(&extra, &cat1, autocorr == 0 ? &cat2:NULL, element_size);
+    results_countpairs *results = malloc(sizeof(*results)*ncatalogs);
+    if(all_extra == NULL || results == NULL) {
+        free(all_extra);free(results);
+        Py_XDECREF(bin_edges_array);
+        free_batch_catalogs(&cat1);free_batch_catalogs(&cat2);
+        return PyErr_NoMemory();
+    }
+
+    NPY_BEGIN_THREADS_DEF;
+    NPY_BEGIN_THREADS;
+
+    options.float_type = element_size;
+    double c_api_time = 0.0;
+    int status = countpairs_batch(ncatalogs,
+                                  cat1.N, cat1.X, cat1.Y, cat1.Z,
+                                  cat2.N, cat2.X, cat2.Y, cat2.Z,
+                                  nthreads,
+                                  autocorr,
+                                  binfile,
+                                  results,
+                                  &options,
+                                  all_extra);
+    if(options.c_api_timer) {
+        c_api_time = options.c_api_time;
+    }
+    NPY_END_THREADS;
+
+    /* Clean up. */
+    Py_XDECREF(bin_edges_array);
+    free_batch_catalogs(&cat1);free_batch_catalogs(&cat2);
+    free(all_extra);
+
+    if(status != EXIT_SUCCESS) {
+        free(results);
+        Py_RETURN_NONE;
+    }
+
+    /* Build the output arrays (the first bin contains junk) */
+    const int nbin = results[0].nbin;
+    npy_intp rdims[] = {nbin};
+    npy_intp dims[] = {ncatalogs, nbin - 1};
+    PyObject *rupp_array = PyArray_SimpleNew(1, rdims, NPY_DOUBLE);
+    PyObject *npairs_array = PyArray_SimpleNew(2, dims, NPY_UINT64);
+    PyObject *ravg_array = PyArray_SimpleNew(2, dims, NPY_DOUBLE);
+    PyObject *weightavg_array = PyArray_SimpleNew(2, dims, NPY_DOUBLE);
+    if(rupp_array != NULL && npairs_array != NULL && ravg_array != NULL && weightavg_array != NULL) {
+        memcpy(PyArray_DATA((PyArrayObject *) rupp_array), results[0].rupp, sizeof(double)*nbin);
+        uint64_t *npairs = (uint64_t *) PyArray_DATA((PyArrayObject *) npairs_array);
+        double *ravg = (double *) PyArray_DATA((PyArrayObject *) ravg_array);
+        double *weightavg = (double *) PyArray_DATA((PyArrayObject *) weightavg_array);
+        for(int64_t icat=0;icat<ncatalogs;icat++) {
+            for(int i=1;i<nbin;i++) {
+                const int64_t index = icat*(nbin - 1) + i - 1;
+                npairs[index] = results[icat].npairs[i];
+                ravg[index] = results[icat].rpavg[i];
+                weightavg[index] = results[icat].weightavg[i];
+            }
+        }
+    }
+    for(int64_t icat=0;icat<ncatalogs;icat++) {
+        free_results(&(results[icat]));
+    }
+    free(results);
+    if(rupp_array == NULL || npairs_array == NULL || ravg_array == NULL || weightavg_array == NULL) {
+        Py_XDECREF(rupp_array);Py_XDECREF(npairs_array);Py_XDECREF(ravg_array);Py_XDECREF(weightavg_array);
+        return PyErr_NoMemory();
+    }
+
+    return Py_BuildValue("(NNNNd)", rupp_array, npairs_array, ravg_array, weightavg_array, c_api_time);
+}
+
+
+static PyObject *countpairs_countpairs_wp_batch(PyObject *self, PyObject *args, PyObject *kwargs)
+{
+#if PY_MAJOR_VERSION < 3
+    (void) self;//to suppress the unused variable warning. Terrible hack
+    PyObject *module = NULL;//need not be used -> setting to NULL so any attempts to dereference will result in a crash.
+#else
+    //In python3, self is simply the module object that was returned earlier by init
+    PyObject *module = self;
+#endif
+    PyArrayObject *x1_obj=NULL, *y1_obj=NULL, *z1_obj=NULL, *offsets1_obj=NULL, *weights1_obj=NULL, *pimax_list_obj=NULL;
+    double boxsize,pimax;
+    int nthreads=1;
+    PyObject *binfile_obj = NULL;
+    char *weighting_method_str = NULL;
+
+    struct config_options options = get_config_options();
+    options.verbose = 0;
+    options.instruction_set = -1;
+    options.need_avg_sep = 0;
+    options.periodic = 1;
+    options.c_api_timer = 0;
+    options.c_cell_timer = 0;
+    int8_t xbin_ref=options.bin_refine_factors[0],
+        ybin_ref=options.bin_refine_factors[1],
+        zbin_ref=options.bin_refine_factors[2];
+
+    static char *kwlist[] = {
+        "boxsize",
+        "pimax",
+        "nthreads",
+        "binfile",
+        "X",
+        "Y",
+        "Z",
+        "offsets",
+        "weights",
+        "weight_type",
+        "output_rpavg",
+        "xbin_refine_factor",
+        "ybin_refine_factor",
+        "zbin_refine_factor",
+        "max_cells_per_dim",
+        "c_api_timer",
+        "isa",/* instruction set to use of type enum isa; valid values are AVX, SSE, FALLBACK */
+        "pimax_list",
+        "mixed_precision",
+        "max_position_error",
+        NULL
+    };
+
+    if( ! PyArg_ParseTupleAndKeywords(args, kwargs, "ddiOO!O!O!O!|O!sbbbbhbiO!bd", kwlist,
+                                      &boxsize,&pimax,&nthreads,&binfile_obj,
+                                      &PyArray_Type,&x1_obj,
+                                      &PyArray_Type,&y1_obj,
+                                      &PyArray_Type,&z1_obj,
+                                      &PyArray_Type,&offsets1_obj,
+                                      &PyArray_Type,&weights1_obj,
+                                      &weighting_method_str,
+                                      &(options.need_avg_sep),
+                                      &xbin_ref, &ybin_ref, &zbin_ref,
+                                      &(options.max_cells_per_dim),
+                                      &(options.c_api_timer),
+                                      &(options.instruction_set),
+                                      &PyArray_Type,&pimax_list_obj,
+                                      &(options.mixed_precision),
+                                      &(options.max_position_error))
+
+        ){
+        char msg[1024];
+        int len=snprintf(msg, 1024,"ArgumentError: In wp_batch> Could not parse the arguments. Input parameters are: \n");
+
+        /* How many keywords do we have? Subtract 1 because of the last NULL */
+        const size_t nitems = sizeof(kwlist)/sizeof(*kwlist) - 1;
+        int status = print_kwlist_into_msg(msg, 1024, len, kwlist, nitems);
+        if(status != EXIT_SUCCESS) {
+            fprintf(stderr,"Error message does not contain all of the keywords\n");
+        }
+
+        countpairs_error_out(module,msg);
+        Py_RETURN_NONE;
+    }
+    options.boxsize=boxsize;
+
+    /*This is for the fastest isa */
+    if(options.instruction_set == -1) {
+        options.instruction_set = highest_isa;
+    }
+
+    if(xbin_ref != options.bin_refine_factors[0] ||
+       ybin_ref != options.bin_refine_factors[1] ||
+       zbin_ref != options.bin_refine_factors[2]) {
+        options.bin_refine_factors[0] = xbin_ref;
+        options.bin_refine_factors[1] = ybin_ref;
+        options.bin_refine_factors[2] = zbin_ref;
+        set_bin_refine_scheme(&options, BINNING_CUST);//custom binning -> code will honor requested binning scheme
+    }
+
+    size_t element_size;
+    struct batch_catalogs cat;
+    if(get_batch_catalogs(module, x1_obj, y1_obj, z1_obj, weights1_obj, offsets1_obj, &element_size, &cat) != EXIT_SUCCESS) {
+        Py_RETURN_NONE;
+    }
+
+    struct extra_options extra;
+    if(check_weights_for_method(module, weighting_method_str, cat.weights_array, &extra) != EXIT_SUCCESS) {
+        free_batch_catalogs(&cat);
+        Py_RETURN_NONE;
+    }
+
+    /* The list of pimax values is always in double precision */
+    PyObject *pimax_list_array = NULL;
+    if(pimax_list_obj != NULL) {
+        pimax_list_array = PyArray_FromArray(pimax_list_obj, PyArray_DescrFromType(NPY_DOUBLE), NPY_ARRAY_IN_ARRAY);
+        if(pimax_list_array == NULL || PyArray_NDIM((PyArrayObject *) pimax_list_array) != 1) {
+            free_batch_catalogs(&cat);
+            Py_XDECREF(pimax_list_array);
+            char msg[1024];
+            snprintf(msg, 1024, "TypeError: In %s: Could not convert pimax_list to a 1-D array of doubles",
+                     __FUNCTION__);
+            countpairs_error_out(module, msg);
+            Py_RETURN_NONE;
+        }
+        extra.pimax_list = (double *) PyArray_DATA((PyArrayObject *) pimax_list_array);
+        extra.num_pimax = (int) PyArray_SIZE((PyArrayObject *) pimax_list_array);
+    }
+
+    /* The bins are either a file name, or an array of bin-edges that is passed on directly */
+    const char *binfile = NULL;
+    PyObject *bin_edges_array = NULL;
+    if(get_binfile_or_bin_edges(module, binfile_obj, &binfile, &bin_edges_array, &options) != EXIT_SUCCESS) {
+        free_batch_catalogs(&cat);
+        Py_XDECREF(pimax_list_array);
+        Py_RETURN_NONE;
+    }
+
+    const int64_t ncatalogs = cat.ncatalogs;
+    struct extra_options *all_extra = get_batch_extra_options(&extra, &cat, NULL, element_size);
+    results_countpairs_wp *results = malloc(sizeof(*results)*ncatalogs);
+    if(all_extra == NULL || results == NULL) {
+        free(all_extra);free(results);
+        Py_XDECREF(bin_edges_array);Py_XDECREF(pimax_list_array);
+        free_batch_catalogs(&cat);
+        return PyErr_NoMemory();
+    }
+
+    NPY_BEGIN_THREADS_DEF;
+    NPY_BEGIN_THREADS;
+
+    options.float_type = element_size;
+    double c_api_time = 0.0;
+    int status = countpairs_wp_batch(ncatalogs,
+                                     cat.N, cat.X, cat.Y, cat.Z,
+                                     boxsize,
+                                     nthreads,
+                                     binfile,
+                                     pimax,
+                                     results,
+                                     &options,
+                                     all_extra);
+    if(options.c_api_timer) {
+        c_api_time = options.c_api_time;
+    }
+    NPY_END_THREADS;
+
+    /* Clean up. */
+    Py_XDECREF(bin_edges_array);
+    Py_XDECREF(pimax_list_array);
+    free_batch_catalogs(&cat);
+    free(all_extra);
+
+    if(status != EXIT_SUCCESS) {
+        free(results);
+        Py_RETURN_NONE;
+    }
+
+    /* Build the output arrays (the first bin for every pimax contains junk) */
+    const int nbin = results[0].nbin;
+    const int num_pimax = results[0].num_pimax;
+    const int64_t nvalid = (int64_t) num_pimax * (nbin - 1);
+    npy_intp rdims[] = {nbin};
+    npy_intp dims[] = {ncatalogs, nvalid};
+    PyObject *rupp_array = PyArray_SimpleNew(1, rdims, NPY_DOUBLE);
+    PyObject *npairs_array = PyArray_SimpleNew(2, dims, NPY_UINT64);
+    PyObject *wp_array = PyArray_SimpleNew(2, dims, NPY_DOUBLE);
+    PyObject *rpavg_array = PyArray_SimpleNew(2, dims, NPY_DOUBLE);
+    PyObject *weightavg_array = PyArray_SimpleNew(2, dims, NPY_DOUBLE);
+    if(rupp_array != NULL && npairs_array != NULL && wp_array != NULL && rpavg_array != NULL && weightavg_array != NULL) {
+        memcpy(PyArray_DATA((PyArrayObject *) rupp_array), results[0].rupp, sizeof(double)*nbin);
+        uint64_t *npairs = (uint64_t *) PyArray_DATA((PyArrayObject *) npairs_array);
+        double *wp = (double *) PyArray_DATA((PyArrayObject *) wp_array);
+        double *rpavg = (double *) PyArray_DATA((PyArrayObject *) rpavg_array);
+        double *weightavg = (double *) PyArray_DATA((PyArrayObject *) weightavg_array);
+        for(int64_t icat=0;icat<ncatalogs;icat++) {
+            for(int ipi=0;ipi<num_pimax;ipi++) {
+                for(int i=1;i<nbin;i++) {
+                    const int64_t ibin = ipi*(int64_t) nbin + i;
+                    const int64_t index = icat*nvalid + ipi*(int64_t) (nbin - 1) + i - 1;
+                    npairs[index] = results[icat].npairs[ibin];
+                    wp[index] = results[icat].wp[ibin];
+                    rpavg[index] = results[icat].rpavg[ibin];
+                    weightavg[index] = results[icat].weightavg[ibin];
+                }
+            }
+        }
+    }
+    for(int64_t icat=0;icat<ncatalogs;icat++) {
+        free_results_wp(&(results[icat]));
+    }
+    free(results);
+    if(rupp_array == NULL || npairs_array == NULL || wp_array == NULL || rpavg_array == NULL || weightavg_array == NULL) {
+        Py_XDECREF(rupp_array);Py_XDECREF(npairs_array);Py_XDECREF(wp_array);
+        Py_XDECREF(rpavg_array);Py_XDECREF(weightavg_array);
+        return PyErr_NoMemory();
+    }
+
+    return Py_BuildValue("(NNNNNd)", rupp_array, npairs_array, wp_array, rpavg_array, weightavg_array, c_api_time);
+}
@@ -0,0 +1,183 @@
+/* File: bench_kernels.c */
+/*
+  This file is a part of the Corrfunc package
+  Copyright (C) 2015-- Manodeep Sinha (manodeep@gmail.com)
+  License: MIT LICENSE. See LICENSE file under the top-level
+  directory at https://github.com/manodeep/Corrfunc/
+*/
+
+/*
+  Microbenchmark for the pair-counting kernels of the theory routines. Every
+  kernel (AVX, SSE4.2 and fallback, in float and double) is called directly on
+  synthetic pairs of cells, over a range of cell sizes, number of bins, weight
+  methods and same-cell (autocorrelation of a cell with itself) settings. The
+  throughput is reported in pairs per second and in time-stamp counter cycles
+  per pair; a pair is every (i, j) that the kernel examines, i.e., N1*N2 for two
+  cells and N1*(N1-1)/2 within the same cell. The number of pairs counted into
+  the histograms by every call is also reported, and should be the same for all
+  of the instruction sets.
+
+  Usage: ./bench_kernels [-q] [-t min_time] [-k kernel] [-i isa] [-p precision] [-a]
+*/
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <inttypes.h>
+#include <unistd.h>
+
+#include "defs.h"
+#include "cpu_features.h"
+#include "bench_kernels.h"
+
+static const char *counter_names[] = {"DD", "DDrppi", "DDsmu", "wp", "xi"};
+
+static void usage(const char *progname)
+{
+    fprintf(stderr,"Usage: %s [-q] [-t min_time] [-k kernel] [-i isa] [-p precision] [-a]\n", progname);
+    fprintf(stderr,"   -q            : quick run (fewer cell sizes and bins)\n");
+    fprintf(stderr,"   -t min_time   : minimum time per benchmark in seconds (default 0.05)\n");
+    fprintf(stderr,"   -k kernel     : only benchmark this kernel (DD, DDrppi, DDsmu, wp or xi)\n");
+    fprintf(stderr,"   -i isa        : only benchmark this instruction set (avx, sse42 or fallback)\n");
+    fprintf(stderr,"   -p precision  : only benchmark this precision (float or double)\n");
+    fprintf(stderr,"   -a            : also compute the average separation\n");
+}
+
+static const char *isa_name(const isa instruction_set)
+{
+    switch(instruction_set) {
+    case AVX:
+        return "avx";
+    case SSE42:
+        return "sse42";
+    default:
+        return "fallback";
+    }
+}
+
+/* Is the kernel compiled in and supported by the cpu */
+static int isa_available(const isa instruction_set, const int highest_isa)
+{
+    switch(instruction_set) {
+#ifdef __AVX__
+    case AVX:
+        return highest_isa >= AVX;
+#endif
+#ifdef __SSE4_2__
+    case SSE42:
+        return highest_isa >= SSE42;
+#endif
+    case FALLBACK:
+        return 1;
+    default:
+        return 0;
+    }
+}
+
+int main(int argc, char **argv)
+{
+    double min_time = 0.05;
+    int quick = 0, need_avg_sep = 0;
+    const char *only_kernel = NULL, *only_isa = NULL, *only_precision = NULL;
+
+    int opt;
+    while((opt = getopt(argc, argv, "qt:k:i:p:ah")) != -1) {
+        switch(opt) {
+        case 'q':
+            quick = 1;
+            break;
+        case 't':
+            min_time = atof(optarg);
+            break;
+        case 'k':
+            only_kernel = optarg;
+            break;
+        case 'i':
+            only_isa = optarg;
+            break;
+        case 'p':
+            only_precision = optarg;
+            break;
+        case 'a':
+            need_avg_sep = 1;
+            break;
+        default:
+            usage(argv[0]);
+            return EXIT_FAILURE;
+        }
+    }
+    if(min_time <= 0.0) {
+        fprintf(stderr,"Error: The minimum time per benchmark must be positive. Found min_time = %lf\n", min_time);
+        return EXIT_FAILURE;
+    }
+
+    /* Pairs of cell sizes (N1, N2). The same-cell benchmarks use the cells with N1 == N2 */
+    const int64_t all_sizes[][2] = {{16, 16}, {64, 64}, {256, 256}, {1024, 1024}, {4096, 4096}, {64, 1024}, {1024, 64}};
+    const int64_t quick_sizes[][2] = {{64, 64}, {1024, 1024}};
+    const int all_nbins[] = {5, 15, 30};
+    const int quick_nbins[] = {15};
+    const isa all_isa[] = {AVX, SSE42, FALLBACK};
+    const weight_method_t all_weights[] = {NONE, PAIR_PRODUCT};
+    const char *precisions[] = {"double", "float"};
+
+    const int64_t (*sizes)[2] = quick ? quick_sizes:all_sizes;
+    const int nsizes = quick ? (int) (sizeof(quick_sizes)/sizeof(quick_sizes[0])):(int) (sizeof(all_sizes)/sizeof(all_sizes[0]));
+    const int *nbins = quick ? quick_nbins:all_nbins;
+    const int num_nbins = quick ? (int) (sizeof(quick_nbins)/sizeof(quick_nbins[0])):(int) (sizeof(all_nbins)/sizeof(all_nbins[0]));
+
+    const int highest_isa = instrset_detect();
+    int nfailed = 0;
+
+    fprintf(stdout,"# %-7s %-9s %-6s %6s %6s %5s %7s %4s %12s %10s %14s %12s\n",
+            "kernel", "isa", "prec", "N1", "N2", "nbins", "weights", "same", "ncalls", "counted", "pairs/sec", "cycles/pair");
+    for(int c=0;c<BENCH_NUM_COUNTERS;c++) {
+        if(only_kernel != NULL && strcmp(only_kernel, counter_names[c]) != 0) continue;
+        for(size_t i=0;i<sizeof(all_isa)/sizeof(all_isa[0]);i++) {
+            if(only_isa != NULL && strcmp(only_isa, isa_name(all_isa[i])) != 0) continue;
+            if( ! isa_available(all_isa[i], highest_isa)) {
+                fprintf(stderr,"Skipping the %s kernels for %s. Not available on this cpu (or in this build)\n",
+                        isa_name(all_isa[i]), counter_names[c]);
+                continue;
+            }
+            for(int p=0;p<2;p++) {
+                if(only_precision != NULL && strcmp(only_precision, precisions[p]) != 0) continue;
+                for(int s=0;s<nsizes;s++) {
+                    for(int same_cell=0;same_cell<=1;same_cell++) {
+                        if(same_cell && sizes[s][0] != sizes[s][1]) continue;
+                        for(int b=0;b<num_nbins;b++) {
+                            for(size_t w=0;w<sizeof(all_weights)/sizeof(all_weights[0]);w++) {
+                                struct bench_kernel_config config = {.counter = (bench_counter_t) c,
+                                                                     .instruction_set = all_isa[i],
+                                                                     .N1 = sizes[s][0],
+                                                                     .N2 = sizes[s][1],
+                                                                     .nbins = nbins[b],
+                                                                     .weight_method = all_weights[w],
+                                                                     .same_cell = same_cell,
+                                                                     .need_avg_sep = need_avg_sep,
+                                                                     .rmax = 20.0,
+                                                                     .min_time = min_time,
+                                                                     .seed = 42};
+                                struct bench_kernel_result result;
+                                const int status = p == 0 ? bench_kernel_double(&config, &result):bench_kernel_float(&config, &result);
+                                if(status != EXIT_SUCCESS) {
+                                    fprintf(stderr,"Error: Benchmark failed for the %s %s kernel in %s\n",
+                                            isa_name(all_isa[i]), counter_names[c], precisions[p]);
+                                    nfailed++;
+                                    continue;
+                                }
+                                fprintf(stdout,"  %-7s %-9s %-6s %6"PRId64" %6"PRId64" %5d %7s %4d %12"PRId64" %10"PRIu64" %14.4e %12.3f\n",
+                                        counter_names[c], isa_name(all_isa[i]), precisions[p],
+                                        config.N1, same_cell ? config.N1:config.N2, config.nbins,
+                                        config.weight_method == NONE ? "none":"pair", same_cell,
+                                        result.ncalls, result.npairs_per_call, result.pairs_per_second, result.cycles_per_pair);
+                                fflush(stdout);
+                            }
+                        }
+                    }
+                }
+            }
+        }
+    }
+
+    return nfailed == 0 ? EXIT_SUCCESS:EXIT_FAILURE;
+}
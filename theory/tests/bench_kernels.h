@@ -0,0 +1,59 @@
+/* File: bench_kernels.h */
+/*
+  This file is a part of the Corrfunc package
+  Copyright (C) 2015-- Manodeep Sinha (manodeep@gmail.com)
+  License: MIT LICENSE. See LICENSE file under the top-level
+  directory at https://github.com/manodeep/Corrfunc/
+*/
+
+#pragma once
+
+#ifdef __cplusplus
+extern "C" {
+#endif
+
+#include <stdint.h>
+
+#include "defs.h"
+
+    /* The pair-counting kernels that can be benchmarked */
+    typedef enum {
+        BENCH_DD=0,
+        BENCH_DDRPPI=1,
+        BENCH_DDSMU=2,
+        BENCH_WP=3,
+        BENCH_XI=4,
+        BENCH_NUM_COUNTERS
+    } bench_counter_t;
+
+    /* One benchmark: a single kernel called on one synthetic pair of cells */
+    struct bench_kernel_config{
+        bench_counter_t counter;
+        isa instruction_set;//AVX, SSE42 or FALLBACK
+        int64_t N1;//number of particles in the first cell
+        int64_t N2;//number of particles in the second cell (ignored if same_cell is set)
+        int nbins;//number of separation bins
+        weight_method_t weight_method;//NONE or PAIR_PRODUCT
+        int same_cell;//count the pairs within the first cell (as for the autocorrelation of a cell with itself)
+        int need_avg_sep;
+        double rmax;//the cells are cubes of side rmax (and pimax = rmax)
+        double min_time;//the kernel is called repeatedly until it has run for at least this long (in seconds)
+        uint64_t seed;
+    };
+
+    struct bench_kernel_result{
+        int64_t ncalls;//number of timed kernel calls
+        double seconds;//total time for the timed calls
+        uint64_t cycles;//total number of time-stamp counter cycles for the timed calls (0 if unavailable)
+        double pairs_per_call;//number of pairs examined by every call
+        double pairs_per_second;
+        double cycles_per_pair;
+        uint64_t npairs_per_call;//number of pairs counted into the bins by every call
+    };
+
+    extern int bench_kernel_double(const struct bench_kernel_config *config, struct bench_kernel_result *result);
+    extern int bench_kernel_float(const struct bench_kernel_config *config, struct bench_kernel_result *result);
+
+#ifdef __cplusplus
+}
+#endif
@@ -24,6 +24,11 @@ int test_periodic_DDsmu(const char *correct_outputfile);
 int test_wp(const char *correct_outputfile);
 int test_vpf(const char *correct_outputfile);
 int test_xi(const char *correct_outputfile);
+int test_periodic_DD_mixed(const char *correct_outputfile);
+int test_wp_mixed(const char *correct_outputfile);
+int test_periodic_DD_quantised(const char *correct_outputfile);
+int test_periodic_DD_in_place(const char *correct_outputfile);
+int test_periodic_DD_strided(const char *correct_outputfile);
 
 void read_data_and_set_globals(const char *firstfilename, const char *firstformat,
                                const char *secondfilename, const char *secondformat);
@@ -39,6 +44,13 @@ double *X2=NULL,*Y2=NULL,*Z2=NULL,*weights2=NULL;
 char current_file1[MAXLEN],current_file2[MAXLEN];
 
 struct config_options options;
+
+//The mixed-precision runs count with float separations -> compare to the
+//double-precision reference outputs with a looser (relative) tolerance,
+//that also applies to npairs (for the pairs right at the bin edges)
+const double mixed_maxreldiff = 1e-5;
+//The quantised runs move every position by up to max_position_error
+const double quantised_maxreldiff = 1e-4;
 //end global variables
 
 int test_periodic_DD(const char *correct_outputfile)
@@ -78,11 +90,14 @@ int test_periodic_DD(const char *correct_outputfile)
                 ret = EXIT_FAILURE;//not required but showing intent
                 break;
             }
-            int floats_equal = AlmostEqualRelativeAndAbs_double(rpavg, results.rpavg[i], maxdiff, maxreldiff);
-            int weights_equal = AlmostEqualRelativeAndAbs_double(weightavg, results.weightavg[i], maxdiff, maxreldiff);
+            const int approximate = options.mixed_precision || options.max_position_error > 0;
+            const double reldiff = options.max_position_error > 0 ? quantised_maxreldiff:(options.mixed_precision ? mixed_maxreldiff:maxreldiff);
+            int floats_equal = AlmostEqualRelativeAndAbs_double(rpavg, results.rpavg[i], maxdiff, reldiff);
+            int weights_equal = AlmostEqualRelativeAndAbs_double(weightavg, results.weightavg[i], maxdiff, reldiff);
+            int npairs_equal = approximate ? fabs((double) npairs - (double) results.npairs[i]) <= reldiff*npairs:npairs == results.npairs[i];
             
             //Check for exact equality of npairs and float "equality" for rpavg
-            if(npairs == results.npairs[i] && floats_equal == EXIT_SUCCESS && weights_equal == EXIT_SUCCESS) {
+            if(npairs_equal && floats_equal == EXIT_SUCCESS && weights_equal == EXIT_SUCCESS) {
                 ret = EXIT_SUCCESS;
             } else {
                 ret = EXIT_FAILURE;//not required but showing intent
@@ -319,12 +334,14 @@ int test_wp(const char *correct_outputfile)
                 ret = EXIT_FAILURE;//not required but showing intent
                 break;
             }
-            int rpavg_equal = AlmostEqualRelativeAndAbs_double(rpavg, results.rpavg[i], maxdiff, maxreldiff);
-            int weightavg_equal = AlmostEqualRelativeAndAbs_double(weightavg, results.weightavg[i], maxdiff, maxreldiff);
-            int wp_equal = AlmostEqualRelativeAndAbs_double(wp, results.wp[i], maxdiff, maxreldiff);
+            const double reldiff = options.mixed_precision ? mixed_maxreldiff:maxreldiff;
+            int rpavg_equal = AlmostEqualRelativeAndAbs_double(rpavg, results.rpavg[i], maxdiff, reldiff);
+            int weightavg_equal = AlmostEqualRelativeAndAbs_double(weightavg, results.weightavg[i], maxdiff, reldiff);
+            int wp_equal = AlmostEqualRelativeAndAbs_double(wp, results.wp[i], maxdiff, reldiff);
+            int npairs_equal = options.mixed_precision ? fabs((double) npairs - (double) results.npairs[i]) <= mixed_maxreldiff*npairs:npairs == results.npairs[i];
             
             //Check for exact equality of npairs and float "equality" for rpavg + wp
-            if(npairs == results.npairs[i] && rpavg_equal == EXIT_SUCCESS && wp_equal == EXIT_SUCCESS && weightavg_equal == EXIT_SUCCESS) {
+            if(npairs_equal && rpavg_equal == EXIT_SUCCESS && wp_equal == EXIT_SUCCESS && weightavg_equal == EXIT_SUCCESS) {
                 ret = EXIT_SUCCESS;
             } else {
                 ret = EXIT_FAILURE;//not required but showing intent
@@ -361,6 +378,76 @@ int test_wp(const char *correct_outputfile)
     return ret;
 }
 
+int test_periodic_DD_mixed(const char *correct_outputfile)
+{
+    options.mixed_precision = 1;
+    int ret = test_periodic_DD(correct_outputfile);
+    options.mixed_precision = 0;
+    return ret;
+}
+
+int test_wp_mixed(const char *correct_outputfile)
+{
+    options.mixed_precision = 1;
+    int ret = test_wp(correct_outputfile);
+    options.mixed_precision = 0;
+    return ret;
+}
+
+int test_periodic_DD_quantised(const char *correct_outputfile)
+{
+    //The cells are ~rmax = 24 wide -> 16 bit offsets
+    options.max_position_error = 1e-3;
+    int ret = test_periodic_DD(correct_outputfile);
+    options.max_position_error = 0.0;
+    return ret;
+}
+
+int test_periodic_DD_in_place(const char *correct_outputfile)
+{
+    //Reorders the (global) particle arrays -> the pair counts do not depend on the order
+    int64_t *original_index = malloc(sizeof(*original_index) * ND1);
+    if(original_index == NULL) {
+        return EXIT_FAILURE;
+    }
+    options.permute_in_place = 1;
+    options.original_index1 = original_index;
+    int ret = test_periodic_DD(correct_outputfile);
+    options.permute_in_place = 0;
+    options.original_index1 = NULL;
+    free(original_index);
+    return ret;
+}
+
+int test_periodic_DD_strided(const char *correct_outputfile)
+{
+    //Interleave the positions into an (N, 3) array, and read the columns through their stride
+    if(X1 != X2) {
+        return EXIT_FAILURE;
+    }
+    double *pos = malloc(sizeof(*pos) * 3 * ND1);
+    if(pos == NULL) {
+        return EXIT_FAILURE;
+    }
+    for(int i=0;i<ND1;i++) {
+        pos[3*i + 0] = X1[i];
+        pos[3*i + 1] = Y1[i];
+        pos[3*i + 2] = Z1[i];
+    }
+    double *x = X1, *y = Y1, *z = Z1;
+    X1 = X2 = pos;
+    Y1 = Y2 = pos + 1;
+    Z1 = Z2 = pos + 2;
+    options.position_stride1 = 3*sizeof(*pos);
+    int ret = test_periodic_DD(correct_outputfile);
+    options.position_stride1 = 0;
+    X1 = X2 = x;
+    Y1 = Y2 = y;
+    Z1 = Z2 = z;
+    free(pos);
+    return ret;
+}
+
 int test_vpf(const char *correct_outputfile)
 {
     const double rmax = 10.0;
@@ -608,9 +695,14 @@ int main(int argc, char **argv)
                                            "Mr19 DDsmu (periodic)",
                                            "CMASS DDrppi DD (periodic)",
                                            "CMASS DDrppi DR (periodic)",
-                                           "CMASS DDrppi RR (periodic)"};
+                                           "CMASS DDrppi RR (periodic)",
+                                           "Mr19 DD (periodic, mixed precision)",
+                                           "Mr19 wp (periodic, mixed precision)",
+                                           "Mr19 DD (periodic, quantised positions)",
+                                           "Mr19 DD (periodic, in place)",
+                                           "Mr19 DD (periodic, strided positions)"};
     const int ntests = sizeof(alltests_names)/(sizeof(char)*MAXLEN);
-    const int function_pointer_index[] = {1,0,2,3,4,5,1,1,1};//0->DD, 1->DDrppi,2->wp, 3->vpf, 4->xi, 5->DDsmu
+    const int function_pointer_index[] = {1,0,2,3,4,5,1,1,1,6,7,8,9,10};//0->DD, 1->DDrppi,2->wp, 3->vpf, 4->xi, 5->DDsmu, 6->DD (mixed), 7->wp (mixed), 8->DD (quantised), 9->DD (in place), 10->DD (strided)
 
     const char correct_outputfiles[][MAXLEN] = {"Mr19_DDrppi_periodic",
                                                 "Mr19_DD_periodic",
@@ -620,7 +712,12 @@ int main(int argc, char **argv)
                                                 "Mr19_DDsmu_periodic",
                                                 "cmass_DD_periodic",
                                                 "cmass_DR_periodic",
-                                                "cmass_RR_periodic"};
+                                                "cmass_RR_periodic",
+                                                "Mr19_DD_periodic",
+                                                "Mr19_wp",
+                                                "Mr19_DD_periodic",
+                                                "Mr19_DD_periodic",
+                                                "Mr19_DD_periodic"};
     const char firstfilename[][MAXLEN] = {"../tests/data/gals_Mr19.ff",
                                           "../tests/data/gals_Mr19.ff",
                                           "../tests/data/gals_Mr19.ff",
@@ -629,8 +726,13 @@ int main(int argc, char **argv)
                                           "../tests/data/gals_Mr19.ff",
                                           "../tests/data/cmassmock_Zspace.ff",
                                           "../tests/data/cmassmock_Zspace.ff",
-                                          "../tests/data/random_Zspace.ff"};
-    const char firstfiletype[][MAXLEN] = {"f","f","f","f","f","f","f","f","f"};
+                                          "../tests/data/random_Zspace.ff",
+                                          "../tests/data/gals_Mr19.ff",
+                                          "../tests/data/gals_Mr19.ff",
+                                          "../tests/data/gals_Mr19.ff",
+                                          "../tests/data/gals_Mr19.ff",
+                                          "../tests/data/gals_Mr19.ff"};
+    const char firstfiletype[][MAXLEN] = {"f","f","f","f","f","f","f","f","f","f","f","f","f","f"};
     const char secondfilename[][MAXLEN] = {"../tests/data/gals_Mr19.ff",
                                            "../tests/data/gals_Mr19.ff",
                                            "../tests/data/gals_Mr19.ff",
@@ -639,17 +741,27 @@ int main(int argc, char **argv)
                                            "../tests/data/gals_Mr19.ff",
                                            "../tests/data/cmassmock_Zspace.ff",
                                            "../tests/data/random_Zspace.ff",
-                                           "../tests/data/random_Zspace.ff"};
-    const char secondfiletype[][MAXLEN] = {"f","f","f","f","f","f","f","f","f"};
-    const double allpimax[]             = {40.0,40.0,40.0,40.0,40.0,40.0,80.0,80.0,80.0};
+                                           "../tests/data/random_Zspace.ff",
+                                           "../tests/data/gals_Mr19.ff",
+                                           "../tests/data/gals_Mr19.ff",
+                                           "../tests/data/gals_Mr19.ff",
+                                           "../tests/data/gals_Mr19.ff",
+                                           "../tests/data/gals_Mr19.ff"};
+    const char secondfiletype[][MAXLEN] = {"f","f","f","f","f","f","f","f","f","f","f","f","f","f"};
+    const double allpimax[]             = {40.0,40.0,40.0,40.0,40.0,40.0,80.0,80.0,80.0,40.0,40.0,40.0,40.0,40.0};
 
     int (*allfunctions[]) (const char *) = {test_periodic_DD,
                                             test_periodic_DDrppi,
                                             test_wp,
                                             test_vpf,
                                             test_xi,
-                                            test_periodic_DDsmu};
-    const int numfunctions=6;//6 functions total
+                                            test_periodic_DDsmu,
+                                            test_periodic_DD_mixed,
+                                            test_wp_mixed,
+                                            test_periodic_DD_quantised,
+                                            test_periodic_DD_in_place,
+                                            test_periodic_DD_strided};
+    const int numfunctions=11;//11 functions total
 
     int total_tests=0,skipped=0;
 
@@ -25,6 +25,7 @@ void free_results_wp(results_countpairs_wp *results)
     free(results->wp);
     free(results->rpavg);
     free(results->weightavg);
+    free(results->pimax_list);
 }
 
 int countpairs_wp(const int64_t ND, void * restrict X, void * restrict Y, void * restrict Z,
@@ -47,7 +48,9 @@ int countpairs_wp(const int64_t ND, void * restrict X, void * restrict Y, void *
         return EXIT_FAILURE;
     }
 
-    if(options->float_type == sizeof(float)) {
+    /* The float kernels are also used in mixed-precision mode. The arrays then still hold
+       doubles -> they are only read (according to options->float_type) while gridding */
+    if(options->float_type == sizeof(float) || options->mixed_precision) {
       return countpairs_wp_float(ND, (float * restrict) X, (float * restrict) Y, (float * restrict) Z,
                                  boxsize,
                                  numthreads,
@@ -67,3 +70,46 @@ int countpairs_wp(const int64_t ND, void * restrict X, void * restrict Y, void *
                                   extra);
     }
 }
+
+
+int countpairs_wp_batch(const int64_t ncatalogs,
+                        const int64_t *ND, void **X, void **Y, void **Z,
+                        const double boxsize,
+                        const int numthreads,
+                        const char *binfile,
+                        const double pimax,
+                        results_countpairs_wp *results,
+                        struct config_options *options,
+                        struct extra_options *extra)
+{
+    if( ! (options->float_type == sizeof(float) || options->float_type == sizeof(double))){
+        fprintf(stderr,"ERROR: In %s> Can only handle doubles or floats. Got an array of size = %zu\n",
+                __FUNCTION__, options->float_type);
+        return EXIT_FAILURE;
+    }
+
+    if( strncmp(options->version, STR(VERSION), sizeof(options->version)/sizeof(char)-1 ) != 0) {
+        fprintf(stderr,"Error: Do not know this API version = `%s'. Expected version = `%s'\n", options->version, STR(VERSION));
+        return EXIT_FAILURE;
+    }
+
+    if(options->float_type == sizeof(float) || options->mixed_precision) {
+      return countpairs_wp_batch_float(ncatalogs, ND, (float **) X, (float **) Y, (float **) Z,
+                                       boxsize,
+                                       numthreads,
+                                       binfile,
+                                       pimax,
+                                       results,
+                                       options,
+                                       extra);
+    } else {
+      return countpairs_wp_batch_double(ncatalogs, ND, (double **) X, (double **) Y, (double **) Z,
+                                        boxsize,
+                                        numthreads,
+                                        binfile,
+                                        pimax,
+                                        results,
+                                        options,
+                                        extra);
+    }
+}
@@ -25,6 +25,11 @@ extern "C" {
         double *weightavg;
         double pimax;
         int nbin;
+        /* With multiple pimax values (extra_options.pimax_list), npairs, wp, rpavg
+           and weightavg contain `num_pimax' consecutive blocks of `nbin' elements,
+           one for each pimax in pimax_list */
+        int num_pimax;
+        double *pimax_list;
     } results_countpairs_wp;
     
     extern int countpairs_wp(const int64_t ND1, void * restrict X1, void * restrict Y1, void * restrict Z1,
@@ -36,6 +41,19 @@ extern "C" {
                              struct config_options *options,
                              struct extra_options *extra) __attribute__((warn_unused_result));
 
+    /* Computes wp for `ncatalogs' independent catalogs (e.g., many small catalogs), distributing
+       whole catalogs over the threads. `results' must hold `ncatalogs' elements, and `extra' is
+       either NULL or an array of `ncatalogs' elements (with the weights of every catalog) */
+    extern int countpairs_wp_batch(const int64_t ncatalogs,
+                                   const int64_t *ND, void **X, void **Y, void **Z,
+                                   const double boxsize,
+                                   const int numthreads,
+                                   const char *binfile,
+                                   const double pimax,
+                                   results_countpairs_wp *results,
+                                   struct config_options *options,
+                                   struct extra_options *extra) __attribute__((warn_unused_result));
+
     extern void free_results_wp(results_countpairs_wp *results);
 
 #ifdef __cplusplus
@@ -46,7 +46,9 @@ int countpairs_xi(const int64_t ND, void * restrict X, void * restrict Y, void *
         return EXIT_FAILURE;
     }
     
-    if(options->float_type == sizeof(float)) {
+    /* The float kernels are also used in mixed-precision mode. The arrays then still hold
+       doubles -> they are only read (according to options->float_type) while gridding */
+    if(options->float_type == sizeof(float) || options->mixed_precision) {
         return countpairs_xi_float(ND, (float * restrict) X, (float * restrict) Y, (float * restrict) Z,
                                    boxsize,
                                    numthreads,
@@ -32,6 +32,10 @@ extern "C" {
 #define AVX_BIT_COUNT_UNSIGNED_LONG(X)      _mm_popcnt_u64(X)
 #define AVX_SET_INT(X)                      _mm256_set1_epi32(X)
 
+/* Number of particles from the first cell that are compared against every
+   vector of particles loaded from the second cell (register-blocking) */
+#define AVX_NTILE                           4
+
 
 #ifndef DOUBLE_PREC
 
@@ -51,6 +55,7 @@ extern "C" {
 #define AVX_SQRT_FLOAT(X)                _mm256_sqrt_ps(X)
 #define AVX_SVML_SQRT_FLOAT(X)           _mm256_svml_sqrt_ps(X)
 #define AVX_TRUNCATE_FLOAT_TO_INT(X)     _mm256_cvttps_epi32(X)
+#define AVX_FLOOR_FLOAT(X)               _mm256_floor_ps(X)
 #define AVX_STORE_FLOATS_TO_MEMORY(X,Y)  _mm256_storeu_ps(X,Y)
 #define AVX_SQUARE_FLOAT(X)              _mm256_mul_ps(X,X)
 #define AVX_LOG_FLOAT(X)                 _mm256_log_ps(X)
@@ -116,6 +121,7 @@ extern "C" {
 #define AVX_SQRT_FLOAT(X)                _mm256_sqrt_pd(X)
 #define AVX_SVML_SQRT_FLOAT(X)           _mm256_svml_sqrt_pd(X)
 #define AVX_TRUNCATE_FLOAT_TO_INT(X)     _mm256_cvttpd_epi32(X)
+#define AVX_FLOOR_FLOAT(X)               _mm256_floor_pd(X)
 #define AVX_STORE_FLOATS_TO_MEMORY(X,Y)  _mm256_storeu_pd(X,Y)
 #define AVX_SQUARE_FLOAT(X)              _mm256_mul_pd(X,X)
 #define AVX_LOG_FLOAT(X)                 _mm256_log_pd(X)
@@ -0,0 +1,219 @@
+/* File: cell_timer.h */
+/*
+  This file is a part of the Corrfunc package
+  Copyright (C) 2015-- Manodeep Sinha (manodeep@gmail.com)
+  License: MIT LICENSE. See LICENSE file under the top-level
+  directory at https://github.com/manodeep/Corrfunc/
+*/
+
+/*
+  Per cell-pair timers, enabled with the c_cell_timer option. Every thread
+  keeps its own `struct cell_pair_timer`, and times (every
+  c_cell_timer_sampling-th of) the cell pairs that it counts with the cycle
+  counter. The timings are only stored for the timed cell pairs, and the
+  threads add their timings to a shared timer at the end of the parallel
+  region. The cycles are converted into nano-seconds with the cycle rate
+  measured over the entire loop.
+
+  Usage:
+
+  struct cell_pair_timer all_timings;
+  init_cell_pair_timer(&all_timings, options);
+  #pragma omp parallel
+  {
+     struct cell_pair_timer timer;
+     init_cell_pair_timer(&timer, options);
+     for(...) {
+         start_cell_pair_timer(&timer);
+         ...count the pairs between the two cells...
+         stop_cell_pair_timer(&timer, N1, N2, first_cellindex, second_cellindex);
+     }
+     #pragma omp critical
+     merge_cell_pair_timers(&all_timings, &timer);
+  }
+  assign_cell_pair_timings(&all_timings, options);
+*/
+
+#pragma once
+
+#ifdef __cplusplus
+extern "C" {
+#endif
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <stdint.h>
+#include <string.h>
+
+#if defined(__x86_64__) || defined(__i386__)
+#include <x86intrin.h>
+#endif
+
+#if defined(_OPENMP)
+#include <omp.h>
+#endif
+
+#include "defs.h"
+#include "utils.h"
+
+struct cell_pair_timer
+{
+    struct api_cell_timings *timings;
+    int64_t ntimings;
+    int64_t nallocated;
+    int64_t ncell_pairs;/* Number of cell pairs seen by this timer -> only every `sampling'-th pair is timed */
+    int64_t ndropped;/* Number of timed cell pairs that could not be stored (out of memory) */
+    uint64_t start;/* Cycle count at the start of the current cell pair */
+    uint64_t calibration_cycles;/* Cycle count and (monotonic) time when the timer was set up. Used to convert */
+    double calibration_time;    /* the cycles into nano-seconds */
+    int32_t sampling;
+    int tid;
+    uint8_t enabled;
+    uint8_t running;
+};
+
+/* A cheap, monotonically increasing counter. The time-stamp counter on x86 (the
+   nominal frequency for all recent cpus), the virtual counter on arm64, and nano-seconds otherwise */
+static inline uint64_t read_cycle_counter(void)
+{
+#if defined(__x86_64__) || defined(__i386__)
+    return __rdtsc();
+#elif defined(__aarch64__)
+    uint64_t cycles;
+    __asm__ __volatile__("mrs %0, cntvct_el0" : "=r" (cycles));
+    return cycles;
+#else
+    return (uint64_t) (get_monotonic_time() * 1e9);
+#endif
+}
+
+static inline void init_cell_pair_timer(struct cell_pair_timer *timer, const struct config_options *options)
+{
+    memset(timer, 0, sizeof(*timer));
+    timer->enabled = options->c_cell_timer ? 1:0;
+    timer->sampling = options->c_cell_timer_sampling > 1 ? options->c_cell_timer_sampling:1;
+#if defined(_OPENMP)
+    timer->tid = omp_get_thread_num();
+#endif
+    if(timer->enabled) {
+        timer->calibration_time = get_monotonic_time();
+        timer->calibration_cycles = read_cycle_counter();
+    }
+}
+
+static inline void start_cell_pair_timer(struct cell_pair_timer *timer)
+{
+    if(timer->enabled == 0) {
+        return;
+    }
+    /* Only time every `sampling'-th cell pair */
+    timer->running = (timer->ncell_pairs % timer->sampling) == 0 ? 1:0;
+    timer->ncell_pairs++;
+    if(timer->running) {
+        timer->start = read_cycle_counter();
+    }
+}
+
+static inline void stop_cell_pair_timer(struct cell_pair_timer *timer, const int64_t N1, const int64_t N2,
+                                        const int first_cellindex, const int second_cellindex)
+{
+    if(timer->running == 0) {
+        return;
+    }
+    const uint64_t cycles = read_cycle_counter() - timer->start;
+    timer->running = 0;
+    if(timer->ntimings == timer->nallocated) {
+        const int64_t nallocated = timer->nallocated > 0 ? 2*timer->nallocated:1024;
+        struct api_cell_timings *timings = realloc(timer->timings, nallocated * sizeof(*timings));
+        if(timings == NULL) {
+            timer->ndropped++;
+            return;
+        }
+        timer->timings = timings;
+        timer->nallocated = nallocated;
+    }
+    struct api_cell_timings *t = &(timer->timings[timer->ntimings]);
+    const int tid = timer->tid;
+    ASSIGN_CELL_TIMINGS(t, N1, N2, 0, tid, first_cellindex, second_cellindex);
+    t->cycles = (int64_t) cycles;
+    timer->ntimings++;
+}
+
+/* Moves the timings from `thread_timer' into `all'. Needs to be called from within a critical section */
+static inline void merge_cell_pair_timers(struct cell_pair_timer *all, struct cell_pair_timer *thread_timer)
+{
+    all->ndropped += thread_timer->ndropped;
+    all->ncell_pairs += thread_timer->ncell_pairs;
+    if(thread_timer->ntimings > 0) {
+        if(all->ntimings + thread_timer->ntimings > all->nallocated) {
+            const int64_t nallocated = all->ntimings + thread_timer->ntimings;
+            struct api_cell_timings *timings = realloc(all->timings, nallocated * sizeof(*timings));
+            if(timings == NULL) {
+                all->ndropped += thread_timer->ntimings;
+                thread_timer->ntimings = 0;
+            } else {
+                all->timings = timings;
+                all->nallocated = nallocated;
+            }
+        }
+        if(thread_timer->ntimings > 0) {
+            memcpy(&(all->timings[all->ntimings]), thread_timer->timings, thread_timer->ntimings * sizeof(*(all->timings)));
+            all->ntimings += thread_timer->ntimings;
+        }
+    }
+    free(thread_timer->timings);
+    thread_timer->timings = NULL;
+    thread_timer->ntimings = thread_timer->nallocated = 0;
+}
+
+static inline int compare_cell_timings(const void *a, const void *b)
+{
+    const struct api_cell_timings *ta = (const struct api_cell_timings *) a;
+    const struct api_cell_timings *tb = (const struct api_cell_timings *) b;
+    if(ta->first_cellindex != tb->first_cellindex) {
+        return ta->first_cellindex < tb->first_cellindex ? -1:1;
+    }
+    if(ta->second_cellindex != tb->second_cellindex) {
+        return ta->second_cellindex < tb->second_cellindex ? -1:1;
+    }
+    return 0;
+}
+
+/* Sorts the timings (on the cell indices), converts the cycles into nano-seconds and hands
+   the timings over to options->cell_timings (freed with `free_cell_timings') */
+static inline void assign_cell_pair_timings(struct cell_pair_timer *all, struct config_options *options)
+{
+    if(all->ndropped > 0) {
+        fprintf(stderr,"Warning: In %s> Could not allocate memory to store the timings of %"PRId64" (out of %"PRId64") cell pairs\n",
+                __FUNCTION__, all->ndropped, all->ntimings + all->ndropped);
+    }
+
+    const uint64_t cycles = read_cycle_counter() - all->calibration_cycles;
+    const double ns_per_cycle = cycles > 0 ? (get_monotonic_time() - all->calibration_time) * 1e9 / cycles:1.0;
+    for(int64_t i=0;i<all->ntimings;i++) {
+        all->timings[i].time_in_ns = (int64_t) (all->timings[i].cycles * ns_per_cycle);
+    }
+    qsort(all->timings, all->ntimings, sizeof(*(all->timings)), compare_cell_timings);
+
+    free_cell_timings(options);
+    options->cell_timings = all->timings;
+    options->totncells_timings = all->ntimings;
+    if(all->ntimings == 0) {
+        free(all->timings);
+        options->cell_timings = NULL;
+    }
+    all->timings = NULL;
+    all->ntimings = all->nallocated = 0;
+}
+
+/* Frees the timings (after an error) */
+static inline void free_cell_pair_timer(struct cell_pair_timer *timer)
+{
+    free(timer->timings);
+    timer->timings = NULL;
+    timer->ntimings = timer->nallocated = 0;
+}
+
+#ifdef __cplusplus
+}
+#endif
@@ -54,10 +54,46 @@ struct api_cell_timings
     int64_t N1;/* Number of points in the first cell*/
     int64_t N2;/* Number of points in the second cell */
     int64_t time_in_ns;/* Time taken in the compute kernel, measured in nano-seconds*/
+    int64_t cycles;/* Time taken in the compute kernel, measured with the cycle counter (see `read_cycle_counter') */
     int first_cellindex;
     int second_cellindex;
     int tid;/* Thread-id, 0 for serial case, wastes 4 bytes, since thread id is 4bytes integer and not 8 bytes */
 };
+
+/* Phases of a pair-counter that are timed separately when the c_api_timer option is set.
+   The phases do not overlap, but do not cover everything (e.g., setting up the bins) */
+typedef enum {
+  API_PHASE_MAX_MIN=0, /* get_max_min -> the extent of the particles */
+  API_PHASE_GRIDLINK=1,/* gridlink -> assigning the particles to the cells (excluding the sort) */
+  API_PHASE_SORT=2,    /* sorting the particles within every cell (on z for theory, on dec/cz for mocks) */
+  API_PHASE_NGB=3,     /* assign_ngb_cells -> the neighbouring cells of every cell */
+  API_PHASE_KERNEL=4,  /* the loop over the cells, until the last thread has finished its cells */
+  API_PHASE_REDUCTION=5,/* adding up the per-thread histograms (and the self-pairs) and packing the results */
+  API_PHASE_DISTANCE=6,/* mocks only: the cosmology and (ra, dec, cz) -> (x, y, z) conversion */
+  API_PHASE_CLEANUP=7, /* freeing the lattices (after the kernel) and the bins (after the reduction) */
+  NUM_API_PHASES
+} api_phase;
+
+/* Events counted with the (Linux) perf_event_open interface when the c_perf_counters option is set */
+typedef enum {
+  API_PERF_CYCLES=0,
+  API_PERF_INSTRUCTIONS=1,
+  API_PERF_CACHE_REFERENCES=2,/* last-level cache accesses */
+  API_PERF_CACHE_MISSES=3,    /* last-level cache misses */
+  API_PERF_BRANCHES=4,
+  API_PERF_BRANCH_MISSES=5,
+  API_PERF_TASK_CLOCK=6,      /* software event: nano-seconds spent running on a cpu */
+  API_PERF_PAGE_FAULTS=7,     /* software event */
+  NUM_API_PERF_EVENTS
+} api_perf_event;
+
+/* The counts of every event, for one phase on one thread */
+struct api_perf_counts
+{
+    int64_t counts[NUM_API_PERF_EVENTS];/* -1 if the event could not be counted (scaled up if the counter was multiplexed) */
+    int32_t phase;/* One of API_PHASE_GRIDLINK (includes the sort), API_PHASE_NGB or API_PHASE_KERNEL */
+    int32_t tid;/* Thread-id -> the gridlink and ngb phases are only counted on the calling thread */
+};
     
 
 #define MAX_FAST_DIVIDE_NR_STEPS  6
@@ -76,6 +112,10 @@ struct config_options
     /* Theory option for periodic boundaries */
     double boxsize;
 
+    /* Theory option: if > 0, gridlink stores the positions as 16 or 32 bit integer offsets within
+       every cell, with at most this error (per axis). Cuts the memory used by the lattice */
+    double max_position_error;
+
     /* Options for mocks */
     //cosmology struct. Intentionally left anoynoymous, so I can
     //directly access the fields.
@@ -94,27 +134,69 @@ struct config_options
      */
     double c_api_time;
 
+    /* Time (in seconds, measured with a monotonic clock) spent in every one of the
+       `api_phase' phases. Also enabled with c_api_timer */
+    double c_api_phase_times[NUM_API_PHASES];
+
     /* Per cell timers. Keeps track of the number of particles per cell pair
        and time spent to compute the pairs. Might slow down code */
     struct api_cell_timings *cell_timings;
     int64_t totncells_timings;
+
+    /* Hardware performance counters (see `api_perf_counts'), one entry per phase and thread. Enabled with c_perf_counters */
+    struct api_perf_counts *perf_counts;
+    int64_t nperf_counts;
+
+    /* Peak memory (in bytes) allocated by Corrfunc since the start of the call, reached during every one of the
+       `api_phase' phases. Enabled with c_api_phase_memory (Linux and OSX, -1 if the allocations can not be counted) */
+    int64_t c_api_phase_peak_memory[NUM_API_PHASES];
+    int64_t c_api_memory_baseline;/* Allocated memory (in bytes) at the start of the call (0, or -1 if it can not be counted) */
+
+    /* Theory option, only used with permute_in_place (may be NULL, except with velocities). Arrays of ND1 and ND2 elements
+       that are filled with the original index of every particle, after the inputs have been permuted */
+    int64_t *original_index1;
+    int64_t *original_index2;
+
+    /* Theory option. Number of bytes between consecutive elements of the X/Y/Z arrays of the first
+       and second set of points, e.g., the columns of an (N, 3) array. 0 -> contiguous arrays */
+    int64_t position_stride1;
+    int64_t position_stride2;
+
+    /* Theory option (may be NULL). The num_bin_edges (increasing) bin-edges, used instead of
+       reading the bins from the `binfile'. Set by the python extensions to avoid a temporary file */
+    double *bin_edges;
+    int64_t num_bin_edges;
+
+    /* Theory option for DD, DDrppi and DDsmu (may be NULL). A gridded catalog of the first set of points (see
+       gridded_catalog.h): memory-mapped and used instead of gridding the points if the file exists (X1/Y1/Z1 must then
+       be NULL, and ND1 the number of points in the file), written otherwise */
+    const char *grid_file;
     
     
     size_t float_type; /* floating point type -> vectorized supports double/float; fallback can support long double*/
     int32_t instruction_set; /* select instruction set to run on */
+    int32_t c_cell_timer_sampling;/* with c_cell_timer, only time every c_cell_timer_sampling-th cell pair (per thread). 0 or 1 -> every cell pair */
 
     char version[32];/* fill in the version number */
     uint8_t verbose; /* Outputs progressbar and times */
     uint8_t c_api_timer; /* Measures time spent in the C function */
     uint8_t c_cell_timer;/* Measures time spent per cell-pair. Might slow down the code */
+    uint8_t c_perf_counters;/* Counts cycles, instructions, cache and branch misses with perf_event_open (Linux only) */
+    uint8_t c_api_phase_memory;/* Measures the peak memory allocated by Corrfunc during every phase. The allocations
+                                  are counted process-wide, i.e., concurrent calls are added together */
 
     /* Options valid for both theory and mocks */
     uint8_t need_avg_sep; /* <rp> or <\theta> is required */
     uint8_t autocorr;/* Only one dataset is required */
+    uint8_t query_mode;/* cross-correlations only: grid the second dataset, and stream the (small) first dataset through the
+                          neighbouring cells instead of gridding it onto the same lattice */
     
     /* Options for theory*/
     uint8_t periodic; /* count in periodic mode? flag ignored for wp/xi */
     uint8_t sort_on_z;/* option to sort particles based on their Z co-ordinate in gridlink*/
+    uint8_t los;/* line-of-sight axis for DDrppi/DDsmu. One of the values in `los_type` (default is LOS_Z) */
+    uint8_t mixed_precision;/* store the positions relative to their cell in gridlink. Lets the float kernels run on double inputs */
+    uint8_t permute_in_place;/* reorder the input arrays into cell order in gridlink, instead of copying them into the cells */
 
     /* For DDrppi_mocks and vpf*/
     uint8_t is_comoving_dist;/* flag to indicate cz is already co-moving distance */
@@ -154,8 +236,9 @@ struct config_options
     /* Reserving to maintain ABI compatibility for the future */
     /* Note that the math here assumes no padding bytes, that's because of the 
        order in which the fields are declared (largest to smallest alignments)  */
-    uint8_t reserved[OPTIONS_HEADER_SIZE - 33*sizeof(char) - sizeof(size_t) - 9*sizeof(double) - 3*sizeof(int)
-                     - sizeof(uint16_t) - 14*sizeof(uint8_t) - sizeof(struct api_cell_timings *) - sizeof(int64_t) ];
+    uint8_t reserved[OPTIONS_HEADER_SIZE - 33*sizeof(char) - sizeof(size_t) - 10*sizeof(double) - NUM_API_PHASES*sizeof(double) - 4*sizeof(int)
+                     - sizeof(uint16_t) - 20*sizeof(uint8_t) - sizeof(struct api_cell_timings *) - sizeof(struct api_perf_counts *)
+                     - (6 + NUM_API_PHASES)*sizeof(int64_t) - 2*sizeof(int64_t *) - sizeof(double *) - sizeof(char *) ];
 };
 
 static inline void set_bin_refine_scheme(struct config_options *options, const int8_t flag)
@@ -362,15 +445,76 @@ static inline int get_weight_method_by_name(const char *name, weight_method_t *m
     return EXIT_FAILURE;
 }
     
+/* Line-of-sight choices for the theory DDrppi and DDsmu routines */
+typedef enum {
+  LOS_Z=0, /* default */
+  LOS_X=1,
+  LOS_Y=2,
+  LOS_ALL=3, /* x, y and z lines-of-sight in one pass (three histograms in that order) */
+  NUM_LOS_TYPE
+} los_type;
+
+/* Maps a name to the line-of-sight
+   `los` will be set on return.
+ */
+static inline int get_los_by_name(const char *name, uint8_t *los){
+    if(name == NULL || strcmp(name, "") == 0 || strcmp(name, "z") == 0){
+        *los = LOS_Z;
+        return EXIT_SUCCESS;
+    }
+    if(strcmp(name, "x") == 0){
+        *los = LOS_X;
+        return EXIT_SUCCESS;
+    }
+    if(strcmp(name, "y") == 0){
+        *los = LOS_Y;
+        return EXIT_SUCCESS;
+    }
+    if(strcmp(name, "all") == 0){
+        *los = LOS_ALL;
+        return EXIT_SUCCESS;
+    }
+
+    return EXIT_FAILURE;
+}
+
+/* Number of histograms produced for a given line-of-sight */
+static inline int get_num_los(const uint8_t los){
+    return los == LOS_ALL ? 3:1;
+}
+
 struct extra_options
 {
     // Two possible weight_structs (at most we will have two loaded sets of particles)
     weight_struct weights0;
     weight_struct weights1;
+
+    // Optional velocities (x, y, z; same precision as the positions) for applying
+    // redshift-space displacements along the line-of-sight on the fly.
+    // Only used by the theory DDrppi and DDsmu routines. NULL pointers disable the displacement.
+    void *velocities0[3];
+    void *velocities1[3];
+    double rsd_factor;// displacement = velocity * rsd_factor (e.g., 1/(aH) in the units of the positions)
+
+    // Optional list of (strictly increasing) pimax values. Only used by theory wp, where
+    // the pairs are counted once and wp is returned for every pimax. NULL disables.
+    double *pimax_list;
+    int num_pimax;
+
     weight_method_t weight_method; // the function that will get called to give the weight of a particle pair
-    uint8_t reserved[EXTRA_OPTIONS_HEADER_SIZE - 2*sizeof(weight_struct) - sizeof(weight_method_t)];
+    uint8_t reserved[EXTRA_OPTIONS_HEADER_SIZE - 2*sizeof(weight_struct) - 6*sizeof(void *) - sizeof(double)
+                     - sizeof(double *) - sizeof(int) - sizeof(weight_method_t)];
 };
 
+static inline int has_velocities(const struct extra_options *extra, const int autocorr)
+{
+    for(int i=0;i<3;i++) {
+        if(extra->velocities0[i] != NULL) return 1;
+        if(autocorr == 0 && extra->velocities1[i] != NULL) return 1;
+    }
+    return 0;
+}
+
 // weight_method determines the number of various weighting arrays that we allocate
 static inline struct extra_options get_extra_options(const weight_method_t weight_method)
 {    
@@ -388,18 +532,75 @@ static inline struct extra_options get_extra_options(const weight_method_t weigh
     return extra;
 }
 
+static inline const char *get_api_phase_name(const api_phase phase)
+{
+    switch(phase) {
+    case API_PHASE_MAX_MIN:
+        return "max_min";
+    case API_PHASE_GRIDLINK:
+        return "gridlink";
+    case API_PHASE_SORT:
+        return "sort";
+    case API_PHASE_NGB:
+        return "assign_ngb_cells";
+    case API_PHASE_KERNEL:
+        return "kernel";
+    case API_PHASE_REDUCTION:
+        return "reduction";
+    case API_PHASE_DISTANCE:
+        return "distance";
+    case API_PHASE_CLEANUP:
+        return "cleanup";
+    default:
+        return "unknown";
+    }
+}
+
+static inline const char *get_api_perf_event_name(const api_perf_event event)
+{
+    switch(event) {
+    case API_PERF_CYCLES:
+        return "cycles";
+    case API_PERF_INSTRUCTIONS:
+        return "instructions";
+    case API_PERF_CACHE_REFERENCES:
+        return "cache_references";
+    case API_PERF_CACHE_MISSES:
+        return "cache_misses";
+    case API_PERF_BRANCHES:
+        return "branches";
+    case API_PERF_BRANCH_MISSES:
+        return "branch_misses";
+    case API_PERF_TASK_CLOCK:
+        return "task_clock_ns";
+    case API_PERF_PAGE_FAULTS:
+        return "page_faults";
+    default:
+        return "unknown";
+    }
+}
+
+static inline void reset_api_phase_times(struct config_options *options)
+{
+    for(int i=0;i<NUM_API_PHASES;i++) {
+        options->c_api_phase_times[i] = 0.0;
+        options->c_api_phase_peak_memory[i] = 0;
+    }
+}
+
 static inline void print_cell_timings(struct config_options *options)
 {
-    fprintf(stderr,"#########################################################################\n");
-    fprintf(stderr,"#  Cell_1    Cell_2          N1          N2        Time_ns     ThreadID  \n");
-    fprintf(stderr,"#########################################################################\n");
+    fprintf(stderr,"######################################################################################\n");
+    fprintf(stderr,"#  Cell_1    Cell_2          N1          N2        Time_ns       Cycles     ThreadID  \n");
+    fprintf(stderr,"######################################################################################\n");
     for(int64_t i=0;i<options->totncells_timings;i++) {
-        fprintf(stderr,"%8d %8d %12"PRId64" %12"PRId64" %12"PRId64" %12d\n",
+        fprintf(stderr,"%8d %8d %12"PRId64" %12"PRId64" %12"PRId64" %12"PRId64" %12d\n",
                 options->cell_timings[i].first_cellindex,
                 options->cell_timings[i].second_cellindex,
                 options->cell_timings[i].N1,
                 options->cell_timings[i].N2,
                 options->cell_timings[i].time_in_ns,
+                options->cell_timings[i].cycles,
                 options->cell_timings[i].tid);
     }
 
@@ -407,52 +608,16 @@ static inline void print_cell_timings(struct config_options *options)
 
 static inline void free_cell_timings(struct config_options *options)
 {
-    if(options->totncells_timings > 0 && options->cell_timings != NULL) {
-        free(options->cell_timings);
-    }
-}    
+    free(options->cell_timings);
+    options->cell_timings = NULL;
+    options->totncells_timings = 0;
+}
 
-static inline void assign_cell_timer(struct api_cell_timings *cell_timings, const int64_t totncells, const int max_ngb_cells, struct config_options *options)
+static inline void free_perf_counts(struct config_options *options)
 {
-    int64_t totncells_timings=0;
-    for(int64_t index1=0;index1<totncells;index1++) {
-        for(int ingb=0;ingb<max_ngb_cells;ingb++) {
-            int index = index1 * max_ngb_cells + ingb;
-            struct api_cell_timings *t = &(cell_timings[index]);
-            if(t->time_in_ns > 0) {
-                totncells_timings++;
-            }
-        }
-    }
-    /* Does the existing thread timings pointer have enough memory allocated ?*/
-    if(options->totncells_timings < totncells_timings) {
-        options->totncells_timings = 0;
-        
-        /* Not enough memory -> need to reallocate*/
-        free(options->cell_timings);
-        options->cell_timings = calloc(totncells_timings, sizeof(*(options->cell_timings)));
-        if(options->cell_timings == NULL) {
-            fprintf(stderr,"Warning: In %s> Could not allocate memory to store the API timings per cell. \n",
-                    __FUNCTION__);
-        } else {
-            options->totncells_timings = totncells_timings;
-        }
-    } 
-    
-    /* This looks like a repeated "if" condition but it is not. Covers the case for the calloc failure above */
-    if(options->totncells_timings >= totncells_timings) {
-        /* Okay, enough memory to assign the thread timings */
-        struct api_cell_timings *t = options->cell_timings;
-        for(int64_t index1=0;index1<totncells;index1++) {
-            for(int ingb=0;ingb<max_ngb_cells;ingb++) {
-                int index = index1 * max_ngb_cells + ingb;
-                if(cell_timings[index].time_in_ns > 0) {
-                    *t = cell_timings[index];
-                    t++;
-                }
-            }
-        }
-    }
+    free(options->perf_counts);
+    options->perf_counts = NULL;
+    options->nperf_counts = 0;
 }
     
     
@@ -70,6 +70,7 @@ extern "C" {
 #define ASIN   asin
 #define POW    pow
 #define ABS    fabs
+#define NEXTAFTER nextafter
 #else
 #define DOUBLE float
 #define REAL_FORMAT "f"
@@ -86,6 +87,7 @@ extern "C" {
 #define ASIN   asinf
 #define POW    powf
 #define ABS    fabsf
+#define NEXTAFTER nextafterf
 #endif
 
 #ifdef __cplusplus
@@ -0,0 +1,188 @@
+/* File: gridded_catalog.h */
+/*
+  This file is a part of the Corrfunc package
+  Copyright (C) 2015-- Manodeep Sinha (manodeep@gmail.com)
+  License: MIT LICENSE. See LICENSE file under the top-level
+  directory at https://github.com/manodeep/Corrfunc/
+*/
+
+/*
+  Gridded catalogs, enabled with the grid_file option. The lattice built by
+  gridlink_index_particles for the first set of points is written to a
+  (versioned) binary file, and later calls -- in any process -- memory-map
+  the file read-only and use the cells directly, instead of gridding the
+  points again. Every process that maps the same file shares one copy in the
+  page cache.
+
+  Layout (native byte-order, checked with `byte_order'):
+
+  [struct gridded_catalog_header]                     GRIDDED_CATALOG_HEADER_SIZE bytes
+  [struct gridded_catalog_cell] x totncells           at cells_offset
+  [cell data]                                         at data_offset (page aligned)
+
+  The data of every cell are the padded x, y, z and weights arrays (see
+  cellarray.h.src) of GRIDLINK_PADDED_NELEMENTS(nelements) elements each,
+  every array starting on a GRIDDED_CATALOG_ARRAY_ALIGNMENT byte boundary.
+  The positions are stored relative to the origin of the cell (only non-zero
+  with mixed_precision). The particles are sorted on z if `sort_on_z' is set.
+
+  The lattice (mesh, refine factors and the max. separation along every axis
+  it was built for) is fixed by the file: a later call may use any smaller
+  (or equal) max. separation, and a second set of points that lies within
+  the bounds of the file. The file does not record (e.g., with a hash) which
+  points were gridded, so a later call must not pass the first set of points
+  at all -- passing them is an error.
+
+  DD, DDrppi and DDsmu (theory), and DDrppi_mocks and DDsmu_mocks support gridded catalogs. The lattices of the
+  mocks (flagged with `mocks') are not padded: every cell holds the x, y, z and cz (co-moving distance) arrays and the
+  weights of exactly nelements particles, sorted on cz. The positions depend on the cosmology that converted cz into
+  co-moving distances, so the file records it (0 if the co-moving distances were passed).
+*/
+
+#pragma once
+
+#ifdef __cplusplus
+extern "C" {
+#endif
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <stdint.h>
+#include <inttypes.h>
+#include <string.h>
+#include <errno.h>
+#include <unistd.h>
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+
+#define GRIDDED_CATALOG_MAGIC          "CORRGRID"
+#define GRIDDED_CATALOG_VERSION        1
+#define GRIDDED_CATALOG_BYTE_ORDER     UINT64_C(0x0102030405060708)
+#define GRIDDED_CATALOG_HEADER_SIZE    256
+#define GRIDDED_CATALOG_DATA_ALIGNMENT 4096
+#define GRIDDED_CATALOG_ARRAY_ALIGNMENT  64 /* GRIDLINK_ALIGNMENT */
+
+struct gridded_catalog_header
+{
+    char magic[8];
+    int64_t version;
+    uint64_t byte_order;
+    int64_t np;/* number of particles (without the padding) */
+    int64_t totncells;
+    int64_t cells_offset;/* offset (in bytes, from the start of the file) of the table of cells */
+    int64_t data_offset;/* offset of the data of the first cell */
+    int64_t file_size;
+    int64_t element_size;/* sizeof(DOUBLE) of the lattice */
+    int64_t input_element_size;/* size of the input positions (options->float_type) */
+    int64_t num_weights;
+    double bounds[6];/* xmin, xmax, ymin, ymax, zmin, zmax */
+    double max_size[3];/* max. separation along every axis that the lattice was built for */
+    double boxsize;
+    double max_cz;/* mocks: max. cz of the points, which sets the cz -> co-moving distance table (0 if not converted) */
+    int32_t nmesh[3];
+    int32_t bin_refine_factors[3];
+    int32_t max_cells_per_dim;
+    int32_t periodic;
+    int32_t sort_on_z;
+    int32_t mixed_precision;
+    int32_t los;
+    int32_t mocks;/* lattice of DDrppi_mocks/DDsmu_mocks */
+    int32_t cosmology;/* mocks: cosmology used for the co-moving distances (0 if they were passed) */
+    uint8_t reserved[GRIDDED_CATALOG_HEADER_SIZE - 8*sizeof(char) - 10*sizeof(int64_t) - 11*sizeof(double) - 13*sizeof(int32_t)];
+};
+
+struct gridded_catalog_cell
+{
+    int64_t offset;/* offset (in bytes, from data_offset) of the x array of the cell */
+    int64_t nelements;
+    double origin[3];
+};
+
+/* Returns the space (in bytes) taken by one array of npadded elements of a cell, including the alignment */
+static inline int64_t gridded_catalog_array_size(const int64_t npadded, const int64_t element_size)
+{
+    const int64_t nbytes = npadded * element_size;
+    return ((nbytes + GRIDDED_CATALOG_ARRAY_ALIGNMENT - 1)/GRIDDED_CATALOG_ARRAY_ALIGNMENT)*GRIDDED_CATALOG_ARRAY_ALIGNMENT;
+}
+
+/* Reads (and checks) the header of a gridded catalog. `found' is set to 0 (and EXIT_SUCCESS is returned) if
+   the file does not exist */
+static inline int read_gridded_catalog_header(const char *filename, struct gridded_catalog_header *header, int *found)
+{
+    *found = 0;
+    if(filename == NULL) {
+        return EXIT_SUCCESS;
+    }
+    FILE *fp = fopen(filename, "rb");
+    if(fp == NULL) {
+        if(errno == ENOENT) {
+            return EXIT_SUCCESS;
+        }
+        fprintf(stderr,"Error: In %s> Could not open the gridded catalog `%s'\n", __FUNCTION__, filename);
+        perror(NULL);
+        return EXIT_FAILURE;
+    }
+    const size_t nread = fread(header, sizeof(*header), 1, fp);
+    fclose(fp);
+    if(nread != 1 || memcmp(header->magic, GRIDDED_CATALOG_MAGIC, sizeof(header->magic)) != 0) {
+        fprintf(stderr,"Error: In %s> `%s' is not a gridded catalog\n", __FUNCTION__, filename);
+        return EXIT_FAILURE;
+    }
+    if(header->byte_order != GRIDDED_CATALOG_BYTE_ORDER) {
+        fprintf(stderr,"Error: In %s> The gridded catalog `%s' was written on a machine with a different byte-order\n",
+                __FUNCTION__, filename);
+        return EXIT_FAILURE;
+    }
+    if(header->version != GRIDDED_CATALOG_VERSION) {
+        fprintf(stderr,"Error: In %s> The gridded catalog `%s' has version %"PRId64" but this version of Corrfunc "
+                "can only read version %d. Please remove the file (it is written again by the next call)\n",
+                __FUNCTION__, filename, header->version, GRIDDED_CATALOG_VERSION);
+        return EXIT_FAILURE;
+    }
+    *found = 1;
+    return EXIT_SUCCESS;
+}
+
+/* Checks the layout in the header, and memory-maps the (read-only) gridded catalog. Every process that maps the
+   file shares the same pages */
+static inline int map_gridded_catalog(const char *filename, const struct gridded_catalog_header *header, void **mapping)
+{
+    *mapping = NULL;
+    const int64_t totncells = (int64_t) header->nmesh[0] * header->nmesh[1] * header->nmesh[2];
+    if(header->totncells != totncells || totncells <= 0 || header->cells_offset < GRIDDED_CATALOG_HEADER_SIZE ||
+       header->cells_offset + totncells * (int64_t) sizeof(struct gridded_catalog_cell) > header->data_offset ||
+       header->data_offset > header->file_size) {
+        fprintf(stderr,"Error: In %s> The gridded catalog `%s' is corrupted (%"PRId64" cells, data at %"PRId64" in a file "
+                "of %"PRId64" bytes)\n", __FUNCTION__, filename, header->totncells, header->data_offset, header->file_size);
+        return EXIT_FAILURE;
+    }
+
+    const int fd = open(filename, O_RDONLY);
+    if(fd < 0) {
+        fprintf(stderr,"Error: In %s> Could not open the gridded catalog `%s'\n", __FUNCTION__, filename);
+        perror(NULL);
+        return EXIT_FAILURE;
+    }
+    struct stat st;
+    if(fstat(fd, &st) != 0 || (int64_t) st.st_size != header->file_size) {
+        fprintf(stderr,"Error: In %s> The gridded catalog `%s' should contain %"PRId64" bytes (the file is truncated)\n",
+                __FUNCTION__, filename, header->file_size);
+        close(fd);
+        return EXIT_FAILURE;
+    }
+    void *map = mmap(NULL, header->file_size, PROT_READ, MAP_SHARED, fd, 0);
+    close(fd);
+    if(map == MAP_FAILED) {
+        fprintf(stderr,"Error: In %s> Could not memory-map the gridded catalog `%s' (%"PRId64" bytes)\n",
+                __FUNCTION__, filename, header->file_size);
+        perror(NULL);
+        return EXIT_FAILURE;
+    }
+    *mapping = map;
+    return EXIT_SUCCESS;
+}
+
+#ifdef __cplusplus
+}
+#endif
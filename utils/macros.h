@@ -6,9 +6,72 @@
 #define BOOST_NUMPART_THRESH 250
 #define BOOST_BIN_REF       1
 
+/* Max. number of query points (in query mode) that are streamed through the neighbouring cells together */
+#define QUERY_GROUP_NPART   64
+
 #define ADD_DIFF_TIME(t0,t1)            ((t1.tv_sec - t0.tv_sec) + 1e-6*(t1.tv_usec - t0.tv_usec))
 #define REALTIME_ELAPSED_NS(t0, t1)     ((t1.tv_sec - t0.tv_sec)*1000000000.0 + (t1.tv_nsec - t0.tv_nsec))
 
+/* Starts counting the bytes allocated by Corrfunc (see start_allocation_tracking) from 0. The peaks are -1 if the
+   allocations can not be counted. Does nothing unless the c_api_phase_memory option is set */
+#define API_PHASE_MEMORY_START(options)                                 \
+    {                                                                   \
+        if((options)->c_api_phase_memory) {                             \
+            (options)->c_api_memory_baseline =                          \
+                start_allocation_tracking() == EXIT_SUCCESS ? 0:-1;     \
+            for(int iphase_=0;iphase_<NUM_API_PHASES;iphase_++) {       \
+                (options)->c_api_phase_peak_memory[iphase_] =           \
+                    (options)->c_api_memory_baseline < 0 ? -1:0;        \
+            }                                                           \
+        }                                                               \
+    }
+
+/* Updates the peak memory of `phase' with the peak of the bytes allocated (since the start of the call) since
+   the last lap, and resets the peak to the bytes currently allocated */
+#define API_PHASE_MEMORY_LAP(options, phase)                            \
+    {                                                                   \
+        if((options)->c_api_phase_memory && (options)->c_api_memory_baseline >= 0) { \
+            int64_t peak_ = get_allocated_memory(1) - (options)->c_api_memory_baseline; \
+            peak_ = peak_ < 0 ? 0:peak_;                                \
+            if(peak_ > (options)->c_api_phase_peak_memory[phase]) {     \
+                (options)->c_api_phase_peak_memory[phase] = peak_;      \
+            }                                                           \
+            reset_peak_allocated_memory();                              \
+        }                                                               \
+    }
+
+/* Stops counting the allocated bytes at the end of the call */
+#define API_PHASE_MEMORY_STOP(options)                                  \
+    {                                                                   \
+        if((options)->c_api_phase_memory) {                             \
+            stop_allocation_tracking();                                 \
+        }                                                               \
+    }
+
+/* Adds the time elapsed since `tstart' (from get_monotonic_time) to the timer for `phase',
+   and restarts `tstart'. Does nothing unless the c_api_timer option is set. Also updates
+   the peak memory of `phase' with the c_api_phase_memory option */
+#define API_PHASE_LAP(options, phase, tstart)                           \
+    {                                                                   \
+        if((options)->c_api_timer) {                                    \
+            const double tlap_ = get_monotonic_time();                  \
+            (options)->c_api_phase_times[phase] += tlap_ - (tstart);    \
+            tstart = tlap_;                                             \
+        }                                                               \
+        API_PHASE_MEMORY_LAP(options, phase);                           \
+    }
+
+/* Restarts `tstart' without adding the elapsed time (or the memory) to any of the phases */
+#define API_PHASE_RESTART(options, tstart)                              \
+    {                                                                   \
+        if((options)->c_api_timer) {                                    \
+            tstart = get_monotonic_time();                              \
+        }                                                               \
+        if((options)->c_api_phase_memory && (options)->c_api_memory_baseline >= 0) { \
+            reset_peak_allocated_memory();                              \
+        }                                                               \
+    }
+
 #define ALIGNMENT                32
 
 #define STRINGIFY(x)   #x
@@ -134,12 +197,21 @@ the ROOT DIRECTORY of ``Corrfunc`` and re-install the entire packge.\n"
      } while (0)
 #endif
 
-#define SETUP_INTERRUPT_HANDLERS(handler_name)                          \
+#define SETUP_INTERRUPT_HANDLERS(handler_name)  SETUP_INTERRUPT_HANDLERS_IF(1, handler_name)
+
+/* The handlers are only installed if `install' is non-zero. Otherwise (e.g., for every catalog
+   of a batch counted within a parallel region) the handlers of the caller remain in place, and
+   RESET_INTERRUPT_HANDLERS leaves them alone */
+#define SETUP_INTERRUPT_HANDLERS_IF(install, handler_name)              \
      const int interrupt_signals[] = {SIGTERM, SIGINT, SIGHUP};         \
      const size_t nsig = sizeof(interrupt_signals)/sizeof(interrupt_signals[0]); \
      typedef void (* sig_handlers)(int);                                \
      sig_handlers previous_handlers[nsig];                              \
      for(size_t i=0;i<nsig;i++) {                                       \
+         if( ! (install)) {                                             \
+             previous_handlers[i] = SIG_IGN;                            \
+             continue;                                                  \
+         }                                                              \
          int signo = interrupt_signals[i];                              \
          sig_handlers prev = signal(signo, handler_name);               \
          if (prev == SIG_ERR) {                                         \
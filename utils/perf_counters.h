@@ -0,0 +1,187 @@
+/* File: perf_counters.h */
+/*
+  This file is a part of the Corrfunc package
+  Copyright (C) 2015-- Manodeep Sinha (manodeep@gmail.com)
+  License: MIT LICENSE. See LICENSE file under the top-level
+  directory at https://github.com/manodeep/Corrfunc/
+*/
+
+/*
+  Hardware performance counters, enabled with the c_perf_counters option. The
+  events in `api_perf_event' are counted with perf_event_open (Linux only) for
+  the thread that calls start_perf_counters, i.e., every thread in the kernel
+  loop counts its own events. An event that can not be counted (no PMU in a
+  virtual machine, perf_event_paranoid too high, or not Linux) is reported as
+  -1, and the calculation goes ahead as usual.
+
+  Usage:
+
+  struct perf_counters counters;
+  start_perf_counters(&counters, API_PHASE_KERNEL, options);
+  ...
+  stop_perf_counters(&counters);//also closes the counters -> call on error paths as well
+  #pragma omp critical
+  add_perf_counts(options, &counters);
+*/
+
+#pragma once
+
+#ifdef __cplusplus
+extern "C" {
+#endif
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <stdint.h>
+#include <string.h>
+
+#if defined(__linux__)
+#include <unistd.h>
+#include <sys/ioctl.h>
+#include <sys/syscall.h>
+#include <linux/perf_event.h>
+#endif
+
+#if defined(_OPENMP)
+#include <omp.h>
+#endif
+
+#include "defs.h"
+
+struct perf_counters
+{
+    int64_t counts[NUM_API_PERF_EVENTS];
+    int fd[NUM_API_PERF_EVENTS];/* -1 if the event is not being counted */
+    int32_t phase;
+    int32_t tid;
+    uint8_t running;
+};
+
+#if defined(__linux__)
+static inline int open_perf_event(const api_perf_event event)
+{
+    struct perf_event_attr attr;
+    memset(&attr, 0, sizeof(attr));
+    attr.size = sizeof(attr);
+    attr.type = PERF_TYPE_HARDWARE;
+    switch(event) {
+    case API_PERF_CYCLES:
+        attr.config = PERF_COUNT_HW_CPU_CYCLES;
+        break;
+    case API_PERF_INSTRUCTIONS:
+        attr.config = PERF_COUNT_HW_INSTRUCTIONS;
+        break;
+    case API_PERF_CACHE_REFERENCES:
+        attr.config = PERF_COUNT_HW_CACHE_REFERENCES;
+        break;
+    case API_PERF_CACHE_MISSES:
+        attr.config = PERF_COUNT_HW_CACHE_MISSES;
+        break;
+    case API_PERF_BRANCHES:
+        attr.config = PERF_COUNT_HW_BRANCH_INSTRUCTIONS;
+        break;
+    case API_PERF_BRANCH_MISSES:
+        attr.config = PERF_COUNT_HW_BRANCH_MISSES;
+        break;
+    case API_PERF_TASK_CLOCK:
+        attr.type = PERF_TYPE_SOFTWARE;
+        attr.config = PERF_COUNT_SW_TASK_CLOCK;
+        break;
+    case API_PERF_PAGE_FAULTS:
+        attr.type = PERF_TYPE_SOFTWARE;
+        attr.config = PERF_COUNT_SW_PAGE_FAULTS;
+        break;
+    default:
+        return -1;
+    }
+    attr.disabled = 1;
+    /* Only the user-space part of Corrfunc is of interest (and this works with perf_event_paranoid = 2) */
+    attr.exclude_kernel = 1;
+    attr.exclude_hv = 1;
+    /* To scale the counts if there are more events than hardware counters */
+    attr.read_format = PERF_FORMAT_TOTAL_TIME_ENABLED | PERF_FORMAT_TOTAL_TIME_RUNNING;
+
+    /* pid = 0, cpu = -1 -> the calling thread, on any cpu. Every event is opened separately, so
+       that the events that are not supported do not prevent counting the others */
+    return (int) syscall(SYS_perf_event_open, &attr, 0, -1, -1, 0);
+}
+#endif
+
+static inline void start_perf_counters(struct perf_counters *counters, const api_phase phase, const struct config_options *options)
+{
+    counters->phase = phase;
+    counters->tid = 0;
+#if defined(_OPENMP)
+    counters->tid = omp_get_thread_num();
+#endif
+    counters->running = options->c_perf_counters ? 1:0;
+    for(int i=0;i<NUM_API_PERF_EVENTS;i++) {
+        counters->counts[i] = -1;
+        counters->fd[i] = -1;
+#if defined(__linux__)
+        if(counters->running) {
+            counters->fd[i] = open_perf_event((api_perf_event) i);
+        }
+#endif
+    }
+#if defined(__linux__)
+    for(int i=0;i<NUM_API_PERF_EVENTS;i++) {
+        if(counters->fd[i] >= 0) {
+            ioctl(counters->fd[i], PERF_EVENT_IOC_RESET, 0);
+            ioctl(counters->fd[i], PERF_EVENT_IOC_ENABLE, 0);
+        }
+    }
+#endif
+}
+
+/* Reads and closes the counters. Does nothing if the counters are not running */
+static inline void stop_perf_counters(struct perf_counters *counters)
+{
+    if(counters->running == 0) {
+        return;
+    }
+    counters->running = 0;
+#if defined(__linux__)
+    for(int i=0;i<NUM_API_PERF_EVENTS;i++) {
+        if(counters->fd[i] >= 0) {
+            ioctl(counters->fd[i], PERF_EVENT_IOC_DISABLE, 0);
+        }
+    }
+    for(int i=0;i<NUM_API_PERF_EVENTS;i++) {
+        if(counters->fd[i] < 0) {
+            continue;
+        }
+        uint64_t values[3];/* value, time enabled, time running */
+        if(read(counters->fd[i], values, sizeof(values)) == (ssize_t) sizeof(values) && values[2] > 0) {
+            const double scale = values[2] < values[1] ? (double) values[1]/(double) values[2]:1.0;
+            counters->counts[i] = (int64_t) (values[0] * scale);
+        }
+        close(counters->fd[i]);
+        counters->fd[i] = -1;
+    }
+#endif
+}
+
+/* Appends the counts to options->perf_counts (freed with `free_perf_counts'). Needs to be called from within a critical section */
+static inline void add_perf_counts(struct config_options *options, const struct perf_counters *counters)
+{
+    if(options->c_perf_counters == 0) {
+        return;
+    }
+    struct api_perf_counts *perf_counts = realloc(options->perf_counts, (options->nperf_counts + 1) * sizeof(*perf_counts));
+    if(perf_counts == NULL) {
+        fprintf(stderr,"Warning: In %s> Could not allocate memory to store the performance counters of thread %d\n",
+                __FUNCTION__, counters->tid);
+        return;
+    }
+    struct api_perf_counts *p = &(perf_counts[options->nperf_counts]);
+    memcpy(p->counts, counters->counts, sizeof(p->counts));
+    p->phase = counters->phase;
+    p->tid = counters->tid;
+    options->perf_counts = perf_counts;
+    options->nperf_counts++;
+}
+
+#ifdef __cplusplus
+}
+#endif
@@ -38,6 +38,7 @@ extern "C" {
 #define SSE_DIVIDE_FLOATS(X,Y)           _mm_div_ps(X,Y)
 #define SSE_SQRT_FLOAT(X)                _mm_sqrt_ps(X)
 #define SSE_TRUNCATE_FLOAT_TO_INT(X)     _mm_cvttps_epi32(X)
+#define SSE_FLOOR_FLOAT(X)               _mm_floor_ps(X)
 #define SSE_SQUARE_FLOAT(X)              _mm_mul_ps(X,X)
 #define SSE_SET_FLOAT(X)                 _mm_set1_ps(X)
 
@@ -87,6 +88,7 @@ extern "C" {
 
 //Memory stores
 #define SSE_TRUNCATE_FLOAT_TO_INT(X)     _mm_cvttpd_epi32(X)
+#define SSE_FLOOR_FLOAT(X)               _mm_floor_pd(X)
 #define SSE_STORE_FLOATS_TO_MEMORY(X,Y)  _mm_storeu_pd(X,Y)
 
 //The comparisons
@@ -32,10 +32,23 @@
 #include "macros.h"
 #include "utils.h"
 
+#if defined(_OPENMP)
+#include <omp.h>
+#endif
+
 #ifdef __MACH__ // OS X does not have clock_gettime, use clock_get_time
 #include <mach/mach_time.h> /* mach_absolute_time -> really fast */
 #endif
 
+/* Usable size of a heap allocation, used to count the allocated bytes */
+#if defined(__APPLE__)
+#include <malloc/malloc.h>
+#define ALLOCATION_SIZE(x)    ((int64_t) malloc_size(x))
+#elif defined(__linux__)
+#include <malloc.h>
+#define ALLOCATION_SIZE(x)    ((int64_t) malloc_usable_size(x))
+#endif
+
 void get_max_float(const int64_t ND1, const float *cz1, float *czmax)
 {
     float max=*czmax;
@@ -71,7 +84,7 @@ int setup_bins(const char *fname,double *rmin,double *rmax,int *nbin,double **ru
 
     fp = my_fopen(fname,"r");
     if(fp == NULL) {
-        free(*rupp);
+        my_tracked_free(*rupp);
         return EXIT_FAILURE;
     }
     int index=1;
@@ -119,7 +132,7 @@ int setup_bins_double(const char *fname,double *rmin,double *rmax,int *nbin,doub
 
     fp = my_fopen(fname,"r");
     if(fp == NULL) {
-        free(*rupp);
+        my_tracked_free(*rupp);
         return EXIT_FAILURE;
     }
     int index=1;
@@ -164,7 +177,7 @@ int setup_bins_float(const char *fname,float *rmin,float *rmax,int *nbin,float *
 
     fp = my_fopen(fname,"r");
     if(fp == NULL) {
-        free(*rupp);
+        my_tracked_free(*rupp);
         return EXIT_FAILURE;
     }
     int index=1;
@@ -195,6 +208,88 @@ int setup_bins_float(const char *fname,float *rmin,float *rmax,int *nbin,float *
 }
 
 
+/* Same as setup_bins, but with the (increasing) bin-edges passed as an array. Lets the
+   python extensions pass the bins directly, instead of writing them to a file on every call */
+int setup_bins_from_array(const int64_t nedges, const double *edges, double *rmin, double *rmax, int *nbin, double **rupp)
+{
+    if(edges == NULL || nedges < 2 || nedges > INT_MAX) {
+        fprintf(stderr,"Error: In %s> Expected at least 2 bin-edges. Found nedges = %"PRId64"\n",
+                __FUNCTION__, nedges);
+        return EXIT_FAILURE;
+    }
+    for(int64_t i=1;i<nedges;i++) {
+        if( ! (edges[i] > edges[i-1])) {
+            fprintf(stderr,"Error: In %s> The bin-edges must be strictly increasing. Found edges[%"PRId64"] = %lf "
+                    "and edges[%"PRId64"] = %lf\n", __FUNCTION__, i-1, edges[i-1], i, edges[i]);
+            return EXIT_FAILURE;
+        }
+    }
+
+    /* Same layout as in setup_bins: nbin = nedges, and the last element is repeated */
+    *nbin = (int) nedges;
+    *rupp = my_calloc(sizeof(double),*nbin+1);
+    if(*rupp == NULL) {
+        return EXIT_FAILURE;
+    }
+    for(int64_t i=0;i<nedges;i++) {
+        (*rupp)[i] = edges[i];
+    }
+    *rmin = edges[0];
+    *rmax = edges[nedges-1];
+    (*rupp)[*nbin] = *rmax;
+
+    return EXIT_SUCCESS;
+}
+
+
+/* Each thread should have at least these many particles. Below this, the time to start up
+   (and synchronise) the threads is comparable to the time spent counting the pairs */
+#define MIN_PARTICLES_PER_THREAD   5000
+
+int get_nthreads_for_particles(const int numthreads, const int64_t N)
+{
+#if defined(_OPENMP)
+    if(numthreads > 0) {
+        return numthreads;
+    }
+    const int64_t max_nthreads = N/MIN_PARTICLES_PER_THREAD;
+    const int nprocs = omp_get_num_procs();
+    if(max_nthreads < 1) {
+        return 1;
+    }
+    return max_nthreads < nprocs ? (int) max_nthreads:nprocs;
+#else
+    (void) numthreads;
+    (void) N;
+    return 1;
+#endif
+}
+
+int get_max_cells_for_particles(const int max_cells_per_dim, const int64_t N)
+{
+    /* ~ at least one particle per cell on average */
+    int ncells = (int) cbrt((double) N);
+    ncells = ncells < 1 ? 1:ncells;
+    return ncells < max_cells_per_dim ? ncells:max_cells_per_dim;
+}
+
+int gather_by_index(void *arr, const int64_t *index, const int64_t N, const size_t element_size)
+{
+    /* arr[i] <- arr[index[i]], via a copy of the original array */
+    char *copy = my_malloc(element_size, N);
+    if(copy == NULL) {
+        return EXIT_FAILURE;
+    }
+    memcpy(copy, arr, N*element_size);
+    char *dst = (char *) arr;
+    for(int64_t i=0;i<N;i++) {
+        memcpy(dst + i*element_size, copy + index[i]*element_size, element_size);
+    }
+    my_tracked_free(copy);
+    return EXIT_SUCCESS;
+}
+
+
 int run_system_call(const char *execstring)
 {
     int status=system(execstring);
@@ -387,6 +482,75 @@ void current_utc_time(struct timespec *ts)
 #endif
 }    
 
+/* Seconds since an arbitrary (but fixed) point, from a clock that is not affected by changes to the system time */
+double get_monotonic_time(void)
+{
+#ifdef __MACH__
+    static mach_timebase_info_data_t    sTimebaseInfo = {.numer=0, .denom=0};
+    if ( sTimebaseInfo.denom == 0 ) {
+        mach_timebase_info(&sTimebaseInfo);
+    }
+    return 1e-9 * (double) mach_absolute_time() * sTimebaseInfo.numer / sTimebaseInfo.denom;
+#else
+    struct timespec ts;
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+    return ts.tv_sec + 1e-9*ts.tv_nsec;
+#endif
+}
+
+/* Bytes allocated with my_malloc, my_calloc, my_aligned_malloc and my_realloc, and not yet released with my_tracked_free,
+   since the last call to start_allocation_tracking. Counted from the usable size of every allocation, so that the
+   size does not have to be stored next to the pointer. The counters are shared by all threads (and calls) */
+static int allocation_tracking = 0;
+static int64_t allocated_bytes = 0, peak_allocated_bytes = 0;
+
+static void track_allocation(void *x, const int64_t sign)
+{
+#ifdef ALLOCATION_SIZE
+    if(x == NULL || __atomic_load_n(&allocation_tracking, __ATOMIC_RELAXED) == 0) {
+        return;
+    }
+    const int64_t current = __atomic_add_fetch(&allocated_bytes, sign*ALLOCATION_SIZE(x), __ATOMIC_RELAXED);
+    int64_t peak = __atomic_load_n(&peak_allocated_bytes, __ATOMIC_RELAXED);
+    while(current > peak &&
+          !__atomic_compare_exchange_n(&peak_allocated_bytes, &peak, current, 1, __ATOMIC_RELAXED, __ATOMIC_RELAXED));
+#else
+    (void) x;
+    (void) sign;
+#endif
+}
+
+/* Resets the allocated (and the peak allocated) bytes to 0 and starts counting. Returns EXIT_FAILURE if the size of
+   an allocation can not be found on this platform */
+int start_allocation_tracking(void)
+{
+#ifdef ALLOCATION_SIZE
+    __atomic_store_n(&allocated_bytes, 0, __ATOMIC_RELAXED);
+    __atomic_store_n(&peak_allocated_bytes, 0, __ATOMIC_RELAXED);
+    __atomic_store_n(&allocation_tracking, 1, __ATOMIC_RELAXED);
+    return EXIT_SUCCESS;
+#else
+    return EXIT_FAILURE;
+#endif
+}
+
+void stop_allocation_tracking(void)
+{
+    __atomic_store_n(&allocation_tracking, 0, __ATOMIC_RELAXED);
+}
+
+/* Bytes currently allocated (or the peak since the last call to reset_peak_allocated_memory) */
+int64_t get_allocated_memory(const int peak)
+{
+    return __atomic_load_n(peak ? &peak_allocated_bytes:&allocated_bytes, __ATOMIC_RELAXED);
+}
+
+/* Resets the peak allocated bytes to the bytes currently allocated */
+void reset_peak_allocated_memory(void)
+{
+    __atomic_store_n(&peak_allocated_bytes, __atomic_load_n(&allocated_bytes, __ATOMIC_RELAXED), __ATOMIC_RELAXED);
+}
+
 
 
 /*
@@ -480,11 +644,21 @@ void print_time(struct timeval t0,struct timeval t1,const char *s)
 
 void* my_realloc(void *x,size_t size,int64_t N,const char *varname)
 {
+#ifdef ALLOCATION_SIZE
+    const int64_t old_size = x == NULL ? 0:ALLOCATION_SIZE(x);
+#endif
     void *tmp = realloc(x,N*size);
 
     if (tmp==NULL) {
         fprintf(stderr,"ERROR: Could not reallocate for %"PRId64" elements with %zu size for variable `%s' ..aborting\n",N,size,varname);
         perror(NULL);
+    } else {
+#ifdef ALLOCATION_SIZE
+        if(__atomic_load_n(&allocation_tracking, __ATOMIC_RELAXED)) {
+            __atomic_sub_fetch(&allocated_bytes, old_size, __ATOMIC_RELAXED);
+        }
+#endif
+        track_allocation(tmp, +1);
     }
 
     return tmp;
@@ -499,10 +673,23 @@ void* my_malloc(size_t size,int64_t N)
         fprintf(stderr,"malloc for %"PRId64" elements with %zu bytes failed...\n",N,size);
         perror(NULL);
     }
+    track_allocation(x, +1);
         
     return x;
 }
 
+void* my_aligned_malloc(size_t size,int64_t N,size_t alignment)
+{
+    void *x = NULL;
+    if(posix_memalign(&x, alignment, N*size) != 0) {
+        fprintf(stderr,"aligned malloc (alignment = %zu bytes) for %"PRId64" elements with %zu bytes failed...\n",alignment,N,size);
+        return NULL;
+    }
+    track_allocation(x, +1);
+
+    return x;
+}
+
 
 
 void* my_calloc(size_t size,int64_t N)
@@ -513,6 +700,7 @@ void* my_calloc(size_t size,int64_t N)
         fprintf(stderr,"malloc for %"PRId64" elements with %zu size failed...\n",N,size);
         perror(NULL);
     }
+    track_allocation(x, +1);
 
     return x;
 }
@@ -531,11 +719,19 @@ void my_free(void ** x)
     */
 
     if(*x!=NULL)
-        free(*x);//free the memory
+        my_tracked_free(*x);//free the memory
 
     *x=NULL;//sets the pointer in the calling routine to NULL.
 }
 
+//free for memory allocated with my_malloc and friends -> keeps
+//the allocated bytes (see start_allocation_tracking) up to date.
+void my_tracked_free(void *x)
+{
+    track_allocation(x, -1);
+    free(x);
+}
+
 
 void **matrix_malloc(size_t size,int64_t nrow,int64_t ncol)
 {
@@ -550,9 +746,9 @@ void **matrix_malloc(size_t size,int64_t nrow,int64_t ncol)
         if(m[i] == NULL) {
             /* Free up all the memory allocated so far */
             for(int j=i-1;j>=0;j--) {
-                free(m[j]);
+                my_tracked_free(m[j]);
             }
-            free(m);
+            my_tracked_free(m);
             return NULL;
         }
     }
@@ -572,9 +768,9 @@ void **matrix_calloc(size_t size,int64_t nrow,int64_t ncol)
         if(m[i] == NULL) {
             /* Free up all the memory allocated so far */
             for(int j=i-1;j>=0;j--) {
-                free(m[j]);
+                my_tracked_free(m[j]);
             }
-            free(m);
+            my_tracked_free(m);
             return NULL;
         }
     }
@@ -606,9 +802,9 @@ void matrix_free(void **m,int64_t nrow)
         return;
     
     for(int i=0;i<nrow;i++)
-        free(m[i]);
+        my_tracked_free(m[i]);
 
-    free(m);
+    my_tracked_free(m);
 }
 
 
@@ -626,10 +822,10 @@ void *** volume_malloc(size_t size,int64_t nrow,int64_t ncol,int64_t nframe)
             /* Free up all the memory allocated so far */
             for(int jj=i-1;jj>=0;jj--) {
                 for(int k=0;k<ncol;k++) {
-                    free(v[jj][k]);
+                    my_tracked_free(v[jj][k]);
                 }
             }
-            free(v);
+            my_tracked_free(v);
             return NULL;
         }
         
@@ -639,15 +835,15 @@ void *** volume_malloc(size_t size,int64_t nrow,int64_t ncol,int64_t nframe)
                 /* Free up all the memory allocated so far */
                 /* First free up all columns in this row*/
                 for(int k=ncol-1;k>=0;k--) {
-                    free(v[i][k]);
+                    my_tracked_free(v[i][k]);
                 }
                 /* Now free all previous rows with all ncols */
                 for(int jj=i-1;jj>=0;jj--) {
                     for(int k=0;k<ncol;k++) {
-                        free(v[jj][k]);
+                        my_tracked_free(v[jj][k]);
                     }
                 }
-                free(v);
+                my_tracked_free(v);
                 return NULL;
             }
         }
@@ -669,10 +865,10 @@ void *** volume_calloc(size_t size,int64_t nrow,int64_t ncol,int64_t nframe)
             /* Free up all the memory allocated so far */
             for(int jj=i-1;jj>=0;jj--) {
                 for(int k=0;k<ncol;k++) {
-                    free(v[jj][k]);
+                    my_tracked_free(v[jj][k]);
                 }
             }
-            free(v);
+            my_tracked_free(v);
             return NULL;
         }
 
@@ -682,15 +878,15 @@ void *** volume_calloc(size_t size,int64_t nrow,int64_t ncol,int64_t nframe)
                 /* Free up all the memory allocated so far */
                 /* First free up all columns in this row*/
                 for(int k=ncol-1;k>=0;k--) {
-                    free(v[i][k]);
+                    my_tracked_free(v[i][k]);
                 }
                 /* Now free all previous rows with all ncols */
                 for(int jj=i-1;jj>=0;jj--) {
                     for(int k=0;k<ncol;k++) {
-                        free(v[j][k]);
+                        my_tracked_free(v[j][k]);
                     }
                 }
-                free(v);
+                my_tracked_free(v);
                 return NULL;
             }
         }
@@ -706,13 +902,13 @@ void volume_free(void ***v,int64_t nrow,int64_t ncol)
 {
     for(int i=0;i<nrow;i++) {
         for(int j=0;j<ncol;j++) {
-            free(v[i][j]);
+            my_tracked_free(v[i][j]);
         }
 
-        free(v[i]);
+        my_tracked_free(v[i]);
     }
 
-    free(v);
+    my_tracked_free(v);
 }
 
 
@@ -35,6 +35,11 @@ extern int my_snprintf(char *buffer,int len,const char *format, ...) __attribute
 extern char * get_time_string(struct timeval t0,struct timeval t1);
 extern void print_time(struct timeval t0,struct timeval t1,const char *s);
 extern void current_utc_time(struct timespec *ts);
+extern double get_monotonic_time(void);
+extern int start_allocation_tracking(void);
+extern void stop_allocation_tracking(void);
+extern int64_t get_allocated_memory(const int peak);
+extern void reset_peak_allocated_memory(void);
 extern int64_t getnumlines(const char *fname,const char comment);
 extern int is_big_endian(void);
 extern void byte_swap(char * const in, const size_t size, char *out);
@@ -43,8 +48,10 @@ extern void byte_swap(char * const in, const size_t size, char *out);
 extern void* my_realloc(void *x,size_t size,int64_t N,const char *varname);
 extern void* my_realloc_in_function(void **x,size_t size,int64_t N,const char *varname);
 extern void* my_malloc(size_t size,int64_t N);
+extern void* my_aligned_malloc(size_t size,int64_t N,size_t alignment);
 extern void* my_calloc(size_t size,int64_t N);
 extern void my_free(void ** x);
+extern void my_tracked_free(void *x);
 extern void **matrix_malloc(size_t size,int64_t nx,int64_t ny);
 extern void **matrix_calloc(size_t size,int64_t nx,int64_t ny);
 extern int matrix_realloc(void **matrix, size_t size, int64_t nrow, int64_t ncol);
@@ -56,9 +63,41 @@ void volume_free(void ***v,int64_t nrow,int64_t ncol);
 
 extern int run_system_call(const char *execstring);
 
+/* Reorders the N elements (of element_size bytes each) of arr such that arr[i] = (original) arr[index[i]] */
+extern int gather_by_index(void *arr, const int64_t *index, const int64_t N, const size_t element_size);
+
+/* Sets index[i] = i for all N elements (index may be NULL) */
+static inline void set_identity_index(int64_t *index, const int64_t N)
+{
+    if(index == NULL) return;
+    for(int64_t i=0;i<N;i++) {
+        index[i] = i;
+    }
+}
+
+/* Reads the i'th element of an array of floats (element_size = 4) or doubles (element_size = 8) */
+static inline double get_input_element(const void *arr, const int64_t i, const size_t element_size)
+{
+    return element_size == sizeof(double) ? ((const double *) arr)[i]:(double) ((const float *) arr)[i];
+}
+
+/* Same as get_input_element, for an array with consecutive elements `stride' bytes apart */
+static inline double get_strided_input_element(const void *arr, const int64_t i, const size_t element_size, const int64_t stride)
+{
+    const char *elem = (const char *) arr + i*stride;
+    return element_size == sizeof(double) ? *((const double *) elem):(double) *((const float *) elem);
+}
+
 extern int setup_bins(const char *fname,double *rmin,double *rmax,int *nbin,double **rupp);
 extern int setup_bins_double(const char *fname,double *rmin,double *rmax,int *nbin,double **rupp);
 extern int setup_bins_float(const char *fname,float *rmin,float *rmax,int *nbin,float **rupp);
+extern int setup_bins_from_array(const int64_t nedges, const double *edges, double *rmin, double *rmax, int *nbin, double **rupp);
+
+/* Number of threads to use for N particles; numthreads <= 0 -> picked automatically */
+extern int get_nthreads_for_particles(const int numthreads, const int64_t N);
+
+/* Max. number of cells per dimension for N particles, so that the lattice is not mostly empty */
+extern int get_max_cells_for_particles(const int max_cells_per_dim, const int64_t N);
 
 extern int test_all_files_present(const int nfiles, ...);
 